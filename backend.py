@@ -1,11 +1,18 @@
 #最终发布版本
 import base64
 import struct
+import array
+import bisect
+import heapq
 import hashlib
 import hmac
+import secrets
 import json
 import copy
-from collections import deque
+import gzip
+import difflib
+from collections import OrderedDict, deque
+from collections.abc import Mapping
 import functools
 import bcrypt
 import logging
@@ -22,12 +29,16 @@ import sys
 import xml
 import uuid
 import csv
+import sqlite3
 import zipfile
+import multiprocessing
+import multiprocessing.spawn
 from datetime import datetime, timedelta
 from logging.handlers import TimedRotatingFileHandler
 from pathlib import Path
 from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from contextvars import ContextVar, copy_context
 from fastapi import FastAPI, Request as StarletteRequest, HTTPException
 from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse, FileResponse, Response as StarletteResponse
@@ -37,10 +48,11 @@ from starlette.datastructures import QueryParams, Headers, FormData, UploadFile
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 import aiofiles
 from re import compile, Pattern, Match
-from typing import Iterator, TextIO, AnyStr, Optional, Union, Set, List, Dict, Tuple, Any, Iterable
+from typing import Iterator, TextIO, AnyStr, Optional, Union, Set, List, Dict, Tuple, Any, Iterable, Callable
 from xml.dom.minicompat import NodeList
 from xml.dom import Node
 from xml.dom.minidom import Document, Element
+from xml.parsers import expat
 from openai import OpenAI
 import random
 import threading
@@ -48,7 +60,6 @@ import socket
 import ipaddress
 import asyncio
 import websockets
-import queue
 from urllib.parse import urlparse, unquote, urlencode, parse_qs
 import requests
 from PIL import Image
@@ -57,8 +68,6 @@ APP_VERSION = "0.0.0-dev"
 
 _request_context: ContextVar[Optional["RequestContext"]] = ContextVar("request_context", default=None)
 _MISSING = object()
-TEMP_TTML_FILES: Dict[str, float] = {}
-TEMP_TTML_TTL_SEC = 10 * 60
 
 
 class FileStorageAdapter:
@@ -282,28 +291,70 @@ async def save_upload_file_with_meta(
     return await _run_sync_in_thread(_sync_copy)
 
 
+def _is_form_content_type(content_type: str) -> bool:
+    return content_type.startswith("multipart/") or "application/x-www-form-urlencoded" in content_type
+
+
 class RequestContext:
     """请求上下文类，封装HTTP请求的所有相关信息
 
     该类提供了一个统一的接口来访问HTTP请求的各个部分，
     包括请求体、表单数据、JSON数据、文件上传等。
-    使用缓存机制提高性能。
+    请求体和表单都是懒加载的：路由第一次访问 json/files 时才读取，
+    multipart 表单边读边写入 SpooledTemporaryFile，大文件上传内存占用恒定。
+    同步路由在线程池里访问时会回到事件循环读取；协程路由需要在注册时声明
+    load_body=True（或自行 await load_body()）。
     """
 
-    def __init__(self, request: StarletteRequest, body: bytes, form: Optional[FormData]):
+    def __init__(self, request: StarletteRequest):
         """初始化请求上下文
 
         Args:
             request: Starlette的Request对象
-            body: 请求体的字节数据
-            form: 解析后的表单数据（如果存在）
         """
         self._request = request
-        self._body = body
-        self._form = form
+        self._loop = asyncio.get_running_loop()
+        self._body: Any = _MISSING  # 懒加载的请求体字节，表单请求为 b""
+        self._form: Any = _MISSING  # 懒加载的表单数据，非表单请求为 None
         self._json_cache: Any = _MISSING  # 用于缓存JSON数据
         self._files_cache: Optional[FilesWrapper] = None  # 用于缓存文件包装器
 
+    def bind(self, request: StarletteRequest) -> None:
+        """换成路由端点自己的 Request 读取请求体（中间件那一层的 Request 不读 body）。"""
+        if self._body is _MISSING and self._form is _MISSING:
+            self._request = request
+
+    async def load_body(self) -> None:
+        """读取并缓存请求体；表单请求改为流式解析表单，不再整体缓冲。"""
+        if self._body is not _MISSING:
+            return
+        if _is_form_content_type(self._request.headers.get("content-type", "")):
+            try:
+                self._form = await self._request.form()
+            except Exception:
+                self._form = None
+            self._body = b""
+        else:
+            self._body = await self._request.body()
+            self._form = None
+
+    async def close(self) -> None:
+        """关闭表单里的上传临时文件。"""
+        form = self._form
+        if isinstance(form, FormData):
+            await form.close()
+
+    def _ensure_body(self) -> None:
+        if self._body is not _MISSING:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError("协程路由需要以 load_body=True 注册，或先 await request.load_body()")
+        asyncio.run_coroutine_threadsafe(self.load_body(), self._loop).result()
+
     @property
     def method(self) -> str:
         """获取HTTP请求方法
@@ -396,6 +447,7 @@ class RequestContext:
             返回FilesWrapper对象，用于访问上传的文件
         """
         if self._files_cache is None:
+            self._ensure_body()
             mapping: Dict[str, List[FileStorageAdapter]] = {}
             if self._form:
                 for key, value in self._form.multi_items():
@@ -420,6 +472,7 @@ class RequestContext:
         """
         if self._json_cache is not _MISSING:
             return self._json_cache
+        self._ensure_body()
         if not self._body:
             self._json_cache = None
             return None
@@ -795,7 +848,11 @@ class FlaskCompat(FastAPI):
             autoescape=select_autoescape(["html", "xml", "HTML"])
         )
 
-    def route(self, path: str, methods: Optional[List[str]] = None, **kwargs):
+    def route(self, path: str, methods: Optional[List[str]] = None, load_body: bool = False, **kwargs):
+        """注册Flask风格的路由
+
+        load_body=True 时在调用协程路由前先读取请求体/表单；同步路由按需懒加载，无需声明。
+        """
         methods = methods or ["GET"]
         converted_path = re.sub(
             r"<(?:(\w+):)?(\w+)>",
@@ -806,11 +863,20 @@ class FlaskCompat(FastAPI):
         def decorator(func):
             if not hasattr(func, "_fastapi_endpoint"):
                 async def endpoint(request: StarletteRequest):
-                    if asyncio.iscoroutinefunction(func):
-                        result = await func(**request.path_params)
-                    else:
-                        result = await _run_sync_in_thread(func, **request.path_params)
-                    return _normalize_response(result)
+                    ctx = _request_context.get()
+                    if ctx is not None:
+                        ctx.bind(request)
+                        if load_body:
+                            await ctx.load_body()
+                    try:
+                        if asyncio.iscoroutinefunction(func):
+                            result = await func(**request.path_params)
+                        else:
+                            result = await _run_sync_in_thread(func, **request.path_params)
+                        return _normalize_response(result)
+                    finally:
+                        if ctx is not None:
+                            await ctx.close()
 
                 func._fastapi_endpoint = endpoint
             self.add_api_route(converted_path, func._fastapi_endpoint, methods=methods, **kwargs)
@@ -1292,10 +1358,19 @@ def render_template(template_name: str, **context: Any) -> HTMLResponse:
 
 THREADPOOL_MAX_WORKERS = int(os.getenv("APP_THREADPOOL_WORKERS", "16"))
 THREADPOOL_EXECUTOR = ThreadPoolExecutor(max_workers=THREADPOOL_MAX_WORKERS)
+# bcrypt 单独一个小线程池：并发登录再多也占不满通用线程池；排队超过上限直接拒绝
+PASSWORD_HASH_MAX_WORKERS = max(1, int(os.getenv("APP_PASSWORD_HASH_WORKERS", "2")))
+PASSWORD_HASH_MAX_PENDING = PASSWORD_HASH_MAX_WORKERS * 4
+PASSWORD_HASH_EXECUTOR = ThreadPoolExecutor(max_workers=PASSWORD_HASH_MAX_WORKERS, thread_name_prefix="password-hash")
+_password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
 BEAT_CURVE_TASKS: Dict[str, Dict[str, Any]] = {}
 BEAT_CURVE_LOCK = threading.Lock()
 STATIC_EXPORT_TASKS: Dict[str, Dict[str, Any]] = {}
 STATIC_EXPORT_LOCK = threading.Lock()
+# 批量歌词格式转换：CPU 密集，放进独立的进程池；1 表示不开子进程，直接在任务线程里逐个转换
+CONVERT_BATCH_MAX_WORKERS = max(1, int(os.getenv("APP_CONVERT_WORKERS", str(min(4, os.cpu_count() or 1)))))
+CONVERT_BATCH_TASKS: Dict[str, Dict[str, Any]] = {}
+CONVERT_BATCH_LOCK = threading.Lock()
 
 def cleanup_missing_ssl_cert_env() -> List[str]:
     """
@@ -1934,6 +2009,25 @@ def cleanup_amll_cover_images() -> int:
 cleanup_amll_cover_images()
 
 
+def cleanup_legacy_player_ttml_files() -> int:
+    """删除旧版本按请求生成在 songs 目录里的 lyrics_player_*.ttml（现改用 .cache/player_ttml）。
+
+    只在 __main__ 正常启动服务时调用：导入本模块（测试、转换进程池子进程）不应动 songs 目录。
+    """
+    removed = 0
+    if not SONGS_DIR.exists():
+        return removed
+    for path in SONGS_DIR.glob('lyrics_player_*.ttml'):
+        try:
+            path.unlink()
+            removed += 1
+        except Exception as exc:
+            app.logger.warning("Failed to remove legacy player ttml: %s (%s)", path, exc)
+    if removed:
+        app.logger.info("Removed %s legacy player ttml files from songs dir", removed)
+    return removed
+
+
 def cleanup_exports_dir(max_keep: int = 20) -> int:
     """清理 exports 目录，保留最新的 N 个文件
 
@@ -2793,16 +2887,8 @@ async def _request_context_middleware(request_in: StarletteRequest, call_next):
     if blocked is not None:
         return blocked
 
-    body = await request_in.body()
-    form: Optional[FormData] = None
-    content_type = request_in.headers.get("content-type", "")
-    if content_type.startswith("multipart/") or "application/x-www-form-urlencoded" in content_type:
-        try:
-            form = await request_in.form()
-        except Exception:
-            form = None
-
-    token = _request_context.set(RequestContext(request_in, body=body, form=form))
+    # 请求体不在这里读取，由 RequestContext 按需懒加载
+    token = _request_context.set(RequestContext(request_in))
     try:
         response: Optional[StarletteResponse] = None
         for func in app._before_request_funcs:
@@ -3311,10 +3397,226 @@ AMLL_STATE = {
     "progress_ms": 0,
     "lines": [],
     "raw_lines": [],
+    "lyrics_rev": 0,
     "last_update": 0
 }
-# 事件队列（给前端实时推送用）
-AMLL_QUEUE = queue.Queue(maxsize=1000)
+# lyrics_rev 只在本进程内递增、重启后从 0 开始；客户端续传时须同时带回本纪元标识，不一致就下发整份快照
+AMLL_LYRICS_EPOCH = uuid.uuid4().hex[:12]
+# 最近几版歌词的 (lyrics_rev, raw_lines)，用于给 delta 客户端计算行级差量
+AMLL_LYRICS_HISTORY_SIZE = max(2, int(os.getenv("AMLL_LYRICS_HISTORY_SIZE", "16")))
+_amll_lyrics_history: deque = deque(maxlen=AMLL_LYRICS_HISTORY_SIZE)
+_amll_lyrics_history_lock = threading.Lock()
+AMLL_SUBSCRIBER_BUFFER_SIZE = max(8, int(os.getenv("AMLL_SUBSCRIBER_BUFFER_SIZE", "256")))
+# 高频事件：订阅者缓冲区里尚未消费的同类事件直接被最新一条替换
+AMLL_COALESCE_EVENT_TYPES = frozenset({"progress", "audio_levels"})
+
+
+class AmllSubscription:
+    """单个 SSE 订阅者：独立的有界环形缓冲（满时丢弃最旧）+ 积压计数。"""
+
+    def __init__(self, sub_id: int, buffer_size: int, label: str = ""):
+        self.id = sub_id
+        self.label = label
+        self.created_at = time.time()
+        self._cond = threading.Condition(threading.Lock())
+        self._buffer: deque = deque()
+        self._buffer_size = buffer_size
+        # type -> 缓冲区内尚未消费的可合并事件（同一 dict 对象）
+        self._pending_coalesced: Dict[str, Dict[str, Any]] = {}
+        self._closed = False
+        # 异步订阅者：由发布线程通过 call_soon_threadsafe 唤醒，不占用任何线程
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._async_waiting = False
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_event_id = 0
+
+    def _offer(self, event: Dict[str, Any]) -> None:
+        etype = event["type"]
+        with self._cond:
+            if self._closed:
+                return
+            if etype in AMLL_COALESCE_EVENT_TYPES:
+                pending = self._pending_coalesced.pop(etype, None)
+                if pending is not None:
+                    # 旧条目直接移出缓冲区，不再占容量；新事件排到队尾保证顺序
+                    self._remove_entry_locked(pending)
+                    self.coalesced += 1
+            if len(self._buffer) >= self._buffer_size:
+                oldest = self._buffer.popleft()
+                self.dropped += 1
+                old_type = oldest["type"]
+                if self._pending_coalesced.get(old_type) is oldest:
+                    del self._pending_coalesced[old_type]
+            self._buffer.append(event)
+            if etype in AMLL_COALESCE_EVENT_TYPES:
+                self._pending_coalesced[etype] = event
+            depth = len(self._buffer)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cond.notify()
+            if self._async_waiting:
+                self._wake_async_locked()
+
+    def _remove_entry_locked(self, entry: Dict[str, Any]) -> None:
+        # 按身份查找（事件 dict 可能很大，避免 deque.remove 的逐值比较）
+        for index, candidate in enumerate(self._buffer):
+            if candidate is entry:
+                del self._buffer[index]
+                return
+
+    def _wake_async_locked(self) -> None:
+        # 只在协程确实在等待时跨线程唤醒一次，避免高频事件刷爆事件循环
+        self._async_waiting = False
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # 事件循环已关闭，订阅者随连接一起失效
+            pass
+
+    def _pop_locked(self) -> Optional[Dict[str, Any]]:
+        if not self._buffer:
+            return None
+        event = self._buffer.popleft()
+        if self._pending_coalesced.get(event["type"]) is event:
+            del self._pending_coalesced[event["type"]]
+        self.delivered += 1
+        self.last_event_id = event["id"]
+        return event
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """取下一条事件；超时或订阅已关闭时返回 None。"""
+        with self._cond:
+            event = self._pop_locked()
+            if event is not None or self._closed:
+                return event
+            self._cond.wait(timeout)
+            return self._pop_locked()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """绑定到事件循环，之后可用 get_async 等待事件。"""
+        with self._cond:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+
+    async def get_async(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """协程版 get：等待期间只挂起协程，不阻塞任何线程。"""
+        if self._wakeup is None:
+            self.bind_loop(asyncio.get_running_loop())
+        wakeup = self._wakeup
+        with self._cond:
+            event = self._pop_locked()
+            if event is not None or self._closed:
+                return event
+            wakeup.clear()
+            self._async_waiting = True
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiting = False
+        with self._cond:
+            return self._pop_locked()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._buffer.clear()
+            self._pending_coalesced.clear()
+            self._cond.notify_all()
+            if self._async_waiting:
+                self._wake_async_locked()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self, head_id: int) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._buffer)
+            return {
+                "id": self.id,
+                "label": self.label,
+                "connected_sec": round(time.time() - self.created_at, 3),
+                "depth": depth,
+                "max_depth": self.max_depth,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "last_event_id": self.last_event_id,
+                "lag_events": max(0, head_id - self.last_event_id),
+            }
+
+
+class AmllEventBroker:
+    """AMLL 事件广播器：每条事件扇出给所有订阅者，发布端永不阻塞。
+
+    发布来自 WebSocket 线程，订阅者是各个 /amll/stream 连接；
+    慢订阅者只会丢弃/合并自己缓冲区里的旧事件，不影响其他屏幕。
+    """
+
+    def __init__(self, buffer_size: int = AMLL_SUBSCRIBER_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, AmllSubscription] = {}
+        self._buffer_size = buffer_size
+        self._next_sub_id = 1
+        self._last_event_id = 0
+        self.published = 0
+
+    def subscribe(self, label: str = "") -> AmllSubscription:
+        with self._lock:
+            sub = AmllSubscription(self._next_sub_id, self._buffer_size, label)
+            self._next_sub_id += 1
+            sub.last_event_id = self._last_event_id
+            self._subscribers[sub.id] = sub
+        return sub
+
+    def unsubscribe(self, sub: AmllSubscription) -> None:
+        with self._lock:
+            self._subscribers.pop(sub.id, None)
+        sub.close()
+
+    def publish(self, evt_type: str, data: dict) -> Dict[str, Any]:
+        with self._lock:
+            self._last_event_id += 1
+            self.published += 1
+            event = {"id": self._last_event_id, "type": evt_type, "data": data}
+            subscribers = list(self._subscribers.values())
+        for sub in subscribers:
+            sub._offer(event)
+        return event
+
+    @property
+    def last_event_id(self) -> int:
+        return self._last_event_id
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            head_id = self._last_event_id
+            published = self.published
+        return {
+            "published": published,
+            "last_event_id": head_id,
+            "buffer_size": self._buffer_size,
+            "subscribers": [sub.stats(head_id) for sub in subscribers],
+        }
+
+
+# 事件广播（给前端实时推送用）
+AMLL_BROKER = AmllEventBroker()
 
 # 添加全局变量存储AI翻译设置
 AI_TRANSLATION_SETTINGS = {
@@ -3523,6 +3825,7 @@ def normalize_security_credential(raw_credential: Any, fallback_id: Optional[str
     credential = raw_credential if isinstance(raw_credential, dict) else {}
     credential_id = str(credential.get('credential_id') or fallback_id or f'cred_{uuid.uuid4().hex[:12]}').strip()
     password_hash = str(credential.get('password_hash') or '').strip()
+    password_lookup = str(credential.get('password_lookup') or '').strip() if password_hash else ''
     permissions = normalize_device_permissions(credential.get('permissions'))
     max_uses = coerce_int(credential.get('max_uses'))
     used_count = coerce_int(credential.get('used_count'), 0) or 0
@@ -3537,6 +3840,7 @@ def normalize_security_credential(raw_credential: Any, fallback_id: Optional[str
     return {
         'credential_id': credential_id,
         'password_hash': password_hash,
+        'password_lookup': password_lookup,
         'remark': remark,
         'expires_at': expires_at,
         'max_uses': max_uses,
@@ -3560,6 +3864,7 @@ def normalize_security_config(config: Any) -> Tuple[Dict[str, Any], bool]:
         credentials = []
 
     system_password_hash = str(normalized.get('system_password_hash') or '').strip()
+    system_password_lookup = str(normalized.get('system_password_lookup') or '').strip() if system_password_hash else ''
     next_credentials = []
     for item in credentials:
         credential = normalize_security_credential(item)
@@ -3567,6 +3872,7 @@ def normalize_security_config(config: Any) -> Tuple[Dict[str, Any], bool]:
         if credential_id == 'legacy-admin':
             if not system_password_hash:
                 system_password_hash = credential.get('password_hash', '')
+                system_password_lookup = credential.get('password_lookup', '')
             migrated = True
             continue
         next_credentials.append(credential)
@@ -3578,7 +3884,16 @@ def normalize_security_config(config: Any) -> Tuple[Dict[str, Any], bool]:
 
     normalized['device_credentials'] = next_credentials
     normalized['system_password_hash'] = system_password_hash
+    normalized['system_password_lookup'] = system_password_lookup
     normalized['password_hash'] = ''
+    lookup_key = str(normalized.get('password_lookup_key') or '').strip()
+    if not lookup_key:
+        # 预哈希分桶用的随机 HMAC 密钥；换了密钥旧标签全部作废，所以只在缺失时生成
+        lookup_key = secrets.token_hex(16)
+        for credential in next_credentials:
+            credential['password_lookup'] = ''
+        normalized['system_password_lookup'] = ''
+    normalized['password_lookup_key'] = lookup_key
     normalized['trusted_expire_days'] = coerce_int(normalized.get('trusted_expire_days'), DEFAULT_SECURITY_CONFIG['trusted_expire_days']) or DEFAULT_SECURITY_CONFIG['trusted_expire_days']
     normalized['security_enabled'] = parse_bool(normalized.get('security_enabled'), DEFAULT_SECURITY_CONFIG['security_enabled'])
 
@@ -3595,26 +3910,76 @@ def system_admin_permissions() -> Dict[str, bool]:
     return default_device_permissions(write_access=True)
 
 
-def find_password_conflict(
+# 口令预哈希标签只保留 HMAC 的前几位十六进制：几十个凭据基本各占一个桶，登录只需一次 bcrypt；
+# 位数故意取短，拿到配置文件的人也只能靠标签排除 255/256 的猜测，离线爆破仍以 bcrypt 为主
+PASSWORD_LOOKUP_TAG_HEX_CHARS = 2
+
+
+def password_lookup_tag(security_config: Dict[str, Any], password: str) -> str:
+    key = str(security_config.get('password_lookup_key') or '')
+    if not key:
+        return ''
+    digest = hmac.new(key.encode('utf-8'), str(password).encode('utf-8'), hashlib.sha256).hexdigest()
+    return digest[:PASSWORD_LOOKUP_TAG_HEX_CHARS]
+
+
+def password_hash_candidates(
     security_config: Dict[str, Any],
     password: str,
     exclude_credential_id: Optional[str] = None,
     skip_system_password: bool = False,
-) -> Optional[str]:
-    candidate_password = str(password or '').strip()
-    if not candidate_password:
-        return None
+    usable_only: bool = False,
+) -> List[Tuple[str, Optional[Dict[str, Any]], str]]:
+    """按预哈希标签挑出值得做 bcrypt 的 (类型, 凭据, 哈希)。
 
-    system_password_hash = get_system_password_hash(security_config)
-    if system_password_hash and not skip_system_password and verify_password(candidate_password, system_password_hash):
-        return 'system'
+    标签命中的排在前面；还没有标签的旧凭据无法预筛，排在最后逐个校验。
+    """
+    tag = password_lookup_tag(security_config, password)
+    matched: List[Tuple[str, Optional[Dict[str, Any]], str]] = []
+    legacy: List[Tuple[str, Optional[Dict[str, Any]], str]] = []
+
+    def consider(auth_type: str, credential: Optional[Dict[str, Any]], password_hash: str, lookup: str) -> None:
+        if not password_hash:
+            return
+        if not lookup:
+            legacy.append((auth_type, credential, password_hash))
+        elif tag and hmac.compare_digest(lookup, tag):
+            matched.append((auth_type, credential, password_hash))
 
+    system_password_hash = get_system_password_hash(security_config)
+    if not skip_system_password:
+        consider('system', None, system_password_hash, str(security_config.get('system_password_lookup') or ''))
     for credential in security_config.get('device_credentials', []):
         credential_id = str(credential.get('credential_id') or '').strip()
         if exclude_credential_id and credential_id == exclude_credential_id:
             continue
-        if verify_password(candidate_password, credential.get('password_hash', '')):
-            return credential_id or 'credential'
+        if usable_only and not is_credential_usable(credential):
+            continue
+        consider('credential', credential, str(credential.get('password_hash') or ''), str(credential.get('password_lookup') or ''))
+    return matched + legacy
+
+
+def find_password_conflict(
+    security_config: Dict[str, Any],
+    password: str,
+    exclude_credential_id: Optional[str] = None,
+    skip_system_password: bool = False,
+) -> Optional[str]:
+    candidate_password = str(password or '').strip()
+    if not candidate_password:
+        return None
+
+    candidates = password_hash_candidates(
+        security_config,
+        candidate_password,
+        exclude_credential_id=exclude_credential_id,
+        skip_system_password=skip_system_password,
+    )
+    for auth_type, credential, password_hash in candidates:
+        if verify_password(candidate_password, password_hash):
+            if auth_type == 'system':
+                return 'system'
+            return str(credential.get('credential_id') or '').strip() or 'credential'
 
     return None
 
@@ -3651,6 +4016,9 @@ def resolve_trusted_device_auth_state(security_config: Dict[str, Any], device_in
 
 
 def get_device_credential_by_id(security_config: Dict[str, Any], credential_id: str) -> Optional[Dict[str, Any]]:
+    cached = _security_config_cache.peek()
+    if cached is not None and security_config is cached[0]:
+        return cached[1].get(credential_id)
     for credential in security_config.get('device_credentials', []):
         if credential.get('credential_id') == credential_id:
             return credential
@@ -4920,8 +5288,8 @@ def get_current_device_auth_context() -> Dict[str, Any]:
             'used_count': 0,
         }
 
-    trusted_devices = load_trusted_devices()
-    device_info = trusted_devices.get(device_id)
+    # 鉴权上下文只读设备记录与凭据：直接用缓存里的共享对象，不做文件 I/O 也不拷贝
+    device_info = _cached_trusted_devices().get(device_id)
     if not isinstance(device_info, dict):
         return {
             'device_id': device_id,
@@ -4939,7 +5307,7 @@ def get_current_device_auth_context() -> Dict[str, Any]:
             'used_count': 0,
         }
 
-    security_config = get_security_config()
+    security_config = _cached_security_config()
     resolved = resolve_trusted_device_auth_state(security_config, device_info)
     if not resolved:
         return {
@@ -5107,6 +5475,8 @@ ANIMATION_CONFIG_DEFAULTS = {
 _animation_config_state = dict(ANIMATION_CONFIG_DEFAULTS)
 _animation_config_lock = threading.Lock()
 _animation_config_last_update = 0.0
+# 每次配置实际发生变化时递增，供依赖动画参数的缓存做失效判断
+_animation_config_revision = 0
 
 
 def load_animation_config() -> dict:
@@ -5150,8 +5520,9 @@ def update_animation_config(payload: dict) -> dict:
     with _animation_config_lock:
         if updated_fields:
             _animation_config_state.update(updated_fields)
-            global _animation_config_last_update
+            global _animation_config_last_update, _animation_config_revision
             _animation_config_last_update = time.time()
+            _animation_config_revision += 1
 
         return dict(_animation_config_state)
 
@@ -5526,6 +5897,129 @@ def is_parenthetical_background_line(content: str) -> bool:
     inner = stripped[1:-1].strip()
     return bool(inner)
 
+# ===== LYS 解析引擎：预编译正则一次分词，parse_lys / qe_parse_lys / lys_to_ttml 共用 =====
+LYS_OFFSET_REGEX = re.compile(r'\[offset:\s*(-?\d+)\s*\]')
+_LYS_BRACKET_LINE_REGEX = re.compile(r'\[([^\]]*)\](.*)')
+_LYS_TOKEN_REGEX = re.compile(r'(.*?)\((\d+),(\d+)\)')
+# 快速编辑器额外接受全角括号的时间标记
+_LYS_WIDE_TOKEN_REGEX = re.compile(r'(.*?)[(（](\d+),(\d+)[)）]')
+_LYS_QE_META_REGEX = re.compile(r'^\[(ti|ar|al):', re.IGNORECASE)
+_LYS_SKIPPED_META_PREFIXES = ('[from:', '[id:', '[offset:')
+_LYS_WHITESPACE_RUN_REGEX = re.compile(r'\s{2,}')
+LYS_DOCUMENT_CACHE_SIZE = 64
+
+
+class LysLine:
+    """LYS 单行的分词结果（缓存共享，只读）。
+
+    marker/content 来自行首的 [标记]，不是这种形式的行 marker 为 None；
+    tokens 为 content 中 (文本, 开始毫秒, 时长毫秒) 的元组，时间保持原文字符串（快速编辑器要原样写回），
+    文本里不会再含时间标记。
+    """
+
+    __slots__ = ('raw', 'marker', 'content', 'tokens', 'font_meta', 'skipped_meta')
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        stripped = raw.strip()
+        self.skipped_meta = stripped.startswith(_LYS_SKIPPED_META_PREFIXES)
+        self.font_meta: Optional[Tuple[Optional[str], Dict[str, str]]] = None
+        if stripped[:13].lower() == '[font-family:':
+            font_match = FONT_FAMILY_META_REGEX.match(stripped)
+            if font_match:
+                self.font_meta = parse_font_family_meta(font_match.group(1) or '')
+        bracket = _LYS_BRACKET_LINE_REGEX.match(raw)
+        if bracket:
+            self.marker: Optional[str] = bracket.group(1)
+            self.content = bracket.group(2)
+        else:
+            self.marker = None
+            self.content = ''
+        self.tokens: Tuple[Tuple[str, str, str], ...] = (
+            tuple(_LYS_TOKEN_REGEX.findall(self.content)) if '(' in self.content else ()
+        )
+
+    @property
+    def is_lyric(self) -> bool:
+        """[] 或 [数字] 开头的歌词行。"""
+        return self.marker is not None and (self.marker == '' or self.marker.isdecimal())
+
+
+class LysDocument:
+    """整篇 LYS 的分词结果：原文、[offset:] 偏移和逐行 LysLine。
+
+    player_template 是 build_lys_player_lines 第一次算出的播放器歌词行，之后只做拷贝。
+    """
+
+    __slots__ = ('text', 'offset', 'lines', 'player_template')
+
+    def __init__(self, text: str):
+        self.text = text
+        offset_match = LYS_OFFSET_REGEX.search(text)
+        self.offset = int(offset_match.group(1)) if offset_match else 0
+        self.lines: Tuple[LysLine, ...] = tuple(LysLine(raw) for raw in text.splitlines())
+        self.player_template: Optional[List[Dict[str, Any]]] = None
+
+
+class LysDocumentCache:
+    """LysDocument 的进程内 LRU：按文本内容缓存，文件另按 (路径, mtime_ns, size) 缓存。"""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._by_text: 'OrderedDict[str, LysDocument]' = OrderedDict()
+        self._by_path: 'OrderedDict[str, Tuple[Tuple[int, int], LysDocument]]' = OrderedDict()
+        self.parses = 0
+
+    def parse(self, text: str) -> LysDocument:
+        with self._lock:
+            doc = self._by_text.get(text)
+            if doc is not None:
+                self._by_text.move_to_end(text)
+                return doc
+        doc = LysDocument(text)
+        with self._lock:
+            self.parses += 1
+            self._by_text[text] = doc
+            while len(self._by_text) > self._max_entries:
+                self._by_text.popitem(last=False)
+        return doc
+
+    def load(self, path: Union[str, Path]) -> LysDocument:
+        """读取并解析 LYS 文件；文件未变化时直接返回缓存，不读盘。"""
+        key = str(path)
+        st = os.stat(key)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._by_path.get(key)
+            if cached is not None and cached[0] == signature:
+                self._by_path.move_to_end(key)
+                return cached[1]
+        with open(key, 'r', encoding='utf-8-sig', errors='replace') as handle:
+            doc = self.parse(handle.read())
+        with self._lock:
+            self._by_path[key] = (signature, doc)
+            while len(self._by_path) > self._max_entries:
+                self._by_path.popitem(last=False)
+        return doc
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_text.clear()
+            self._by_path.clear()
+
+
+_lys_document_cache = LysDocumentCache(LYS_DOCUMENT_CACHE_SIZE)
+
+
+def parse_lys_document(lys_content: str) -> LysDocument:
+    return _lys_document_cache.parse(lys_content or '')
+
+
+def load_lys_document(path: Union[str, Path]) -> LysDocument:
+    return _lys_document_cache.load(path)
+
+
 # ===== 快速歌词顺序编辑器：LYS文档解析与状态 =====
 QUICK_EDITOR_DOCS: Dict[str, Dict[str, Any]] = {}
 QUICK_EDITOR_UNDO: Dict[str, List[Dict[str, Any]]] = {}
@@ -5605,12 +6099,11 @@ def _extract_lyrics_windows_from_meta(
                 lyrics_path = candidate
         if not lyrics_path.exists():
             return []
-        with open(lyrics_path, 'r', encoding='utf-8-sig') as handle:
-            lys_content = handle.read()
+        lys_doc = load_lys_document(lyrics_path)
     except Exception:
         return []
 
-    lines = parse_lys(lys_content)
+    lines = build_lys_player_lines(lys_doc)
     if not lines:
         return []
 
@@ -5652,8 +6145,14 @@ def analyze_lyrics_tags(lyrics_path: str) -> Tuple[bool, bool]:
     检查歌词文件是否包含对唱或背景人声标记。
     返回 (has_duet, has_background)。
     """
+    has_duet, has_background, _ = analyze_lyrics_file(lyrics_path)
+    return has_duet, has_background
+
+
+def analyze_lyrics_file(lyrics_path: str) -> Tuple[bool, bool, Set[str]]:
+    """读取一次歌词文件，返回 (has_duet, has_background, LYS 引用的字体名集合)。"""
     if not lyrics_path or lyrics_path == '!':
-        return False, False
+        return False, False, set()
 
     real_path = resolve_resource_path(lyrics_path, 'songs')
     if not real_path.exists():
@@ -5664,7 +6163,8 @@ def analyze_lyrics_tags(lyrics_path: str) -> Tuple[bool, bool]:
 
     has_duet = '[2]' in content or '[5]' in content or 'ttm:agent="v2"' in content
     has_background = '[6]' in content or '[7]' in content or '[8]' in content or 'ttm:role="x-bg"' in content
-    return has_duet, has_background
+    fonts = extract_font_files_from_lys(content) if real_path.suffix.lower() == '.lys' else set()
+    return has_duet, has_background, fonts
 
 
 _PLACEHOLDER_AUDIO_BASENAME = '音乐.mp3'
@@ -5727,13 +6227,13 @@ def qe_parse_lys(raw_text: str) -> Dict[str, Any]:
     doc = { id, version, lines: [ {id, prefix, is_meta, tokens:[{id, ts, text}]} ] }
     """
     lines: List[Dict[str, Any]] = []
-    for raw_line in raw_text.splitlines():
-        s = raw_line.rstrip("\r\n")
+    for lys_line in parse_lys_document(raw_text).lines:
+        s = lys_line.raw
         if not s:
             lines.append({"id": qe_new_id(), "prefix": "", "is_meta": False, "tokens": []})
             continue
 
-        if re.match(r'^\[(ti|ar|al):', s, re.IGNORECASE):
+        if _LYS_QE_META_REGEX.match(s):
             lines.append({
                 "id": qe_new_id(),
                 "prefix": "",
@@ -5744,20 +6244,20 @@ def qe_parse_lys(raw_text: str) -> Dict[str, Any]:
 
         prefix = ""
         rest = s
-        m = re.match(r'^\[(\d+)\]', s)
-        if m:
-            prefix = m.group(0)
-            rest = s[m.end():]
-        elif s.startswith("[]"):
-            prefix = "[]"
-            rest = s[2:]
-
-        tokens: List[Dict[str, str]] = []
-        for tok in re.finditer(r'(.*?)[(（](\d+),(\d+)[)）]', rest):
-            text = tok.group(1)
-            start = tok.group(2)
-            dur = tok.group(3)
-            tokens.append({"id": qe_new_id(), "ts": f"{start},{dur}", "text": text})
+        parts = None
+        if lys_line.is_lyric:
+            prefix = f"[{lys_line.marker}]"
+            rest = lys_line.content
+            if '（' not in rest and '）' not in rest:
+                parts = lys_line.tokens
+        if parts is None:
+            # 快速编辑器额外接受全角括号
+            parts = _LYS_WIDE_TOKEN_REGEX.findall(rest)
+
+        tokens: List[Dict[str, str]] = [
+            {"id": qe_new_id(), "ts": f"{start},{dur}", "text": text}
+            for text, start, dur in parts
+        ]
 
         if tokens:
             lines.append({"id": qe_new_id(), "prefix": prefix, "is_meta": False, "tokens": tokens})
@@ -6209,42 +6709,53 @@ def parse_lys(lys_content):
     解析.lys格式的逐音节歌词文件，并计算每行的消失时机（disappearTime，单位毫秒）。
     返回的歌词列表将保持文件中的原始顺序。
     """
+    return build_lys_player_lines(parse_lys_document(lys_content))
+
+
+def build_lys_player_lines(doc: LysDocument) -> List[Dict[str, Any]]:
+    """由 LysDocument 生成播放器用的歌词行（每次返回新拷贝，调用方可以随意修改）。"""
+    template = doc.player_template
+    if template is None:
+        template = _build_lys_player_template(doc)
+        doc.player_template = template
+    lyrics_data = []
+    for line in template:
+        style = dict(line['style'])
+        if 'fontFamilyMap' in style:
+            style['fontFamilyMap'] = dict(style['fontFamilyMap'])
+        lyrics_data.append({
+            **line,
+            'syllables': [dict(syllable) for syllable in line['syllables']],
+            'style': style,
+        })
+
+    # 如果没有歌词数据，直接返回
+    if not lyrics_data:
+        return []
+
+    # === 统一用通用函数计算消失时机 ===
+    compute_disappear_times(lyrics_data, delta1=500, delta2=0)
+    return lyrics_data
+
+
+def _build_lys_player_template(doc: LysDocument) -> List[Dict[str, Any]]:
     lyrics_data = []
-    block_regex = re.compile(r'(.+?)\((\d+),(\d+)\)')
-    offset_regex = re.compile(r'\[offset:\s*(-?\d+)\s*\]')
+    offset = doc.offset
     last_align = 'left'
-    offset = 0
     current_font_family: Optional[str] = None
     current_font_map: Dict[str, str] = {}
 
-    # 查找并解析 offset
-    offset_match = offset_regex.search(lys_content)
-    if offset_match:
-        offset = int(offset_match.group(1))
-
-    for line in lys_content.splitlines():
-        stripped_line = line.strip()
-        font_meta_match = FONT_FAMILY_META_REGEX.match(stripped_line)
-        if font_meta_match:
-            detected_family = font_meta_match.group(1)
-            default_font, lang_map = parse_font_family_meta(detected_family or "")
-            current_font_family = default_font
-            current_font_map = lang_map or {}
+    for lys_line in doc.lines:
+        if lys_line.font_meta is not None:
+            current_font_family, current_font_map = lys_line.font_meta
+            current_font_map = current_font_map or {}
             continue
 
-        # 跳过元数据行
-        if stripped_line.startswith('[from:') or stripped_line.startswith('[id:') or stripped_line.startswith('[offset:'):
-            continue
-        
-        # 修改标记解析逻辑：允许空[]，只排除非数字的标记
-        content_match = re.match(r'\[(?P<marker>\d*)\](?P<content>.*)', line)
-        if not content_match:
-            continue
-        marker = content_match.group('marker')
-        # 新增：如果标记不是空且不是纯数字，则跳过
-        if marker != '' and not marker.isdigit():
+        # 跳过元数据行；允许空[]，只排除非数字的标记
+        if lys_line.skipped_meta or not lys_line.is_lyric:
             continue
-        content = content_match.group('content')
+        marker = lys_line.marker
+        content = lys_line.content
         is_background_marker = marker in ['6', '7', '8']
         parenthetical_background = is_parenthetical_background_line(content) if not is_background_marker else False
         is_background = is_background_marker or parenthetical_background
@@ -6264,15 +6775,18 @@ def parse_lys(lys_content):
         syllables = []
         full_line_text = ""
         detected_scripts: Set[str] = set()
-        matches = block_regex.finditer(content)
-        for match in matches:
-            text_part, start_ms, duration_ms = match.groups()
-            cleaned_text = strip_timing_tags(text_part)
-            if not parenthetical_background:
-                cleaned_text = re.sub(r'[()]', '', cleaned_text)
+        for text_part, start_ms, duration_ms in lys_line.tokens:
+            cleaned_text = text_part
+            if not parenthetical_background and ('(' in cleaned_text or ')' in cleaned_text):
+                cleaned_text = cleaned_text.replace('(', '').replace(')', '')
             if cleaned_text:
-                detected_scripts.add(detect_script(cleaned_text))
-                syllable_font = choose_font_for_text(cleaned_text, current_font_family, current_font_map)
+                # 只有配置了按语言映射的字体时才需要识别文字种类
+                syllable_font = current_font_family or None
+                if current_font_map:
+                    script = detect_script(cleaned_text)
+                    detected_scripts.add(script)
+                    if script and script in current_font_map:
+                        syllable_font = current_font_map[script] or None
                 syllables.append({
                     'text': cleaned_text,
                     'startTime': (int(start_ms) + offset) / 1000.0, # 应用 offset
@@ -6299,20 +6813,6 @@ def parse_lys(lys_content):
                 if suggested_fonts:
                     style['fontFamilySuggested'] = ','.join(sorted(suggested_fonts))
 
-            # 调试输出：展示当前行的字体选择结果，方便排查
-            try:
-                if style.get('fontFamily') or style.get('fontFamilyMap') or style.get('fontFamilySuggested'):
-                    print("[FONT_DEBUG] line=%d scripts=%s family=%s map=%s suggested=%s text=%s" % (
-                        len(lyrics_data),
-                        ','.join(sorted(s for s in detected_scripts if s)) or '-',
-                        style.get('fontFamily') or '-',
-                        style.get('fontFamilyMap') or '-',
-                        style.get('fontFamilySuggested') or '-',
-                        full_line_text[:80]
-                    ))
-            except Exception:
-                pass
-
             lyrics_data.append({
                 'line': full_line_text,
                 'rawTimedLine': content,
@@ -6322,13 +6822,6 @@ def parse_lys(lys_content):
                 'isBackground': is_background
             })
         last_align = align
-    
-    # 如果没有歌词数据，直接返回
-    if not lyrics_data:
-        return []
-
-    # === 统一用通用函数计算消失时机 ===
-    compute_disappear_times(lyrics_data, delta1=500, delta2=0)
     return lyrics_data
 
 @app.route('/')
@@ -7685,11 +8178,12 @@ def import_static_bundle():
     if not upload or not upload.filename:
         return jsonify({'status': 'error', 'message': '请上传 static.zip 文件'}), 400
 
-    file_bytes = upload.read()
-    if not file_bytes:
+    # 直接在上传的临时文件上打开 zip，不再整包读进内存
+    if upload.seek(0, os.SEEK_END) <= 0:
         return jsonify({'status': 'error', 'message': '上传文件为空'}), 400
+    upload.seek(0)
 
-    buffer = BytesIO(file_bytes)
+    buffer = upload.stream
     imported_jsons: List[str] = []
     imported_assets = 0
     renamed_files: List[str] = []
@@ -7912,6 +8406,7 @@ def update_json():
             json.dump(data['content'], f, ensure_ascii=False, indent=2)
 
         upsert_song_search_index_for_path(file_path)
+        _song_response_cache.clear()
         return jsonify({'status': 'success', 'filename': filename})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -8046,6 +8541,8 @@ def save_lyrics():
                 related_json_paths = _resolve_related_json_paths(file_path, data.get('jsonFile'))
             for jp in related_json_paths:
                 upsert_song_search_index_for_path(Path(jp))
+            # mtime 精度不够时指纹可能不变，保存后直接清空响应缓存
+            _song_response_cache.clear()
             return jsonify({'status': 'success'})
         except Exception as e:
             app.logger.error(f"保存文件失败: {file_path}, 错误: {str(e)}, 权限: {oct(file_path.parent.stat().st_mode)[-3:] if file_path.parent.exists() else 'N/A'}")
@@ -8085,13 +8582,63 @@ def _normalize_lyrics_field_to_songs_relative(field_value: str) -> Optional[str]
         return None
 
 
-def _lyrics_resource_keys_from_summary(summary: Dict[str, Any]) -> Set[str]:
-    keys: Set[str] = set()
-    for field in ('lyricsPath', 'translationPath', 'romanPath'):
+_SUMMARY_LYRICS_RESOURCE_FIELDS = (
+    ('lyrics', 'lyricsPath'),
+    ('translation', 'translationPath'),
+    ('roman', 'romanPath'),
+)
+_SUMMARY_MEDIA_RESOURCE_FIELDS = (
+    ('cover', 'albumImgSrc'),
+    ('background', 'backgroundImage'),
+    ('dynamicCover', 'dynamicCoverSrc'),
+    ('dynamicCoverPoster', 'dynamicCoverPoster'),
+)
+_FONT_FILE_EXTENSIONS = ('.ttf', '.otf', '.woff', '.woff2', '.eot')
+
+
+def _song_resource_refs_from_summary(summary: Dict[str, Any]) -> Dict[str, List[str]]:
+    """从摘要字段提取 songs/ 下的资源引用（歌词三件套、音源、封面、背景、动态封面）。"""
+    refs: Dict[str, List[str]] = {}
+    for kind, field in _SUMMARY_LYRICS_RESOURCE_FIELDS:
         rel = _normalize_lyrics_field_to_songs_relative(str(summary.get(field) or ''))
         if rel:
-            keys.add(rel)
-    return keys
+            refs[kind] = [rel]
+    audio = _normalize_song_audio_reference(str(summary.get('song') or '').strip() or None)
+    if audio:
+        refs['audio'] = [audio]
+    for kind, field in _SUMMARY_MEDIA_RESOURCE_FIELDS:
+        rel = _extract_single_song_relative(str(summary.get(field) or ''))
+        if rel:
+            refs[kind] = [rel]
+    return refs
+
+
+def _song_resource_refs_from_payload(meta: Dict[str, Any], fonts: Iterable[str]) -> Dict[str, List[str]]:
+    """摘要之外的引用：节奏曲线（meta.background_beat_curve）与 LYS 里 [font-family:] 指向的字体文件。"""
+    refs: Dict[str, List[str]] = {}
+    curve = _extract_single_song_relative(str(meta.get('background_beat_curve') or ''))
+    if curve:
+        refs['beatCurve'] = [curve]
+    font_files: List[str] = []
+    for font_name in sorted(fonts):
+        for ext in _FONT_FILE_EXTENSIONS:
+            if (SONGS_DIR / f"{font_name}{ext}").is_file():
+                font_files.append(f"{font_name}{ext}")
+                break
+    if font_files:
+        refs['font'] = font_files
+    return refs
+
+
+def _song_row_resource_refs(row: Any) -> Dict[str, List[str]]:
+    """索引行记录的资源引用；旧行没有 resources 时退回按摘要推导。"""
+    if not isinstance(row, dict):
+        return {}
+    resources = row.get('resources')
+    if isinstance(resources, dict):
+        return resources
+    summary = row.get('summary')
+    return _song_resource_refs_from_summary(summary) if isinstance(summary, dict) else {}
 
 
 def _resolve_related_json_paths(lyrics_path: Union[str, Path],
@@ -8109,7 +8656,7 @@ def _resolve_related_json_paths(lyrics_path: Union[str, Path],
 def find_related_json(lyrics_path):
     """查找引用该歌词文件的JSON文件"""
     related_jsons = []
-    static_dir = BASE_PATH / 'static'
+    static_dir = STATIC_DIR
     lyrics_path = Path(lyrics_path)
     
     # 确保歌词路径是绝对路径
@@ -8126,14 +8673,16 @@ def find_related_json(lyrics_path):
 
     lyrics_relative_key = str(lyrics_relative).replace('\\', '/')
 
-    with _song_search_index_lock:
-        if _lyrics_resource_index_initialized:
-            json_names = _lyrics_resource_index.get(lyrics_relative_key, set())
-            for json_name in json_names:
-                json_file = static_dir / json_name
-                if json_file.is_file():
-                    related_jsons.append(str(json_file.resolve()))
-            return related_jsons
+    graph_ready, json_names = _song_search_index_lock.read_optimistic(lambda: (
+        _song_resource_graph_ready,
+        _song_resource_graph.referrers(lyrics_relative_key, ('lyrics', 'translation', 'roman')),
+    ))
+    if graph_ready:
+        for json_name in sorted(json_names):
+            json_file = static_dir / json_name
+            if json_file.is_file():
+                related_jsons.append(str(json_file.resolve()))
+        return related_jsons
 
     def _field_matches(field_value: str) -> bool:
         rel = _normalize_lyrics_field_to_songs_relative(field_value)
@@ -8311,6 +8860,7 @@ def create_json():
             json.dump(data['content'], f, ensure_ascii=False, indent=2)
 
         upsert_song_search_index_for_path(file_path)
+        _song_response_cache.clear()
         return jsonify({'status': 'success', 'filename': filename})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -8401,70 +8951,118 @@ def check_lyrics():
     })
 
 
-def collect_static_json_file_paths() -> List[Path]:
-    """在 static 目录内罗列 json 文件路径，多策略容错，兼容 Windows（不读取文件内容）。"""
-
-    collected: Dict[str, Path] = {}
-
-    def add_paths(paths: Iterable[Path], label: str) -> None:
-        for p in paths:
-            try:
-                if not p.exists() or not p.is_file():
-                    continue
-                if not p.name.lower().endswith('.json'):
-                    continue
-                collected[p.name] = p
-            except OSError as exc:
-                app.logger.warning("%s 路径检查失败 %s: %s", label, p, exc)
-
-    try:
-        add_paths(STATIC_DIR.glob('*.json'), 'glob')
-    except OSError as exc:
-        app.logger.warning("glob static/*.json 失败，进入降级：%s", exc)
+# 列举 static/*.json 的外部命令兜底（find / cmd dir）只在显式开启时使用
+STATIC_LIST_SUBPROCESS_FALLBACK = os.environ.get(
+    'FAMYLIAM_STATIC_LIST_SUBPROCESS', ''
+).strip().lower() in ('1', 'true', 'yes', 'on')
+# 目录 mtime 距扫描时刻太近时不信任缓存（粗粒度时间戳的文件系统上同一刻的新增可能不改变 mtime）
+_STATIC_LISTING_RACY_WINDOW_NS = 2_000_000_000
+_static_json_listing_lock = threading.Lock()
+_static_json_listing_cache: Dict[str, Any] = {}
 
-    try:
-        with os.scandir(STATIC_DIR) as it:
-            for entry in it:
-                try:
-                    if entry.is_file() and entry.name.lower().endswith('.json'):
-                        add_paths([Path(entry.path)], 'scandir')
-                except OSError as exc:
-                    app.logger.warning("scandir 处理 %s 失败: %s", entry.name, exc)
-    except OSError as exc:
-        app.logger.warning("scandir static 失败：%s", exc)
 
+def _list_static_json_via_subprocess() -> List[Path]:
+    """显式开启时的外部命令兜底（Windows: cmd /c dir；其他: find）。"""
+    parsed: List[Path] = []
     try:
         if os.name == 'nt':
             cmd = ['cmd', '/c', 'dir', '/b', '*.json']
-            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=str(STATIC_DIR))
         else:
             cmd = ['find', '.', '-maxdepth', '1', '-type', 'f', '-name', '*.json', '-print']
-            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=str(STATIC_DIR))
-
-        if proc.stdout:
-            lines = proc.stdout.splitlines()
-            parsed: List[Path] = []
-            for line in lines:
-                name = line.strip()
-                if not name:
-                    continue
-                if os.name != 'nt' and name.startswith('./'):
-                    name = name[2:]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=str(STATIC_DIR))
+        for line in (proc.stdout or '').splitlines():
+            name = line.strip()
+            if os.name != 'nt' and name.startswith('./'):
+                name = name[2:]
+            if name:
                 parsed.append(STATIC_DIR / name)
-            add_paths(parsed, 'fallback-cmd')
-
         if proc.returncode != 0:
             app.logger.warning("fallback 命令 %s 返回码 %s, stderr=%s", cmd[0], proc.returncode, proc.stderr.strip())
     except FileNotFoundError:
         app.logger.warning("fallback 命令不可用（%s），跳过", 'cmd/dir' if os.name == 'nt' else 'find')
     except Exception as exc:
         app.logger.warning("fallback 命令列举 static/*.json 异常：%s", exc)
+    return parsed
+
+
+def scan_static_json_entries() -> Dict[str, Tuple[Path, int, int]]:
+    """单次 os.scandir 列举 static/*.json，返回 {文件名: (路径, mtime_ns, size)}（stat 取自 DirEntry）。"""
+    entries: Dict[str, Tuple[Path, int, int]] = {}
+    try:
+        with os.scandir(STATIC_DIR) as it:
+            for entry in it:
+                if not entry.name.lower().endswith('.json'):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError as exc:
+                    app.logger.warning("scandir 处理 %s 失败: %s", entry.name, exc)
+                    continue
+                entries[entry.name] = (Path(entry.path), st.st_mtime_ns, st.st_size)
+    except OSError as exc:
+        app.logger.warning("scandir static 失败，进入降级：%s", exc)
+        fallback = list(STATIC_DIR.glob('*.json'))
+        if STATIC_LIST_SUBPROCESS_FALLBACK:
+            fallback.extend(_list_static_json_via_subprocess())
+        for p in fallback:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.setdefault(p.name, (p, st.st_mtime_ns, st.st_size))
+        return entries
+    if STATIC_LIST_SUBPROCESS_FALLBACK:
+        for p in _list_static_json_via_subprocess():
+            if p.name in entries:
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries[p.name] = (p, st.st_mtime_ns, st.st_size)
+    return entries
+
+
+def collect_static_json_file_paths() -> List[Path]:
+    """罗列 static 目录内的 json 文件路径（不读取文件内容）。
 
-    return list(collected.values())
+    目录 mtime 未变（且不在时间戳粒度的竞争窗口内）时直接复用上次 scandir 的结果；
+    文件内容变化由调用方按各自的指纹判断。
+    """
+    try:
+        dir_mtime_ns = os.stat(STATIC_DIR).st_mtime_ns
+    except OSError:
+        dir_mtime_ns = None
+    key = str(STATIC_DIR)
+    with _static_json_listing_lock:
+        cached = _static_json_listing_cache
+        if (dir_mtime_ns is not None and cached.get('dir') == key
+                and cached.get('dir_mtime_ns') == dir_mtime_ns
+                and cached.get('scanned_ns', 0) - dir_mtime_ns > _STATIC_LISTING_RACY_WINDOW_NS):
+            return list(cached['paths'])
+    scanned_ns = time.time_ns()
+    paths = [entry[0] for entry in scan_static_json_entries().values()]
+    with _static_json_listing_lock:
+        _static_json_listing_cache.clear()
+        _static_json_listing_cache.update({
+            'dir': key,
+            'dir_mtime_ns': dir_mtime_ns,
+            'scanned_ns': scanned_ns,
+            'paths': paths,
+        })
+    return list(paths)
 
 
 def _build_song_summary_from_static_json(file: Path) -> Optional[Dict[str, Any]]:
     """从 static 下单个 JSON 文件构建歌曲摘要；失败返回 None。"""
+    built = _build_song_summary_and_resources(file)
+    return built[0] if built else None
+
+
+def _build_song_summary_and_resources(file: Path) -> Optional[Tuple[Dict[str, Any], Dict[str, List[str]]]]:
+    """构建摘要并顺带收集资源依赖（同一次读取 JSON 与歌词文件）；失败返回 None。"""
     try:
         raw_data = json.loads(file.read_text(encoding='utf-8'))
     except Exception as exc:
@@ -8490,11 +9088,12 @@ def _build_song_summary_from_static_json(file: Path) -> Optional[Dict[str, Any]]
         artists_list = []
 
     try:
-        has_duet, has_background = analyze_lyrics_tags(lyrics_path)
+        has_duet, has_background, fonts = analyze_lyrics_file(lyrics_path)
     except Exception as exc:
         app.logger.warning("检测歌词标签失败，已跳过标签标记 %s: %s", lyrics_path, exc)
         has_duet = False
         has_background = False
+        fonts = set()
 
     try:
         mtime_val = file.stat().st_mtime
@@ -8502,7 +9101,7 @@ def _build_song_summary_from_static_json(file: Path) -> Optional[Dict[str, Any]]
         mtime_val = 0.0
 
     song_value = str(raw_data.get('song', '')).strip()
-    return {
+    summary = {
         'filename': file.name,
         'title': meta.get('title', ''),
         'artists': artists_list,
@@ -8521,13 +9120,211 @@ def _build_song_summary_from_static_json(file: Path) -> Optional[Dict[str, Any]]
         'hasAudio': has_valid_audio(song_value),
         'mtime': mtime_val,
     }
+    resources = _song_resource_refs_from_summary(summary)
+    resources.update(_song_resource_refs_from_payload(meta, fonts))
+    return summary, resources
+
+
+class LockWaitHistogram:
+    """锁获取等待耗时直方图（毫秒分桶）；由所属锁在其内部条件变量下更新。"""
+
+    BOUNDS_MS = (0.1, 0.5, 1.0, 5.0, 10.0, 50.0, 100.0, 500.0, 1000.0)
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.contended = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, wait_ms: float, contended: bool) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS_MS, wait_ms)] += 1
+        self.count += 1
+        if contended:
+            self.contended += 1
+        self.total_ms += wait_ms
+        if wait_ms > self.max_ms:
+            self.max_ms = wait_ms
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f'<={bound:g}ms' for bound in self.BOUNDS_MS] + [f'>{self.BOUNDS_MS[-1]:g}ms']
+        return {
+            'count': self.count,
+            'contended': self.contended,
+            'totalMs': round(self.total_ms, 3),
+            'meanMs': round(self.total_ms / self.count, 4) if self.count else 0.0,
+            'maxMs': round(self.max_ms, 3),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class ReadWriteLock:
+    """写者优先的读写锁（不可重入）：`with lock:` 为独占写，`with lock.read():` 为共享读。
+
+    读 / 写两种模式分别记录获取等待耗时；after_write 在释放写锁之前调用（仍独占），
+    用于把本次写入的结果发布成只读快照。写者进出各把 _write_epoch 加一（持有期间为奇数），
+    read_optimistic 借此做 seqlock 式的无锁读。
+    """
+
+    def __init__(self, after_write: Optional[Callable[[], None]] = None) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._write_epoch = 0
+        self.after_write = after_write
+        self.read_waits = LockWaitHistogram()
+        self.write_waits = LockWaitHistogram()
+        self.optimistic_reads = 0
+        self.optimistic_retries = 0
+
+    def acquire(self) -> None:
+        start = time.perf_counter()
+        with self._cond:
+            contended = self._writer or self._readers > 0
+            if contended:
+                self._writers_waiting += 1
+                try:
+                    while self._writer or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._writers_waiting -= 1
+            self._writer = True
+            self._write_epoch += 1
+            self.write_waits.record((time.perf_counter() - start) * 1000.0, contended)
+
+    def release(self) -> None:
+        try:
+            if self.after_write is not None:
+                self.after_write()
+        finally:
+            with self._cond:
+                self._write_epoch += 1
+                self._writer = False
+                self._cond.notify_all()
+
+    def acquire_read(self) -> None:
+        start = time.perf_counter()
+        with self._cond:
+            contended = self._writer or self._writers_waiting > 0
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+            self.read_waits.record((time.perf_counter() - start) * 1000.0, contended)
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def read(self) -> '_ReadLockGuard':
+        return _ReadLockGuard(self)
+
+    def write(self) -> '_WriteLockGuard':
+        """与 `with lock:` 相同的独占写，但允许中途 downgrade() 成读锁（之后只读的落盘等慢操作不再挡读者）。"""
+        return _WriteLockGuard(self)
+
+    def downgrade(self) -> None:
+        """把持有的写锁原子地降为读锁（期间其他写者插不进来）；之后用 release_read 释放。"""
+        if self.after_write is not None:
+            self.after_write()
+        with self._cond:
+            self._write_epoch += 1
+            self._writer = False
+            self._readers += 1
+            self._cond.notify_all()
+
+    def read_optimistic(self, func: Callable[[], Any], fallback: Optional[Callable[[], Any]] = None) -> Any:
+        """不加锁直接执行只读的 func；期间有写者进出（或读到写了一半的结构而抛错）时，
+        调用 fallback（不需要锁的退路），没有 fallback 则在共享读锁下重做 func。"""
+        epoch = self._write_epoch
+        if not epoch & 1:
+            try:
+                result = func()
+            except Exception:
+                pass
+            else:
+                if self._write_epoch == epoch:
+                    self.optimistic_reads += 1
+                    return result
+        self.optimistic_retries += 1
+        if fallback is not None:
+            return fallback()
+        with self.read():
+            return func()
+
+    def __enter__(self) -> 'ReadWriteLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+    def reset_stats(self) -> None:
+        with self._cond:
+            self.read_waits = LockWaitHistogram()
+            self.write_waits = LockWaitHistogram()
+            self.optimistic_reads = 0
+            self.optimistic_retries = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'readers': self._readers,
+                'writer': self._writer,
+                'writersWaiting': self._writers_waiting,
+                'optimisticReads': self.optimistic_reads,
+                'optimisticRetries': self.optimistic_retries,
+                'read': self.read_waits.stats(),
+                'write': self.write_waits.stats(),
+            }
+
+
+class _WriteLockGuard:
+    __slots__ = ('_lock', '_downgraded')
+
+    def __init__(self, lock: ReadWriteLock) -> None:
+        self._lock = lock
+        self._downgraded = False
+
+    def __enter__(self) -> '_WriteLockGuard':
+        self._lock.acquire()
+        return self
+
+    def downgrade(self) -> None:
+        self._lock.downgrade()
+        self._downgraded = True
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._downgraded:
+            self._lock.release_read()
+        else:
+            self._lock.release()
+
+
+class _ReadLockGuard:
+    __slots__ = ('_lock',)
+
+    def __init__(self, lock: ReadWriteLock) -> None:
+        self._lock = lock
+
+    def __enter__(self) -> ReadWriteLock:
+        self._lock.acquire_read()
+        return self._lock
 
+    def __exit__(self, *exc_info: Any) -> None:
+        self._lock.release_read()
 
-_song_search_index_lock = threading.Lock()
+
+# 写者（增删改行、落盘、重建换入）用 `with _song_search_index_lock:`；每次释放写锁前把结果发布成
+# _song_search_view，列表 / 快照 / 歌手等读路径直接读快照不加锁；n-gram 候选、变更日志与资源图
+# 用 read_optimistic 乐观无锁读，只在与写者重叠时退回共享读锁
+_song_search_index_lock = ReadWriteLock(after_write=lambda: _publish_song_search_view_locked())
 _song_search_index: Dict[str, Dict[str, Any]] = {}
 _song_search_index_revision: int = 0
-_lyrics_resource_index: Dict[str, Set[str]] = {}
-_lyrics_resource_index_initialized: bool = False
+# 资源依赖图（_song_resource_graph）随索引行维护；启动加载 / 重建完成前为 False，查找需回退扫盘
+_song_resource_graph_ready: bool = False
 
 _INDEX_PERSIST_DEBOUNCE_SEC = 1.5
 _song_search_index_persist_timer: Optional[threading.Timer] = None
@@ -8535,14 +9332,16 @@ _artist_playlist_index_persist_timer: Optional[threading.Timer] = None
 _song_search_index_persist_pending = False
 _artist_playlist_index_persist_pending = False
 
-SONG_SEARCH_INDEX_VERSION = 2
+SONG_SEARCH_INDEX_VERSION = 4
+# 低于当前版本、但不低于此版本的缓存可以迁移：行先照常提供搜索，去掉指纹后由启动对账重新解析
+SONG_SEARCH_INDEX_MIN_MIGRATABLE_VERSION = 2
 
 
 def _resolve_song_search_index_file() -> Path:
     override = os.environ.get('FAMYLIAM_SONG_SEARCH_INDEX_FILE', '').strip()
     if override:
         return Path(override)
-    return BASE_PATH / '.cache' / 'song_search_index.json'
+    return BASE_PATH / '.cache' / 'song_search_index.sqlite3'
 
 
 SONG_SEARCH_INDEX_FILE = _resolve_song_search_index_file()
@@ -8563,24 +9362,407 @@ ARTIST_PLAYLIST_INDEX_FILE = _resolve_artist_playlist_index_file()
 _artist_playlist_index_revision: int = 0
 _artist_playlist_index: Dict[str, Set[str]] = {}
 _artist_playlist_file_to_keys: Dict[str, Set[str]] = {}
+# 每个歌手桶按 time / name 预排序的文件名序列（SongSearchOrderings），随桶增删同步维护
+_artist_playlist_orderings: Dict[str, 'SongSearchOrderings'] = {}
+# 歌手桶最近一次变动时的序号（_artist_playlist_change_seq），用作 /songs/artist 的 ETag 版本
+_artist_playlist_stamps: Dict[str, int] = {}
+_artist_playlist_change_seq = 0
+# 本进程的随机标识：ETag 里的进程内计数器重启后会从头开始，加上它避免与旧进程的 ETag 撞上
+_song_index_boot_id = uuid.uuid4().hex[:12]
 
+# 索引存储后端：sqlite（默认，WAL + 按行 upsert）或 json（旧的整文件格式，同时用作导出格式）
+SONG_INDEX_STORE_KINDS = ('sqlite', 'json')
 
-def _song_search_json_paths() -> List[Path]:
-    return [p for p in collect_static_json_file_paths() if p.name.lower() != 'artists.json']
 
+def _song_index_store_kind() -> str:
+    """FAMYLIAM_INDEX_STORE 优先；未设置时索引文件以 .json 结尾则沿用整文件 JSON。"""
+    kind = os.environ.get('FAMYLIAM_INDEX_STORE', '').strip().lower()
+    if kind in SONG_INDEX_STORE_KINDS:
+        return kind
+    return 'json' if SONG_SEARCH_INDEX_FILE.suffix.lower() == '.json' else 'sqlite'
 
-def _compact_search_pool(pool: str) -> str:
-    return re.sub(r'[\s,，\-_]+', '', pool or '')
 
+def _song_search_index_version_loadable(version: Any, migrate: bool) -> bool:
+    if version == SONG_SEARCH_INDEX_VERSION:
+        return True
+    return (
+        migrate
+        and isinstance(version, int)
+        and SONG_SEARCH_INDEX_MIN_MIGRATABLE_VERSION <= version < SONG_SEARCH_INDEX_VERSION
+    )
 
-def _search_tag_tokens_from_summary(summary: Dict[str, Any]) -> str:
-    """Match LyricSphere-library tag search strings (zh + en) without importing i18n."""
-    tags_zh: List[str] = []
-    tags_en: List[str] = []
-    lp = str(summary.get('lyricsPath') or '').strip()
-    has_lyrics = bool(lp and lp != '!')
-    if not has_lyrics:
-        tags_zh.extend(['纯音乐', '无歌词'])
+
+def _normalize_loaded_song_search_row(row: Any, legacy: bool) -> Optional[Dict[str, Any]]:
+    """校验一条缓存行；旧版本的行去掉指纹，由启动对账重新解析补齐新字段。"""
+    if not isinstance(row, dict) or not isinstance(row.get('summary'), dict):
+        return None
+    if 'pool' not in row or 'pool_compact' not in row:
+        return None
+    try:
+        row['mtime'] = float(row.get('mtime', 0.0))
+    except (TypeError, ValueError):
+        row['mtime'] = 0.0
+    if legacy:
+        row.pop('fp', None)
+    if not isinstance(row.get('rank'), dict):
+        # 旧缓存没有排序搜索键：由摘要现算，不必重新解析文件
+        row['rank'] = _song_search_rank_keys(row['summary'])
+    return row
+
+
+def _read_song_search_index_json(path: Path, *, migrate: bool = False) -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
+    """Return (entries map, revision) or None. Legacy files omit revision (treated as 0)."""
+    if not path.is_file():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as exc:
+        app.logger.warning('song search index: load failed %s: %s', path, exc)
+        return None
+    if not isinstance(data, dict):
+        return None
+    version = data.get('version')
+    if not _song_search_index_version_loadable(version, migrate):
+        return None
+    raw_entries = data.get('entries')
+    if not isinstance(raw_entries, dict):
+        return None
+    raw_rev = data.get('revision', 0)
+    try:
+        file_revision = int(raw_rev)
+    except (TypeError, ValueError):
+        file_revision = 0
+    legacy = version != SONG_SEARCH_INDEX_VERSION
+    out: Dict[str, Dict[str, Any]] = {}
+    for key, row in raw_entries.items():
+        if not isinstance(key, str):
+            continue
+        row = _normalize_loaded_song_search_row(row, legacy)
+        if row is not None:
+            out[key] = row
+    return out, file_revision
+
+
+def _song_search_index_json_payload(rows: Dict[str, Dict[str, Any]], revision: int) -> Dict[str, Any]:
+    return {
+        'version': SONG_SEARCH_INDEX_VERSION,
+        'revision': int(revision),
+        'updatedAt': datetime.utcnow().isoformat() + 'Z',
+        'entries': dict(rows),
+    }
+
+
+def _dump_index_json_atomic(target: Path, payload: Dict[str, Any]) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{target.stem}.', suffix='.tmp', dir=str(target.parent))
+    tmp_file = Path(tmp_path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_fp:
+            json.dump(payload, tmp_fp, ensure_ascii=False)
+        os.replace(str(tmp_file), str(target))
+    except Exception:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+
+def _artist_playlist_buckets_from_file_keys(file_to_keys: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    buckets: Dict[str, Set[str]] = {}
+    for fn, keys in file_to_keys.items():
+        for ak in keys:
+            buckets.setdefault(ak, set()).add(fn)
+    return buckets
+
+
+def _read_artist_playlist_index_json(path: Path) -> Optional[Tuple[Dict[str, Set[str]], Dict[str, Set[str]], int, int]]:
+    """Return (buckets, file_to_keys, file_artist_revision, paired_song_revision) or None."""
+    if not path.is_file():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as exc:
+        app.logger.warning('artist playlist index: load failed %s: %s', path, exc)
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get('version') != ARTIST_PLAYLIST_INDEX_VERSION:
+        return None
+    raw_buckets = data.get('buckets')
+    raw_ftk = data.get('fileToKeys')
+    if not isinstance(raw_buckets, dict) or not isinstance(raw_ftk, dict):
+        return None
+    try:
+        file_artist_rev = int(data.get('revision', 0))
+    except (TypeError, ValueError):
+        file_artist_rev = 0
+    try:
+        paired_song_rev = int(data.get('songSearchRevision', 0))
+    except (TypeError, ValueError):
+        paired_song_rev = 0
+    buckets: Dict[str, Set[str]] = {}
+    for ak, lst in raw_buckets.items():
+        if not isinstance(ak, str) or not isinstance(lst, list):
+            continue
+        good: Set[str] = set()
+        for fn in lst:
+            if isinstance(fn, str) and fn.lower().endswith('.json') and fn.lower() != 'artists.json':
+                good.add(fn)
+        if good:
+            buckets[ak] = good
+    file_to_keys: Dict[str, Set[str]] = {}
+    for fn, lst in raw_ftk.items():
+        if not isinstance(fn, str) or not isinstance(lst, list):
+            continue
+        keys = {k for k in lst if isinstance(k, str)}
+        if keys:
+            file_to_keys[fn] = keys
+    return buckets, file_to_keys, file_artist_rev, paired_song_rev
+
+
+class JsonSongIndexStore:
+    """整文件 JSON 存储（旧格式）：每次落盘重写全部行，touched 参数被忽略。
+
+    两个 *_generation 记录上次落盘时的索引 generation（None 表示下次必须整体写入），
+    由 _persist_* 维护；所有方法都在 _song_search_index_lock 内调用。
+    """
+
+    kind = 'json'
+
+    def __init__(self, song_path: Path, artist_path: Path) -> None:
+        self.song_path = song_path
+        self.artist_path = artist_path
+        self.song_generation: Optional[int] = None
+        self.artist_generation: Optional[int] = None
+
+    def load_song_index(self) -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
+        return _read_song_search_index_json(self.song_path)
+
+    def save_song_index(self, rows: Dict[str, Dict[str, Any]], revision: int,
+                        touched: Optional[Iterable[str]] = None) -> None:
+        _dump_index_json_atomic(self.song_path, _song_search_index_json_payload(rows, revision))
+
+    def load_artist_index(self) -> Optional[Tuple[Dict[str, Set[str]], Dict[str, Set[str]], int, int]]:
+        return _read_artist_playlist_index_json(self.artist_path)
+
+    def save_artist_index(self, file_to_keys: Dict[str, Set[str]], revision: int, song_revision: int,
+                          touched: Optional[Iterable[str]] = None) -> None:
+        buckets = _artist_playlist_buckets_from_file_keys(file_to_keys)
+        _dump_index_json_atomic(self.artist_path, {
+            'version': ARTIST_PLAYLIST_INDEX_VERSION,
+            'revision': int(revision),
+            'songSearchRevision': int(song_revision),
+            'updatedAt': datetime.utcnow().isoformat() + 'Z',
+            'buckets': {ak: sorted(fset) for ak, fset in buckets.items()},
+            'fileToKeys': {fn: sorted(keys) for fn, keys in file_to_keys.items()},
+        })
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteSongIndexStore(JsonSongIndexStore):
+    """SQLite（WAL）存储：每行一条记录，防抖落盘只 upsert / 删除变更过的行。
+
+    歌曲行与艺术家 fileToKeys 放在同一个库里，桶在加载时由 fileToKeys 反推。
+    库还没有数据时，自动从同目录的旧 JSON 缓存迁移（见 SONG_SEARCH_INDEX_MIN_MIGRATABLE_VERSION）。
+    """
+
+    kind = 'sqlite'
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS song_rows (fn TEXT PRIMARY KEY, row TEXT NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS artist_keys (fn TEXT PRIMARY KEY, keys TEXT NOT NULL) WITHOUT ROWID',
+    )
+
+    def __init__(self, db_path: Path, legacy_song_path: Path, legacy_artist_path: Path) -> None:
+        super().__init__(legacy_song_path, legacy_artist_path)
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._needs_full_save = False
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _meta(self, conn: sqlite3.Connection) -> Dict[str, str]:
+        return dict(conn.execute('SELECT key, value FROM meta').fetchall())
+
+    @staticmethod
+    def _meta_int(meta: Dict[str, str], key: str) -> Optional[int]:
+        try:
+            return int(meta[key])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def load_song_index(self) -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
+        try:
+            conn = self._connection()
+            meta = self._meta(conn)
+            version = self._meta_int(meta, 'version')
+            if version is None:
+                return self._migrate_from_json()
+            if not _song_search_index_version_loadable(version, True):
+                return None
+            legacy = version != SONG_SEARCH_INDEX_VERSION
+            out: Dict[str, Dict[str, Any]] = {}
+            for fn, raw in conn.execute('SELECT fn, row FROM song_rows'):
+                row = _normalize_loaded_song_search_row(json.loads(raw), legacy)
+                if row is not None:
+                    out[fn] = row
+        except (sqlite3.Error, ValueError) as exc:
+            app.logger.warning('song search index: load failed %s: %s', self.db_path, exc)
+            return None
+        self._needs_full_save = legacy
+        return out, self._meta_int(meta, 'revision') or 0
+
+    def _migrate_from_json(self) -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
+        loaded = _read_song_search_index_json(self.song_path, migrate=True)
+        if loaded is None:
+            return None
+        rows, revision = loaded
+        self.save_song_index(rows, revision)
+        app.logger.info('song search index: migrated %d rows from %s into %s', len(rows), self.song_path, self.db_path)
+        return loaded
+
+    def save_song_index(self, rows: Dict[str, Dict[str, Any]], revision: int,
+                        touched: Optional[Iterable[str]] = None) -> None:
+        if self._needs_full_save:
+            touched = None
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if touched is None:
+                conn.execute('DELETE FROM song_rows')
+                conn.executemany(
+                    'INSERT INTO song_rows (fn, row) VALUES (?, ?)',
+                    ((fn, self._encode(row)) for fn, row in rows.items()),
+                )
+            else:
+                upserts = []
+                removed = []
+                for fn in touched:
+                    row = rows.get(fn)
+                    if row is None:
+                        removed.append((fn,))
+                    else:
+                        upserts.append((fn, self._encode(row)))
+                conn.executemany('INSERT OR REPLACE INTO song_rows (fn, row) VALUES (?, ?)', upserts)
+                conn.executemany('DELETE FROM song_rows WHERE fn = ?', removed)
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (
+                ('version', str(SONG_SEARCH_INDEX_VERSION)),
+                ('revision', str(int(revision))),
+                ('updatedAt', datetime.utcnow().isoformat() + 'Z'),
+            ))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._needs_full_save = False
+
+    def load_artist_index(self) -> Optional[Tuple[Dict[str, Set[str]], Dict[str, Set[str]], int, int]]:
+        try:
+            conn = self._connection()
+            meta = self._meta(conn)
+            if self._meta_int(meta, 'artistVersion') != ARTIST_PLAYLIST_INDEX_VERSION:
+                return None
+            file_to_keys: Dict[str, Set[str]] = {}
+            for fn, raw in conn.execute('SELECT fn, keys FROM artist_keys'):
+                keys = {k for k in json.loads(raw) if isinstance(k, str)}
+                if keys:
+                    file_to_keys[fn] = keys
+        except (sqlite3.Error, ValueError, TypeError) as exc:
+            app.logger.warning('artist playlist index: load failed %s: %s', self.db_path, exc)
+            return None
+        return (
+            _artist_playlist_buckets_from_file_keys(file_to_keys),
+            file_to_keys,
+            self._meta_int(meta, 'artistRevision') or 0,
+            self._meta_int(meta, 'artistSongSearchRevision') or 0,
+        )
+
+    def save_artist_index(self, file_to_keys: Dict[str, Set[str]], revision: int, song_revision: int,
+                          touched: Optional[Iterable[str]] = None) -> None:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if touched is None:
+                conn.execute('DELETE FROM artist_keys')
+                touched = file_to_keys.keys()
+            upserts = []
+            removed = []
+            for fn in touched:
+                keys = file_to_keys.get(fn)
+                if keys:
+                    upserts.append((fn, self._encode(sorted(keys))))
+                else:
+                    removed.append((fn,))
+            conn.executemany('INSERT OR REPLACE INTO artist_keys (fn, keys) VALUES (?, ?)', upserts)
+            conn.executemany('DELETE FROM artist_keys WHERE fn = ?', removed)
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (
+                ('artistVersion', str(ARTIST_PLAYLIST_INDEX_VERSION)),
+                ('artistRevision', str(int(revision))),
+                ('artistSongSearchRevision', str(int(song_revision))),
+            ))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_song_index_stores: Dict[Tuple[str, str, str], JsonSongIndexStore] = {}
+
+
+def _song_index_store() -> JsonSongIndexStore:
+    """按当前配置返回（并缓存）索引存储。Caller must hold _song_search_index_lock."""
+    kind = _song_index_store_kind()
+    key = (kind, str(SONG_SEARCH_INDEX_FILE), str(ARTIST_PLAYLIST_INDEX_FILE))
+    store = _song_index_stores.get(key)
+    if store is None:
+        if kind == 'json':
+            store = JsonSongIndexStore(SONG_SEARCH_INDEX_FILE, ARTIST_PLAYLIST_INDEX_FILE)
+        else:
+            db_path = SONG_SEARCH_INDEX_FILE
+            if db_path.suffix.lower() == '.json':
+                db_path = db_path.with_suffix('.sqlite3')
+            store = SqliteSongIndexStore(db_path, db_path.with_suffix('.json'), ARTIST_PLAYLIST_INDEX_FILE)
+        _song_index_stores[key] = store
+    return store
+
+
+def _song_search_json_paths() -> List[Path]:
+    return [p for p in collect_static_json_file_paths() if p.name.lower() != 'artists.json']
+
+
+def _compact_search_pool(pool: str) -> str:
+    return re.sub(r'[\s,，\-_]+', '', pool or '')
+
+
+def _search_tag_tokens_from_summary(summary: Dict[str, Any]) -> str:
+    """Match LyricSphere-library tag search strings (zh + en) without importing i18n."""
+    tags_zh: List[str] = []
+    tags_en: List[str] = []
+    lp = str(summary.get('lyricsPath') or '').strip()
+    has_lyrics = bool(lp and lp != '!')
+    if not has_lyrics:
+        tags_zh.extend(['纯音乐', '无歌词'])
         tags_en.append('instrumental')
     if not summary.get('hasAudio'):
         tags_zh.append('无音源')
@@ -8610,43 +9792,1006 @@ def _search_pool_from_summary(summary: Dict[str, Any]) -> str:
     return ' '.join(p for p in parts if p)
 
 
-def _load_song_search_index_from_disk() -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
-    """Return (entries map, revision) or None to trigger a full rebuild. Legacy files omit revision (treated as 0)."""
-    path = SONG_SEARCH_INDEX_FILE
+try:
+    from pypinyin import lazy_pinyin as _lazy_pinyin
+except ImportError:  # 没装 pypinyin 时只为假名生成罗马字
+    _lazy_pinyin = None
+
+# 平假名 -> 罗马字（片假名先平移到平假名）；拗音、促音、长音在 _kana_to_romaji 里处理
+_KANA_ROMAJI = dict(zip(
+    'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん'
+    'がぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽぁぃぅぇぉゔ',
+    ('a i u e o ka ki ku ke ko sa shi su se so ta chi tsu te to na ni nu ne no '
+     'ha hi fu he ho ma mi mu me mo ya yu yo ra ri ru re ro wa wo n '
+     'ga gi gu ge go za ji zu ze zo da ji zu de do ba bi bu be bo pa pi pu pe po a i u e o vu').split(),
+))
+_KANA_SMALL_Y = {'ゃ': 'a', 'ゅ': 'u', 'ょ': 'o'}
+_HAN_RE = re.compile(r'[㐀-鿿]')
+_KANA_RE = re.compile(r'[ぁ-ゖァ-ヺ]')
+
+
+def _kana_to_romaji(text: str) -> str:
+    """平 / 片假名转 Hepburn 风格罗马字（おう 等长音不合并），其他字符原样保留。"""
+    out: List[str] = []
+    double_next = False
+    for ch in text:
+        code = ord(ch)
+        if 0x30A1 <= code <= 0x30F6:
+            ch = chr(code - 0x60)
+        if ch in ('っ',):
+            double_next = True
+            continue
+        if ch in _KANA_SMALL_Y and out and out[-1].endswith('i') and len(out[-1]) > 1:
+            prev = out.pop()
+            vowel = _KANA_SMALL_Y[ch]
+            out.append(prev[:-1] + vowel if prev in ('shi', 'chi', 'ji') else prev[:-1] + 'y' + vowel)
+            continue
+        if ch == 'ー':
+            last = out[-1] if out else ''
+            if last and last[-1] in 'aiueo':
+                out.append(last[-1])
+            continue
+        romaji = _KANA_ROMAJI.get(ch, ch)
+        if double_next and romaji[:1].isalpha() and romaji[0] not in 'aiueon':
+            romaji = ('t' if romaji.startswith('ch') else romaji[0]) + romaji
+        double_next = False
+        out.append(romaji)
+    return ''.join(out)
+
+
+def _romanize_search_text(text: str) -> str:
+    """为含汉字 / 假名的字段生成拼音 / 罗马字检索键：音节、连写、各音节起的后缀连写与首字母。
+
+    没有汉字和假名时返回空串；没装 pypinyin 时汉字原样保留。
+    """
+    if not text or not (_HAN_RE.search(text) or _KANA_RE.search(text)):
+        return ''
+    romaji = _kana_to_romaji(text)
+    if _lazy_pinyin is not None and _HAN_RE.search(romaji):
+        syllables = [part.strip().lower() for part in _lazy_pinyin(romaji) if part.strip()]
+    else:
+        syllables = [romaji.lower()]
+    words = [w for part in syllables for w in _SEARCH_RANK_WORD_RE.findall(part)]
+    if not words:
+        return ''
+    variants = list(words)
+    if len(words) > 1:
+        if len(words) <= SONG_SEARCH_ROMAN_SUFFIX_MAX:
+            variants.extend(''.join(words[i:]) for i in range(len(words) - 1))
+        else:
+            variants.append(''.join(words))
+        variants.append(''.join(w[0] for w in words))
+    return ' '.join(dict.fromkeys(variants))
+
+
+# 排序搜索的字段权重：标题 > 歌手 > 专辑 > 文件名 > 标签；拼音 / 罗马字键按原字段权重打折
+SONG_SEARCH_RANK_WEIGHTS = {'title': 10.0, 'artist': 8.0, 'album': 5.0, 'file': 3.0, 'tags': 1.0}
+SONG_SEARCH_RANK_ROMAN_FACTOR = 0.8
+SONG_SEARCH_RANK_ROMAN_FIELDS = ('title', 'artist', 'album')
+_SONG_SEARCH_FIELD_WEIGHTS = dict(SONG_SEARCH_RANK_WEIGHTS, **{
+    field + '_roman': SONG_SEARCH_RANK_WEIGHTS[field] * SONG_SEARCH_RANK_ROMAN_FACTOR
+    for field in SONG_SEARCH_RANK_ROMAN_FIELDS
+})
+# 音节数不超过该值时为每个音节起的后缀生成连写键（"jielun" 命中 "周杰伦"）
+SONG_SEARCH_ROMAN_SUFFIX_MAX = 12
+_SEARCH_RANK_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def _song_search_rank_keys(summary: Dict[str, Any]) -> Dict[str, str]:
+    """预先算好排序搜索要比对的各字段（小写），含汉字 / 假名的字段另附 '<字段>_roman' 键。"""
+    artists = summary.get('artists') or []
+    if isinstance(artists, list):
+        artist = ' / '.join(str(a).strip() for a in artists if str(a).strip())
+    else:
+        artist = str(artists).strip()
+    fields = {
+        'title': str(summary.get('title') or '').strip().lower(),
+        'artist': artist.lower(),
+        'album': str(summary.get('album') or '').strip().lower(),
+        'file': re.sub(r'\.json$', '', str(summary.get('filename') or ''), flags=re.I).lower(),
+        'tags': _search_tag_tokens_from_summary(summary),
+    }
+    for field in SONG_SEARCH_RANK_ROMAN_FIELDS:
+        roman = _romanize_search_text(fields[field])
+        if roman:
+            fields[field + '_roman'] = roman
+    return {field: text for field, text in fields.items() if text}
+
+
+SONG_SEARCH_NGRAM_INDEX_VERSION = 1
+_SONG_SEARCH_NGRAM_MAGIC = b"SSNG"
+# 最短倒排表超过文档数的该比例时，交集并不比顺序扫描便宜，直接回退全表扫描
+_SONG_SEARCH_NGRAM_DENSE_RATIO = 0.5
+
+
+def _search_ngrams_of_text(text: str) -> Set[str]:
+    """单字 + 相邻双字（不跨空白）。CJK 标题以字为单位，双字已足够区分；拉丁词同样适用。"""
+    grams: Set[str] = set()
+    for part in text.split():
+        grams.update(part)
+        grams.update(part[i:i + 2] for i in range(len(part) - 1))
+    return grams
+
+
+def _search_ngrams_of_keyword(keyword: str) -> Set[str]:
+    """子串查询所需的 gram：每段非空白文本取其双字，单字段取单字。"""
+    grams: Set[str] = set()
+    for part in keyword.split():
+        if len(part) == 1:
+            grams.add(part)
+        else:
+            grams.update(part[i:i + 2] for i in range(len(part) - 1))
+    return grams
+
+
+class SongSearchNgramIndex:
+    """/songs/search 的字符 n-gram 倒排索引（调用方持有 _song_search_index_lock）。
+
+    每个 pool 以单字 + 双字建立倒排表，查询时对关键词的 gram 求交集得到候选，
+    再由调用方按原有的子串 / 字符规则逐条校验。文档号单调递增，
+    倒排表是按文档号升序的 uint32 数组，追加即有序，删除用二分定位。
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, array.array] = {}
+        self._fn_to_doc: Dict[str, int] = {}
+        self._doc_to_fn: Dict[int, str] = {}
+        self._doc_pool: Dict[int, str] = {}
+        self._next_doc = 0
+
+    def __len__(self) -> int:
+        return len(self._fn_to_doc)
+
+    def filenames(self) -> Set[str]:
+        return set(self._fn_to_doc)
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._fn_to_doc.clear()
+        self._doc_to_fn.clear()
+        self._doc_pool.clear()
+        self._next_doc = 0
+
+    def add(self, fn: str, pool: str) -> None:
+        self.remove(fn)
+        doc = self._next_doc
+        self._next_doc += 1
+        self._fn_to_doc[fn] = doc
+        self._doc_to_fn[doc] = fn
+        self._doc_pool[doc] = pool
+        postings = self._postings
+        for gram in _search_ngrams_of_text(pool):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array.array('I')
+            posting.append(doc)
+
+    def remove(self, fn: str) -> None:
+        doc = self._fn_to_doc.pop(fn, None)
+        if doc is None:
+            return
+        self._doc_to_fn.pop(doc, None)
+        pool = self._doc_pool.pop(doc, '')
+        for gram in _search_ngrams_of_text(pool):
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            pos = bisect.bisect_left(posting, doc)
+            if pos < len(posting) and posting[pos] == doc:
+                del posting[pos]
+            if not posting:
+                del self._postings[gram]
+
+    def candidates(self, tokens: List[str], fuzzy: bool) -> Optional[List[str]]:
+        """返回可能命中的文件名；None 表示索引帮不上忙（应全表扫描）。"""
+        grams: Set[str] = set()
+        for token in tokens:
+            grams.update(token if fuzzy else _search_ngrams_of_keyword(token))
+        if not grams:
+            return None
+        lists = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        if len(lists[0]) > len(self._fn_to_doc) * _SONG_SEARCH_NGRAM_DENSE_RATIO:
+            return None
+        docs = lists[0]
+        for other in lists[1:]:
+            size = len(other)
+            kept = []
+            for doc in docs:
+                pos = bisect.bisect_left(other, doc)
+                if pos < size and other[pos] == doc:
+                    kept.append(doc)
+            docs = kept
+            if not docs:
+                return []
+        doc_to_fn = self._doc_to_fn
+        return [doc_to_fn[doc] for doc in docs]
+
+    def rebuild(self, rows: Dict[str, Dict[str, Any]]) -> None:
+        self.clear()
+        for fn, row in rows.items():
+            if isinstance(row, dict) and isinstance(row.get('pool'), str):
+                self.add(fn, row['pool'])
+
+    def to_bytes(self, song_search_revision: int) -> bytes:
+        """紧凑二进制：头部 + 文档表 + 每个 gram 的 uint32 文档号数组（小端）。"""
+        out = bytearray(_SONG_SEARCH_NGRAM_MAGIC)
+        out += struct.pack('<BQIII', SONG_SEARCH_NGRAM_INDEX_VERSION, int(song_search_revision),
+                           self._next_doc, len(self._doc_to_fn), len(self._postings))
+        for doc, fn in self._doc_to_fn.items():
+            raw = fn.encode('utf-8')
+            out += struct.pack('<IH', doc, len(raw))
+            out += raw
+        for gram, posting in self._postings.items():
+            raw = gram.encode('utf-8')
+            out += struct.pack('<BI', len(raw), len(posting))
+            out += raw
+            if sys.byteorder != 'little':
+                posting = array.array('I', posting)
+                posting.byteswap()
+            out += posting.tobytes()
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, rows: Dict[str, Dict[str, Any]]) -> Tuple['SongSearchNgramIndex', int]:
+        """解析 to_bytes 的输出；文档的 pool 取自当前行（删除时需要）。格式不符抛 ValueError。"""
+        view = memoryview(data)
+        if bytes(view[:4]) != _SONG_SEARCH_NGRAM_MAGIC:
+            raise ValueError('bad magic')
+        version, revision, next_doc, doc_count, gram_count = struct.unpack_from('<BQIII', view, 4)
+        if version != SONG_SEARCH_NGRAM_INDEX_VERSION:
+            raise ValueError(f'unsupported version {version}')
+        index = cls()
+        index._next_doc = next_doc
+        offset = 4 + struct.calcsize('<BQIII')
+        for _ in range(doc_count):
+            doc, size = struct.unpack_from('<IH', view, offset)
+            offset += 6
+            fn = bytes(view[offset:offset + size]).decode('utf-8')
+            offset += size
+            row = rows.get(fn)
+            if not isinstance(row, dict) or not isinstance(row.get('pool'), str):
+                raise ValueError(f'row missing for {fn}')
+            index._fn_to_doc[fn] = doc
+            index._doc_to_fn[doc] = fn
+            index._doc_pool[doc] = row['pool']
+        for _ in range(gram_count):
+            size, count = struct.unpack_from('<BI', view, offset)
+            offset += 5
+            gram = bytes(view[offset:offset + size]).decode('utf-8')
+            offset += size
+            posting = array.array('I')
+            posting.frombytes(view[offset:offset + count * 4])
+            if sys.byteorder != 'little':
+                posting.byteswap()
+            offset += count * 4
+            index._postings[gram] = posting
+        if offset != len(view) or len(index._fn_to_doc) != len(rows):
+            raise ValueError('truncated or stale ngram index')
+        return index, revision
+
+
+_song_search_ngram_index = SongSearchNgramIndex()
+
+
+def _song_search_ngram_index_file() -> Path:
+    return SONG_SEARCH_INDEX_FILE.with_name('song_search_ngram_index.bin')
+
+
+def _persist_song_search_ngram_index_locked() -> None:
+    """Atomic persist next to the song search index file. Caller must hold _song_search_index_lock."""
+    target = _song_search_ngram_index_file()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='song_search_ngram_index.', suffix='.tmp', dir=str(target.parent))
+    tmp_file = Path(tmp_path)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_fp:
+            tmp_fp.write(_song_search_ngram_index.to_bytes(_song_search_index_revision))
+        os.replace(str(tmp_file), str(target))
+    except Exception:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+
+def _load_song_search_ngram_index_locked(expected_revision: int) -> bool:
+    """Load the persisted ngram index if it pairs with the loaded song index revision. Caller holds lock."""
+    global _song_search_ngram_index
+    path = _song_search_ngram_index_file()
     if not path.is_file():
-        return None
+        return False
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as exc:
-        app.logger.warning('song search index: load failed %s: %s', path, exc)
-        return None
-    if not isinstance(data, dict):
+        loaded, revision = SongSearchNgramIndex.from_bytes(path.read_bytes(), _song_search_index)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError) as exc:
+        app.logger.warning('song search ngram index: load failed %s: %s', path, exc)
+        return False
+    if revision != int(expected_revision):
+        return False
+    _song_search_ngram_index = loaded
+    return True
+
+
+# 拼写容错：长度 < 4 的词不纠错，4–7 容 1 处、8 及以上容 2 处（编辑距离含相邻换位）
+SONG_SEARCH_TYPO_MIN_LEN = 4
+SONG_SEARCH_TYPO_TWO_EDITS_MIN_LEN = 8
+# 超过该长度的词不建删除变体（长文件名等），只参与前缀匹配
+SONG_SEARCH_TERM_MAX_LEN = 32
+
+
+def _search_typo_budget(word: str) -> int:
+    if len(word) >= SONG_SEARCH_TYPO_TWO_EDITS_MIN_LEN:
+        return 2
+    return 1 if len(word) >= SONG_SEARCH_TYPO_MIN_LEN else 0
+
+
+def _search_edit_distance(a: str, b: str, limit: int) -> int:
+    """带上限的编辑距离（optimal string alignment：插入 / 删除 / 替换 / 相邻换位）；超过 limit 时返回 limit + 1。"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    before: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        best = i
+        for j, cb in enumerate(b, 1):
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                value = min(value, before[j - 2] + 1)
+            cur[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return limit + 1
+        before, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+def _search_single_deletes(word: str) -> Set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class SongSearchTermIndex:
+    """排序搜索的词表：词 -> 文件名（调用方持有 _song_search_index_lock）。
+
+    词来自各行的排序搜索键（含拼音 / 罗马字键）；有序词表做前缀匹配，
+    另存每个词的单字符删除变体（SymSpell 思路），拼写容错只需查删除变体再校验编辑距离，
+    不必逐词计算。与 n-gram 索引一起在启动加载 / 全量重建时整体构建，之后随行增删维护。
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._sorted_terms: List[str] = []
+        self._deletes: Dict[str, Set[str]] = {}
+        self._fn_terms: Dict[str, Tuple[str, ...]] = {}
+        self.built = False
+
+    @staticmethod
+    def terms_of(rank: Any) -> Tuple[str, ...]:
+        if not isinstance(rank, dict):
+            return ()
+        terms: Dict[str, None] = {}
+        for text in rank.values():
+            if isinstance(text, str):
+                for word in _SEARCH_RANK_WORD_RE.findall(text):
+                    terms[word] = None
+        return tuple(terms)
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._sorted_terms.clear()
+        self._deletes.clear()
+        self._fn_terms.clear()
+        self.built = False
+
+    def build(self, rows: Dict[str, Dict[str, Any]]) -> None:
+        self.clear()
+        for fn, row in rows.items():
+            if isinstance(row, dict):
+                terms = self.terms_of(row.get('rank'))
+                self._fn_terms[fn] = terms
+                for term in terms:
+                    self._postings.setdefault(term, set()).add(fn)
+        self._sorted_terms = sorted(self._postings)
+        for term in self._sorted_terms:
+            self._index_deletes(term)
+        self.built = True
+
+    def _index_deletes(self, term: str) -> None:
+        if len(term) >= SONG_SEARCH_TYPO_MIN_LEN - 1 and len(term) <= SONG_SEARCH_TERM_MAX_LEN:
+            for variant in _search_single_deletes(term):
+                self._deletes.setdefault(variant, set()).add(term)
+
+    def _drop_term(self, term: str) -> None:
+        del self._postings[term]
+        pos = bisect.bisect_left(self._sorted_terms, term)
+        if pos < len(self._sorted_terms) and self._sorted_terms[pos] == term:
+            del self._sorted_terms[pos]
+        if len(term) >= SONG_SEARCH_TYPO_MIN_LEN - 1 and len(term) <= SONG_SEARCH_TERM_MAX_LEN:
+            for variant in _search_single_deletes(term):
+                bucket = self._deletes.get(variant)
+                if bucket is not None:
+                    bucket.discard(term)
+                    if not bucket:
+                        del self._deletes[variant]
+
+    def add(self, fn: str, rank: Any) -> None:
+        if not self.built:
+            return
+        self.remove(fn)
+        terms = self.terms_of(rank)
+        self._fn_terms[fn] = terms
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                self._postings[term] = {fn}
+                bisect.insort(self._sorted_terms, term)
+                self._index_deletes(term)
+            else:
+                posting.add(fn)
+
+    def remove(self, fn: str) -> None:
+        if not self.built:
+            return
+        for term in self._fn_terms.pop(fn, ()):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.discard(fn)
+            if not posting:
+                self._drop_term(term)
+
+    def lookup(self, word: str) -> Set[str]:
+        """以 word 为前缀、或在拼写容错范围内等于 word 的词所在的文件名。"""
+        matched: Set[str] = set()
+        terms = self._sorted_terms
+        pos = bisect.bisect_left(terms, word)
+        while pos < len(terms) and terms[pos].startswith(word):
+            matched.update(self._postings[terms[pos]])
+            pos += 1
+        budget = _search_typo_budget(word)
+        if not budget:
+            return matched
+        variants = {word} | _search_single_deletes(word)
+        if budget > 1:
+            variants.update(d for v in list(variants) for d in _search_single_deletes(v))
+        near: Set[str] = set()
+        for variant in variants:
+            if variant in self._postings:
+                near.add(variant)
+            near.update(self._deletes.get(variant, ()))
+        for term in near:
+            if _search_edit_distance(word, term, budget) <= budget:
+                matched.update(self._postings[term])
+        return matched
+
+
+_song_search_term_index = SongSearchTermIndex()
+
+
+class SongResourceGraph:
+    """歌曲 JSON 与其引用的 songs/ 资源之间的双向依赖图（调用方持有 _song_search_index_lock）。
+
+    正向：JSON 文件名 -> {种类: [songs/ 相对路径]}；反向：相对路径 -> {种类: {JSON 文件名}}。
+    随索引行增删同步维护，按资源找引用它的歌曲、按歌曲找资源都是字典查找。
+    """
+
+    KINDS = ('lyrics', 'translation', 'roman', 'audio', 'cover', 'background',
+             'dynamicCover', 'dynamicCoverPoster', 'font', 'beatCurve')
+
+    def __init__(self) -> None:
+        self._forward: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._reverse: Dict[str, Dict[str, Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._forward)
+
+    def clear(self) -> None:
+        self._forward.clear()
+        self._reverse.clear()
+
+    def set(self, fn: str, refs: Dict[str, Iterable[str]]) -> None:
+        self.remove(fn)
+        forward: Dict[str, Tuple[str, ...]] = {}
+        for kind, paths in refs.items():
+            unique = tuple(dict.fromkeys(p for p in paths if p))
+            if not unique:
+                continue
+            forward[kind] = unique
+            for rel in unique:
+                self._reverse.setdefault(rel, {}).setdefault(kind, set()).add(fn)
+        if forward:
+            self._forward[fn] = forward
+
+    def remove(self, fn: str) -> None:
+        forward = self._forward.pop(fn, None)
+        if not forward:
+            return
+        for kind, paths in forward.items():
+            for rel in paths:
+                by_kind = self._reverse.get(rel)
+                if not by_kind:
+                    continue
+                fns = by_kind.get(kind)
+                if fns is not None:
+                    fns.discard(fn)
+                    if not fns:
+                        del by_kind[kind]
+                if not by_kind:
+                    del self._reverse[rel]
+
+    def referrers(self, rel: str, kinds: Optional[Iterable[str]] = None) -> Set[str]:
+        """引用该资源的 JSON 文件名；kinds 限定引用种类（如只看 audio）。"""
+        by_kind = self._reverse.get(rel)
+        if not by_kind:
+            return set()
+        if kinds is None:
+            return set().union(*by_kind.values())
+        out: Set[str] = set()
+        for kind in kinds:
+            out.update(by_kind.get(kind, ()))
+        return out
+
+    def dependencies(self, fn: str) -> Dict[str, Tuple[str, ...]]:
+        return dict(self._forward.get(fn, {}))
+
+    def resources(self) -> Dict[str, Dict[str, Set[str]]]:
+        """相对路径 -> {种类: JSON 文件名集合}（拷贝）。"""
+        return {rel: {kind: set(fns) for kind, fns in by_kind.items()} for rel, by_kind in self._reverse.items()}
+
+
+class SongSearchOrderings:
+    """按 time / name 预排序的文件名序列（调用方持有 _song_search_index_lock）。
+
+    首次使用时整体排序一次，之后随行增删二分插入 / 删除；降序直接倒着读升序序列，
+    分页只需切片，成本与页大小成正比。
+    """
+
+    SORT_TYPES = ('time', 'name')
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, List[tuple]] = {}
+        self._fns: Dict[str, List[str]] = {}
+        self._fn_keys: Dict[str, Dict[str, tuple]] = {}
+        # 只读副本（snapshot）才有：小子集排序时从这里取摘要现算键
+        self._rows: Optional[Mapping] = None
+        self.built = False
+
+    @staticmethod
+    def sort_key(sort_type: str, fn: str, summary: Dict[str, Any]) -> tuple:
+        # 与 _sort_search_summaries_inplace 一致，末位补 fn 保证键唯一，便于二分定位
+        filename_l = str(summary.get('filename') or '').lower()
+        if sort_type == 'name':
+            return (_library_list_display_name_for_sort(summary), filename_l, fn)
+        return (float(summary.get('mtime') or 0.0), filename_l, fn)
+
+    def __len__(self) -> int:
+        return len(self._fns.get('time') or ())
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._fns.clear()
+        self._fn_keys.clear()
+        self.built = False
+
+    def build(self, rows: Dict[str, Dict[str, Any]]) -> None:
+        self.clear()
+        for sort_type in self.SORT_TYPES:
+            pairs = sorted(
+                (self.sort_key(sort_type, fn, row['summary']), fn)
+                for fn, row in rows.items()
+                if isinstance(row, dict) and isinstance(row.get('summary'), dict)
+            )
+            self._keys[sort_type] = [key for key, _ in pairs]
+            self._fns[sort_type] = [fn for _, fn in pairs]
+            self._fn_keys[sort_type] = {fn: key for key, fn in pairs}
+        self.built = True
+
+    def add(self, fn: str, summary: Any) -> None:
+        if not self.built:
+            return
+        self.remove(fn)
+        if not isinstance(summary, dict):
+            return
+        for sort_type in self.SORT_TYPES:
+            key = self.sort_key(sort_type, fn, summary)
+            keys = self._keys[sort_type]
+            pos = bisect.bisect_left(keys, key)
+            keys.insert(pos, key)
+            self._fns[sort_type].insert(pos, fn)
+            self._fn_keys[sort_type][fn] = key
+
+    def remove(self, fn: str) -> None:
+        if not self.built:
+            return
+        for sort_type in self.SORT_TYPES:
+            key = self._fn_keys[sort_type].pop(fn, None)
+            if key is None:
+                continue
+            keys = self._keys[sort_type]
+            pos = bisect.bisect_left(keys, key)
+            if pos < len(keys) and keys[pos] == key:
+                del keys[pos]
+                del self._fns[sort_type][pos]
+
+    def page(self, sort_type: str, sort_asc: bool, offset: int, limit: int) -> List[str]:
+        fns = self._fns[sort_type]
+        if sort_asc:
+            return fns[offset:offset + limit]
+        end = len(fns) - offset
+        if end <= 0:
+            return []
+        start = max(0, end - limit)
+        return fns[start:end][::-1]
+
+    def ordered(self, sort_type: str, sort_asc: bool) -> List[str]:
+        fns = self._fns[sort_type]
+        return list(fns) if sort_asc else fns[::-1]
+
+    def page_after(self, sort_type: str, sort_asc: bool, cursor_key: tuple, limit: int,
+                   rows: Mapping) -> List[str]:
+        """游标分页：按当前排序方向取排在 cursor_key 之后的 limit 个文件名（键由 rows 里的摘要现算）。
+
+        游标是上一页末项的排序键而不是偏移量，翻页期间有歌曲增删也不会重复或漏项。
+        """
+        fns = self._fns[sort_type]
+
+        def key_of(fn: str) -> tuple:
+            return self.sort_key(sort_type, fn, rows[fn]['summary'])
+
+        if sort_asc:
+            start = bisect.bisect_right(fns, cursor_key, key=key_of)
+            return fns[start:start + limit]
+        end = bisect.bisect_left(fns, cursor_key, key=key_of)
+        return fns[max(0, end - limit):end][::-1]
+
+    def snapshot(self, rows: Optional[Mapping]) -> 'SongSearchOrderings':
+        """只读副本，供发布快照使用：只复制两条文件名序列，小子集排序时按 rows 现算键；副本不可再 add / remove。
+
+        rows 为 None 时副本只能 page / page_after / ordered（歌手桶的副本不绑定某一版行，避免留住旧快照）。
+        """
+        copy_ = SongSearchOrderings()
+        for sort_type in self.SORT_TYPES:
+            copy_._fns[sort_type] = list(self._fns.get(sort_type) or ())
+        copy_._rows = rows
+        copy_.built = True
+        return copy_
+
+    def order_subset(self, subset: Set[str], sort_type: str, sort_asc: bool) -> List[str]:
+        """把一组文件名按预排序顺序排列；子集较大时顺序过滤，较小时按已存键排序。"""
+        if len(subset) * 8 >= len(self):
+            fns = [fn for fn in self._fns[sort_type] if fn in subset]
+            return fns if sort_asc else fns[::-1]
+        rows = self._rows
+        if rows is not None:
+            keyed = []
+            for fn in subset:
+                row = rows.get(fn)
+                summary = row.get('summary') if isinstance(row, dict) else None
+                if isinstance(summary, dict):
+                    keyed.append((self.sort_key(sort_type, fn, summary), fn))
+            keyed.sort(reverse=not sort_asc)
+            return [fn for _, fn in keyed]
+        fn_keys = self._fn_keys[sort_type]
+        present = [fn for fn in subset if fn in fn_keys]
+        present.sort(key=fn_keys.__getitem__, reverse=not sort_asc)
+        return present
+
+
+class LayeredSongRows(Mapping):
+    """只读的行映射：共享的 base 字典 + 之后的增改（overlay）与删除（removed）。
+
+    发布快照时只复制增量，增量超过 base 的 1/16 时再整体压平，单行写入不必每次复制整个索引。
+    """
+
+    __slots__ = ('_base', '_overlay', '_removed', '_len')
+
+    def __init__(self, base: Dict[str, Dict[str, Any]], overlay: Optional[Dict[str, Dict[str, Any]]] = None,
+                 removed: Optional[Set[str]] = None, length: Optional[int] = None) -> None:
+        self._base = base
+        self._overlay = overlay or {}
+        self._removed = removed or set()
+        self._len = len(base) if length is None else length
+
+    def __getitem__(self, fn: str) -> Dict[str, Any]:
+        row = self._overlay.get(fn)
+        if row is not None:
+            return row
+        if fn in self._removed:
+            raise KeyError(fn)
+        return self._base[fn]
+
+    def get(self, fn: str, default: Any = None) -> Any:
+        row = self._overlay.get(fn)
+        if row is not None:
+            return row
+        if fn in self._removed:
+            return default
+        return self._base.get(fn, default)
+
+    def __contains__(self, fn: object) -> bool:
+        return fn in self._overlay or (fn not in self._removed and fn in self._base)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._overlay
+        overlay, removed = self._overlay, self._removed
+        for fn in self._base:
+            if fn not in overlay and fn not in removed:
+                yield fn
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self) -> Iterable[Tuple[str, Dict[str, Any]]]:  # type: ignore[override]
+        """可迭代的 (文件名, 行)；没有增量时直接返回 base 的视图，避免逐键 __getitem__。"""
+        if not self._overlay and not self._removed:
+            return self._base.items()
+        return self._iter_items()
+
+    def _iter_items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        overlay, removed = self._overlay, self._removed
+        yield from overlay.items()
+        for fn, row in self._base.items():
+            if fn not in overlay and fn not in removed:
+                yield fn, row
+
+    def with_changes(self, live: Dict[str, Dict[str, Any]], touched: Iterable[str]) -> 'LayeredSongRows':
+        """按 live 中 touched 文件名的当前状态生成新映射；增量过大时压平成新的 base。"""
+        overlay = dict(self._overlay)
+        removed = set(self._removed)
+        for fn in touched:
+            row = live.get(fn)
+            if row is None:
+                overlay.pop(fn, None)
+                if fn in self._base:
+                    removed.add(fn)
+            else:
+                overlay[fn] = row
+                removed.discard(fn)
+        if (len(overlay) + len(removed)) * 16 > max(len(self._base), 1024):
+            return LayeredSongRows(dict(live))
+        return LayeredSongRows(self._base, overlay, removed, len(live))
+
+
+_song_search_orderings = SongSearchOrderings()
+_song_resource_graph = SongResourceGraph()
+# 行每次增删改都 +1；_song_search_index_revision 只在防抖落盘时递增，不能用来判断内存缓存是否过期
+_song_search_index_generation: int = 0
+SONG_SEARCH_QUERY_CACHE_MAX = 64
+# /songs/snapshot?since= 增量：逐行变更日志 (generation, filename)，以及 revision 落盘时对应的 generation
+SONG_SEARCH_CHANGE_LOG_MAX = 8192
+SONG_SEARCH_REVISION_HISTORY_MAX = 256
+_song_search_change_log: "deque[Tuple[int, str]]" = deque(maxlen=SONG_SEARCH_CHANGE_LOG_MAX)
+# 早于（含）该 generation 的变更可能已丢失（日志溢出或整体替换），只能回退全量
+_song_search_change_log_floor: int = 0
+_song_search_revision_generations: "OrderedDict[int, int]" = OrderedDict()
+
+
+def _touch_song_search_index_locked(fn: Optional[str] = None) -> None:
+    global _song_search_index_generation, _song_search_change_log_floor
+    _song_search_index_generation += 1
+    if fn is None:
+        _song_search_change_log.clear()
+        _song_search_change_log_floor = _song_search_index_generation
+        return
+    if len(_song_search_change_log) == _song_search_change_log.maxlen:
+        _song_search_change_log_floor = _song_search_change_log[0][0]
+    _song_search_change_log.append((_song_search_index_generation, fn))
+
+
+def _song_search_index_set_row_locked(fn: str, row: Dict[str, Any]) -> None:
+    """写入一行并同步 n-gram 索引与预排序序列。Caller must hold _song_search_index_lock."""
+    _song_search_index[fn] = row
+    _song_search_ngram_index.add(fn, row['pool'])
+    _song_search_orderings.add(fn, row.get('summary'))
+    _song_search_term_index.add(fn, row.get('rank'))
+    _song_resource_graph.set(fn, _song_row_resource_refs(row))
+    _touch_song_search_index_locked(fn)
+
+
+def _song_search_index_pop_row_locked(fn: str) -> Optional[Dict[str, Any]]:
+    """删除一行（不存在时返回 None）。Caller must hold _song_search_index_lock."""
+    row = _song_search_index.pop(fn, None)
+    _song_search_ngram_index.remove(fn)
+    _song_search_orderings.remove(fn)
+    _song_search_term_index.remove(fn)
+    _song_resource_graph.remove(fn)
+    _touch_song_search_index_locked(fn)
+    return row
+
+
+def _song_search_index_reset_locked(rows: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """整体替换所有行；n-gram 索引与词表需调用方随后加载或重建。Caller must hold _song_search_index_lock."""
+    _song_search_index.clear()
+    if rows:
+        _song_search_index.update(rows)
+    _song_search_ngram_index.clear()
+    _song_search_orderings.clear()
+    _song_search_term_index.clear()
+    _song_resource_graph.clear()
+    for fn, row in _song_search_index.items():
+        _song_resource_graph.set(fn, _song_row_resource_refs(row))
+    _touch_song_search_index_locked()
+
+
+def _record_song_search_revision_generation_locked() -> None:
+    """记下当前 revision 对应的行 generation，供 since=<revision> 定位。Caller must hold _song_search_index_lock."""
+    try:
+        rev = int(_song_search_index_revision)
+    except (TypeError, ValueError):
+        return
+    _song_search_revision_generations[rev] = _song_search_index_generation
+    _song_search_revision_generations.move_to_end(rev)
+    while len(_song_search_revision_generations) > SONG_SEARCH_REVISION_HISTORY_MAX:
+        _song_search_revision_generations.popitem(last=False)
+
+
+def _song_search_fns_touched_since_locked(generation: int) -> Optional[Dict[str, None]]:
+    """generation 之后增删改过的文件名（按最近优先去重）；日志不完整时返回 None。Caller must hold _song_search_index_lock."""
+    if generation < _song_search_change_log_floor:
         return None
-    if data.get('version') != SONG_SEARCH_INDEX_VERSION:
+    touched: Dict[str, None] = {}
+    for gen, fn in reversed(_song_search_change_log):
+        if gen <= generation:
+            break
+        touched[fn] = None
+    return touched
+
+
+def _song_search_row_changed_since_locked(fn: str, seen: Optional[Dict[str, Any]]) -> bool:
+    """变更日志已溢出时的退路：索引里 fn 的当前行与锁外读到的 seen 相比是否被别的线程换过。
+
+    行只会整体替换，同一对象必然未变；否则比较文件指纹。Caller must hold _song_search_index_lock.
+    """
+    live = _song_search_index.get(fn)
+    if live is seen:
+        return False
+    if live is None or seen is None:
+        return True
+    return live.get('fp') != seen.get('fp')
+
+
+def _song_search_changes_since_locked(revision: int) -> Optional[Tuple[List[str], List[str]]]:
+    """返回 revision 之后 (仍存在的变更行, 已删除行)；无法保证完整时返回 None。
+
+    revision 在防抖落盘时才递增，拿到该 revision 的客户端至少包含落盘那一刻的所有行，
+    所以从落盘时的 generation 之后重放即可（可能多发几行，但不会漏）。
+    Caller must hold _song_search_index_lock (a shared read lock is enough).
+    """
+    since_gen = _song_search_revision_generations.get(revision)
+    if since_gen is None:
         return None
-    raw_entries = data.get('entries')
-    if not isinstance(raw_entries, dict):
+    touched = _song_search_fns_touched_since_locked(since_gen)
+    if touched is None:
         return None
-    raw_rev = data.get('revision', 0)
-    try:
-        file_revision = int(raw_rev)
-    except (TypeError, ValueError):
-        file_revision = 0
-    out: Dict[str, Dict[str, Any]] = {}
-    for key, row in raw_entries.items():
-        if not isinstance(key, str) or not isinstance(row, dict):
-            continue
-        if not isinstance(row.get('summary'), dict):
-            continue
-        if 'pool' not in row or 'pool_compact' not in row:
-            continue
-        try:
-            row['mtime'] = float(row.get('mtime', 0.0))
-        except (TypeError, ValueError):
-            row['mtime'] = 0.0
-        out[key] = row
-    return out, file_revision
+    changed = [fn for fn in touched if fn in _song_search_index]
+    removed = [fn for fn in touched if fn not in _song_search_index]
+    return changed, removed
+
+
+class SongSearchIndexView:
+    """某一时刻曲库索引的只读快照：写者在写锁内构建后替换 _song_search_view 引用，读者无锁读取。
+
+    rows（LayeredSongRows）/ orderings / artist_buckets / artist_orderings 发布后不再修改
+    （行字典按约定只整体替换、不原地修改）；搜索结果缓存挂在快照上，行一变就随旧快照一起失效。
+    artist_stamps / artist_seq 是各歌手桶与整个歌手索引的变动序号，用于生成 ETag。
+    """
+
+    __slots__ = ('generation', 'revision', 'artist_revision', 'rows', 'orderings', 'artist_buckets',
+                 'artist_orderings', 'artist_stamps', 'artist_seq', '_query_cache', '_query_cache_lock')
+
+    def __init__(self, generation: int, revision: int, artist_revision: int,
+                 rows: LayeredSongRows, orderings: SongSearchOrderings,
+                 artist_buckets: Dict[str, frozenset],
+                 query_cache: "Optional[OrderedDict[tuple, Any]]" = None,
+                 artist_orderings: Optional[Dict[str, SongSearchOrderings]] = None,
+                 artist_stamps: Optional[Dict[str, int]] = None, artist_seq: int = 0) -> None:
+        self.generation = generation
+        self.revision = revision
+        self.artist_revision = artist_revision
+        self.rows = rows
+        self.orderings = orderings
+        self.artist_buckets = artist_buckets
+        self.artist_orderings = artist_orderings if artist_orderings is not None else {}
+        self.artist_stamps = artist_stamps if artist_stamps is not None else {}
+        self.artist_seq = artist_seq
+        self._query_cache = query_cache if query_cache is not None else OrderedDict()
+        self._query_cache_lock = threading.Lock()
+
+    def cached_query(self, key: tuple) -> Any:
+        with self._query_cache_lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+            return cached
+
+    def store_query(self, key: tuple, summaries: Any) -> None:
+        with self._query_cache_lock:
+            self._query_cache[key] = summaries
+            while len(self._query_cache) > SONG_SEARCH_QUERY_CACHE_MAX:
+                self._query_cache.popitem(last=False)
+
+    def summaries(self, fns: Iterable[str]) -> List[Dict[str, Any]]:
+        rows = self.rows
+        return [rows[fn]['summary'] for fn in fns]
+
+
+_song_search_view = SongSearchIndexView(0, 0, 0, LayeredSongRows({}), SongSearchOrderings().snapshot({}), {})
+# 自上次发布以来变动过的歌手键；None 表示歌手索引被整体替换，下次发布需全量复制
+_artist_playlist_dirty_keys: Optional[Set[str]] = None
+_song_search_view_publishes = 0
+_song_search_view_publish_ms = 0.0
+
+
+def _publish_song_search_view_locked(force: bool = False) -> None:
+    """索引有变化时重新发布只读快照；未变的部分沿用上一版。Caller must hold _song_search_index_lock (write)."""
+    global _song_search_view, _artist_playlist_dirty_keys
+    global _song_search_view_publishes, _song_search_view_publish_ms
+    current = _song_search_view
+    generation = _song_search_index_generation
+    revision = int(_song_search_index_revision)
+    artist_revision = int(_artist_playlist_index_revision)
+    dirty = _artist_playlist_dirty_keys
+    rows_changed = force or current.generation != generation
+    if not rows_changed and dirty == set() and current.revision == revision \
+            and current.artist_revision == artist_revision:
+        return
+    start = time.perf_counter()
+    if rows_changed:
+        touched = None if force else _song_search_fns_touched_since_locked(current.generation)
+        if touched is None:
+            rows = LayeredSongRows(dict(_song_search_index))
+        else:
+            rows = current.rows.with_changes(_song_search_index, touched)
+        orderings = _song_search_orderings_locked().snapshot(rows)
+        query_cache = None
+    else:
+        rows, orderings, query_cache = current.rows, current.orderings, current._query_cache
+    if force or dirty is None:
+        buckets = {ak: frozenset(fns) for ak, fns in _artist_playlist_index.items()}
+        artist_orderings = {ak: o.snapshot(None) for ak, o in _artist_playlist_orderings.items()}
+        stamps = dict(_artist_playlist_stamps)
+    elif dirty:
+        buckets = dict(current.artist_buckets)
+        artist_orderings = dict(current.artist_orderings)
+        stamps = dict(current.artist_stamps)
+        for ak in dirty:
+            live = _artist_playlist_index.get(ak)
+            if live:
+                buckets[ak] = frozenset(live)
+            else:
+                buckets.pop(ak, None)
+            live_orderings = _artist_playlist_orderings.get(ak)
+            if live_orderings is not None:
+                artist_orderings[ak] = live_orderings.snapshot(None)
+            else:
+                artist_orderings.pop(ak, None)
+            stamps[ak] = _artist_playlist_stamps.get(ak, 0)
+    else:
+        buckets = current.artist_buckets
+        artist_orderings = current.artist_orderings
+        stamps = current.artist_stamps
+    _artist_playlist_dirty_keys = set()
+    _song_search_view = SongSearchIndexView(generation, revision, artist_revision, rows, orderings, buckets,
+                                            query_cache, artist_orderings, stamps, _artist_playlist_change_seq)
+    _song_search_view_publishes += 1
+    _song_search_view_publish_ms += (time.perf_counter() - start) * 1000.0
+
+
+def _song_search_orderings_locked() -> SongSearchOrderings:
+    if not _song_search_orderings.built:
+        _song_search_orderings.build(_song_search_index)
+    return _song_search_orderings
+
+
+def _load_song_search_index_from_disk() -> Optional[Tuple[Dict[str, Dict[str, Any]], int]]:
+    """Return (entries map, revision) from the configured index store, or None to trigger a full rebuild."""
+    return _song_index_store().load_song_index()
 
 
 def _bump_song_search_index_revision_locked() -> None:
@@ -8657,34 +10802,7 @@ def _bump_song_search_index_revision_locked() -> None:
     except (TypeError, ValueError):
         cur = 0
     _song_search_index_revision = cur + 1
-
-
-def _remove_json_from_lyrics_resource_index_locked(json_fn: str,
-                                                   summary: Optional[Dict[str, Any]]) -> None:
-    if not summary:
-        return
-    for key in _lyrics_resource_keys_from_summary(summary):
-        refs = _lyrics_resource_index.get(key)
-        if not refs:
-            continue
-        refs.discard(json_fn)
-        if not refs:
-            _lyrics_resource_index.pop(key, None)
-
-
-def _add_json_to_lyrics_resource_index_locked(json_fn: str, summary: Dict[str, Any]) -> None:
-    for key in _lyrics_resource_keys_from_summary(summary):
-        _lyrics_resource_index.setdefault(key, set()).add(json_fn)
-
-
-def _rebuild_lyrics_resource_index_from_song_index_locked() -> None:
-    global _lyrics_resource_index_initialized
-    _lyrics_resource_index.clear()
-    for fn, row in _song_search_index.items():
-        summ = row.get('summary') if isinstance(row, dict) else None
-        if isinstance(summ, dict):
-            _add_json_to_lyrics_resource_index_locked(fn, summ)
-    _lyrics_resource_index_initialized = True
+    _record_song_search_revision_generation_locked()
 
 
 def _schedule_persist_song_search_index_locked() -> None:
@@ -8709,125 +10827,298 @@ def _schedule_persist_artist_playlist_index_locked() -> None:
     timer.start()
 
 
+# 串行化降级为读锁后的防抖落盘（多个读锁持有者不能同时使用同一个存储连接）；须先于索引锁获取
+_song_search_persist_lock = threading.Lock()
+
+
 def _flush_pending_song_search_index_persist() -> None:
     global _song_search_index_persist_timer, _song_search_index_persist_pending
-    with _song_search_index_lock:
+    with _song_search_persist_lock, _song_search_index_lock.write() as guard:
         _song_search_index_persist_timer = None
         if not _song_search_index_persist_pending:
             return
-        _persist_song_search_index()
+        _bump_song_search_index_revision_locked()
         _song_search_index_persist_pending = False
+        # 写盘只读索引：降为读锁，落盘期间读路径与搜索的乐观读不受影响
+        guard.downgrade()
+        try:
+            _write_song_search_index_locked()
+        except Exception:
+            _song_search_index_persist_pending = True
+            raise
 
 
 def _flush_pending_artist_playlist_index_persist() -> None:
     global _artist_playlist_index_persist_timer, _artist_playlist_index_persist_pending
-    with _song_search_index_lock:
+    with _song_search_persist_lock, _song_search_index_lock.write() as guard:
         _artist_playlist_index_persist_timer = None
         if not _artist_playlist_index_persist_pending:
             return
-        _persist_artist_playlist_index_locked()
+        _bump_artist_playlist_index_revision_locked()
         _artist_playlist_index_persist_pending = False
+        guard.downgrade()
+        try:
+            _write_artist_playlist_index_locked()
+        except Exception:
+            _artist_playlist_index_persist_pending = True
+            raise
 
 
 def flush_pending_index_persists() -> None:
     """Flush debounced index writes (e.g. on process exit)."""
     global _song_search_index_persist_timer, _artist_playlist_index_persist_timer
     global _song_search_index_persist_pending, _artist_playlist_index_persist_pending
-    with _song_search_index_lock:
+    with _song_search_persist_lock, _song_search_index_lock.write() as guard:
         for timer in (_song_search_index_persist_timer, _artist_playlist_index_persist_timer):
             if timer is not None:
                 timer.cancel()
         _song_search_index_persist_timer = None
         _artist_playlist_index_persist_timer = None
-        if _song_search_index_persist_pending:
-            _persist_song_search_index()
-            _song_search_index_persist_pending = False
-        if _artist_playlist_index_persist_pending:
-            _persist_artist_playlist_index_locked()
-            _artist_playlist_index_persist_pending = False
+        song_pending = _song_search_index_persist_pending
+        artist_pending = _artist_playlist_index_persist_pending
+        if song_pending:
+            _bump_song_search_index_revision_locked()
+        if artist_pending:
+            _bump_artist_playlist_index_revision_locked()
+        _song_search_index_persist_pending = False
+        _artist_playlist_index_persist_pending = False
+        guard.downgrade()
+        if song_pending:
+            _write_song_search_index_locked()
+        if artist_pending:
+            _write_artist_playlist_index_locked()
+
+
+atexit.register(flush_pending_index_persists)
+
 
+def _persist_song_search_index() -> None:
+    """Bump the revision and persist via the index store. Caller must hold _song_search_index_lock."""
+    _bump_song_search_index_revision_locked()
+    _write_song_search_index_locked()
+
+
+def _write_song_search_index_locked() -> None:
+    """Write rows (SQLite: only those touched since its last save) and the ngram sidecar.
+
+    Only reads the index, so a shared read lock is enough; callers holding just a read lock
+    must also hold _song_search_persist_lock.
+    """
+    store = _song_index_store()
+    touched = None
+    if store.song_generation is not None:
+        touched = _song_search_fns_touched_since_locked(store.song_generation)
+    store.save_song_index(_song_search_index, int(_song_search_index_revision), touched)
+    store.song_generation = _song_search_index_generation
+    _persist_song_search_ngram_index_locked()
+
+
+def export_song_search_index_json(target: Optional[Path] = None) -> Dict[str, Any]:
+    """按旧的整文件 JSON 格式导出当前索引；给出 target 时原子写入该文件。"""
+    view = _song_search_view
+    payload = _song_search_index_json_payload(view.rows, view.revision)
+    if target is not None:
+        _dump_index_json_atomic(Path(target), payload)
+    return payload
+
+
+# 重建 / 对账时并行生成摘要的线程数（读 JSON、歌词文件与 stat 音频，主要是 I/O）
+SONG_SEARCH_REBUILD_WORKERS = max(
+    1,
+    coerce_int(os.environ.get('FAMYLIAM_INDEX_REBUILD_WORKERS'), min(8, (os.cpu_count() or 1) + 2)) or 1,
+)
+# 串行化整库重建与磁盘对账（两者都在锁外计算、锁内换入）
+_song_search_rebuild_lock = threading.Lock()
+
+
+def _file_fingerprint(path: Optional[Union[str, Path]]) -> Optional[List[int]]:
+    """(mtime_ns, size)；路径为空或文件不存在时返回 None。"""
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _song_audio_local_path(song_value: str) -> Optional[Path]:
+    """与 has_valid_audio 相同的解析规则，返回本地音源路径；外链或占位符返回 None。"""
+    trimmed = (song_value or '').strip()
+    if not trimmed or trimmed == '!' or _is_placeholder_song_audio(trimmed):
+        return None
+    relative = _extract_single_song_relative(trimmed)
+    if not relative:
+        relative = _extract_media_audio_file_param(trimmed)
+    if relative:
+        return SONGS_DIR / relative
+    try:
+        if urlparse(trimmed).scheme in ('http', 'https'):
+            return None
+        return resolve_resource_path(trimmed, 'songs')
+    except Exception:
+        return None
 
-atexit.register(flush_pending_index_persists)
 
+def _song_summary_dependency_fingerprints(summary: Dict[str, Any]) -> Dict[str, Optional[List[Any]]]:
+    """摘要依赖的歌词文件（对唱 / 背景人声标记）与音源文件（hasAudio）：[解析后路径, mtime_ns, size]。
 
-def _persist_song_search_index() -> None:
-    """Serialize index to disk atomically. Caller must hold _song_search_index_lock."""
-    cache_dir = SONG_SEARCH_INDEX_FILE.parent
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    _bump_song_search_index_revision_locked()
-    payload = {
-        'version': SONG_SEARCH_INDEX_VERSION,
-        'revision': int(_song_search_index_revision),
-        'updatedAt': datetime.utcnow().isoformat() + 'Z',
-        'entries': dict(_song_search_index),
-    }
-    fd, tmp_path = tempfile.mkstemp(prefix='song_search_index.', suffix='.tmp', dir=str(cache_dir))
-    tmp_file = Path(tmp_path)
-    try:
-        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_fp:
-            json.dump(payload, tmp_fp, ensure_ascii=False)
-        os.replace(str(tmp_file), str(SONG_SEARCH_INDEX_FILE))
-    except Exception:
-        tmp_file.unlink(missing_ok=True)
-        raise
+    记下解析后的路径，复核时只需 stat，不必重复解析资源路径；非本地引用记为 None。
+    """
+    lyrics_path: Optional[Path] = None
+    lp = str(summary.get('lyricsPath') or '').strip()
+    if lp and lp != '!':
+        try:
+            lyrics_path = resolve_resource_path(lp, 'songs')
+        except Exception:
+            lyrics_path = None
+    deps: Dict[str, Optional[List[Any]]] = {}
+    for key, dep_path in (('lyrics', lyrics_path),
+                          ('audio', _song_audio_local_path(str(summary.get('song') or '')))):
+        if dep_path is None:
+            deps[key] = None
+        else:
+            deps[key] = [str(dep_path)] + (_file_fingerprint(dep_path) or [None, None])
+    return deps
 
 
-def _apply_single_path_to_index_locked(path: Path, *, skip_artist_reconcile: bool = False) -> None:
-    fn = path.name
-    old_row = _song_search_index.get(fn)
-    old_summary = old_row.get('summary') if isinstance(old_row, dict) else None
-    if old_summary:
-        _remove_json_from_lyrics_resource_index_locked(fn, old_summary)
-    if fn.lower() == 'artists.json':
-        _song_search_index.pop(fn, None)
-        if not skip_artist_reconcile:
-            _artist_index_reconcile_file_locked(fn, old_summary, None)
-        return
+def _build_song_search_row(path: Path) -> Optional[Dict[str, Any]]:
+    """读盘生成一行索引（不碰全局状态，可在锁外 / 工作线程调用）；文件不可用时返回 None。"""
     try:
-        mtime = float(path.stat().st_mtime)
+        st = path.stat()
     except OSError as exc:
         app.logger.warning('song search index: stat failed %s: %s', path, exc)
-        _song_search_index.pop(fn, None)
-        if not skip_artist_reconcile:
-            _artist_index_reconcile_file_locked(fn, old_summary, None)
-        return
-    built = _build_song_summary_from_static_json(path)
-    if not built:
-        _song_search_index.pop(fn, None)
-        if not skip_artist_reconcile:
-            _artist_index_reconcile_file_locked(fn, old_summary, None)
-        return
+        return None
+    built_pair = _build_song_summary_and_resources(path)
+    if not built_pair:
+        return None
+    built, resources = built_pair
     pool = _search_pool_from_summary(built)
-    _song_search_index[fn] = {
-        'mtime': mtime,
+    fingerprint = {'json': [st.st_mtime_ns, st.st_size]}
+    fingerprint.update(_song_summary_dependency_fingerprints(built))
+    return {
+        'mtime': float(st.st_mtime),
         'summary': built,
         'pool': pool,
         'pool_compact': _compact_search_pool(pool),
+        'rank': _song_search_rank_keys(built),
+        'fp': fingerprint,
+        'resources': resources,
     }
-    _add_json_to_lyrics_resource_index_locked(fn, built)
-    new_row = _song_search_index.get(fn)
-    new_summary = new_row.get('summary') if isinstance(new_row, dict) else None
+
+
+def _song_search_row_is_fresh(path: Path, row: Any) -> bool:
+    """JSON 及其歌词 / 音源指纹均未变化时可直接复用旧行（旧版缓存没有 fp，视为过期）。"""
+    if not isinstance(row, dict) or not isinstance(row.get('summary'), dict):
+        return False
+    fingerprint = row.get('fp')
+    if not isinstance(fingerprint, dict) or 'json' not in fingerprint:
+        return False
+    if fingerprint['json'] != _file_fingerprint(path):
+        return False
+    for key in ('lyrics', 'audio'):
+        dep = fingerprint.get(key)
+        if dep is None:
+            continue
+        if not isinstance(dep, list) or len(dep) != 3:
+            return False
+        if (_file_fingerprint(dep[0]) or [None, None]) != dep[1:]:
+            return False
+    return True
+
+
+def _build_song_search_rows(paths: List[Path]) -> List[Optional[Dict[str, Any]]]:
+    """在线程池里并行构建多行，结果与 paths 一一对应。"""
+    if not paths:
+        return []
+    workers = min(SONG_SEARCH_REBUILD_WORKERS, len(paths))
+    if workers <= 1:
+        return [_build_song_search_row(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='song-index') as executor:
+        return list(executor.map(_build_song_search_row, paths))
+
+
+def _collect_song_search_rows(paths: List[Path],
+                              previous: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """锁外按指纹复用未变化的行、并行重建其余行。返回 (filename -> row, 重新解析的数量)。"""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(paths)
+    stale: List[int] = []
+    for pos, path in enumerate(paths):
+        prev = previous.get(path.name)
+        if _song_search_row_is_fresh(path, prev):
+            results[pos] = prev
+        else:
+            stale.append(pos)
+    for pos, row in zip(stale, _build_song_search_rows([paths[pos] for pos in stale])):
+        results[pos] = row
+    rows: Dict[str, Dict[str, Any]] = {}
+    for path, row in zip(paths, results):
+        if row is not None:
+            rows[path.name] = row
+    return rows, len(stale)
+
+
+def _install_song_search_row_locked(fn: str, row: Optional[Dict[str, Any]], *,
+                                    skip_artist_reconcile: bool = False) -> None:
+    """换入（row 为 None 时删除）一行，并同步歌手索引。Caller must hold _song_search_index_lock."""
+    old_row = _song_search_index.get(fn)
+    old_summary = old_row.get('summary') if isinstance(old_row, dict) else None
+    if row is None or fn.lower() == 'artists.json':
+        _song_search_index_pop_row_locked(fn)
+        if not skip_artist_reconcile:
+            _artist_index_reconcile_file_locked(fn, old_summary, None)
+        return
+    _song_search_index_set_row_locked(fn, row)
     if not skip_artist_reconcile:
-        _artist_index_reconcile_file_locked(fn, old_summary, new_summary)
+        _artist_index_reconcile_file_locked(fn, old_summary, row['summary'])
 
 
-def _rebuild_song_search_index_full_locked() -> None:
-    global _lyrics_resource_index_initialized
-    _song_search_index.clear()
-    _artist_playlist_index.clear()
-    _artist_playlist_file_to_keys.clear()
-    _lyrics_resource_index.clear()
-    for path in _song_search_json_paths():
-        _apply_single_path_to_index_locked(path, skip_artist_reconcile=True)
+def _apply_single_path_to_index_locked(path: Path, *, skip_artist_reconcile: bool = False) -> None:
+    row = None if path.name.lower() == 'artists.json' else _build_song_search_row(path)
+    _install_song_search_row_locked(path.name, row, skip_artist_reconcile=skip_artist_reconcile)
+
+
+def _replace_song_search_rows_locked(rows: Dict[str, Dict[str, Any]]) -> None:
+    """整体换入新行并重建派生索引、落盘。Caller must hold _song_search_index_lock."""
+    global _song_resource_graph_ready
+    _song_search_index_reset_locked(rows)
+    _song_search_ngram_index.rebuild(_song_search_index)
+    _song_search_term_index.build(_song_search_index)
     _rebuild_artist_playlist_from_song_index_locked()
-    _lyrics_resource_index_initialized = True
+    _song_resource_graph_ready = True
     _persist_song_search_index()
     _persist_artist_playlist_index_locked()
 
 
-def rebuild_song_search_index_full() -> None:
-    with _song_search_index_lock:
-        _rebuild_song_search_index_full_locked()
+def rebuild_song_search_index_full(force: bool = False) -> int:
+    """锁外并行构建全部行后原子换入；force=False 时指纹未变的行直接复用。返回重新解析的数量。
+
+    构建期间其他线程对单行的增删改（upsert / remove）以索引里的最新行为准，不会被本次结果覆盖。
+    """
+    with _song_search_rebuild_lock:
+        for attempt in range(2):
+            view = _song_search_view
+            previous = {} if force else view.rows
+            generation = view.generation
+            rows, parsed = _collect_song_search_rows(_song_search_json_paths(), previous)
+            with _song_search_index_lock:
+                touched = _song_search_fns_touched_since_locked(generation)
+                if touched is None and attempt == 0:
+                    continue
+                if touched is None:
+                    # 变更日志不完整（“未知”而不是“没有变更”）：逐行与开始时的快照比对
+                    touched = {fn: None for fn in set(view.rows) | set(_song_search_index)
+                               if _song_search_row_changed_since_locked(fn, view.rows.get(fn))}
+                for fn in touched:
+                    live = _song_search_index.get(fn)
+                    if live is not None:
+                        rows[fn] = live
+                    else:
+                        rows.pop(fn, None)
+                _replace_song_search_rows_locked(rows)
+            app.logger.info('song search index: rebuilt %d rows (%d parsed)', len(rows), parsed)
+            return parsed
+    return 0
 
 
 def upsert_song_search_index_for_path(path: Path) -> None:
@@ -8839,17 +11130,18 @@ def upsert_song_search_index_for_path(path: Path) -> None:
         path.relative_to(STATIC_DIR.resolve())
     except ValueError:
         return
+    # 读盘解析放在锁外；换入前若文件又被改写（指纹不一致），在锁内按最新内容重建
+    row = _build_song_search_row(path) if path.is_file() else None
     with _song_search_index_lock:
         if not path.is_file():
-            old_row = _song_search_index.get(path.name)
-            old_summary = old_row.get('summary') if isinstance(old_row, dict) else None
-            if _song_search_index.pop(path.name, None) is not None:
-                _remove_json_from_lyrics_resource_index_locked(path.name, old_summary)
+            if _song_search_index_pop_row_locked(path.name) is not None:
                 _artist_index_remove_file_locked(path.name)
                 _schedule_persist_song_search_index_locked()
                 _schedule_persist_artist_playlist_index_locked()
             return
-        _apply_single_path_to_index_locked(path)
+        if row is None or row['fp'].get('json') != _file_fingerprint(path):
+            row = _build_song_search_row(path)
+        _install_song_search_row_locked(path.name, row)
         _schedule_persist_song_search_index_locked()
         _schedule_persist_artist_playlist_index_locked()
 
@@ -8858,48 +11150,184 @@ def remove_song_search_index_entry(filename: str) -> None:
     """Remove index row by JSON basename (e.g. foo.json)."""
     key = Path(str(filename)).name
     with _song_search_index_lock:
-        old_row = _song_search_index.get(key)
-        old_summary = old_row.get('summary') if isinstance(old_row, dict) else None
-        if _song_search_index.pop(key, None) is None:
+        if _song_search_index_pop_row_locked(key) is None:
             return
-        _remove_json_from_lyrics_resource_index_locked(key, old_summary)
         _artist_index_remove_file_locked(key)
         _schedule_persist_song_search_index_locked()
         _schedule_persist_artist_playlist_index_locked()
 
 
-def _sync_song_search_index_with_disk_locked() -> bool:
-    """Prune stale keys and refresh rows whose mtime is newer than cached. Caller holds lock."""
-    changed = False
-    paths = _song_search_json_paths()
-    valid = {p.name for p in paths}
-    for fn in list(_song_search_index.keys()):
-        if fn not in valid:
-            old_row = _song_search_index.get(fn)
-            old_summary = old_row.get('summary') if isinstance(old_row, dict) else None
-            _remove_json_from_lyrics_resource_index_locked(fn, old_summary)
-            _artist_index_remove_file_locked(fn)
-            del _song_search_index[fn]
-            changed = True
-    for path in paths:
-        fn = path.name
-        try:
-            mtime = float(path.stat().st_mtime)
-        except OSError as exc:
-            app.logger.warning('song search index: stat failed %s: %s', path, exc)
-            continue
-        cached = _song_search_index.get(fn)
-        if cached and float(cached.get('mtime', 0.0)) >= mtime:
-            continue
-        _apply_single_path_to_index_locked(path)
-        changed = True
+def sync_song_search_index_with_disk() -> bool:
+    """Prune stale keys and re-parse rows whose JSON / lyrics / audio fingerprint changed.
+
+    Fingerprints are checked and changed rows are built outside _song_search_index_lock; rows that
+    another thread upserted or removed meanwhile are left alone. Returns True if anything changed.
+    """
+    with _song_search_rebuild_lock:
+        view = _song_search_view
+        previous = view.rows
+        generation = view.generation
+        paths = _song_search_json_paths()
+        valid = {p.name for p in paths}
+        stale = [p for p in paths if not _song_search_row_is_fresh(p, previous.get(p.name))]
+        built = _build_song_search_rows(stale)
+        with _song_search_index_lock:
+            touched = _song_search_fns_touched_since_locked(generation)
+            if touched is None:
+                # 变更日志不完整（“未知”而不是“没有变更”）：逐行与开始时的快照比对，不覆盖别的线程的改动
+                touched = {fn: None for fn in set(previous) | valid
+                           if _song_search_row_changed_since_locked(fn, previous.get(fn))}
+            changed = False
+            for fn in previous:
+                if fn in valid or fn in touched or fn not in _song_search_index:
+                    continue
+                _artist_index_remove_file_locked(fn)
+                _song_search_index_pop_row_locked(fn)
+                changed = True
+            for path, row in zip(stale, built):
+                if path.name in touched:
+                    continue
+                if row is None and path.name not in _song_search_index:
+                    continue
+                _install_song_search_row_locked(path.name, row)
+                changed = True
+    if stale:
+        app.logger.info('song search index: re-parsed %d of %d rows', len(stale), len(paths))
     return changed
 
 
+try:
+    from watchdog.observers import Observer as _WatchdogObserver
+except ImportError:  # 没装 watchdog 时 inotify 模式退化为轮询
+    _WatchdogObserver = None
+
+# static/*.json 变更监听：off（默认）| poll | inotify（需要 watchdog）
+LIBRARY_WATCH_MODE = os.environ.get('FAMYLIAM_LIBRARY_WATCH', 'off').strip().lower() or 'off'
+LIBRARY_WATCH_INTERVAL = max(0.2, float(os.environ.get('FAMYLIAM_LIBRARY_WATCH_INTERVAL', '2') or 2))
+_LIBRARY_WATCH_EVENT_DEBOUNCE = 0.3
+
+
+class StaticLibraryWatcher:
+    """监听 static/*.json 的增删改并逐行刷新索引，避免整库对账。
+
+    poll 模式每隔 interval 做一次 scandir，比较 (mtime_ns, size)；inotify 模式由 watchdog 推送事件，
+    去抖后只处理涉及的文件名。只跟踪 JSON 本身，歌词 / 音源文件的变化仍由启动对账或重建的指纹发现。
+    """
+
+    def __init__(self, mode: str = 'poll', interval: float = LIBRARY_WATCH_INTERVAL):
+        if mode == 'inotify' and _WatchdogObserver is None:
+            app.logger.warning('library watcher: watchdog 未安装，inotify 模式改用轮询')
+            mode = 'poll'
+        self.mode = mode
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer: Any = None
+        self._pending: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+
+    def start(self) -> None:
+        self._snapshot = self._scan()
+        if self.mode == 'inotify':
+            self._observer = _WatchdogObserver()
+            self._observer.schedule(self, str(STATIC_DIR), recursive=False)
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, name='Library-Watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def dispatch(self, event: Any) -> None:
+        """watchdog 事件回调（在 observer 线程里执行，只登记文件名）。"""
+        if getattr(event, 'is_directory', False):
+            return
+        names = set()
+        for attr in ('src_path', 'dest_path'):
+            raw = getattr(event, attr, None)
+            if raw:
+                name = os.path.basename(os.fsdecode(raw))
+                if name.lower().endswith('.json'):
+                    names.add(name)
+        if names:
+            with self._pending_lock:
+                self._pending.update(names)
+
+    @staticmethod
+    def _scan() -> Dict[str, Tuple[int, int]]:
+        return {name: (mtime_ns, size) for name, (_, mtime_ns, size) in scan_static_json_entries().items()}
+
+    def poll_once(self) -> Tuple[int, int]:
+        """比较两次 scandir 的结果并刷新变化的行，返回 (刷新数, 删除数)。"""
+        current = self._scan()
+        previous = self._snapshot
+        self._snapshot = current
+        changed = [name for name, stamp in current.items() if previous.get(name) != stamp]
+        removed = [name for name in previous if name not in current]
+        return self._apply(changed, removed)
+
+    def flush_pending(self) -> Tuple[int, int]:
+        with self._pending_lock:
+            names, self._pending = self._pending, set()
+        changed = [name for name in names if (STATIC_DIR / name).is_file()]
+        removed = [name for name in names if name not in changed]
+        return self._apply(changed, removed)
+
+    @staticmethod
+    def _apply(changed: List[str], removed: List[str]) -> Tuple[int, int]:
+        refreshed = 0
+        for name in changed:
+            path = STATIC_DIR / name
+            row = _song_search_view.rows.get(name)
+            # 应用自己保存时已 upsert 过，指纹一致就不再重复解析
+            if _song_search_row_is_fresh(path, row):
+                continue
+            upsert_song_search_index_for_path(path)
+            refreshed += 1
+        for name in removed:
+            remove_song_search_index_entry(name)
+        if refreshed or removed:
+            app.logger.info('library watcher: refreshed %d, removed %d', refreshed, len(removed))
+        return refreshed, len(removed)
+
+    def _run(self) -> None:
+        wait = self.interval if self.mode == 'poll' else _LIBRARY_WATCH_EVENT_DEBOUNCE
+        while not self._stop.wait(wait):
+            try:
+                if self.mode == 'poll':
+                    self.poll_once()
+                else:
+                    self.flush_pending()
+            except Exception:
+                app.logger.exception('library watcher: refresh failed')
+
+
+_static_library_watcher: Optional[StaticLibraryWatcher] = None
+
+
+def start_static_library_watcher_once() -> Optional[StaticLibraryWatcher]:
+    global _static_library_watcher
+    if LIBRARY_WATCH_MODE not in ('poll', 'inotify') or not _song_search_index_should_initialize():
+        return None
+    if _static_library_watcher is None:
+        _static_library_watcher = StaticLibraryWatcher(LIBRARY_WATCH_MODE)
+        _static_library_watcher.start()
+    return _static_library_watcher
+
+
 def _song_search_index_should_initialize() -> bool:
     # Allow unit tests to import backend without loading/rebuilding search indexes.
     if os.environ.get('FAMYLIAM_SKIP_INDEX_INIT', '').strip().lower() in ('1', 'true', 'yes'):
         return False
+    # Conversion pool workers are spawned and re-import this module (a frozen exe re-runs it with
+    # --multiprocessing-fork); they only run converters.
+    if getattr(multiprocessing.current_process(), '_inheriting', False) or multiprocessing.spawn.is_forking(sys.argv):
+        return False
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
         return True
     if not getattr(app, 'debug', False):
@@ -8909,7 +11337,7 @@ def _song_search_index_should_initialize() -> bool:
 
 def init_song_search_index_on_startup() -> None:
     """Load persisted index or rebuild. Skips werkzeug reloader parent (mirrors start_ws_server_once)."""
-    global _song_search_index_revision
+    global _song_search_index_revision, _song_resource_graph_ready
     if not _song_search_index_should_initialize():
         return
     try:
@@ -8918,14 +11346,20 @@ def init_song_search_index_on_startup() -> None:
             if loaded is not None:
                 entries_map, file_revision = loaded
                 _song_search_index_revision = file_revision
-                _song_search_index.clear()
-                _song_search_index.update(entries_map)
-                _rebuild_lyrics_resource_index_from_song_index_locked()
-                if _sync_song_search_index_with_disk_locked():
-                    _persist_song_search_index()
-                    _persist_artist_playlist_index_locked()
-            else:
-                _rebuild_song_search_index_full_locked()
+                _song_search_index_reset_locked(entries_map)
+                _record_song_search_revision_generation_locked()
+                _song_index_store().song_generation = _song_search_index_generation
+                if not _load_song_search_ngram_index_locked(file_revision):
+                    _song_search_ngram_index.rebuild(_song_search_index)
+                _song_search_term_index.build(_song_search_index)
+                _song_resource_graph_ready = True
+        # 对账 / 重建都在锁外解析，启动期间搜索请求可以继续使用已加载的行
+        if loaded is None:
+            rebuild_song_search_index_full()
+        elif sync_song_search_index_with_disk():
+            with _song_search_index_lock:
+                _persist_song_search_index()
+                _persist_artist_playlist_index_locked()
     except Exception:
         app.logger.exception('song search index: startup init failed')
 
@@ -9003,17 +11437,32 @@ def _artist_keys_from_summary_for_index(summary: Optional[Dict[str, Any]]) -> Se
     return {_normalize_artist_name_for_match(n) for n in expanded}
 
 
+def _stamp_artist_keys_locked(keys: Iterable[str]) -> None:
+    global _artist_playlist_change_seq
+    _artist_playlist_change_seq += 1
+    for ak in keys:
+        _artist_playlist_stamps[ak] = _artist_playlist_change_seq
+    if _artist_playlist_dirty_keys is not None:
+        _artist_playlist_dirty_keys.update(keys)
+
+
 def _artist_index_remove_file_locked(fn: str) -> None:
     """Caller must hold _song_search_index_lock."""
     keys = _artist_playlist_file_to_keys.pop(fn, None)
     if not keys:
         return
+    _stamp_artist_keys_locked(keys)
     for ak in keys:
         bucket = _artist_playlist_index.get(ak)
         if bucket:
             bucket.discard(fn)
             if not bucket:
                 del _artist_playlist_index[ak]
+        orderings = _artist_playlist_orderings.get(ak)
+        if orderings is not None:
+            orderings.remove(fn)
+            if not len(orderings):
+                del _artist_playlist_orderings[ak]
 
 
 def _artist_index_add_file_locked(fn: str, summary: Dict[str, Any]) -> None:
@@ -9022,8 +11471,23 @@ def _artist_index_add_file_locked(fn: str, summary: Dict[str, Any]) -> None:
     if not keys:
         return
     _artist_playlist_file_to_keys[fn] = set(keys)
+    _stamp_artist_keys_locked(keys)
     for ak in keys:
         _artist_playlist_index.setdefault(ak, set()).add(fn)
+        orderings = _artist_playlist_orderings.get(ak)
+        if orderings is None:
+            orderings = _artist_playlist_orderings[ak] = SongSearchOrderings()
+            orderings.build({})
+        orderings.add(fn, summary)
+
+
+def _rebuild_artist_orderings_locked() -> None:
+    """按当前歌手桶与歌曲索引整体重建各歌手的预排序序列（从磁盘载入歌手索引后调用）。"""
+    _artist_playlist_orderings.clear()
+    for ak, fns in _artist_playlist_index.items():
+        orderings = SongSearchOrderings()
+        orderings.build({fn: _song_search_index[fn] for fn in fns if fn in _song_search_index})
+        _artist_playlist_orderings[ak] = orderings
 
 
 def _artist_index_reconcile_file_locked(fn: str, old_summary: Optional[Dict[str, Any]], new_summary: Optional[Dict[str, Any]]) -> None:
@@ -9043,86 +11507,39 @@ def _bump_artist_playlist_index_revision_locked() -> None:
 
 
 def _persist_artist_playlist_index_locked() -> None:
-    """Atomic persist for artist index. Caller must hold _song_search_index_lock."""
-    cache_dir = ARTIST_PLAYLIST_INDEX_FILE.parent
-    cache_dir.mkdir(parents=True, exist_ok=True)
+    """Persist artist index via the index store. Caller must hold _song_search_index_lock."""
     _bump_artist_playlist_index_revision_locked()
-    buckets_out: Dict[str, List[str]] = {}
-    for ak, fset in _artist_playlist_index.items():
-        buckets_out[ak] = sorted(fset)
-    file_keys_out: Dict[str, List[str]] = {
-        fn: sorted(keys) for fn, keys in _artist_playlist_file_to_keys.items()
-    }
-    payload = {
-        'version': ARTIST_PLAYLIST_INDEX_VERSION,
-        'revision': int(_artist_playlist_index_revision),
-        'songSearchRevision': int(_song_search_index_revision),
-        'updatedAt': datetime.utcnow().isoformat() + 'Z',
-        'buckets': buckets_out,
-        'fileToKeys': file_keys_out,
-    }
-    fd, tmp_path = tempfile.mkstemp(prefix='artist_playlist_index.', suffix='.tmp', dir=str(cache_dir))
-    tmp_file = Path(tmp_path)
-    try:
-        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_fp:
-            json.dump(payload, tmp_fp, ensure_ascii=False)
-        os.replace(str(tmp_file), str(ARTIST_PLAYLIST_INDEX_FILE))
-    except Exception:
-        tmp_file.unlink(missing_ok=True)
-        raise
+    _write_artist_playlist_index_locked()
+
+
+def _write_artist_playlist_index_locked() -> None:
+    """Write the artist index; same locking rules as _write_song_search_index_locked."""
+    store = _song_index_store()
+    touched = None
+    if store.artist_generation is not None:
+        touched = _song_search_fns_touched_since_locked(store.artist_generation)
+    store.save_artist_index(
+        _artist_playlist_file_to_keys,
+        int(_artist_playlist_index_revision),
+        int(_song_search_index_revision),
+        touched,
+    )
+    store.artist_generation = _song_search_index_generation
 
 
 def _load_artist_playlist_index_from_disk() -> Optional[Tuple[Dict[str, Set[str]], Dict[str, Set[str]], int, int]]:
     """Return (buckets, file_to_keys, file_artist_revision, paired_song_revision) or None."""
-    path = ARTIST_PLAYLIST_INDEX_FILE
-    if not path.is_file():
-        return None
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as exc:
-        app.logger.warning('artist playlist index: load failed %s: %s', path, exc)
-        return None
-    if not isinstance(data, dict):
-        return None
-    if data.get('version') != ARTIST_PLAYLIST_INDEX_VERSION:
-        return None
-    raw_buckets = data.get('buckets')
-    raw_ftk = data.get('fileToKeys')
-    if not isinstance(raw_buckets, dict) or not isinstance(raw_ftk, dict):
-        return None
-    try:
-        file_artist_rev = int(data.get('revision', 0))
-    except (TypeError, ValueError):
-        file_artist_rev = 0
-    try:
-        paired_song_rev = int(data.get('songSearchRevision', 0))
-    except (TypeError, ValueError):
-        paired_song_rev = 0
-    buckets: Dict[str, Set[str]] = {}
-    for ak, lst in raw_buckets.items():
-        if not isinstance(ak, str) or not isinstance(lst, list):
-            continue
-        good: Set[str] = set()
-        for fn in lst:
-            if isinstance(fn, str) and fn.lower().endswith('.json') and fn.lower() != 'artists.json':
-                good.add(fn)
-        if good:
-            buckets[ak] = good
-    file_to_keys: Dict[str, Set[str]] = {}
-    for fn, lst in raw_ftk.items():
-        if not isinstance(fn, str) or not isinstance(lst, list):
-            continue
-        keys = {k for k in lst if isinstance(k, str)}
-        if keys:
-            file_to_keys[fn] = keys
-    return buckets, file_to_keys, file_artist_rev, paired_song_rev
+    return _song_index_store().load_artist_index()
 
 
 def _rebuild_artist_playlist_from_song_index_locked() -> None:
     """Rebuild in-memory artist buckets from _song_search_index. Caller holds _song_search_index_lock."""
+    global _artist_playlist_dirty_keys
+    _song_index_store().artist_generation = None
+    _artist_playlist_dirty_keys = None
     _artist_playlist_index.clear()
     _artist_playlist_file_to_keys.clear()
+    _artist_playlist_orderings.clear()
     for fn, row in _song_search_index.items():
         if not isinstance(row, dict):
             continue
@@ -9138,8 +11555,8 @@ def rebuild_artist_playlist_index_full() -> None:
 
 
 def init_artist_playlist_index_on_startup() -> None:
-    """Load .cache/artist_playlist_index.json or rebuild from song index. Call after init_song_search_index_on_startup."""
-    global _artist_playlist_index_revision
+    """Load the persisted artist index or rebuild from song index. Call after init_song_search_index_on_startup."""
+    global _artist_playlist_index_revision, _artist_playlist_dirty_keys
     if not _song_search_index_should_initialize():
         return
     try:
@@ -9150,12 +11567,15 @@ def init_artist_playlist_index_on_startup() -> None:
                 buckets, file_to_keys, artist_rev, paired = loaded
                 if paired == song_rev:
                     _artist_playlist_index_revision = artist_rev
+                    _artist_playlist_dirty_keys = None
                     _artist_playlist_index.clear()
                     _artist_playlist_file_to_keys.clear()
                     for ak, s in buckets.items():
                         _artist_playlist_index[ak] = set(s)
                     for fn, ks in file_to_keys.items():
                         _artist_playlist_file_to_keys[fn] = set(ks)
+                    _rebuild_artist_orderings_locked()
+                    _song_index_store().artist_generation = _song_search_index_generation
                     if _song_search_index:
                         indexed_fns = set(_artist_playlist_file_to_keys.keys())
                         if indexed_fns != set(_song_search_index.keys()):
@@ -9208,17 +11628,198 @@ def _run_library_search_ordered_summaries(
             pool = entry['pool']
             return all(kw in pool for kw in tokens)
 
-    with _song_search_index_lock:
-        rows = list(_song_search_index.values())
-    summaries: List[Dict[str, Any]] = []
-    for entry in rows:
-        if not row_match(entry):
-            continue
-        summaries.append(entry['summary'])
-    _sort_search_summaries_inplace(summaries, sort_type, sort_asc)
+    st = (sort_type or 'time').strip().lower()
+    if st not in SongSearchOrderings.SORT_TYPES:
+        st = 'time'
+    cache_key = (tuple(tokens), fuzzy, st, bool(sort_asc))
+    cached = _song_search_view.cached_query(cache_key)
+    if cached is not None:
+        return cached
+    # 候选集来自可变的 n-gram 索引：乐观无锁读并取到与之对应的快照；
+    # 与写者重叠时不等锁，直接在当前快照上全表校验
+    view, candidate_fns = _song_search_index_lock.read_optimistic(
+        lambda: (_song_search_view, _song_search_ngram_index.candidates(tokens, fuzzy)),
+        fallback=lambda: (_song_search_view, None),
+    )
+    rows = view.rows
+    if candidate_fns is None:
+        items: Iterable[Tuple[str, Dict[str, Any]]] = rows.items()
+    else:
+        items = [(fn, rows[fn]) for fn in candidate_fns if fn in rows]
+    matched = {fn for fn, entry in items if row_match(entry) and isinstance(entry.get('summary'), dict)}
+    summaries = view.summaries(view.orderings.order_subset(matched, st, sort_asc))
+    view.store_query(cache_key, summaries)
     return summaries
 
 
+# 排序搜索的匹配质量：整字段相等 > 字段开头 > 词开头 > 词中间 > 乱序 / 前缀 > 拼写容错 > 子序列；
+# 字段都不命中、只在 pool（音源路径等）里命中的行排在最后，保证结果不少于布尔搜索
+SONG_SEARCH_POOL_ONLY_SCORE = 0.1
+# 排序搜索每次至少取前这么多条（按页请求时向上取整），翻页多半能直接用缓存
+SONG_SEARCH_RANK_TOP_K_STEP = 100
+
+
+_SEARCH_COMPACT_TABLE = str.maketrans('', '', ' \t\n\r\f\v\u3000,，-_')
+
+
+def _song_search_needle_words(needle: str) -> Tuple[Tuple[str, int], ...]:
+    """关键词拆成词并附上各自的拼写容错额度。"""
+    return tuple((word, _search_typo_budget(word)) for word in (_SEARCH_RANK_WORD_RE.findall(needle) or [needle]))
+
+
+def _song_search_field_quality(text: str, needle: str, words: Tuple[Tuple[str, int], ...], fuzzy: bool) -> float:
+    """单个字段对一个关键词（模糊模式下为去掉分隔符的整串查询）的匹配质量，0 表示不匹配。
+
+    words 为空时只比子串 / 子序列，不做逐词的前缀与拼写容错比对。
+    """
+    haystack = text
+    idx = text.find(needle)
+    if idx < 0 and fuzzy:
+        haystack = text.translate(_SEARCH_COMPACT_TABLE)
+        idx = haystack.find(needle)
+    if idx == 0:
+        return 1.0 if len(haystack) == len(needle) else 0.9
+    if idx > 0:
+        return 0.75 if not haystack[idx - 1].isalnum() else 0.5
+    if words and (len(words) > 1 or words[0][1]):
+        # 乱序的多个词 / 词前缀，或在容错额度内的拼写错误
+        field_words = _SEARCH_RANK_WORD_RE.findall(text)
+        worst = 0
+        for word, budget in words:
+            best = budget + 1
+            for candidate in field_words:
+                if candidate.startswith(word):
+                    best = 0
+                    break
+                if budget:
+                    best = min(best, _search_edit_distance(word, candidate, budget))
+            if best > budget:
+                worst = -1
+                break
+            worst = max(worst, best)
+        if worst == 0:
+            return 0.4
+        if worst > 0:
+            return 0.3 / worst
+    if fuzzy:
+        # 按顺序出现的子序列：跨度越紧凑分越高
+        start = pos = -1
+        for ch in needle:
+            pos = haystack.find(ch, pos + 1)
+            if pos < 0:
+                return 0.0
+            if start < 0:
+                start = pos
+        return 0.3 * len(needle) / (pos - start + 1)
+    return 0.0
+
+
+def _song_search_row_score(fn: str, row: Dict[str, Any],
+                           needles: List[Tuple[str, Tuple[Tuple[str, int], ...], Set[str]]], fuzzy: bool) -> float:
+    """各关键词取最佳字段的 权重 x 质量 再求和；有关键词完全不命中时返回 0。
+
+    needles 为 (关键词, 词及容错额度, 词表命中的文件名)；不在词表命中里的行跳过逐词比对。
+    """
+    rank = row.get('rank')
+    if not isinstance(rank, dict):
+        rank = _song_search_rank_keys(row['summary'])
+    total = 0.0
+    for needle, words, near in needles:
+        if fuzzy:
+            hit = all(ch in row['pool_compact'] for ch in needle)
+        else:
+            hit = needle in row['pool']
+        if fn not in near:
+            if not hit:
+                return 0.0
+            words = ()
+        best = 0.0
+        for field, text in rank.items():
+            weight = _SONG_SEARCH_FIELD_WEIGHTS.get(field, 0.0)
+            if weight <= best:
+                continue
+            quality = _song_search_field_quality(text, needle, words, fuzzy)
+            if quality:
+                best = max(best, weight * quality)
+        if not best:
+            if not hit:
+                return 0.0
+            best = SONG_SEARCH_POOL_ONLY_SCORE
+        total += best
+    return total
+
+
+def _song_search_rank_candidates(needles: List[str], fuzzy: bool) -> Tuple[Optional[Set[str]], List[Set[str]]]:
+    """返回 (候选文件名, 各关键词的词表命中)。
+
+    候选 = n-gram（原文子串）与词表（词前缀 / 拼写容错 / 拼音罗马字）命中的并集，关键词之间取交集，
+    None 表示缩小不了范围；词表命中之外的行打分时不必再逐词比对。调用方以乐观读执行。
+    """
+    result: Optional[Set[str]] = None
+    near: List[Set[str]] = []
+    for needle in needles:
+        words = _SEARCH_RANK_WORD_RE.findall(needle) or [needle]
+        by_terms = _song_search_term_index.lookup(words[0])
+        for word in words[1:]:
+            by_terms &= _song_search_term_index.lookup(word)
+        near.append(by_terms)
+        exact = _song_search_ngram_index.candidates(list(dict.fromkeys(needle)) if fuzzy else [needle], fuzzy)
+        if exact is None:
+            continue
+        found = by_terms.union(exact)
+        result = found if result is None else result & found
+    return result, near
+
+
+def _run_library_search_ranked(query: str, fuzzy: bool, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """按相关度排序的搜索：返回 (命中总数, 前 limit 条摘要)，用堆取 top-k 而不整体排序。
+
+    普通模式按逗号分关键词、各自打分后求和；模糊模式把去掉分隔符的整串查询当一个关键词，
+    按连续子串 / 拼写容错 / 子序列打分。同分时新文件在前。
+    """
+    if fuzzy:
+        compact = re.sub(r'[,，\s\-_]+', '', (query or '').lower())
+        needles = [compact] if compact else []
+    else:
+        needles = _parse_library_search_keywords(query)
+    if not needles:
+        return 0, []
+    limit = max(1, int(limit))
+    top_k = -(-limit // SONG_SEARCH_RANK_TOP_K_STEP) * SONG_SEARCH_RANK_TOP_K_STEP
+    cache_key = ('relevance', tuple(needles), fuzzy, top_k)
+    cached = _song_search_view.cached_query(cache_key)
+    if cached is not None:
+        total, summaries = cached
+        return total, summaries[:limit]
+    # 正常情况下启动 / 重建时已建好；这里只兜底未走启动初始化的情形（如测试里替换了索引）
+    if not _song_search_term_index.built:
+        with _song_search_index_lock:
+            if not _song_search_term_index.built:
+                _song_search_term_index.build(_song_search_index)
+    # 与写者重叠时在共享读锁下重取候选（全表逐行算拼写容错太贵，不走布尔搜索那样的全表退路）
+    view, (candidate_fns, near) = _song_search_index_lock.read_optimistic(
+        lambda: (_song_search_view, _song_search_rank_candidates(needles, fuzzy)),
+    )
+    specs = [(needle, _song_search_needle_words(needle), hits) for needle, hits in zip(needles, near)]
+    rows = view.rows
+    if candidate_fns is None:
+        items: Iterable[Tuple[str, Dict[str, Any]]] = rows.items()
+    else:
+        items = [(fn, rows[fn]) for fn in candidate_fns if fn in rows]
+    scored = []
+    for fn, row in items:
+        summary = row.get('summary')
+        if not isinstance(summary, dict):
+            continue
+        score = _song_search_row_score(fn, row, specs, fuzzy)
+        if score > 0:
+            scored.append((score, float(summary.get('mtime') or 0.0), fn))
+    best = heapq.nlargest(top_k, scored, key=lambda item: (item[0], item[1]))
+    summaries = view.summaries(fn for _, _, fn in best)
+    view.store_query(cache_key, (len(scored), summaries))
+    return len(scored), summaries[:limit]
+
+
 def _snapshot_query_sort_params() -> Tuple[str, bool]:
     sort_type = (request.args.get('sortType') or 'time').strip().lower()
     if sort_type not in ('time', 'name'):
@@ -9228,9 +11829,143 @@ def _snapshot_query_sort_params() -> Tuple[str, bool]:
     return sort_type, sort_asc
 
 
+try:
+    import brotli as _brotli
+except ImportError:  # 没装 brotli 时只提供 gzip
+    _brotli = None
+
+# 全量快照编码结果缓存：按 (generation, 排序, 签名上下文) 存 JSON 及其压缩版本
+SONG_SNAPSHOT_CACHE_MAX = 8
+# 快照里的 /media/audio 签名 URL 从生成时开始计时，缓存最长只复用 token 有效期的 1/4
+SONG_SNAPSHOT_CACHE_MAX_AGE = 600
+SONG_SNAPSHOT_COMPRESS_MIN_BYTES = 1024
+_song_snapshot_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_song_snapshot_cache_lock = threading.Lock()
+
+
+def _song_snapshot_rewrite_context() -> str:
+    """影响 _rewrite_client_song_summary 输出的请求上下文摘要（设备、域名、播放策略）。"""
+    blocked = _song_info_device_playback_blocked()
+    context = {
+        'device': _media_device_id_for_signing(),
+        'blocked': blocked,
+        'requires_device': _media_token_requires_device(),
+        'base': get_public_base_url(),
+        'mode': None if blocked else _resolve_media_audio_url_mode(),
+        'delivery': None if blocked else build_audio_delivery_info(),
+    }
+    raw = json.dumps(context, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _song_snapshot_cache_max_age() -> float:
+    ttl = coerce_int(get_media_config().get('media_token_ttl_seconds'),
+                     DEFAULT_MEDIA_CONFIG['media_token_ttl_seconds'])
+    return float(max(0, min(SONG_SNAPSHOT_CACHE_MAX_AGE, (ttl or 0) // 4)))
+
+
+def _negotiate_snapshot_encoding() -> str:
+    """按 Accept-Encoding 选 br / gzip / identity（忽略 q=0）。"""
+    accepted: Dict[str, float] = {}
+    for part in (request.headers.get('Accept-Encoding') or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and _brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def _encode_snapshot_body(entry: Dict[str, Any], encoding: str) -> bytes:
+    body = entry['identity']
+    if encoding == 'identity' or len(body) < SONG_SNAPSHOT_COMPRESS_MIN_BYTES:
+        return body
+    encoded = entry.get(encoding)
+    if encoded is None:
+        if encoding == 'br':
+            encoded = _brotli.compress(body, quality=5)
+        else:
+            encoded = gzip.compress(body, compresslevel=6, mtime=0)
+        entry[encoding] = encoded
+    return encoded
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def _song_snapshot_entry(sort_type: str, sort_asc: bool) -> Dict[str, Any]:
+    """取（或生成）当前请求上下文下的全量快照缓存项。"""
+    context = _song_snapshot_rewrite_context()
+    max_age = _song_snapshot_cache_max_age()
+    view = _song_search_view
+    generation = view.generation
+    rev = view.revision
+    key = (generation, rev, sort_type, sort_asc, context)
+    now = time.time()
+    with _song_snapshot_cache_lock:
+        entry = _song_snapshot_cache.get(key)
+        if entry is not None and now - entry['built'] < max_age:
+            _song_snapshot_cache.move_to_end(key)
+            return entry
+
+    summaries = view.summaries(view.orderings.ordered(sort_type, sort_asc))
+    payload = {
+        'status': 'success',
+        'revision': rev,
+        'total': len(summaries),
+        'sortType': sort_type,
+        'sortAsc': sort_asc,
+        'songs': _rewrite_client_song_summaries(summaries),
+    }
+    body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+    tag_src = f"{generation}|{rev}|{sort_type}|{int(sort_asc)}|{context}|{now}"
+    entry = {
+        'built': now,
+        'etag': 'W/"snap-%d-%s"' % (rev, hashlib.sha256(tag_src.encode('utf-8')).hexdigest()[:20]),
+        'identity': body,
+    }
+    key = (generation, rev, sort_type, sort_asc, context)
+    with _song_snapshot_cache_lock:
+        for stale in [k for k in _song_snapshot_cache if k[0] != generation or k[1] != rev]:
+            del _song_snapshot_cache[stale]
+        _song_snapshot_cache[key] = entry
+        while len(_song_snapshot_cache) > SONG_SNAPSHOT_CACHE_MAX:
+            _song_snapshot_cache.popitem(last=False)
+    return entry
+
+
 @app.route('/songs/snapshot')
 def songs_library_snapshot():
-    """Full in-memory library snapshot from the song search index (revision bumps on index writes)."""
+    """Full in-memory library snapshot from the song search index (revision bumps on index writes).
+
+    Full responses carry an ETag (304 on If-None-Match) and honour gzip/br; ``since=<revision>``
+    returns ``delta: true`` with rows changed/removed after that revision, or the plain full snapshot
+    when the change log no longer covers it.
+    """
     if not is_request_allowed():
         return abort(403)
 
@@ -9241,31 +11976,49 @@ def songs_library_snapshot():
         return resp
 
     meta_raw = (request.args.get('meta') or '').strip().lower()
-    meta_only = meta_raw in ('1', 'true', 'yes', 'on')
-    sort_type, sort_asc = _snapshot_query_sort_params()
-
-    with _song_search_index_lock:
-        rev = int(_song_search_index_revision)
-        total = len(_song_search_index)
-    if meta_only:
-        return _no_store(jsonify({'status': 'success', 'revision': rev, 'total': total}))
-
-    with _song_search_index_lock:
-        summaries = [
-            entry['summary']
-            for entry in _song_search_index.values()
-            if isinstance(entry.get('summary'), dict)
-        ]
-    _sort_search_summaries_inplace(summaries, sort_type, sort_asc)
-    payload = {
-        'status': 'success',
-        'revision': rev,
-        'total': len(summaries),
-        'sortType': sort_type,
-        'sortAsc': sort_asc,
-        'songs': _rewrite_client_song_summaries(summaries),
+    meta_only = meta_raw in ('1', 'true', 'yes', 'on')
+    sort_type, sort_asc = _snapshot_query_sort_params()
+
+    if meta_only:
+        view = _song_search_view
+        return _no_store(jsonify({'status': 'success', 'revision': view.revision, 'total': len(view.rows)}))
+
+    since = coerce_int(request.args.get('since'))
+    if since is not None:
+        view, changes = _song_search_index_lock.read_optimistic(
+            lambda: (_song_search_view, _song_search_changes_since_locked(since))
+        )
+        if changes is not None:
+            changed_fns, removed = changes
+            rev = view.revision
+            total = len(view.rows)
+            changed = view.summaries(view.orderings.order_subset(set(changed_fns), sort_type, sort_asc))
+            return _no_store(jsonify({
+                'status': 'success',
+                'delta': True,
+                'since': since,
+                'revision': rev,
+                'total': total,
+                'sortType': sort_type,
+                'sortAsc': sort_asc,
+                'changed': _rewrite_client_song_summaries(changed),
+                'removed': removed,
+            }))
+
+    entry = _song_snapshot_entry(sort_type, sort_asc)
+    headers = {
+        # 设备相关的签名 URL：只允许客户端私有缓存，每次用 ETag 回源校验
+        'Cache-Control': 'private, no-cache',
+        'ETag': entry['etag'],
+        'Vary': 'Accept-Encoding, Cookie',
     }
-    return _no_store(jsonify(payload))
+    if _etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+        return StarletteResponse(status_code=304, headers=headers)
+    encoding = _negotiate_snapshot_encoding()
+    body = _encode_snapshot_body(entry, encoding)
+    if body is not entry['identity']:
+        headers['Content-Encoding'] = encoding
+    return StarletteResponse(content=body, media_type='application/json', headers=headers)
 
 
 @app.route('/songs/summary')
@@ -9328,9 +12081,9 @@ def list_song_summaries():
         if single_path.name.lower() == 'artists.json':
             return _single_error('Not a song metadata file', 400)
 
-        with _song_search_index_lock:
-            rev = int(_song_search_index_revision)
-            cached = _song_search_index.get(single_path.name)
+        view = _song_search_view
+        rev = view.revision
+        cached = view.rows.get(single_path.name)
         if cached and isinstance(cached.get('summary'), dict):
             summary = cached['summary']
         else:
@@ -9349,20 +12102,13 @@ def list_song_summaries():
     page_size = coerce_int(request.args.get('pageSize'), 50) or 50
     page_size = max(1, min(page_size, 50))
 
-    with _song_search_index_lock:
-        rev = int(_song_search_index_revision)
-        rows = list(_song_search_index.values())
-    summaries_full: List[Dict[str, Any]] = []
-    for entry in rows:
-        s = entry.get('summary')
-        if isinstance(s, dict):
-            summaries_full.append(s)
-    _sort_search_summaries_inplace(summaries_full, 'time', False)
-    total = len(summaries_full)
     page_size_eff = page_size
-    total_pages = math.ceil(total / page_size_eff) if total > 0 and page_size_eff > 0 else 0
     offset = (page - 1) * page_size_eff
-    summaries = summaries_full[offset:offset + page_size_eff]
+    view = _song_search_view
+    rev = view.revision
+    total = len(view.orderings)
+    summaries = view.summaries(view.orderings.page('time', False, offset, page_size_eff))
+    total_pages = math.ceil(total / page_size_eff) if total > 0 and page_size_eff > 0 else 0
 
     has_more = total_pages > 0 and page < total_pages
     next_page = page + 1 if has_more else None
@@ -9406,6 +12152,7 @@ def batch_song_summaries():
 
     truncated = len(raw_list) > 50
     capped = raw_list[:50]
+    rows = _song_search_view.rows
     songs_out: List[Optional[Dict[str, Any]]] = []
     errors_out: List[Optional[str]] = []
 
@@ -9434,7 +12181,11 @@ def batch_song_summaries():
             songs_out.append(None)
             errors_out.append(f'{label} file not found')
             continue
-        built = _build_song_summary_from_static_json(path)
+        # 已入索引的歌曲直接用快照里的摘要，只有索引里还没有的才读盘解析
+        row = rows.get(path.name)
+        built = row.get('summary') if isinstance(row, dict) else None
+        if not isinstance(built, dict):
+            built = _build_song_summary_from_static_json(path)
         if not built:
             songs_out.append(None)
             errors_out.append(f'{label} failed to read or parse JSON')
@@ -9453,28 +12204,100 @@ def batch_song_summaries():
     return _no_store(jsonify(body))
 
 
+def _encode_song_list_cursor(sort_type: str, sort_asc: bool, key: tuple) -> str:
+    raw = json.dumps([sort_type, int(sort_asc), list(key)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_song_list_cursor(cursor: str, sort_type: str, sort_asc: bool) -> tuple:
+    """解析 _encode_song_list_cursor 生成的游标；格式不对或与当前排序参数不符时抛 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, cursor_asc, key = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError, UnicodeDecodeError) as exc:
+        raise ValueError('invalid cursor') from exc
+    if cursor_sort != sort_type or bool(cursor_asc) != sort_asc:
+        raise ValueError('cursor does not match sortType / sortAsc')
+    first_type = (int, float) if sort_type == 'time' else str
+    if not isinstance(key, list) or len(key) != 3 or not isinstance(key[0], first_type) \
+            or isinstance(key[0], bool) or not all(isinstance(k, str) for k in key[1:]):
+        raise ValueError('invalid cursor')
+    return (float(key[0]) if sort_type == 'time' else key[0], key[1], key[2])
+
+
+def _song_list_etag(kind: str, revision: int, *parts: Any) -> str:
+    tag_src = '|'.join(str(p) for p in (_song_index_boot_id,) + parts)
+    return 'W/"%s-%d-%s"' % (kind, revision, hashlib.sha256(tag_src.encode('utf-8')).hexdigest()[:20])
+
+
+def _song_list_cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        # 与 /songs/snapshot 相同：含设备相关签名 URL，只允许私有缓存，每次用 ETag 回源校验
+        'Cache-Control': 'private, no-cache',
+        'ETag': etag,
+        'Vary': 'Accept-Encoding, Cookie',
+    }
+
+
 @app.route('/songs/artists')
 def list_artists_index_summary():
-    """Lightweight artist list from static index: revision + [{key, count}] sorted by name."""
+    """Lightweight artist list from static index: revision + [{key, count}] sorted by name.
+
+    Carries an ETag that changes with the artist index (304 on If-None-Match).
+    """
     if not is_request_allowed():
         return abort(403)
 
-    def _no_store(resp):
-        resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        resp.headers['Pragma'] = 'no-cache'
-        resp.headers['Expires'] = '0'
-        return resp
+    view = _song_search_view
+    rev = view.artist_revision
+    etag = _song_list_etag('artists', rev, view.artist_seq)
+    headers = _song_list_cache_headers(etag)
+    headers['Vary'] = 'Accept-Encoding'
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        return StarletteResponse(status_code=304, headers=headers)
+    items = view.cached_query(('artists',))
+    if items is None:
+        items = [{'key': ak, 'count': len(v)} for ak, v in view.artist_buckets.items()]
+        items.sort(key=lambda r: (r['key'].casefold(), r['key']))
+        view.store_query(('artists',), items)
+    resp = jsonify({'status': 'success', 'revision': rev, 'artists': items})
+    resp.headers.update(headers)
+    return resp
 
-    with _song_search_index_lock:
-        rev = int(_artist_playlist_index_revision)
-        items = [{'key': ak, 'count': len(v)} for ak, v in _artist_playlist_index.items()]
-    items.sort(key=lambda r: (r['key'].casefold(), r['key']))
-    return _no_store(jsonify({'status': 'success', 'revision': rev, 'artists': items}))
+
+def _artist_song_summaries_from_disk(view: SongSearchIndexView, artist_key: str, sort_type: str,
+                                     sort_asc: bool) -> List[Dict[str, Any]]:
+    """歌手桶里有文件不在歌曲索引中时的退路：逐个读盘解析后整体排序。"""
+    summaries: List[Dict[str, Any]] = []
+    for fn in sorted(view.artist_buckets.get(artist_key, ())):
+        row = view.rows.get(fn)
+        summ = row.get('summary') if isinstance(row, dict) else None
+        if isinstance(summ, dict):
+            summaries.append(summ)
+            continue
+        try:
+            _, path = _resolve_existing_static_json_filename(fn)
+        except ValueError:
+            continue
+        if path.name.lower() == 'artists.json':
+            continue
+        if not path.is_file():
+            continue
+        built = _build_song_summary_from_static_json(path)
+        if built:
+            summaries.append(built)
+    _sort_search_summaries_inplace(summaries, sort_type, sort_asc)
+    return summaries
 
 
 @app.route('/songs/artist')
 def list_songs_by_artist():
-    """Paginated songs for one artist; filenames from artist index, summaries from song search index."""
+    """Paginated songs for one artist; filenames from artist index, summaries from song search index.
+
+    Pages come from the artist's presorted list. ``cursor=<nextCursor>`` continues after the last
+    song of the previous page (stable while songs are added or removed) and takes precedence over
+    ``page``. Responses carry an ETag (304 on If-None-Match).
+    """
     if not is_request_allowed():
         return abort(403)
 
@@ -9497,6 +12320,7 @@ def list_songs_by_artist():
             'totalPages': 0,
             'hasMore': False,
             'nextPage': None,
+            'nextCursor': None,
             'loaded': 0,
             'songs': [],
         }
@@ -9511,50 +12335,92 @@ def list_songs_by_artist():
     page = max(1, coerce_int(request.args.get('page'), 1) or 1)
     page_size = coerce_int(request.args.get('pageSize'), 50) or 50
     page_size = max(1, min(page_size, 50))
+    cursor = (request.args.get('cursor') or '').strip()
+    cursor_key: Optional[tuple] = None
+    if cursor:
+        try:
+            cursor_key = _decode_song_list_cursor(cursor, sort_type, sort_asc)
+        except ValueError as exc:
+            return _no_store(jsonify({'status': 'error', 'message': str(exc)})), 400
 
     target_norm = _normalize_artist_name_for_match(raw_artist)
-    summaries: List[Dict[str, Any]] = []
-    with _song_search_index_lock:
-        fns = sorted(_artist_playlist_index.get(target_norm, set()))
-        for fn in fns:
-            row = _song_search_index.get(fn)
-            summ = row.get('summary') if isinstance(row, dict) else None
-            if isinstance(summ, dict):
-                summaries.append(summ)
-                continue
-            try:
-                _, path = _resolve_existing_static_json_filename(fn)
-            except ValueError:
-                continue
-            if path.name.lower() == 'artists.json':
-                continue
-            if not path.is_file():
-                continue
-            built = _build_song_summary_from_static_json(path)
-            if built:
-                summaries.append(built)
-    _sort_search_summaries_inplace(summaries, sort_type, sort_asc)
-    total = len(summaries)
-    total_pages = math.ceil(total / page_size) if total > 0 and page_size > 0 else 0
+    view = _song_search_view
+    orderings = view.artist_orderings.get(target_norm)
+    bucket = view.artist_buckets.get(target_norm, frozenset())
+    if orderings is not None and len(orderings) != len(bucket):
+        orderings = None
+
+    etag = None
+    max_age = _song_snapshot_cache_max_age()
+    if orderings is not None and max_age > 0:
+        # 签名 URL 有有效期：ETag 按快照缓存的复用时长轮换，客户端缓存的 URL 不会用到过期
+        etag = _song_list_etag(
+            'artist', view.revision, target_norm, view.artist_stamps.get(target_norm, 0), raw_artist,
+            sort_type, int(sort_asc), page, page_size, cursor, _song_snapshot_rewrite_context(),
+            int(time.time() // max_age),
+        )
+        if _etag_matches(request.headers.get('If-None-Match'), etag):
+            return StarletteResponse(status_code=304, headers=_song_list_cache_headers(etag))
+
     offset = (page - 1) * page_size
-    slice_songs = summaries[offset:offset + page_size]
-    has_more = total_pages > 0 and page < total_pages
-    next_page = page + 1 if has_more else None
+    if orderings is not None:
+        total = len(orderings)
+        if cursor_key is not None:
+            # 多取一项判断后面还有没有
+            page_fns = orderings.page_after(sort_type, sort_asc, cursor_key, page_size + 1, view.rows)
+        else:
+            page_fns = orderings.page(sort_type, sort_asc, offset, page_size)
+        entries = list(zip(page_fns, view.summaries(page_fns)))
+    else:
+        summaries = _artist_song_summaries_from_disk(view, target_norm, sort_type, sort_asc)
+        total = len(summaries)
+        keyed = [(str(s.get('filename') or ''), s) for s in summaries]
+        if cursor_key is not None:
+            start = 0
+            for start, (fn, summ) in enumerate(keyed):
+                key = SongSearchOrderings.sort_key(sort_type, fn, summ)
+                if (key > cursor_key) if sort_asc else (key < cursor_key):
+                    break
+            else:
+                start = total
+            entries = keyed[start:start + page_size + 1]
+        else:
+            entries = keyed[offset:offset + page_size]
+    total_pages = math.ceil(total / page_size) if total > 0 and page_size > 0 else 0
+    if cursor_key is not None:
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        next_page = None
+    else:
+        has_more = total_pages > 0 and page < total_pages
+        next_page = page + 1 if has_more else None
+    next_cursor = None
+    if has_more and entries:
+        last_fn, last_summary = entries[-1]
+        next_cursor = _encode_song_list_cursor(
+            sort_type, sort_asc, SongSearchOrderings.sort_key(sort_type, last_fn, last_summary)
+        )
+    slice_songs = [summ for _, summ in entries]
     payload = {
         'status': 'success',
         'artist': raw_artist,
         'sortType': sort_type,
         'sortAsc': sort_asc,
-        'page': page,
+        'page': None if cursor_key is not None else page,
         'pageSize': page_size,
         'total': total,
         'totalPages': total_pages,
         'hasMore': has_more,
         'nextPage': next_page,
+        'nextCursor': next_cursor,
         'loaded': len(slice_songs),
         'songs': _rewrite_client_song_summaries(slice_songs),
     }
-    return _no_store(jsonify(payload))
+    resp = jsonify(payload)
+    if etag is None:
+        return _no_store(resp)
+    resp.headers.update(_song_list_cache_headers(etag))
+    return resp
 
 
 @app.route('/songs/search')
@@ -9567,8 +12433,9 @@ def search_song_library():
     fuzzy_arg = (request.args.get('fuzzy') or '').strip().lower()
     fuzzy = fuzzy_arg in ('1', 'true', 'yes', 'on')
 
+    # sortType=relevance：按字段权重 / 前缀 / 拼写容错打分排序（见 _run_library_search_ranked）
     sort_type = (request.args.get('sortType') or 'time').strip().lower()
-    if sort_type not in ('time', 'name'):
+    if sort_type not in ('time', 'name', 'relevance'):
         sort_type = 'time'
     sort_asc_raw = (request.args.get('sortAsc') or '0').strip().lower()
     sort_asc = sort_asc_raw in ('1', 'true', 'yes', 'on')
@@ -9601,10 +12468,13 @@ def search_song_library():
         }
         return _no_store(jsonify(payload))
 
-    ordered = _run_library_search_ordered_summaries(raw_q, fuzzy, sort_type, sort_asc)
-    total = len(ordered)
-    total_pages = math.ceil(total / page_size) if total > 0 and page_size > 0 else 0
     offset = (page - 1) * page_size
+    if sort_type == 'relevance':
+        total, ordered = _run_library_search_ranked(raw_q, fuzzy, offset + page_size)
+    else:
+        ordered = _run_library_search_ordered_summaries(raw_q, fuzzy, sort_type, sort_asc)
+        total = len(ordered)
+    total_pages = math.ceil(total / page_size) if total > 0 and page_size > 0 else 0
     slice_songs = ordered[offset:offset + page_size]
     has_more = total_pages > 0 and page < total_pages
     next_page = page + 1 if has_more else None
@@ -9634,14 +12504,26 @@ def internal_rebuild_song_search_index():
     if locked_response:
         return locked_response
     try:
-        rebuild_song_search_index_full()
-        with _song_search_index_lock:
-            count = len(_song_search_index)
-        return jsonify({'status': 'success', 'entries': count})
+        parsed = rebuild_song_search_index_full(force=parse_bool(request.args.get('force')))
+        return jsonify({'status': 'success', 'entries': len(_song_search_view.rows), 'parsed': parsed})
     except Exception as exc:
         return jsonify({'status': 'error', 'message': str(exc)}), 500
 
 
+@app.route('/internal/export_song_search_index', methods=['GET'])
+def internal_export_song_search_index():
+    """以旧的整文件 JSON 格式下载当前歌曲索引（SQLite 存储下的备份 / 排查用）。"""
+    if not is_request_allowed():
+        return abort(403)
+    locked_response = require_unlocked_device('导出歌曲搜索索引')
+    if locked_response:
+        return locked_response
+    payload = export_song_search_index_json()
+    resp = app.make_response(json.dumps(payload, ensure_ascii=False), mimetype='application/json')
+    resp.headers['Content-Disposition'] = 'attachment; filename="song_search_index.json"'
+    return resp
+
+
 @app.route('/internal/rebuild_artist_playlist_index', methods=['POST'])
 def internal_rebuild_artist_playlist_index():
     if not is_request_allowed():
@@ -9651,14 +12533,92 @@ def internal_rebuild_artist_playlist_index():
         return locked_response
     try:
         rebuild_artist_playlist_index_full()
-        with _song_search_index_lock:
-            keys = len(_artist_playlist_index)
-            rev = int(_artist_playlist_index_revision)
+        view = _song_search_view
+        keys = len(view.artist_buckets)
+        rev = view.artist_revision
         return jsonify({'status': 'success', 'artists': keys, 'revision': rev})
     except Exception as exc:
         return jsonify({'status': 'error', 'message': str(exc)}), 500
 
 
+@app.route('/internal/song_search_index_stats')
+def internal_song_search_index_stats():
+    """索引读写锁等待直方图与快照发布统计；reset=1 时返回后清零，便于按压测区间对比。"""
+    if not is_request_allowed():
+        return abort(403)
+    view = _song_search_view
+    payload = {
+        'status': 'success',
+        'generation': view.generation,
+        'revision': view.revision,
+        'rows': len(view.rows),
+        'viewPublishes': _song_search_view_publishes,
+        'viewPublishMs': round(_song_search_view_publish_ms, 3),
+        'lock': _song_search_index_lock.stats(),
+    }
+    if parse_bool(request.args.get('reset')):
+        _song_search_index_lock.reset_stats()
+    return jsonify(payload)
+
+
+def song_resource_orphan_report(limit: int = 500) -> Dict[str, Any]:
+    """对照资源依赖图与 songs/ 目录：未被任何歌曲引用的文件（orphans）与引用了却不存在的文件（missing）。"""
+    ready, songs, resources = _song_search_index_lock.read_optimistic(
+        lambda: (_song_resource_graph_ready, len(_song_search_index), _song_resource_graph.resources())
+    )
+
+    def _key(rel: str) -> str:
+        return rel.lower() if os.name == 'nt' else rel
+
+    on_disk: Dict[str, Tuple[str, int]] = {}
+    songs_root = SONGS_DIR
+    for root, _dirs, files in os.walk(songs_root):
+        for name in files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, songs_root).replace(os.sep, '/')
+            try:
+                size = os.stat(full).st_size
+            except OSError:
+                continue
+            on_disk[_key(rel)] = (rel, size)
+
+    referenced = {_key(rel) for rel in resources}
+    orphan_keys = sorted(k for k in on_disk if k not in referenced)
+    missing = sorted(rel for rel in resources if _key(rel) not in on_disk)
+    by_kind: Dict[str, int] = {}
+    for by_kind_refs in resources.values():
+        for kind in by_kind_refs:
+            by_kind[kind] = by_kind.get(kind, 0) + 1
+    return {
+        'graphReady': ready,
+        'songs': songs,
+        'referenced': len(resources),
+        'referencedByKind': by_kind,
+        'filesOnDisk': len(on_disk),
+        'orphanCount': len(orphan_keys),
+        'orphanBytes': sum(on_disk[k][1] for k in orphan_keys),
+        'orphans': [{'path': on_disk[k][0], 'size': on_disk[k][1]} for k in orphan_keys[:limit]],
+        'missingCount': len(missing),
+        'missing': [
+            {
+                'path': rel,
+                'kinds': sorted(resources[rel]),
+                'referrers': sorted(set().union(*resources[rel].values())),
+            }
+            for rel in missing[:limit]
+        ],
+    }
+
+
+@app.route('/admin/resources/orphans', methods=['GET'])
+def admin_resource_orphans():
+    """songs/ 下的孤立文件与缺失引用报告（基于资源依赖图，只遍历一次 songs/ 目录）。"""
+    if not can_manage_system():
+        return abort(403)
+    limit = max(1, min(coerce_int(request.args.get('limit'), 500) or 500, 10000))
+    return jsonify({'status': 'success', **song_resource_orphan_report(limit)})
+
+
 @app.route('/get_backups', methods=['POST'])
 def get_backups():
     try:
@@ -9703,7 +12663,7 @@ def get_backups():
         return jsonify({'status': 'error', 'message': str(e)})
 
 
-@app.route('/upload_music', methods=['POST'])
+@app.route('/upload_music', methods=['POST'], load_body=True)
 async def upload_music():
     if not is_request_allowed():
         return abort(403)
@@ -9732,7 +12692,7 @@ async def upload_music():
         return jsonify({'status': 'error', 'message': str(e)})
 
 
-@app.route('/upload_music_from_url', methods=['POST'])
+@app.route('/upload_music_from_url', methods=['POST'], load_body=True)
 async def upload_music_from_url():
     if not is_request_allowed():
         return abort(403)
@@ -9793,7 +12753,7 @@ async def upload_music_from_url():
         return jsonify({'status': 'error', 'message': str(e)})
 
 
-@app.route('/upload_image', methods=['POST'])
+@app.route('/upload_image', methods=['POST'], load_body=True)
 async def upload_image():
     if not is_request_allowed():
         return abort(403)
@@ -9913,7 +12873,7 @@ def lddc_get_lyrics_by_id():
         return jsonify({'status': 'error', 'message': f'获取失败: {exc}'})
 
 
-@app.route('/upload_lyrics', methods=['POST'])
+@app.route('/upload_lyrics', methods=['POST'], load_body=True)
 async def upload_lyrics():
     if not is_request_allowed():
         return abort(403)
@@ -9962,7 +12922,7 @@ async def upload_lyrics():
         return jsonify({'status': 'error', 'message': str(e)})
 
 
-@app.route('/upload_translation', methods=['POST'])
+@app.route('/upload_translation', methods=['POST'], load_body=True)
 async def upload_translation():
     if not is_request_allowed():
         return abort(403)
@@ -10098,7 +13058,7 @@ class TTMLSyl:
         """初始化TTML音节对象
 
         Args:
-            element: XML DOM元素对象，包含begin和end属性
+            element: 元素节点（minidom Element 或 TtmlElement），包含begin和end属性
         """
         self.__element: Element = element
         self.__begin: TTMLTime = TTMLTime(element.getAttribute("begin"))
@@ -10107,7 +13067,7 @@ class TTMLSyl:
         # ✅ 安全访问子节点文本
         node_val = None
         try:
-            if element.childNodes and element.childNodes.length > 0:
+            if element.childNodes and len(element.childNodes) > 0:
                 first = element.childNodes[0]
                 # 3 = TEXT_NODE, 4 = CDATA_SECTION_NODE
                 if getattr(first, "nodeType", None) in (3, 4):
@@ -10126,23 +13086,33 @@ class TTMLSyl:
     def get_end(self) -> TTMLTime:
         return self.__end
 
-class TTMLLine:
-    have_ts: bool = False
-    have_duet: bool = False
-    have_bg: bool = False
-    have_pair: int = 0
+class TTMLConversionState:
+    """一次 TTML→LYS 转换内所有行共享的标记。
 
+    每次转换各持一份，不放在 TTMLLine 类上，多个转换可在线程/进程里并行跑。
+    """
+    __slots__ = ('have_ts', 'have_duet', 'have_bg', 'have_pair')
+
+    def __init__(self, have_duet: bool = False):
+        self.have_ts: bool = False
+        self.have_duet: bool = have_duet
+        self.have_bg: bool = False
+        self.have_pair: int = 0
+
+
+class TTMLLine:
     __before: Pattern[AnyStr] = compile(r'^\({2,}')
     __after: Pattern[AnyStr] = compile(r'\){2,}$')
 
-    def __init__(self, element: Element, is_bg: bool = False):
+    def __init__(self, element: Element, is_bg: bool = False, state: Optional[TTMLConversionState] = None):
         self.__element: Element = element
         self.__orig_line = []  # 可以包含TTMLSyl或str类型
         self.__ts_line = None  # 可以是str或None
         self.__bg_line = None  # 可以是TTMLLine或None
         self.__is_bg: bool = is_bg
+        self.__state: TTMLConversionState = state if state is not None else TTMLConversionState()
 
-        TTMLLine.have_bg |= is_bg
+        self.__state.have_bg |= is_bg
 
         # 获取传入元素的 agent 属性
         agent = element.getAttribute("ttm:agent")
@@ -10177,7 +13147,7 @@ class TTMLLine:
 
             if role == "":
                 # 普通 syllable：必须有文本子节点
-                if child.childNodes and child.childNodes.length > 0:
+                if child.childNodes and len(child.childNodes) > 0:
                     try:
                         # TTMLSyl 内部也做了判空
                         self.__orig_line.append(TTMLSyl(child))
@@ -10186,14 +13156,14 @@ class TTMLLine:
                 continue
 
             if role == "x-bg":
-                self.__bg_line = TTMLLine(child, True)
+                self.__bg_line = TTMLLine(child, True, self.__state)
                 self.__bg_line.__is_duet = self.__is_duet
                 continue
 
             if role == "x-translation":
-                TTMLLine.have_ts = True
+                self.__state.have_ts = True
                 try:
-                    if child.childNodes and child.childNodes.length > 0:
+                    if child.childNodes and len(child.childNodes) > 0:
                         first = child.childNodes[0]
                         if getattr(first, "nodeType", None) in (3, 4) and first.nodeValue:
                             self.__ts_line = f'{first.nodeValue}'
@@ -10217,14 +13187,14 @@ class TTMLLine:
         if is_bg and self.__orig_line and isinstance(self.__orig_line[0], TTMLSyl):
             if TTMLLine.__before.search(self.__orig_line[0].text):
                 self.__orig_line[0].text = TTMLLine.__before.sub('(', self.__orig_line[0].text)
-                TTMLLine.have_pair += 1
+                self.__state.have_pair += 1
             if TTMLLine.__after.search(self.__orig_line[-1].text):
                 self.__orig_line[-1].text = TTMLLine.__after.sub(')', self.__orig_line[-1].text)
-                TTMLLine.have_pair += 1
+                self.__state.have_pair += 1
 
     def __role(self) -> int:
-        return ((int(TTMLLine.have_bg) + int(self.__is_bg)) * 3
-                + int(TTMLLine.have_duet) + int(self.__is_duet))
+        return ((int(self.__state.have_bg) + int(self.__is_bg)) * 3
+                + int(self.__state.have_duet) + int(self.__is_duet))
 
     def __raw(self):
         try:
@@ -10266,44 +13236,23 @@ class TTMLLine:
 
 def ttml_text_to_lys_parts(ttml_text: str) -> Tuple[bool, List[str], List[str], str]:
     """解析 TTML 字符串，返回 LYS 行列表与可选翻译行（与写盘版语义一致）。"""
-    TTMLLine.have_duet = False
-    TTMLLine.have_bg = False
-    TTMLLine.have_ts = False
-    TTMLLine.have_pair = 0
     if not (ttml_text or '').strip():
         return False, [], [], 'TTML 内容为空'
     try:
-        sanitized_ttml = sanitize_ttml_content(ttml_text)
+        doc = parse_sanitized_ttml(ttml_text)
     except Exception as exc:
         app.logger.error("TTML 白名单过滤失败（字符串）: %s", exc)
         return False, [], [], f'TTML 白名单过滤失败: {exc}'
 
     try:
-        dom: Document = xml.dom.minidom.parseString(sanitized_ttml)
-        tt: Document = dom.documentElement
-        body_elements = tt.getElementsByTagName('body')
-        head_elements = tt.getElementsByTagName('head')
-        if not body_elements or not head_elements:
-            return False, [], [], 'TTML 缺少 body 或 head'
-        body: Element = body_elements[0]
-        head: Element = head_elements[0]
-        div_elements = body.getElementsByTagName('div')
-        metadata_elements = head.getElementsByTagName('metadata')
-        if not div_elements or not metadata_elements:
-            return False, [], [], 'TTML 缺少 div 或 metadata'
-        div: Element = div_elements[0]
-        metadata: Element = metadata_elements[0]
-        p_elements: NodeList[Element] = div.getElementsByTagName('p')
-        if not p_elements or len(p_elements) == 0:
+        # 直接用净化后的精简节点生成 LYS，不再把净化结果序列化后交给 minidom 二次解析
+        if not doc.lines:
             return False, [], [], 'TTML 缺少歌词行'
-        agent_elements: NodeList[Element] = metadata.getElementsByTagName('ttm:agent')
-        for meta in agent_elements:
-            if meta.getAttribute('xml:id') != 'v1':
-                TTMLLine.have_duet = True
+        state = TTMLConversionState(have_duet=doc.has_duet)
         lines: list[TTMLLine] = []
-        for p in p_elements:
+        for p in doc.lines:
             try:
-                lines.append(TTMLLine(p))
+                lines.append(TTMLLine(p, state=state))
             except Exception as e:
                 app.logger.error(f"处理TTML行时出错: {type(e).__name__}: {e!s}，已跳过")
                 continue
@@ -10419,36 +13368,19 @@ def _format_creator_text(artists: List[str]) -> Optional[str]:
     return f"{CREATOR_LABEL}: {joined}"
 
 
-def _extract_offset_ms(lys_content: str) -> int:
-    offset_match = re.search(r'\[offset:\s*(-?\d+)\s*\]', lys_content)
-    if offset_match:
-        try:
-            return int(offset_match.group(1))
-        except Exception:
-            return 0
-    return 0
-
-
 def _get_last_lyric_end_ms(lys_content: str) -> int:
     last_end_ms = 0
-    offset_ms = _extract_offset_ms(lys_content)
-    for line in lys_content.splitlines():
-        stripped_line = line.strip()
-        if not stripped_line:
+    lys_doc = parse_lys_document(lys_content)
+    for lys_line in lys_doc.lines:
+        if lys_line.skipped_meta:
             continue
-        if stripped_line.startswith('[from:') or stripped_line.startswith('[id:') or stripped_line.startswith('[offset:'):
-            continue
-        content_match = re.match(r'\[(?P<marker>[^\]]*)\](?P<content>.*)', stripped_line)
-        if not content_match:
-            continue
-        marker = content_match.group('marker')
-        if marker != '' and not marker.isdigit():
-            continue
-        content = content_match.group('content')
-        syllables = parse_syllable_info(content, marker, offset=offset_ms)
-        if not syllables:
+        if lys_line.raw[:1].isspace():
+            # 这里按去掉首尾空白后的行解析
+            lys_line = LysLine(lys_line.raw.strip())
+        if not lys_line.is_lyric or not lys_line.tokens:
             continue
-        end_ms = syllables[-1]['start_ms'] + syllables[-1]['duration_ms']
+        _, start_ms, duration_ms = lys_line.tokens[-1]
+        end_ms = int(start_ms) + lys_doc.offset + int(duration_ms)
         if end_ms > last_end_ms:
             last_end_ms = end_ms
     return last_end_ms
@@ -10587,9 +13519,22 @@ def _extract_song_value_from_json(data: Optional[Dict[str, Any]]) -> Optional[st
     return None
 
 
+# (路径, mtime_ns, size) -> 时长；打开播放器每次都要算创作者行时长，librosa 读音频头不便宜
+_audio_duration_cache: 'OrderedDict[Tuple[str, int, int], Optional[int]]' = OrderedDict()
+_audio_duration_cache_lock = threading.Lock()
+_AUDIO_DURATION_CACHE_MAX = 256
+
+
 def _get_audio_duration_ms(audio_path: Path) -> Optional[int]:
-    if not audio_path.exists():
+    fingerprint = _file_fingerprint(audio_path)
+    if fingerprint is None:
         return None
+    cache_key = (str(audio_path), fingerprint[0], fingerprint[1])
+    with _audio_duration_cache_lock:
+        cached = _audio_duration_cache.get(cache_key, _MISSING)
+        if cached is not _MISSING:
+            _audio_duration_cache.move_to_end(cache_key)
+            return cached
     try:
         import librosa
     except Exception:
@@ -10597,10 +13542,18 @@ def _get_audio_duration_ms(audio_path: Path) -> Optional[int]:
     try:
         duration_sec = float(librosa.get_duration(path=str(audio_path)))
         if not math.isfinite(duration_sec) or duration_sec <= 0:
-            return None
-        return int(round(duration_sec * 1000))
+            duration_ms = None
+        else:
+            duration_ms = int(round(duration_sec * 1000))
     except Exception:
-        return None
+        duration_ms = None
+    # 读音频头在锁外进行；同一文件并发算两次无妨，结果相同
+    with _audio_duration_cache_lock:
+        _audio_duration_cache[cache_key] = duration_ms
+        _audio_duration_cache.move_to_end(cache_key)
+        while len(_audio_duration_cache) > _AUDIO_DURATION_CACHE_MAX:
+            _audio_duration_cache.popitem(last=False)
+    return duration_ms
 
 
 def _get_song_duration_ms_from_json(data: Optional[Dict[str, Any]]) -> Optional[int]:
@@ -10614,31 +13567,200 @@ def _get_song_duration_ms_from_json(data: Optional[Dict[str, Any]]) -> Optional[
     return _get_audio_duration_ms(song_path)
 
 
-def _cleanup_temp_ttml_files(now_ts: Optional[float] = None) -> None:
-    now_ts = now_ts or time.time()
-    expired = [path for path, ts in TEMP_TTML_FILES.items() if ts <= now_ts]
-    for path in expired:
+# 播放器用 TTML 产物：按输入内容（歌词 / 翻译 / 创作者行参数）寻址缓存在磁盘上，
+# 同一首歌被多台设备打开只转换一次；总大小超过上限时按最近使用淘汰
+PLAYER_TTML_CACHE_DIR = BASE_PATH / '.cache' / 'player_ttml'
+PLAYER_TTML_CACHE_MAX_BYTES = max(1, int(os.getenv('APP_PLAYER_TTML_CACHE_MB', '64'))) * 1024 * 1024
+# 转换逻辑或产物格式变化时递增，旧键自然失效
+PLAYER_TTML_ARTIFACT_VERSION = 1
+_PLAYER_TTML_KEY_PATTERN = compile(r'[0-9a-f]{64}')
+# 命中时只有 mtime 早于这么久才刷新（mtime 只用于重启后恢复 LRU 顺序，不必每次读都写盘）
+PLAYER_TTML_TOUCH_INTERVAL_SEC = 3600
+
+
+class TtmlArtifactCache:
+    """内容寻址的 TTML 产物目录：文件名即输入哈希，同一键的内容永不改变。
+
+    LRU 顺序记在内存里，命中时若文件 mtime 已超过 PLAYER_TTML_TOUCH_INTERVAL_SEC 才刷新，重启后按 mtime 恢复。
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._total_bytes = 0
+        self._building: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.builds = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f'{key}.ttml'
+
+    def _load_locked(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.directory.glob('*.ttml'):
+            if not _PLAYER_TTML_KEY_PATTERN.fullmatch(path.stem):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime_ns, path.stem, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict_locked()
+
+    def _evict_locked(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._total_bytes -= self._entries.pop(key)
+            try:
+                self.path_for(key).unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[Path]:
+        with self._lock:
+            self._load_locked()
+            if key not in self._entries:
+                return None
+            path = self.path_for(key)
+            try:
+                if time.time() - path.stat().st_mtime > PLAYER_TTML_TOUCH_INTERVAL_SEC:
+                    os.utime(path)
+            except OSError:
+                # 文件被外部删掉了：当作未命中
+                self._total_bytes -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def _store(self, key: str, text: str) -> Path:
+        data = text.encode('utf-8')
+        path = self.path_for(key)
+        with self._lock:
+            self._load_locked()
+        fd, tmp_name = tempfile.mkstemp(dir=str(self.directory), prefix='.tmp-', suffix='.ttml')
         try:
-            Path(path).unlink(missing_ok=True)
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_name, path)
         except Exception:
-            pass
-        TEMP_TTML_FILES.pop(path, None)
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.builds += 1
+            self._evict_locked(keep=key)
+        return path
+
+    def get_or_create(self, key: str, build: Callable[[], Optional[str]]) -> Optional[Path]:
+        """命中直接返回；否则调用 build() 生成文本并落盘。同一键并发请求只构建一次。"""
+        path = self.get(key)
+        if path is not None:
+            return path
+        with self._lock:
+            key_lock = self._building.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                path = self.get(key)
+                if path is not None:
+                    return path
+                text = build()
+                if text is None:
+                    return None
+                return self._store(key, text)
+        finally:
+            with self._lock:
+                if self._building.get(key) is key_lock:
+                    self._building.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._load_locked()
+            for key in list(self._entries):
+                try:
+                    self.path_for(key).unlink(missing_ok=True)
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total_bytes = 0
 
 
-def _create_player_ttml_from_text(
-    ttml_text: str,
-    artists: Optional[List[str]],
-    duration_ms: Optional[int]
-) -> Optional[str]:
-    updated = _inject_creator_line_into_ttml(ttml_text, artists, duration_ms)
-    if not updated:
-        return None
-    unique = uuid.uuid4().hex
-    filename = f"lyrics_player_{unique}.ttml"
-    output_path = SONGS_DIR / filename
-    output_path.write_text(updated, encoding='utf-8')
-    TEMP_TTML_FILES[str(output_path)] = time.time() + TEMP_TTML_TTL_SEC
-    return build_public_url('songs', filename)
+_ttml_artifact_cache = TtmlArtifactCache(PLAYER_TTML_CACHE_DIR, PLAYER_TTML_CACHE_MAX_BYTES)
+
+
+def _lyrics_file_to_ttml_text(real_path: Path, translation_path: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """把 LYS/LRC 转换（TTML 原样读取）为 TTML 文本，返回 (文本, 错误信息)。"""
+    file_ext = real_path.suffix.lower()
+    if file_ext == '.ttml':
+        return real_path.read_text(encoding='utf-8', errors='ignore'), None
+    converter = lys_to_ttml if file_ext == '.lys' else lrc_to_ttml
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir) / f"{real_path.stem}.ttml"
+        success, error_msg = converter(str(real_path), str(temp_path), translation_path=translation_path)
+        if not success:
+            return None, error_msg
+        return temp_path.read_text(encoding='utf-8', errors='ignore'), None
+
+
+def _player_ttml_artifact_key(
+    real_path: Path,
+    translation_path: Optional[str],
+    creator: Optional[Tuple[List[str], Optional[int]]]
+) -> str:
+    digest = hashlib.sha256()
+    header = [PLAYER_TTML_ARTIFACT_VERSION, real_path.suffix.lower(), list(creator) if creator else None]
+    digest.update(json.dumps(header, ensure_ascii=False).encode('utf-8'))
+    for path in (real_path, translation_path):
+        data = Path(path).read_bytes() if path else b''
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _get_player_ttml_artifact(
+    real_path: Path,
+    translation_hint: Optional[str] = None,
+    creator: Optional[Tuple[List[str], Optional[int]]] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """取（必要时生成）播放器 TTML 产物，返回 (公开 URL, 错误信息)。
+
+    creator 为 (artists, duration_ms) 时在末尾追加创作者行；错误信息以"转换失败"开头表示源文件无法转换。
+    """
+    translation_path = None
+    if real_path.suffix.lower() in ('.lys', '.lrc'):
+        translation_path = find_translation_file(real_path, translation_hint)
+    key = _player_ttml_artifact_key(real_path, translation_path, creator)
+    errors: List[str] = []
+
+    def build() -> Optional[str]:
+        ttml_text, error_msg = _lyrics_file_to_ttml_text(real_path, translation_path)
+        if ttml_text is None:
+            errors.append(f'转换失败: {error_msg}')
+            return None
+        if creator is not None:
+            ttml_text = _inject_creator_line_into_ttml(ttml_text, *creator)
+            if not ttml_text:
+                errors.append('生成TTML失败')
+                return None
+        return ttml_text
+
+    path = _ttml_artifact_cache.get_or_create(key, build)
+    if path is None:
+        return None, errors[0] if errors else '生成TTML失败'
+    return f"{get_public_base_url()}/player-ttml/{path.name}", None
 
 
 def _get_artists_from_related_json(lyrics_path: Path) -> Tuple[List[str], Optional[int]]:
@@ -10659,6 +13781,18 @@ def _get_artists_from_related_json(lyrics_path: Path) -> Tuple[List[str], Option
     return [], None
 
 
+def lys_line_syllables(lys_line: LysLine, offset: int = 0) -> List[Dict[str, Any]]:
+    """与 parse_syllable_info 等价，直接复用 LysLine 里已经切好的音节。"""
+    return [
+        {
+            'text': _LYS_WHITESPACE_RUN_REGEX.sub(' ', text) if text else text,
+            'start_ms': start_ms + offset,
+            'duration_ms': duration_ms,
+        }
+        for text, start_ms, duration_ms in ((t, int(s), int(d)) for t, s, d in lys_line.tokens)
+    ]
+
+
 def parse_syllable_info(content, marker='', offset=0):
     """解析LYS内容中的音节信息，返回音节列表；offset 为毫秒，正负皆可。"""
     content = preprocess_brackets(content)
@@ -10783,6 +13917,28 @@ def _translation_path_from_meta_json(lyrics_path: Path) -> Optional[str]:
     """从 static 根目录的歌曲 JSON 元数据中查找显式配置的翻译文件。"""
     target_path = lyrics_path.resolve()
 
+    try:
+        lyrics_key = resource_relative_from_path(target_path, 'songs')
+    except ValueError:
+        lyrics_key = None
+    graph_ready, translations = _song_search_index_lock.read_optimistic(lambda: (
+        _song_resource_graph_ready,
+        [
+            _song_resource_graph.dependencies(fn).get('translation', ())
+            for fn in sorted(_song_resource_graph.referrers(lyrics_key, ('lyrics',)))
+        ] if lyrics_key else [],
+    ))
+    for paths in translations:
+        for rel in paths:
+            try:
+                translation_path = _resolve_resource_path_from_relative(rel, 'songs')
+            except ValueError:
+                continue
+            if translation_path.exists():
+                return str(translation_path)
+    if graph_ready:
+        return None
+
     for json_path in STATIC_DIR.glob('*.json'):
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
@@ -10840,24 +13996,24 @@ def find_translation_file(lyrics_path, translation_hint: Optional[str] = None):
     return None
 
 
-def lys_to_ttml(input_path, output_path, translation_hint: Optional[str] = None):
-    """将LYS格式转换为TTML格式（Apple风格）"""
+def lys_to_ttml(input_path, output_path, translation_hint: Optional[str] = None, translation_path: Any = _MISSING):
+    """将LYS格式转换为TTML格式（Apple风格）
+
+    translation_path 为调用方已解析好的翻译文件（None 表示没有翻译），缺省时按 find_translation_file 查找。
+    """
     try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            lys_content = f.read()
+        lys_doc = load_lys_document(input_path)
+        lys_content = lys_doc.text
         author_name = extract_tag_value(lys_content, 'by')
 
         # ---- 提取 offset（毫秒） ----
-        offset = 0
-        offset_match = re.search(r'\[offset:\s*(-?\d+)\s*\]', lys_content)
-        if offset_match:
-            try:
-                offset = int(offset_match.group(1))
-            except Exception:
-                offset = 0
+        offset = lys_doc.offset
 
         # ---- 读取并解析翻译 LRC：转成 毫秒→文本 的字典，供"容差匹配" ----
-        trans_path = find_translation_file(input_path, translation_hint)
+        if translation_path is _MISSING:
+            trans_path = find_translation_file(input_path, translation_hint)
+        else:
+            trans_path = translation_path
         translation_dict_ms = {}
         trans_offset = 0
         translation_author = None
@@ -10888,23 +14044,18 @@ def lys_to_ttml(input_path, output_path, translation_hint: Optional[str] = None)
                 app.logger.warning(f"读取翻译文件时出错: {trans_path}. 错误: {str(e)}")
 
         # ---- 解析 LYS 主体 ----
-        lines = [line for line in lys_content.splitlines() if line.strip()]
         parsed_lines = []
 
-        for i, line in enumerate(lines):
+        for lys_line in lys_doc.lines:
             # 跳过元数据
-            if line.startswith('[from:') or line.startswith('[id:') or line.startswith('[offset:'):
+            if lys_line.raw.startswith(_LYS_SKIPPED_META_PREFIXES) or lys_line.marker is None:
                 continue
 
-            m_line = re.match(r'\[([^\]]*)\](.*)', line)
-            if not m_line:
-                continue
-
-            marker = m_line.group(1)       # 可能为空
-            content = m_line.group(2)
+            marker = lys_line.marker       # 可能为空
+            content = lys_line.content
 
             # 解析音节 + 应用 offset
-            syllables = parse_syllable_info(content, marker, offset=offset)
+            syllables = lys_line_syllables(lys_line, offset)
             parenthetical_background = False
             if marker not in ['6', '7', '8']:
                 parenthetical_background = is_parenthetical_background_line(content)
@@ -11143,287 +14294,385 @@ def repair_ttml_xml_text(ttml_text: str) -> str:
     return _repair_ttml_xml_text_impl(ttml_text, warn=app.logger.warning)
 
 
-def sanitize_ttml_content(ttml_text: str) -> str:
-    """
-    Rebuild TTML with a strict whitelist to strip complex/unknown metadata.
-    Only preserves Apple-style lyric timing, amll:meta entries, agents, and
-    translation/romanization/background spans.
-    """
-    ttml_text = repair_ttml_xml_text(ttml_text)
-    try:
-        src_dom = xml.dom.minidom.parseString(ttml_text)
-    except Exception as exc:
-        raise ValueError(f"TTML 解析失败: {exc}") from exc
+class TtmlText:
+    """净化后 TTML 的文本节点（只实现 TTMLLine / TTMLSyl 用到的那部分 DOM 接口）。"""
 
-    p_elements = src_dom.getElementsByTagName('p')
-    if not p_elements:
-        raise ValueError("TTML 中缺少 <p> 节点，无法净化保存")
-
-    def _node_text(node) -> str:
-        parts: List[str] = []
-        for child in node.childNodes:
-            if child.nodeType in (Node.TEXT_NODE, Node.CDATA_SECTION_NODE):
-                if child.nodeValue:
-                    parts.append(child.nodeValue)
-            elif child.nodeType == Node.ELEMENT_NODE:
-                parts.append(_node_text(child))
-        return ''.join(parts)
-
-    def _clean_bg_text(value: str) -> str:
-        cleaned = (value or '').strip()
-        cleaned = re.sub(r'^[（(]', '', cleaned)
-        cleaned = re.sub(r'[)）]$', '', cleaned)
-        return cleaned.strip()
-
-    def _is_translation_text(node) -> bool:
-        parent = getattr(node, 'parentNode', None)
-        if not parent or getattr(parent, 'tagName', None) != 'translation':
-            return False
-        grand_parent = getattr(parent, 'parentNode', None)
-        if not grand_parent or getattr(grand_parent, 'tagName', None) != 'translations':
-            return False
-        root = getattr(grand_parent, 'parentNode', None)
-        return bool(root and getattr(root, 'tagName', None) == 'iTunesMetadata')
+    __slots__ = ('nodeValue',)
+    nodeType = Node.TEXT_NODE
 
-    def _is_transliteration_text(node) -> bool:
-        parent = getattr(node, 'parentNode', None)
-        if not parent or getattr(parent, 'tagName', None) != 'transliteration':
-            return False
-        grand_parent = getattr(parent, 'parentNode', None)
-        if not grand_parent or getattr(grand_parent, 'tagName', None) != 'transliterations':
-            return False
-        root = getattr(grand_parent, 'parentNode', None)
-        return bool(root and getattr(root, 'tagName', None) == 'iTunesMetadata')
+    def __init__(self, value: str):
+        self.nodeValue = value
 
-    translations: dict[str, dict[str, str]] = {}
-    timed_translations: dict[str, dict[str, str]] = {}
-    for text_el in src_dom.getElementsByTagName('text'):
-        if not text_el.hasAttribute('for') or not _is_translation_text(text_el):
-            continue
-        key = text_el.getAttribute('for')
-        main_parts: List[str] = []
-        bg_parts: List[str] = []
-        has_span_child = False
-        for child in text_el.childNodes:
-            if child.nodeType in (Node.TEXT_NODE, Node.CDATA_SECTION_NODE):
-                if child.nodeValue:
-                    main_parts.append(child.nodeValue)
-            elif child.nodeType == Node.ELEMENT_NODE:
-                if child.tagName == 'span':
-                    has_span_child = True
-                role = child.getAttribute('ttm:role') if child.hasAttribute('ttm:role') else ''
-                if role == 'x-bg':
-                    bg_parts.append(_node_text(child))
-        main = ''.join(main_parts).strip()
-        bg = _clean_bg_text(''.join(bg_parts))
-        if main or bg:
-            target = timed_translations if has_span_child else translations
-            target[key] = {'main': main, 'bg': bg}
-            if has_span_child:
-                translations.pop(key, None)
-
-    line_romanizations: dict[str, dict[str, str]] = {}
-    for text_el in src_dom.getElementsByTagName('text'):
-        if not text_el.hasAttribute('for') or not _is_transliteration_text(text_el):
-            continue
-        key = text_el.getAttribute('for')
-        line_roman_main: List[str] = []
-        line_roman_bg: List[str] = []
-        for child in text_el.childNodes:
-            if child.nodeType in (Node.TEXT_NODE, Node.CDATA_SECTION_NODE):
-                if child.nodeValue:
-                    line_roman_main.append(child.nodeValue)
-            elif child.nodeType == Node.ELEMENT_NODE:
-                role = child.getAttribute('ttm:role') if child.hasAttribute('ttm:role') else ''
-                if role == 'x-bg':
-                    line_roman_bg.append(_node_text(child))
-                elif child.getAttribute('begin') and child.getAttribute('end'):
-                    line_roman_main.append(_node_text(child))
-        roman_main = ''.join(line_roman_main).strip()
-        roman_bg = _clean_bg_text(''.join(line_roman_bg))
-        if roman_main or roman_bg:
-            line_romanizations[key] = {'main': roman_main, 'bg': roman_bg}
-
-    main_agent_id = 'v1'
-    for agent in src_dom.getElementsByTagName('ttm:agent'):
-        if agent.getAttribute('type') == 'person':
-            xml_id = agent.getAttribute('xml:id')
-            if xml_id:
-                main_agent_id = xml_id
-                break
 
-    has_duet = any(
-        p.getAttribute('ttm:agent')
-        and p.getAttribute('ttm:agent') != main_agent_id
-        for p in p_elements
-    )
+class TtmlElement:
+    """净化后 TTML 的元素节点：属性保持写入顺序，相邻文本在追加时合并（与重新解析后的 DOM 一致）。"""
 
-    dom, div = create_ttml_document(has_duet)
-
-    metadata_nodes = dom.getElementsByTagName('metadata')
-    if metadata_nodes:
-        metadata_el = metadata_nodes[0]
-        for meta in src_dom.getElementsByTagName('amll:meta'):
-            key = meta.getAttribute('key')
-            value = meta.getAttribute('value')
-            if key and value:
-                clone = dom.createElement('amll:meta')
-                clone.setAttribute('key', key)
-                clone.setAttribute('value', value)
-                metadata_el.appendChild(clone)
-
-    src_body_nodes = src_dom.getElementsByTagName('body')
-    if src_body_nodes:
-        dur_value = src_body_nodes[0].getAttribute('dur')
-        dst_body_nodes = dom.getElementsByTagName('body')
-        if dur_value and dst_body_nodes:
-            dst_body_nodes[0].setAttribute('dur', dur_value)
-        src_div_nodes = src_body_nodes[0].getElementsByTagName('div')
-        if src_div_nodes:
-            begin = src_div_nodes[0].getAttribute('begin')
-            end = src_div_nodes[0].getAttribute('end')
-            if begin:
-                div.setAttribute('begin', begin)
-            if end:
-                div.setAttribute('end', end)
-
-    def normalize_agent(agent_value: str) -> str:
-        if not agent_value:
-            return 'v1'
-        return 'v1' if agent_value == main_agent_id else 'v2'
-
-    def copy_lyric_children(src_parent, dst_parent):
-        for child in src_parent.childNodes:
-            if child.nodeType in (Node.TEXT_NODE, Node.CDATA_SECTION_NODE):
-                if child.nodeValue:
-                    dst_parent.appendChild(dom.createTextNode(child.nodeValue))
-                continue
-            if child.nodeType != Node.ELEMENT_NODE:
-                continue
-            if child.tagName != 'span':
-                continue
+    __slots__ = ('tagName', 'attributes', 'childNodes')
+    nodeType = Node.ELEMENT_NODE
 
-            role = child.getAttribute('ttm:role') if child.hasAttribute('ttm:role') else ''
-            if role == 'x-bg':
-                bg_span = dom.createElement('span')
-                bg_span.setAttribute('ttm:role', 'x-bg')
-                begin = child.getAttribute('begin')
-                end = child.getAttribute('end')
-                if begin:
-                    bg_span.setAttribute('begin', begin)
-                if end:
-                    bg_span.setAttribute('end', end)
-                copy_lyric_children(child, bg_span)
-                if bg_span.childNodes:
-                    dst_parent.appendChild(bg_span)
-                continue
+    def __init__(self, tag_name: str, attributes: Optional[Dict[str, str]] = None):
+        self.tagName = tag_name
+        self.attributes: Dict[str, str] = attributes if attributes is not None else {}
+        self.childNodes: List[Union['TtmlElement', TtmlText]] = []
 
-            if role in {'x-translation', 'x-roman'}:
-                meta_span = dom.createElement('span')
-                meta_span.setAttribute('ttm:role', role)
-                if role == 'x-translation' and child.getAttribute('xml:lang'):
-                    meta_span.setAttribute('xml:lang', child.getAttribute('xml:lang'))
-                copy_lyric_children(child, meta_span)
-                if meta_span.childNodes:
-                    dst_parent.appendChild(meta_span)
-                continue
+    def getAttribute(self, name: str) -> str:
+        return self.attributes.get(name, '')
 
-            begin = child.getAttribute('begin')
-            end = child.getAttribute('end')
-            if not (begin and end):
-                continue
+    def hasAttribute(self, name: str) -> bool:
+        return name in self.attributes
+
+    def append_text(self, value: str) -> None:
+        if not value:
+            return
+        children = self.childNodes
+        if children and children[-1].nodeType == Node.TEXT_NODE:
+            children[-1].nodeValue += value
+        else:
+            children.append(TtmlText(value))
+
+    def append_role_span(self, role: str, text: str, lang: Optional[str] = None) -> None:
+        attributes = {'ttm:role': role}
+        if lang:
+            attributes['xml:lang'] = lang
+        span = TtmlElement('span', attributes)
+        span.childNodes.append(TtmlText(text))
+        self.childNodes.append(span)
+
+    def has_role_child(self, role: str) -> bool:
+        return any(child.nodeType == Node.ELEMENT_NODE and child.tagName == 'span'
+                   and child.attributes.get('ttm:role') == role for child in self.childNodes)
+
+    def role_children(self, role: str) -> List['TtmlElement']:
+        return [child for child in self.childNodes
+                if child.nodeType == Node.ELEMENT_NODE and child.tagName == 'span'
+                and child.attributes.get('ttm:role') == role]
+
+    def write_xml(self, out: List[str]) -> None:
+        """按 minidom ``toxml()`` 的格式输出（转义规则、空元素自闭合都一致）。"""
+        out.append('<' + self.tagName)
+        for name, value in self.attributes.items():
+            out.append(f' {name}="{_ttml_escape(value)}"')
+        if not self.childNodes:
+            out.append('/>')
+            return
+        out.append('>')
+        for child in self.childNodes:
+            if child.nodeType == Node.TEXT_NODE:
+                out.append(_ttml_escape(child.nodeValue))
+            else:
+                child.write_xml(out)
+        out.append(f'</{self.tagName}>')
+
+
+def _ttml_escape(value: str) -> str:
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+
+def _clean_ttml_bg_text(value: str) -> str:
+    cleaned = (value or '').strip()
+    cleaned = re.sub(r'^[（(]', '', cleaned)
+    cleaned = re.sub(r'[)）]$', '', cleaned)
+    return cleaned.strip()
+
+
+class TtmlSanitizedDocument:
+    """白名单净化后的 TTML：对唱标记、amll:meta、body/div 时间和逐行 <p>。"""
+
+    __slots__ = ('has_duet', 'metas', 'body_dur', 'div_begin', 'div_end', 'lines')
+
+    def __init__(self):
+        self.has_duet = False
+        self.metas: List[Tuple[str, str]] = []
+        self.body_dur = ''
+        self.div_begin = ''
+        self.div_end = ''
+        self.lines: List[TtmlElement] = []
+
+    def to_xml(self) -> str:
+        """序列化为与 create_ttml_document 同结构的单行 TTML。"""
+        metadata = TtmlElement('metadata')
+        agents = [('person', 'v1')] + ([('other', 'v2')] if self.has_duet else [])
+        for agent_type, agent_id in agents:
+            metadata.childNodes.append(TtmlElement('ttm:agent', {'type': agent_type, 'xml:id': agent_id}))
+        for key, value in self.metas:
+            metadata.childNodes.append(TtmlElement('amll:meta', {'key': key, 'value': value}))
+        head = TtmlElement('head')
+        head.childNodes.append(metadata)
+
+        div = TtmlElement('div')
+        if self.div_begin:
+            div.attributes['begin'] = self.div_begin
+        if self.div_end:
+            div.attributes['end'] = self.div_end
+        div.childNodes = list(self.lines)
+        body = TtmlElement('body', {'dur': self.body_dur} if self.body_dur else None)
+        body.childNodes.append(div)
+
+        tt = TtmlElement('tt', {
+            'xmlns': 'http://www.w3.org/ns/ttml',
+            'xmlns:ttm': 'http://www.w3.org/ns/ttml#metadata',
+            'xmlns:amll': 'http://www.example.com/ns/amll',
+            'xmlns:itunes': 'http://music.apple.com/lyric-ttml-internal',
+        })
+        tt.childNodes.extend((head, body))
+        out: List[str] = []
+        tt.write_xml(out)
+        return ''.join(out)
+
+
+class _TtmlMetaTextCapture:
+    """iTunesMetadata 里一条 <text for=...>（翻译或音译）的收集状态。"""
+
+    __slots__ = ('kind', 'key', 'depth', 'main', 'bg', 'has_span_child', 'child')
+
+    def __init__(self, kind: str, key: str, depth: int):
+        self.kind = kind
+        self.key = key
+        self.depth = depth
+        self.main: List[str] = []
+        self.bg: List[str] = []
+        self.has_span_child = False
+        # 当前直接子元素：(ttm:role, 是否带 begin+end, 其下全部文本)
+        self.child: Optional[Tuple[str, bool, List[str]]] = None
+
+
+class _TtmlStreamReader:
+    """单遍读取 TTML 的 expat 事件流，边读边按白名单净化。
+
+    不建整棵 DOM：只保留祖先标签栈、iTunesMetadata 的翻译 / 音译表，
+    以及每个 <p> 净化后的精简节点；行的对唱归一化与翻译注入在读完后补上。
+    """
 
-            span = dom.createElement('span')
-            span.setAttribute('begin', begin)
-            span.setAttribute('end', end)
-            if child.hasAttribute('amll:empty-beat'):
-                span.setAttribute('amll:empty-beat', child.getAttribute('amll:empty-beat'))
-            if child.getAttribute('amll:obscene') == 'true':
-                span.setAttribute('amll:obscene', 'true')
-            copy_lyric_children(child, span)
-            if span.childNodes:
-                dst_parent.appendChild(span)
-
-    for p in p_elements:
-        begin = p.getAttribute('begin')
-        end = p.getAttribute('end')
+    def __init__(self):
+        self.tags: List[str] = []
+        self._qnames: Dict[str, str] = {}
+        self.main_agent_id: Optional[str] = None
+        self.p_agents: Set[str] = set()
+        self.p_count = 0
+        self.doc = TtmlSanitizedDocument()
+        self._body_depth: Optional[int] = None
+        self._body_done = False
+        self._div_done = False
+        # (净化后的 <p>, 原 ttm:agent, itunes:key 或 None)
+        self.records: List[Tuple[TtmlElement, str, Optional[str]]] = []
+        # 正在读取的 <p>：每项是从该 <p> 起的目标节点栈，None 表示这一层被白名单丢弃
+        self._p_stacks: List[List[Optional[TtmlElement]]] = []
+        self._captures: List[_TtmlMetaTextCapture] = []
+        self.translations: Dict[str, Dict[str, str]] = {}
+        self.timed_translations: Dict[str, Dict[str, str]] = {}
+        self.romanizations: Dict[str, Dict[str, str]] = {}
+
+    def _qname(self, name: str) -> str:
+        """expat 的 "uri local prefix" 还原成 minidom 的 tagName（prefix:local）。"""
+        qname = self._qnames.get(name)
+        if qname is None:
+            parts = name.split(' ')
+            if len(parts) == 3:
+                qname = f'{parts[2]}:{parts[1]}'
+            else:
+                qname = parts[-1]
+            self._qnames[name] = qname
+        return qname
+
+    def feed(self, ttml_text: str) -> None:
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.namespace_prefixes = True
+        parser.buffer_text = True
+        parser.specified_attributes = True
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._chars
+        # 与 minidom 一致：不加载外部实体
+        parser.ExternalEntityRefHandler = lambda *_args: 1
+        parser.Parse(ttml_text, True)
+
+    def _start(self, name: str, raw_attrs: Dict[str, str]) -> None:
+        tag = self._qname(name)
+        attrs = {self._qname(key): value for key, value in raw_attrs.items()} if raw_attrs else {}
+        tags = self.tags
+        depth = len(tags)
+
+        for capture in self._captures:
+            if depth == capture.depth:
+                if tag == 'span':
+                    capture.has_span_child = True
+                capture.child = (attrs.get('ttm:role', ''), bool(attrs.get('begin') and attrs.get('end')), [])
+
+        for stack in self._p_stacks:
+            parent = stack[-1]
+            stack.append(None if parent is None else self._whitelisted_child(tag, attrs))
+
+        if tag == 'p':
+            self.p_count += 1
+            agent = attrs.get('ttm:agent', '')
+            if agent:
+                self.p_agents.add(agent)
+            begin = attrs.get('begin')
+            end = attrs.get('end')
+            if begin and end:
+                node = TtmlElement('p', {'begin': begin, 'end': end})
+                self.records.append((node, agent, attrs.get('itunes:key') if 'itunes:key' in attrs else None))
+                self._p_stacks.append([node])
+        elif tag == 'text':
+            if ('for' in attrs and depth >= 3 and tags[-3] == 'iTunesMetadata'
+                    and tags[-1] in ('translation', 'transliteration') and tags[-2] == tags[-1] + 's'):
+                self._captures.append(_TtmlMetaTextCapture(tags[-1], attrs['for'], depth + 1))
+        elif tag == 'ttm:agent':
+            if self.main_agent_id is None and attrs.get('type') == 'person' and attrs.get('xml:id'):
+                self.main_agent_id = attrs['xml:id']
+        elif tag == 'amll:meta':
+            if attrs.get('key') and attrs.get('value'):
+                self.doc.metas.append((attrs['key'], attrs['value']))
+        elif tag == 'body':
+            if self._body_depth is None and not self._body_done:
+                self._body_depth = depth
+                self.doc.body_dur = attrs.get('dur', '')
+        elif tag == 'div':
+            if self._body_depth is not None and not self._div_done:
+                self._div_done = True
+                self.doc.div_begin = attrs.get('begin', '')
+                self.doc.div_end = attrs.get('end', '')
+
+        tags.append(tag)
+
+    def _end(self, _name: str) -> None:
+        tags = self.tags
+        tags.pop()
+        depth = len(tags)
+
+        if self._captures:
+            for capture in list(self._captures):
+                if depth == capture.depth:
+                    role, timed, parts = capture.child
+                    capture.child = None
+                    if role == 'x-bg':
+                        capture.bg.append(''.join(parts))
+                    elif capture.kind == 'transliteration' and timed:
+                        capture.main.append(''.join(parts))
+                elif depth == capture.depth - 1:
+                    self._captures.remove(capture)
+                    self._store_capture(capture)
+
+        if self._p_stacks:
+            finished = False
+            for stack in self._p_stacks:
+                node = stack.pop()
+                if not stack:
+                    finished = True
+                elif node is not None and node.childNodes and stack[-1] is not None:
+                    stack[-1].childNodes.append(node)
+            if finished:
+                self._p_stacks = [stack for stack in self._p_stacks if stack]
+
+        if depth == self._body_depth:
+            self._body_depth = None
+            self._body_done = True
+
+    def _chars(self, data: str) -> None:
+        depth = len(self.tags)
+        for capture in self._captures:
+            if depth == capture.depth:
+                capture.main.append(data)
+            elif capture.child is not None:
+                capture.child[2].append(data)
+        for stack in self._p_stacks:
+            node = stack[-1]
+            if node is not None:
+                node.append_text(data)
+
+    @staticmethod
+    def _whitelisted_child(tag: str, attrs: Dict[str, str]) -> Optional[TtmlElement]:
+        if tag != 'span':
+            return None
+        role = attrs.get('ttm:role', '')
+        begin = attrs.get('begin', '')
+        end = attrs.get('end', '')
+        if role == 'x-bg':
+            kept = {'ttm:role': 'x-bg'}
+            if begin:
+                kept['begin'] = begin
+            if end:
+                kept['end'] = end
+            return TtmlElement('span', kept)
+        if role in ('x-translation', 'x-roman'):
+            kept = {'ttm:role': role}
+            if role == 'x-translation' and attrs.get('xml:lang'):
+                kept['xml:lang'] = attrs['xml:lang']
+            return TtmlElement('span', kept)
         if not (begin and end):
-            continue
-
-        new_p = dom.createElement('p')
-        new_p.setAttribute('begin', begin)
-        new_p.setAttribute('end', end)
-        itunes_key = ''
-        if p.hasAttribute('itunes:key'):
-            itunes_key = p.getAttribute('itunes:key')
-            new_p.setAttribute('itunes:key', itunes_key)
-        new_p.setAttribute('ttm:agent', normalize_agent(p.getAttribute('ttm:agent')))
-
-        copy_lyric_children(p, new_p)
-
-        def has_role_child(parent, role: str) -> bool:
-            for child in parent.childNodes:
-                if (
-                    child.nodeType == Node.ELEMENT_NODE
-                    and child.tagName == 'span'
-                    and child.getAttribute('ttm:role') == role
-                ):
-                    return True
-            return False
+            return None
+        kept = {'begin': begin, 'end': end}
+        if 'amll:empty-beat' in attrs:
+            kept['amll:empty-beat'] = attrs['amll:empty-beat']
+        if attrs.get('amll:obscene') == 'true':
+            kept['amll:obscene'] = 'true'
+        return TtmlElement('span', kept)
+
+    def _store_capture(self, capture: _TtmlMetaTextCapture) -> None:
+        main = ''.join(capture.main).strip()
+        bg = _clean_ttml_bg_text(''.join(capture.bg))
+        if not (main or bg):
+            return
+        if capture.kind == 'transliteration':
+            self.romanizations[capture.key] = {'main': main, 'bg': bg}
+            return
+        target = self.timed_translations if capture.has_span_child else self.translations
+        target[capture.key] = {'main': main, 'bg': bg}
+        if capture.has_span_child:
+            self.translations.pop(capture.key, None)
+
+    def finish(self) -> TtmlSanitizedDocument:
+        if not self.p_count:
+            raise ValueError("TTML 中缺少 <p> 节点，无法净化保存")
+        doc = self.doc
+        main_agent_id = self.main_agent_id or 'v1'
+        doc.has_duet = any(agent != main_agent_id for agent in self.p_agents)
+        for p, agent, itunes_key in self.records:
+            if itunes_key is not None:
+                p.attributes['itunes:key'] = itunes_key
+            p.attributes['ttm:agent'] = 'v1' if not agent or agent == main_agent_id else 'v2'
+
+            translation_data = roman_data = None
+            if itunes_key:
+                translation_data = self.timed_translations.get(itunes_key) or self.translations.get(itunes_key)
+                roman_data = self.romanizations.get(itunes_key)
+            if translation_data and translation_data.get('main') and not p.has_role_child('x-translation'):
+                p.append_role_span('x-translation', translation_data['main'], 'zh-CN')
+            if translation_data and translation_data.get('bg'):
+                for span in p.role_children('x-bg'):
+                    if not span.has_role_child('x-translation'):
+                        span.append_role_span('x-translation', translation_data['bg'], 'zh-CN')
+                        break
+            if roman_data and roman_data.get('main') and not p.has_role_child('x-roman'):
+                p.append_role_span('x-roman', roman_data['main'])
+            if roman_data and roman_data.get('bg'):
+                for span in p.role_children('x-bg'):
+                    if not span.has_role_child('x-roman'):
+                        span.append_role_span('x-roman', roman_data['bg'])
+                        break
+            if p.childNodes:
+                doc.lines.append(p)
+        return doc
 
-        def bg_spans(parent) -> List[Element]:
-            spans: List[Element] = []
-            for child in parent.childNodes:
-                if (
-                    child.nodeType == Node.ELEMENT_NODE
-                    and child.tagName == 'span'
-                    and child.getAttribute('ttm:role') == 'x-bg'
-                ):
-                    spans.append(child)
-            return spans
-
-        translation_data = None
-        roman_data = None
-        if itunes_key:
-            translation_data = timed_translations.get(itunes_key) or translations.get(itunes_key)
-            roman_data = line_romanizations.get(itunes_key)
-
-        if translation_data and translation_data.get('main') and not has_role_child(new_p, 'x-translation'):
-            trans_span = dom.createElement('span')
-            trans_span.setAttribute('ttm:role', 'x-translation')
-            trans_span.setAttribute('xml:lang', 'zh-CN')
-            trans_span.appendChild(dom.createTextNode(translation_data['main']))
-            new_p.appendChild(trans_span)
-
-        if translation_data and translation_data.get('bg'):
-            for span in bg_spans(new_p):
-                if not has_role_child(span, 'x-translation'):
-                    trans_span = dom.createElement('span')
-                    trans_span.setAttribute('ttm:role', 'x-translation')
-                    trans_span.setAttribute('xml:lang', 'zh-CN')
-                    trans_span.appendChild(dom.createTextNode(translation_data['bg']))
-                    span.appendChild(trans_span)
-                    break
 
-        if roman_data and roman_data.get('main') and not has_role_child(new_p, 'x-roman'):
-            roman_span = dom.createElement('span')
-            roman_span.setAttribute('ttm:role', 'x-roman')
-            roman_span.appendChild(dom.createTextNode(roman_data['main']))
-            new_p.appendChild(roman_span)
-
-        if roman_data and roman_data.get('bg'):
-            for span in bg_spans(new_p):
-                if not has_role_child(span, 'x-roman'):
-                    roman_span = dom.createElement('span')
-                    roman_span.setAttribute('ttm:role', 'x-roman')
-                    roman_span.appendChild(dom.createTextNode(roman_data['bg']))
-                    span.appendChild(roman_span)
-                    break
+def parse_sanitized_ttml(ttml_text: str) -> TtmlSanitizedDocument:
+    """修复后单遍流式读取 TTML，返回白名单净化后的文档（不经过 minidom）。"""
+    ttml_text = repair_ttml_xml_text(ttml_text)
+    reader = _TtmlStreamReader()
+    try:
+        reader.feed(ttml_text)
+    except Exception as exc:
+        raise ValueError(f"TTML 解析失败: {exc}") from exc
+    return reader.finish()
 
-        if new_p.childNodes:
-            div.appendChild(new_p)
 
-    return dom.documentElement.toxml()
+def sanitize_ttml_content(ttml_text: str) -> str:
+    """
+    Rebuild TTML with a strict whitelist to strip complex/unknown metadata.
+    Only preserves Apple-style lyric timing, amll:meta entries, agents, and
+    translation/romanization/background spans.
+    """
+    return parse_sanitized_ttml(ttml_text).to_xml()
 
 
 def parse_lrc_line(line):
@@ -11492,15 +14741,21 @@ def calculate_lrc_end_time(begin_time_str, next_begin_time_str=None, default_dur
     return f"{end_min:02d}:{end_sec:02d}.{end_ms_part:03d}"
 
 
-def lrc_to_ttml(input_path, output_path, translation_hint: Optional[str] = None):
-    """将LRC格式转换为TTML格式（Apple风格）"""
+def lrc_to_ttml(input_path, output_path, translation_hint: Optional[str] = None, translation_path: Any = _MISSING):
+    """将LRC格式转换为TTML格式（Apple风格）
+
+    translation_path 的含义同 lys_to_ttml。
+    """
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
             lrc_content = f.read()
         author_name = extract_tag_value(lrc_content, 'by')
 
         # ---- 读取并解析翻译 LRC：转成 毫秒→文本 的字典，供"精确匹配" ----
-        trans_path = find_translation_file(input_path, translation_hint)
+        if translation_path is _MISSING:
+            trans_path = find_translation_file(input_path, translation_hint)
+        else:
+            trans_path = translation_path
         translation_dict_ms = {}
         translation_author = None
         if trans_path:
@@ -11829,84 +15084,526 @@ def convert_to_ttml():
         if file_ext not in ['.lys', '.lrc']:
             return jsonify({'status': 'error', 'message': '只支持LYS和LRC格式'})
 
-        if not input_path.exists():
-            return jsonify({'status': 'error', 'message': '歌词文件不存在'})
+        if not input_path.exists():
+            return jsonify({'status': 'error', 'message': '歌词文件不存在'})
+
+        # 生成输出文件名
+        output_filename = input_path.stem + '.ttml'
+        output_path = SONGS_DIR / output_filename
+
+        # 根据文件类型调用相应的转换函数
+        success = False
+        error_msg = None
+        if file_ext == '.lys':
+            success, error_msg = lys_to_ttml(str(input_path), str(output_path), translation_path)
+        elif file_ext == '.lrc':
+            success, error_msg = lrc_to_ttml(str(input_path), str(output_path), translation_path)
+
+        if success:
+            target_relative = resource_relative_from_path(output_path, 'songs')
+            return jsonify({
+                'status': 'success',
+                'ttmlPath': build_public_url('songs', target_relative)
+            })
+        else:
+            return jsonify({'status': 'error', 'message': f'转换失败: {error_msg}'})
+
+    except Exception as e:
+        app.logger.error(f"处理转换请求时出错: {str(e)}", exc_info=True)
+        return jsonify({'status': 'error', 'message': f'处理请求时出错: {str(e)}'})
+
+
+@app.route('/convert_to_ttml_temp', methods=['POST'])
+def convert_to_ttml_temp():
+    """将歌词临时转换为TTML格式，用于AMLL规则编写，不覆盖原文件"""
+    if not is_request_allowed():
+        return abort(403)
+    try:
+        data = request.get_json()
+        lyrics_path = data.get('path')
+        translation_path = data.get('translationPath')
+        if not lyrics_path:
+            return jsonify({'status': 'error', 'message': '请提供歌词文件路径'})
+
+        try:
+            input_path = resolve_resource_path(lyrics_path, 'songs')
+        except ValueError as exc:
+            return jsonify({'status': 'error', 'message': f'无法解析歌词路径: {exc}'})
+
+        # 获取文件扩展名
+        file_ext = input_path.suffix.lower()
+        if file_ext not in ['.lys', '.lrc']:
+            return jsonify({'status': 'error', 'message': '只支持LYS和LRC格式'})
+
+        if not input_path.exists():
+            return jsonify({'status': 'error', 'message': '歌词文件不存在'})
+
+        # 产物放在内容寻址缓存里，不写进 songs 目录，也不影响原文件
+        ttml_url, error_msg = _get_player_ttml_artifact(input_path, translation_path)
+        if ttml_url:
+            return jsonify({
+                'status': 'success',
+                'ttmlPath': ttml_url
+            })
+        else:
+            return jsonify({'status': 'error', 'message': error_msg})
+
+    except Exception as e:
+        app.logger.error(f"处理临时转换请求时出错: {str(e)}", exc_info=True)
+        return jsonify({'status': 'error', 'message': f'处理请求时出错: {str(e)}'})
+
+
+CONVERT_BATCH_TARGETS = {
+    # 目标格式 -> 可作为源的扩展名
+    'ttml': ('.lys', '.lrc'),
+    'lys': ('.ttml',),
+}
+CONVERT_BATCH_REPORT_NAME = 'conversion-report.json'
+_convert_batch_pool: Optional[ProcessPoolExecutor] = None
+_convert_batch_pool_lock = threading.Lock()
+
+
+def _init_convert_batch_worker() -> None:
+    """转换子进程的 initializer，本身不做任何事。
+
+    它随进程对象一起在 spawn 的继承阶段被反序列化，本模块因此在该阶段（而不是首个任务到达时）导入，
+    _song_search_index_should_initialize 能据此跳过索引加载和目录监听。
+    """
+
+
+def _get_convert_batch_pool() -> Optional[ProcessPoolExecutor]:
+    """懒创建转换进程池；CONVERT_BATCH_MAX_WORKERS 为 1 时返回 None。"""
+    global _convert_batch_pool
+    if CONVERT_BATCH_MAX_WORKERS <= 1:
+        return None
+    with _convert_batch_pool_lock:
+        if _convert_batch_pool is None:
+            # 统一用 spawn：Windows/打包版本只能 spawn，Linux 上也避免带着后台线程 fork
+            _convert_batch_pool = ProcessPoolExecutor(
+                max_workers=CONVERT_BATCH_MAX_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_convert_batch_worker,
+            )
+        return _convert_batch_pool
+
+
+def _discard_convert_batch_pool(pool: ProcessPoolExecutor) -> None:
+    global _convert_batch_pool
+    with _convert_batch_pool_lock:
+        if _convert_batch_pool is pool:
+            _convert_batch_pool = None
+    try:
+        pool.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def _run_conversion_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """转换单个文件（在进程池子进程或任务线程里执行），不抛异常，结果写进返回的字典。"""
+    result = {
+        'index': item['index'],
+        'source': item['relative'],
+        'status': 'error',
+        'outputs': [],
+        'error': '',
+    }
+    try:
+        source = Path(item['source'])
+        output_dir = Path(item['output_dir']) / Path(item['relative']).parent
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if item['target'] == 'ttml':
+            output_path = output_dir / f'{source.stem}.ttml'
+            converter = lys_to_ttml if source.suffix.lower() == '.lys' else lrc_to_ttml
+            success, error_msg = converter(str(source), str(output_path), translation_path=item.get('translation'))
+            outputs = [str(output_path)] if success else []
+        else:
+            success, lyric_path, trans_path = ttml_to_lys(str(source), str(output_dir))
+            error_msg = None if success else '转换失败，请检查TTML文件格式是否正确'
+            outputs = [path for path in (lyric_path, trans_path) if path]
+        if success:
+            result['status'] = 'ok'
+            result['outputs'] = outputs
+        else:
+            result['error'] = error_msg or '转换失败'
+    except Exception as exc:
+        result['error'] = f'{type(exc).__name__}: {exc}'
+    return result
+
+
+def _is_convert_batch_scratch_file(path: Path) -> bool:
+    """上传/AMLL 临时转换留下的中间文件不参与批量转换。"""
+    name = path.name.lower()
+    return name.startswith('temp_') or name.endswith('_amll_temp.ttml')
+
+
+def _collect_convert_batch_items(target: str, files: Optional[List[str]], output_dir: Path) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """列出要转换的源文件，返回 (待转换条目, 无法转换的文件结果)。
+
+    翻译文件在这里（主进程，有歌曲资源图）解析好再交给子进程；
+    指向 TTML 时，已被当作翻译或与 .lys 同名的 .lrc 不单独转换。
+    """
+    songs_dir = RESOURCE_DIRECTORIES['songs'].resolve()
+    suffixes = CONVERT_BATCH_TARGETS[target]
+    rejected: List[Dict[str, Any]] = []
+    if files is None:
+        sources = [
+            path for path in songs_dir.rglob('*')
+            if path.is_file() and path.suffix.lower() in suffixes and not _is_convert_batch_scratch_file(path)
+        ]
+    else:
+        sources = []
+        for value in files:
+            try:
+                path = resolve_resource_path(str(value), 'songs')
+            except ValueError as exc:
+                rejected.append({'source': str(value), 'status': 'error', 'outputs': [], 'error': str(exc)})
+                continue
+            if path.suffix.lower() not in suffixes or not path.is_file():
+                rejected.append({'source': str(value), 'status': 'error', 'outputs': [], 'error': '文件不存在或格式不支持'})
+                continue
+            sources.append(path)
+    sources = sorted(set(sources), key=lambda path: path.relative_to(songs_dir).as_posix().lower())
+
+    translations: Dict[Path, Optional[str]] = {}
+    if target == 'ttml':
+        # 显式点名的文件照单全收；整库转换时才跳过翻译 LRC
+        skip_translations = files is None
+        lys_stems = {path.with_suffix('') for path in sources if path.suffix.lower() == '.lys'}
+        used_translations: Set[Path] = set()
+        for path in sources:
+            if path.suffix.lower() != '.lys':
+                continue
+            translations[path] = find_translation_file(path)
+            if translations[path]:
+                used_translations.add(Path(translations[path]).resolve())
+        kept = []
+        for path in sources:
+            if path.suffix.lower() == '.lrc':
+                if skip_translations and (path.stem.lower().endswith('_trans') or path in used_translations
+                        or path.with_suffix('') in lys_stems):
+                    continue
+                translations[path] = find_translation_file(path)
+            kept.append(path)
+        sources = kept
+
+    items = []
+    for index, path in enumerate(sources):
+        items.append({
+            'index': index,
+            'target': target,
+            'source': str(path),
+            'relative': path.relative_to(songs_dir).as_posix(),
+            'output_dir': str(output_dir),
+            'translation': translations.get(path),
+        })
+    return items, rejected
+
+
+def _iter_convert_batch_results(items: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """按完成顺序产出转换结果；进程池不可用或中途崩溃时，剩下的条目在当前线程里补做。"""
+    remaining = list(items)
+    pool = _get_convert_batch_pool() if len(items) > 1 else None
+    if pool is not None:
+        futures = {}
+        try:
+            for item in items:
+                futures[pool.submit(_run_conversion_item, item)] = item
+        except (BrokenProcessPool, RuntimeError, OSError) as exc:
+            app.logger.warning("转换进程池不可用，改为在线程内转换: %s", exc)
+            _discard_convert_batch_pool(pool)
+        finished: Set[int] = set()
+        broken = False
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken = True
+                continue
+            except Exception as exc:
+                result = {'index': item['index'], 'source': item['relative'], 'status': 'error',
+                          'outputs': [], 'error': f'{type(exc).__name__}: {exc}'}
+            finished.add(item['index'])
+            yield result
+        if broken:
+            app.logger.warning("转换子进程异常退出，剩余文件改为在线程内转换")
+            _discard_convert_batch_pool(pool)
+        remaining = [item for item in items if item['index'] not in finished]
+    for item in remaining:
+        yield _run_conversion_item(item)
+
+
+def _build_convert_batch_task_snapshot(task_id: str, task: Dict[str, Any]) -> Dict[str, Any]:
+    total_files = int(task.get('total_files') or 0)
+    processed_files = int(task.get('processed_files') or 0)
+    status = task.get('status', 'pending')
+    if status == 'done':
+        progress_percent = 100.0
+    elif total_files > 0:
+        progress_percent = round(min(100.0, (processed_files * 100.0) / total_files), 2)
+    else:
+        progress_percent = 0.0
+
+    download_path = task.get('download_path') or ''
+    download_ready = status == 'done' and bool(download_path) and Path(download_path).exists()
+    return {
+        'task_id': task_id,
+        'status': status,
+        'target': task.get('target', ''),
+        'archive_name': task.get('archive_name', ''),
+        'total_files': total_files,
+        'processed_files': processed_files,
+        'converted_files': int(task.get('converted_files') or 0),
+        'failed': list(task.get('failed') or []),
+        'current_file': task.get('current_file', ''),
+        'error': task.get('error', ''),
+        'created_at': task.get('created_at', ''),
+        'completed_at': task.get('completed_at', ''),
+        'progress_percent': progress_percent,
+        'download_ready': download_ready,
+    }
+
+
+def _find_active_convert_batch_task(device_id: str, target: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """同一设备、同一目标格式仍在进行的任务直接复用（转换结果随歌词变化，已完成的不复用）。"""
+    if not device_id:
+        return None
+    with CONVERT_BATCH_LOCK:
+        active_tasks = [
+            (task_id, task)
+            for task_id, task in CONVERT_BATCH_TASKS.items()
+            if task.get('owner_device_id') == device_id
+            and task.get('target') == target
+            and task.get('status') in {'pending', 'running'}
+        ]
+        if active_tasks:
+            return max(active_tasks, key=_static_export_task_sort_key)
+    return None
+
+
+def _update_convert_batch_task(task_id: str, **fields: Any) -> bool:
+    with CONVERT_BATCH_LOCK:
+        task = CONVERT_BATCH_TASKS.get(task_id)
+        if task is None:
+            return False
+        task.update(fields)
+        return True
+
+
+def _run_convert_batch_task(task_id: str) -> None:
+    archive_path = None
+    staging_dir = None
+    try:
+        with CONVERT_BATCH_LOCK:
+            task = CONVERT_BATCH_TASKS.get(task_id)
+        if task is None:
+            return
+
+        archive_path = Path(task['download_path'])
+        staging_dir = Path(tempfile.mkdtemp(prefix='convert-batch-'))
+        items, rejected = _collect_convert_batch_items(task['target'], task.get('files'), staging_dir)
+        total_files = len(items) + len(rejected)
+        failed = [{'source': result['source'], 'error': result['error']} for result in rejected]
+        if not _update_convert_batch_task(task_id, status='running', total_files=total_files,
+                                          processed_files=len(rejected), converted_files=0,
+                                          failed=list(failed), current_file='', error=''):
+            return
+
+        results: List[Dict[str, Any]] = []
+        converted = 0
+        for result in _iter_convert_batch_results(items):
+            results.append(result)
+            if result['status'] == 'ok':
+                converted += 1
+            else:
+                failed.append({'source': result['source'], 'error': result['error']})
+            if not _update_convert_batch_task(task_id, processed_files=len(rejected) + len(results),
+                                              converted_files=converted, failed=list(failed),
+                                              current_file=result['source']):
+                return
+
+        results.sort(key=lambda result: result['index'])
+        report = []
+        with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for result in results:
+                outputs = []
+                for output in result['outputs']:
+                    arcname = 'songs/' + Path(output).resolve().relative_to(staging_dir.resolve()).as_posix()
+                    archive.write(output, arcname=arcname)
+                    outputs.append(arcname)
+                report.append({'source': result['source'], 'status': result['status'],
+                               'outputs': outputs, 'error': result['error']})
+            report.extend({'source': r['source'], 'status': r['status'], 'outputs': [], 'error': r['error']}
+                          for r in rejected)
+            archive.writestr(CONVERT_BATCH_REPORT_NAME, json.dumps({
+                'target': task['target'],
+                'total_files': total_files,
+                'converted_files': converted,
+                'results': report,
+            }, ensure_ascii=False, indent=2))
+
+        _update_convert_batch_task(task_id, status='done', completed_at=datetime.now().isoformat(),
+                                   current_file='', processed_files=total_files)
+
+    except Exception as exc:
+        app.logger.error("批量转换任务失败: %s", exc, exc_info=True)
+        if archive_path and archive_path.exists():
+            try:
+                archive_path.unlink()
+            except Exception:
+                pass
+        _update_convert_batch_task(task_id, status='error', error=str(exc),
+                                   completed_at=datetime.now().isoformat())
+
+    finally:
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        cleanup_exports_dir(max_keep=20)
+
+
+def _start_convert_batch_task(device_id: str, target: str, files: Optional[List[str]]) -> Tuple[str, Dict[str, Any]]:
+    cleanup_exports_dir(max_keep=20)
+    task_id = uuid.uuid4().hex
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    archive_name = f'convert-{target}-{timestamp}-{task_id[:8]}.zip'
+
+    task = {
+        'status': 'pending',
+        'owner_device_id': device_id,
+        'target': target,
+        'files': files,
+        'archive_name': archive_name,
+        'download_path': str(EXPORTS_DIR / archive_name),
+        'total_files': 0,
+        'processed_files': 0,
+        'converted_files': 0,
+        'failed': [],
+        'current_file': '',
+        'error': '',
+        'created_at': datetime.now().isoformat(),
+        'completed_at': '',
+    }
+
+    with CONVERT_BATCH_LOCK:
+        CONVERT_BATCH_TASKS[task_id] = task
+
+    THREADPOOL_EXECUTOR.submit(_run_convert_batch_task, task_id)
+    return task_id, task
+
+
+@app.route('/convert_batch/start', methods=['POST'])
+def convert_batch_start():
+    """启动批量转换：target=ttml 把 LYS/LRC 转成 TTML，target=lys 把 TTML 转成 LYS（附翻译 LRC）。
+
+    可选 files 限定 songs/ 下的源文件；缺省转换整个歌词库。结果打包为 ZIP，不改动库内文件。
+    """
+    if not is_request_allowed():
+        return abort(403)
+    locked_response = require_unlocked_device('批量转换歌词')
+    if locked_response:
+        return locked_response
+
+    data = request.get_json(silent=True) or {}
+    target = str(data.get('target') or '').strip().lower()
+    if target not in CONVERT_BATCH_TARGETS:
+        return jsonify({'status': 'error', 'message': '目标格式仅支持 ttml 或 lys'}), 400
+    files = data.get('files')
+    if files is not None and (not isinstance(files, list) or not files):
+        return jsonify({'status': 'error', 'message': 'files 必须是非空的文件列表'}), 400
+
+    device_id = request.cookies.get('FEW_DEVICE_ID')
+    if not device_id:
+        device_id = str(uuid.uuid4())
+
+    active_task = _find_active_convert_batch_task(device_id, target) if files is None else None
+    if active_task:
+        task_id, task = active_task
+        reused = True
+    else:
+        task_id, task = _start_convert_batch_task(device_id, target, files)
+        reused = False
+
+    with CONVERT_BATCH_LOCK:
+        snapshot = _build_convert_batch_task_snapshot(task_id, task)
+    response = jsonify({
+        'status': 'success',
+        'reused': reused,
+        'task_id': task_id,
+        'task': snapshot,
+    })
+    response.set_cookie(
+        'FEW_DEVICE_ID',
+        device_id,
+        httponly=True,
+        samesite='Lax',
+        max_age=365 * 24 * 3600
+    )
+    return response
+
 
-        # 生成输出文件名
-        output_filename = input_path.stem + '.ttml'
-        output_path = SONGS_DIR / output_filename
+@app.route('/convert_batch/status', methods=['GET'])
+def convert_batch_status():
+    if not is_request_allowed():
+        return abort(403)
+    locked_response = require_unlocked_device('查看批量转换进度')
+    if locked_response:
+        return locked_response
 
-        # 根据文件类型调用相应的转换函数
-        success = False
-        error_msg = None
-        if file_ext == '.lys':
-            success, error_msg = lys_to_ttml(str(input_path), str(output_path), translation_path)
-        elif file_ext == '.lrc':
-            success, error_msg = lrc_to_ttml(str(input_path), str(output_path), translation_path)
+    task_id = (request.args.get('task_id') or '').strip()
+    if not task_id:
+        return jsonify({'status': 'error', 'message': '请提供任务ID'}), 400
 
-        if success:
-            target_relative = resource_relative_from_path(output_path, 'songs')
-            return jsonify({
-                'status': 'success',
-                'ttmlPath': build_public_url('songs', target_relative)
-            })
-        else:
-            return jsonify({'status': 'error', 'message': f'转换失败: {error_msg}'})
+    device_id = request.cookies.get('FEW_DEVICE_ID')
+    if not device_id:
+        return jsonify({'status': 'error', 'message': '设备未解锁'}), 403
 
-    except Exception as e:
-        app.logger.error(f"处理转换请求时出错: {str(e)}", exc_info=True)
-        return jsonify({'status': 'error', 'message': f'处理请求时出错: {str(e)}'})
+    with CONVERT_BATCH_LOCK:
+        task = CONVERT_BATCH_TASKS.get(task_id)
+        if not task or task.get('owner_device_id') != device_id:
+            return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+        task_snapshot = _build_convert_batch_task_snapshot(task_id, task)
+
+    return jsonify({
+        'status': 'success',
+        'task': task_snapshot,
+    })
 
 
-@app.route('/convert_to_ttml_temp', methods=['POST'])
-def convert_to_ttml_temp():
-    """将歌词临时转换为TTML格式，用于AMLL规则编写，不覆盖原文件"""
+@app.route('/convert_batch/download', methods=['GET'])
+def convert_batch_download():
     if not is_request_allowed():
         return abort(403)
-    try:
-        data = request.get_json()
-        lyrics_path = data.get('path')
-        translation_path = data.get('translationPath')
-        if not lyrics_path:
-            return jsonify({'status': 'error', 'message': '请提供歌词文件路径'})
-
-        try:
-            input_path = resolve_resource_path(lyrics_path, 'songs')
-        except ValueError as exc:
-            return jsonify({'status': 'error', 'message': f'无法解析歌词路径: {exc}'})
+    locked_response = require_unlocked_device('下载批量转换结果')
+    if locked_response:
+        return locked_response
 
-        # 获取文件扩展名
-        file_ext = input_path.suffix.lower()
-        if file_ext not in ['.lys', '.lrc']:
-            return jsonify({'status': 'error', 'message': '只支持LYS和LRC格式'})
+    task_id = (request.args.get('task_id') or '').strip()
+    if not task_id:
+        return jsonify({'status': 'error', 'message': '请提供任务ID'}), 400
 
-        if not input_path.exists():
-            return jsonify({'status': 'error', 'message': '歌词文件不存在'})
+    device_id = request.cookies.get('FEW_DEVICE_ID')
+    if not device_id:
+        return jsonify({'status': 'error', 'message': '设备未解锁'}), 403
 
-        # 生成带专用后缀的临时输出文件名，避免影响原文件
-        output_filename = input_path.stem + '_amll_temp.ttml'
-        output_path = SONGS_DIR / output_filename
+    with CONVERT_BATCH_LOCK:
+        task = CONVERT_BATCH_TASKS.get(task_id)
+        if not task or task.get('owner_device_id') != device_id:
+            return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+        task_snapshot = _build_convert_batch_task_snapshot(task_id, task)
 
-        # 根据文件类型调用相应的转换函数
-        success = False
-        error_msg = None
-        if file_ext == '.lys':
-            success, error_msg = lys_to_ttml(str(input_path), str(output_path), translation_path)
-        elif file_ext == '.lrc':
-            success, error_msg = lrc_to_ttml(str(input_path), str(output_path), translation_path)
+    if task_snapshot['status'] != 'done':
+        return jsonify({'status': 'error', 'message': '任务尚未完成'}), 409
 
-        if success:
-            target_relative = resource_relative_from_path(output_path, 'songs')
-            return jsonify({
-                'status': 'success',
-                'ttmlPath': build_public_url('songs', target_relative)
-            })
-        else:
-            return jsonify({'status': 'error', 'message': f'转换失败: {error_msg}'})
+    archive_path = Path(task.get('download_path', ''))
+    if not archive_path.exists():
+        return jsonify({'status': 'error', 'message': '导出文件已失效'}), 404
 
-    except Exception as e:
-        app.logger.error(f"处理临时转换请求时出错: {str(e)}", exc_info=True)
-        return jsonify({'status': 'error', 'message': f'处理请求时出错: {str(e)}'})
+    return send_file(
+        archive_path,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=task.get('archive_name', 'convert.zip')
+    )
 
 
 @app.route('/merge_to_lqe', methods=['POST'])
@@ -14547,7 +18244,9 @@ def add_header(resp):
     resp.headers['Access-Control-Allow-Origin'] = '*'
     content_type = resp.headers.get('content-type', '')
     media_type = getattr(resp, 'media_type', '') or ''
-    if content_type.startswith('application/json') or media_type.startswith('application/json'):
+    is_json = content_type.startswith('application/json') or media_type.startswith('application/json')
+    # 带 ETag 的 JSON 由路由自己声明缓存策略（靠 If-None-Match 回源校验），不能再被 no-store 覆盖
+    if is_json and 'etag' not in resp.headers:
         resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         resp.headers['Pragma'] = 'no-cache'
         resp.headers['Expires'] = '0'
@@ -14617,11 +18316,97 @@ def lyrics_animate():
     else:  # 默认为 'Kok' 或其他值
         return render_template('Lyrics-style.HTML-COK-up.HTML', amll_entry=amll_entry)
 
+# /lyrics 与 /song-info 的已编码响应缓存（条目带依赖文件指纹，命中时逐个 stat 校验）
+SONG_RESPONSE_CACHE_MAX = 32
+
+
+class SongResponseCache:
+    """按请求参数缓存 /lyrics、/song-info 的 JSON 响应体。
+
+    每个条目记录构建前取得的依赖文件指纹 (mtime_ns, size)，命中时逐个比对，
+    任一文件变化即作废；``clear()`` 供保存歌词 / 歌曲 JSON 后立即失效，
+    并推进 generation，丢弃清空之前开始构建的结果。
+    """
+
+    def __init__(self, max_entries: int = SONG_RESPONSE_CACHE_MAX):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+        fresh = entry is not None and (max_age is None or time.time() - entry['built'] < max_age)
+        if fresh:
+            fresh = all(_file_fingerprint(path) == fingerprint for path, fingerprint in entry['deps'])
+        with self._lock:
+            if not fresh:
+                if entry is not None and self._entries.get(key) is entry:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, payload: Any, deps: List[Tuple[str, Optional[List[int]]]],
+            generation: int) -> Dict[str, Any]:
+        """序列化并登记；``generation`` 已过期（期间被 clear）时只返回条目、不入缓存。"""
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        entry = {
+            'built': time.time(),
+            'etag': 'W/"%s-%s"' % (key[0], hashlib.sha256(body).hexdigest()[:20]),
+            'identity': body,
+            'deps': tuple(deps),
+        }
+        with self._lock:
+            if generation == self.generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+_song_response_cache = SongResponseCache()
+
+
+def _response_dependency(path: Optional[Union[str, Path]]) -> Tuple[str, Optional[List[int]]]:
+    """读文件之前先取指纹，读到的内容不会比记录的指纹新。"""
+    return str(path), _file_fingerprint(path)
+
+
+def _song_response_from_entry(entry: Dict[str, Any]) -> StarletteResponse:
+    headers = {
+        'Cache-Control': 'private, no-cache',
+        'ETag': entry['etag'],
+        'Vary': 'Accept-Encoding, Cookie',
+    }
+    if _etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+        return StarletteResponse(status_code=304, headers=headers)
+    encoding = _negotiate_snapshot_encoding()
+    body = _encode_snapshot_body(entry, encoding)
+    if body is not entry['identity']:
+        headers['Content-Encoding'] = encoding
+    return StarletteResponse(content=body, media_type='application/json', headers=headers)
+
+
 @app.route('/lyrics')
 def get_lyrics():
     """
     获取歌词和音源信息
     支持的音乐格式：.mp3, .wav, .ogg, .mp4
+
+    响应按 (JSON / LYS / LRC 指纹, 动画配置版本, 样式, for_player) 缓存，带 ETag（304）与 gzip/br。
     """
     requested_file = (request.args.get('file') or '').strip()
     
@@ -14639,17 +18424,6 @@ def get_lyrics():
             _, json_path = _resolve_existing_static_json_filename(json_file)
         except ValueError:
             json_path = STATIC_DIR / '测试 - 测试.json'
-    
-    meta_data = {}
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            meta_data = json.load(f)
-    except FileNotFoundError:
-        meta_data = {}
-    except json.JSONDecodeError:
-        return jsonify({'error': '解析元数据JSON时出错'}), 500
-    except Exception:
-        meta_data = {}
 
     # 修复：参数优先级清晰
     # 1. 优先使用显式 lys/lrc 参数（无论是否传了 file）
@@ -14666,6 +18440,30 @@ def get_lyrics():
         lys_url = session.get('override_lys_url')
         lrc_url = session.get('override_lrc_url')
 
+    for_player = request.args.get('for_player') in ('1', 'true', 'True')
+    if not for_player:
+        for_player = bool(session.get('for_player'))
+    style_hint = (request.args.get('style') or session.get('lyrics_style') or '').strip().lower()
+
+    cache_key = ('lyrics', str(json_path), lys_url, lrc_url, for_player, style_hint,
+                 _animation_config_revision)
+    entry = _song_response_cache.get(cache_key)
+    if entry is not None:
+        return _song_response_from_entry(entry)
+    generation = _song_response_cache.generation
+    deps = [_response_dependency(json_path)]
+
+    meta_data = {}
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            meta_data = json.load(f)
+    except FileNotFoundError:
+        meta_data = {}
+    except json.JSONDecodeError:
+        return jsonify({'error': '解析元数据JSON时出错'}), 500
+    except Exception:
+        meta_data = {}
+
     # 如果没有覆盖地址，再走旧逻辑：从 JSON 的 meta.lyrics 里找
     if not lys_url:
         try:
@@ -14686,45 +18484,45 @@ def get_lyrics():
 
     # 读取 LYS 内容
     from urllib.parse import urlparse
-    for_player = request.args.get('for_player') in ('1', 'true', 'True')
-    if not for_player:
-        for_player = bool(session.get('for_player'))
     parsed_url = urlparse(lys_url)
     lyrics_path = os.path.join(app.static_folder, parsed_url.path.lstrip('/'))
+    deps.append(_response_dependency(lyrics_path))
     try:
-        with open(lyrics_path, 'r', encoding='utf-8-sig') as f:
-            lys_content = f.read()
-    except FileNotFoundError:
+        lys_doc = load_lys_document(lyrics_path)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
         return jsonify({'error': 'LYS 歌词文件未找到'}), 404
 
     if for_player:
         meta = meta_data.get('meta', {}) if isinstance(meta_data, dict) else {}
         artists = _extract_artists_from_meta(meta)
         duration_ms = _get_song_duration_ms_from_json(meta_data)
-        lys_content = _ensure_creator_line_in_lys(lys_content, artists, duration_ms)
-    parsed_lyrics = parse_lys(lys_content)
-    style_hint = (request.args.get('style') or session.get('lyrics_style') or '').strip().lower()
+        lys_content = _ensure_creator_line_in_lys(lys_doc.text, artists, duration_ms)
+        if lys_content != lys_doc.text:
+            lys_doc = parse_lys_document(lys_content)
+    # build_lys_player_lines 已算过 disappearTime，只有逐字展开改变了行才需要重算
+    parsed_lyrics = build_lys_player_lines(lys_doc)
     if style_hint in ('junp', 'jump'):
         parsed_lyrics = expand_progressive_timestamp_lines(parsed_lyrics)
-    compute_disappear_times(parsed_lyrics, delta1=500, delta2=0)
+        compute_disappear_times(parsed_lyrics, delta1=500, delta2=0)
 
     # 新增：提取 offset
-    offset = 0
-    offset_match = re.search(r'\[offset:\s*(-?\d+)\s*\]', lys_content)
-    if offset_match:
-        offset = int(offset_match.group(1))
+    offset = lys_doc.offset
 
     # 解析翻译（优先使用覆盖的 lrc_url）
     translation = []
     if lrc_url:
         parsed_lrc_url = urlparse(lrc_url)
         lrc_path = os.path.join(app.static_folder, parsed_lrc_url.path.lstrip('/'))
+        # 不存在的翻译文件也记指纹：之后补上文件会让缓存失效
+        deps.append(_response_dependency(lrc_path))
         if os.path.exists(lrc_path):
             with open(lrc_path, 'r', encoding='utf-8') as f:
                 lrc_content = f.read()
             translation = parse_lrc(lrc_content, offset=offset)  # 传递 offset
 
-    return jsonify({'lyrics': parsed_lyrics, 'translation': translation})
+    entry = _song_response_cache.put(cache_key, {'lyrics': parsed_lyrics, 'translation': translation},
+                                     deps, generation)
+    return _song_response_from_entry(entry)
 
 @app.route('/export_lyrics_csv', methods=['POST'])
 def export_lyrics_csv():
@@ -14808,8 +18606,11 @@ def get_lyrics_by_path():
         if not real_path.exists():
             return jsonify({'status': 'error', 'message': '歌词文件未找到'}), 404
 
-        with open(real_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+        if real_path.suffix.lower() == '.lys':
+            content = load_lys_document(real_path).text
+        else:
+            with open(real_path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
         if for_player:
             artists, duration_ms = _get_artists_from_related_json(real_path)
             if real_path.suffix.lower() == '.ttml':
@@ -14835,8 +18636,6 @@ def prepare_ttml_for_player():
         if not lyrics_path:
             return jsonify({'status': 'error', 'message': '缺少歌词路径'}), 400
 
-        _cleanup_temp_ttml_files()
-
         try:
             real_path = resolve_resource_path(lyrics_path, 'songs')
         except ValueError as exc:
@@ -14845,35 +18644,44 @@ def prepare_ttml_for_player():
         if not real_path.exists():
             return jsonify({'status': 'error', 'message': '歌词文件未找到'}), 404
 
-        artists, duration_ms = _get_artists_from_related_json(real_path)
-        file_ext = real_path.suffix.lower()
-
-        if file_ext == '.ttml':
-            ttml_text = real_path.read_text(encoding='utf-8', errors='ignore')
-        elif file_ext in ('.lys', '.lrc'):
-            temp_dir = tempfile.TemporaryDirectory(dir=str(SONGS_DIR))
-            temp_path = Path(temp_dir.name) / f"{real_path.stem}.ttml"
-            if file_ext == '.lys':
-                success, error_msg = lys_to_ttml(str(real_path), str(temp_path))
-            else:
-                success, error_msg = lrc_to_ttml(str(real_path), str(temp_path))
-            if not success:
-                temp_dir.cleanup()
-                return jsonify({'status': 'error', 'message': f'转换失败: {error_msg}'}), 400
-            ttml_text = temp_path.read_text(encoding='utf-8', errors='ignore')
-            temp_dir.cleanup()
-        else:
+        if real_path.suffix.lower() not in ('.ttml', '.lys', '.lrc'):
             return jsonify({'status': 'error', 'message': '只支持LYS/LRC/TTML格式'}), 400
 
-        ttml_url = _create_player_ttml_from_text(ttml_text, artists, duration_ms)
+        artists, duration_ms = _get_artists_from_related_json(real_path)
+        ttml_url, error_msg = _get_player_ttml_artifact(real_path, creator=(artists, duration_ms))
         if not ttml_url:
-            return jsonify({'status': 'error', 'message': '生成TTML失败'}), 500
+            status_code = 400 if error_msg.startswith('转换失败') else 500
+            return jsonify({'status': 'error', 'message': error_msg}), status_code
 
         return jsonify({'status': 'success', 'ttmlPath': ttml_url})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/player-ttml/<name>')
+def player_ttml_artifact(name):
+    """播放器 TTML 产物：同一 URL 内容永不改变，强 ETag + 长期缓存。
+
+    与 songs/ 下的静态文件一样不做权限校验，文件名是 256 位的内容哈希。
+    """
+    key = name[:-len('.ttml')] if name.endswith('.ttml') else ''
+    if not _PLAYER_TTML_KEY_PATTERN.fullmatch(key):
+        return jsonify({'status': 'error', 'message': 'File not found.'}), 404
+    path = _ttml_artifact_cache.get(key)
+    if path is None:
+        return jsonify({'status': 'error', 'message': 'File not found.'}), 404
+
+    headers = {
+        'ETag': f'"{key}"',
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if _etag_matches(request.headers.get('If-None-Match'), headers['ETag']):
+        return StarletteResponse(status_code=304, headers=headers)
+    response = send_file(path, mimetype='application/ttml+xml')
+    response.headers.update(headers)
+    return response
+
+
 def _build_beat_curve_bins(freqs, band_count: int, min_freq: float, max_freq: float) -> List[Tuple[int, int]]:
     log_min = math.log10(min_freq)
     log_max = math.log10(max_freq)
@@ -15123,12 +18931,28 @@ def song_info():
             _, json_path = _resolve_existing_static_json_filename(json_file)
         except ValueError:
             json_path = STATIC_DIR / '测试 - 测试.json'
+
+    # 问题 1 修复：仅当没有显式指定 file 时才使用 session 里的覆盖
+    # 这样可以防止 A 歌曲的 session 覆盖被应用到 B 歌曲
+    should_apply_session_overrides = not requested_file
+    amll_direct_background = session.get('amll_direct_background_url') if should_apply_session_overrides else None
+    amll_reference_cover = session.get('amll_reference_cover_url') if should_apply_session_overrides else None
+    host = request.host
+
+    # song 字段是按设备签名的 URL：缓存键带上签名上下文，且只复用 token 有效期的一部分
+    cache_key = ('song-info', str(json_path), amll_direct_background, amll_reference_cover, host,
+                 _song_snapshot_rewrite_context())
+    max_age = _song_snapshot_cache_max_age()
+    entry = _song_response_cache.get(cache_key, max_age=max_age)
+    if entry is not None:
+        return _song_response_from_entry(entry)
+    generation = _song_response_cache.generation
+    deps = [_response_dependency(json_path)]
     try:
         with open(json_path, 'r', encoding='utf-8') as f:
             data_str = f.read()
 
         # 动态替换 host 和修复路径，以适配局域网访问
-        host = request.host
         # 替换 host (127.0.0.1 or localhost)
         data_str = re.sub(r'http://(127\.0\.0\.1|localhost):\d+', f'http://{host}', data_str)
         # 修复路径 (移除 /static/)
@@ -15137,12 +18961,6 @@ def song_info():
         data = json.loads(data_str)
         meta = data.setdefault('meta', {}) if isinstance(data, dict) else {}
 
-        # 问题 1 修复：仅当没有显式指定 file 时才使用 session 里的覆盖
-        # 这样可以防止 A 歌曲的 session 覆盖被应用到 B 歌曲
-        should_apply_session_overrides = not requested_file
-        amll_direct_background = session.get('amll_direct_background_url') if should_apply_session_overrides else None
-        amll_reference_cover = session.get('amll_reference_cover_url') if should_apply_session_overrides else None
-
         def normalize_media_url(raw_value: Optional[str]) -> str:
             if not raw_value or raw_value == '!':
                 return ''
@@ -15204,6 +19022,9 @@ def song_info():
                     data['coverUrl'] = normalized_candidate
                     break
 
+        palette_key = _cover_palette_cache_key(*_cover_palette_source(data, meta))
+        if palette_key is not None and palette_key[0] == 'file':
+            deps.append((palette_key[1], [palette_key[2], palette_key[3]]))
         palette_payload = _build_cover_palette_payload(data, meta)
         if palette_payload:
             data['cover_palette'] = palette_payload
@@ -15226,7 +19047,9 @@ def song_info():
             else:
                 data['audio_delivery'] = build_audio_delivery_info()
 
-        return jsonify(data)
+        if max_age <= 0:
+            return jsonify(data)
+        return _song_response_from_entry(_song_response_cache.put(cache_key, data, deps, generation))
     except FileNotFoundError:
         return jsonify({'error': 'Song info file not found'}), 404
     except json.JSONDecodeError:
@@ -15732,7 +19555,7 @@ def is_local_request():
     remote = request.remote_addr
     
     # 检查安全配置，如果禁用则允许所有访问
-    security_config = get_security_config()
+    security_config = _cached_security_config()
     if not security_config.get('security_enabled', True):
         return True
     
@@ -15779,6 +19602,16 @@ _MEDIA_RATE_LIMIT_LOCK = threading.Lock()
 _MEDIA_RATE_LIMIT_WINDOW_SEC = 60
 _MEDIA_RATE_LIMIT_MAX_PER_WINDOW = 120
 
+# 登录失败按 IP 指数退避：前几次免费，之后每次失败等待翻倍，直到上限；成功或冷却后清零
+LOGIN_BACKOFF_FREE_FAILURES = 3
+LOGIN_BACKOFF_BASE_SECONDS = 1.0
+LOGIN_BACKOFF_MAX_SECONDS = 300.0
+LOGIN_BACKOFF_RESET_SECONDS = 900.0
+LOGIN_BACKOFF_MAX_TRACKED = 4096
+_LOGIN_FAILURES: Dict[Tuple[str, str], Tuple[int, float, float]] = {}
+LOGIN_USERNAME_MAX_LENGTH = 64
+_LOGIN_FAILURES_LOCK = threading.Lock()
+
 # 安全配置默认值
 DEFAULT_SECURITY_CONFIG = {
     'security_enabled': True,
@@ -15787,28 +19620,104 @@ DEFAULT_SECURITY_CONFIG = {
     'device_credentials': []
 }
 
-# 读取安全配置
-def get_security_config():
-    migrated = False
-    if SECURITY_CONFIG_FILE.exists():
+# 配置文件缓存最多每隔这么多秒 stat 一次，外部手改文件后最迟这么久生效
+CONFIG_FILE_CACHE_STAT_INTERVAL = 1.0
+
+
+class ConfigFileCache:
+    """单个 JSON 配置文件的进程内缓存：规范化后的值 + 索引，按文件 (mtime_ns, size) 失效。
+
+    build(raw) -> (值, 索引, 是否需要回写)；同一文件 CONFIG_FILE_CACHE_STAT_INTERVAL 秒内不重复 stat，
+    store 原子写盘后直接换入新值。get 返回的是共享对象，调用方只能读；要修改请先深拷贝再 store。
+    """
+
+    def __init__(self, path_getter: Callable[[], Path],
+                 build: Callable[[Any], Tuple[Any, Dict[str, Any], bool]]) -> None:
+        self._path_getter = path_getter
+        self._build = build
+        self._lock = threading.RLock()
+        self._entry: Optional[Tuple[Any, Dict[str, Any]]] = None
+        self._path: Optional[Path] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+        self.loads = 0
+
+    @staticmethod
+    def _stat_signature(path: Path) -> Optional[Tuple[int, int]]:
         try:
-            with open(SECURITY_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except Exception:
-            config = {}
-    else:
-        config = {}
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def peek(self) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """当前缓存项（不做任何检查，可能为 None）。"""
+        return self._entry
+
+    def get(self) -> Tuple[Any, Dict[str, Any]]:
+        path = self._path_getter()
+        entry = self._entry
+        if entry is not None and path == self._path \
+                and time.monotonic() - self._checked < CONFIG_FILE_CACHE_STAT_INTERVAL:
+            return entry
+        with self._lock:
+            signature = self._stat_signature(path)
+            if self._entry is not None and path == self._path and signature == self._signature:
+                self._checked = time.monotonic()
+                return self._entry
+            raw: Any = {}
+            if signature is not None:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        raw = json.load(f)
+                except Exception:
+                    raw = {}
+            value, index, migrated = self._build(raw)
+            if migrated:
+                _write_json_atomically(path, value)
+                signature = self._stat_signature(path)
+            self._install(path, signature, value, index)
+            self.loads += 1
+            return self._entry
+
+    def store(self, raw: Any) -> Any:
+        """规范化后原子写盘并换入缓存，返回规范化后的值。"""
+        with self._lock:
+            path = self._path_getter()
+            value, index, _ = self._build(raw)
+            _write_json_atomically(path, value)
+            self._install(path, self._stat_signature(path), value, index)
+            return value
 
-    normalized_config, migrated = normalize_security_config(config)
-    if migrated:
-        save_security_config(normalized_config)
-    return normalized_config
+    def _install(self, path: Path, signature: Optional[Tuple[int, int]], value: Any, index: Dict[str, Any]) -> None:
+        self._entry = (value, index)
+        self._path = path
+        self._signature = signature
+        self._checked = time.monotonic()
+
+
+def _build_security_config_entry(raw: Any) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+    normalized_config, migrated = normalize_security_config(raw)
+    by_id = {c['credential_id']: c for c in normalized_config['device_credentials']}
+    return normalized_config, by_id, migrated
+
+
+_security_config_cache = ConfigFileCache(lambda: SECURITY_CONFIG_FILE, _build_security_config_entry)
+
+
+def _cached_security_config() -> Dict[str, Any]:
+    """鉴权热路径用：返回缓存里的共享安全配置（只读，不要修改）。"""
+    return _security_config_cache.get()[0]
+
+
+# 读取安全配置
+def get_security_config():
+    """返回安全配置的可修改副本；只读场景用 _cached_security_config 免去拷贝。"""
+    return copy.deepcopy(_cached_security_config())
 
 # 保存安全配置
 def save_security_config(config):
-    normalized_config, _ = normalize_security_config(config)
-    with open(SECURITY_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(normalized_config, f, ensure_ascii=False, indent=2)
+    _security_config_cache.store(config)
 
 
 def normalize_media_config(config: Any) -> Tuple[Dict[str, Any], bool]:
@@ -15967,7 +19876,7 @@ def _song_info_device_playback_blocked() -> bool:
     """True when song-info must not expose a playable URL (strict binding, no device cookie)."""
     if not _strict_device_binding_active():
         return False
-    security_cfg = get_security_config()
+    security_cfg = _cached_security_config()
     if not security_cfg.get('security_enabled', True):
         return False
     if is_local_remote():
@@ -16166,18 +20075,16 @@ def _find_static_json_path_by_audio_relative(audio_relative: str) -> Optional[Pa
     target = _normalize_song_audio_reference(audio_relative)
     if not target:
         return None
-    with _song_search_index_lock:
-        for fn, row in _song_search_index.items():
-            if not isinstance(row, dict):
-                continue
-            summary = row.get('summary')
-            if not isinstance(summary, dict):
-                continue
-            song_rel = _extract_single_song_relative(str(summary.get('song') or ''))
-            if song_rel == target:
-                json_path = STATIC_DIR / fn
-                if json_path.is_file():
-                    return json_path
+    graph_ready, referrers = _song_search_index_lock.read_optimistic(lambda: (
+        _song_resource_graph_ready,
+        sorted(_song_resource_graph.referrers(target, ('audio',))),
+    ))
+    for fn in referrers:
+        json_path = STATIC_DIR / fn
+        if json_path.is_file():
+            return json_path
+    if graph_ready:
+        return None
     for json_file in STATIC_DIR.iterdir():
         if json_file.suffix.lower() != '.json' or json_file.name.lower() == 'artists.json':
             continue
@@ -16281,6 +20188,56 @@ def _check_media_rate_limit(remote_addr: str, relative_path: str) -> bool:
     return True
 
 
+def _login_failure_key(remote_addr: Optional[str], username: Optional[str]) -> Tuple[str, str]:
+    """退避按（用户名, 客户端 IP）计数。
+
+    IP 取 request.remote_addr：uvicorn 默认开启 proxy_headers，经本机反向代理时已解析为真实客户端地址；
+    再带上用户名，同一出口 IP 下一个人连续输错不会把其他用户一起锁住。
+    """
+    name = (username or '').strip().lower()[:LOGIN_USERNAME_MAX_LENGTH]
+    return name, remote_addr or 'unknown'
+
+
+def login_backoff_remaining(remote_addr: Optional[str], username: Optional[str] = '') -> float:
+    """该用户名 + IP 还需等待多少秒才能再尝试登录（0 表示可以）。"""
+    key = _login_failure_key(remote_addr, username)
+    now = time.time()
+    with _LOGIN_FAILURES_LOCK:
+        entry = _LOGIN_FAILURES.get(key)
+        if entry is None:
+            return 0.0
+        if now - entry[1] >= LOGIN_BACKOFF_RESET_SECONDS:
+            _LOGIN_FAILURES.pop(key, None)
+            return 0.0
+        return max(0.0, entry[2] - now)
+
+
+def record_login_failure(remote_addr: Optional[str], username: Optional[str] = '') -> float:
+    """记一次失败，返回下次尝试前需要等待的秒数。"""
+    key = _login_failure_key(remote_addr, username)
+    now = time.time()
+    with _LOGIN_FAILURES_LOCK:
+        if len(_LOGIN_FAILURES) >= LOGIN_BACKOFF_MAX_TRACKED:
+            for stale in [k for k, v in _LOGIN_FAILURES.items() if now - v[1] >= LOGIN_BACKOFF_RESET_SECONDS]:
+                del _LOGIN_FAILURES[stale]
+            if len(_LOGIN_FAILURES) >= LOGIN_BACKOFF_MAX_TRACKED:
+                _LOGIN_FAILURES.pop(next(iter(_LOGIN_FAILURES)))
+        count, last, _ = _LOGIN_FAILURES.get(key, (0, now, 0.0))
+        if now - last >= LOGIN_BACKOFF_RESET_SECONDS:
+            count = 0
+        count += 1
+        excess = count - LOGIN_BACKOFF_FREE_FAILURES
+        delay = 0.0 if excess <= 0 else min(LOGIN_BACKOFF_MAX_SECONDS, LOGIN_BACKOFF_BASE_SECONDS * (2 ** (excess - 1)))
+        _LOGIN_FAILURES.pop(key, None)
+        _LOGIN_FAILURES[key] = (count, now, now + delay)
+        return delay
+
+
+def clear_login_failures(remote_addr: Optional[str], username: Optional[str] = '') -> None:
+    with _LOGIN_FAILURES_LOCK:
+        _LOGIN_FAILURES.pop(_login_failure_key(remote_addr, username), None)
+
+
 def _can_manage_media_config() -> bool:
     return can_manage_system() or is_loopback_request()
 
@@ -16303,42 +20260,50 @@ def get_or_set_device_id():
         return device_id, response
     return device_id, None
 
+def _normalize_trusted_device(info: Any) -> Dict[str, Any]:
+    info = info if isinstance(info, dict) else {}
+    auth_type = str(info.get('auth_type') or '').strip().lower()
+    system_admin = parse_bool(info.get('system_admin'), False) or auth_type == 'system' or str(info.get('credential_id') or '').strip() == 'legacy-admin'
+    return {
+        'created_at': str(info.get('created_at') or now_iso()),
+        'last_seen': str(info.get('last_seen') or now_iso()),
+        'ua_hash': str(info.get('ua_hash') or ''),
+        'ip': str(info.get('ip') or ''),
+        'credential_id': str(info.get('credential_id') or ''),
+        'remark': str(info.get('remark') or ''),
+        'expires_at': str(info.get('expires_at') or ''),
+        'max_uses': coerce_int(info.get('max_uses')),
+        'used_count': coerce_int(info.get('used_count'), 0) or 0,
+        'auth_type': auth_type or ('system' if system_admin else ('credential' if str(info.get('credential_id') or '').strip() else '')),
+        'system_admin': system_admin,
+        'permissions': normalize_device_permissions(info.get('permissions')),
+    }
+
+
+def _build_trusted_devices_entry(raw: Any) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any], bool]:
+    # 设备表本身就是 device_id -> 记录 的索引；读到的旧格式不回写，与原先行为一致
+    if not isinstance(raw, dict):
+        return {}, {}, False
+    return {str(device_id): _normalize_trusted_device(info) for device_id, info in raw.items()}, {}, False
+
+
+_trusted_devices_cache = ConfigFileCache(lambda: TRUSTED_DEVICES_FILE, _build_trusted_devices_entry)
+# last_seen 只用于按天计算的过期，距上次落盘不足该秒数时只更新内存，鉴权请求不必每次写文件
+TRUSTED_DEVICE_LAST_SEEN_PERSIST_SECONDS = 300
+
+
+def _cached_trusted_devices() -> Dict[str, Dict[str, Any]]:
+    """鉴权热路径用：返回缓存里的共享设备表（只读，不要修改）。"""
+    return _trusted_devices_cache.get()[0]
+
+
 def load_trusted_devices():
-    """加载受信任设备列表"""
-    if TRUSTED_DEVICES_FILE.exists():
-        try:
-            with open(TRUSTED_DEVICES_FILE, 'r', encoding='utf-8') as f:
-                devices = json.load(f)
-                if not isinstance(devices, dict):
-                    return {}
-                normalized_devices = {}
-                for device_id, device_info in devices.items():
-                    info = device_info if isinstance(device_info, dict) else {}
-                    auth_type = str(info.get('auth_type') or '').strip().lower()
-                    system_admin = parse_bool(info.get('system_admin'), False) or auth_type == 'system' or str(info.get('credential_id') or '').strip() == 'legacy-admin'
-                    normalized_devices[str(device_id)] = {
-                        'created_at': str(info.get('created_at') or now_iso()),
-                        'last_seen': str(info.get('last_seen') or now_iso()),
-                        'ua_hash': str(info.get('ua_hash') or ''),
-                        'ip': str(info.get('ip') or ''),
-                        'credential_id': str(info.get('credential_id') or ''),
-                        'remark': str(info.get('remark') or ''),
-                        'expires_at': str(info.get('expires_at') or ''),
-                        'max_uses': coerce_int(info.get('max_uses')),
-                        'used_count': coerce_int(info.get('used_count'), 0) or 0,
-                        'auth_type': auth_type or ('system' if system_admin else ('credential' if str(info.get('credential_id') or '').strip() else '')),
-                        'system_admin': system_admin,
-                        'permissions': normalize_device_permissions(info.get('permissions')),
-                    }
-                return normalized_devices
-        except Exception:
-            pass
-    return {}
+    """加载受信任设备列表（可修改的副本）"""
+    return copy.deepcopy(_cached_trusted_devices())
 
 def save_trusted_devices(devices):
-    """保存受信任设备列表"""
-    with open(TRUSTED_DEVICES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(devices, f, indent=2)
+    """保存受信任设备列表（原子写盘并更新缓存）"""
+    _trusted_devices_cache.store(devices)
 
 def hash_password(password):
     """使用bcrypt哈希密码"""
@@ -16354,21 +20319,35 @@ def verify_password(password, hashed_password):
     except:
         return False
 
+
+class PasswordHashBusy(Exception):
+    """bcrypt 线程池排队已满。"""
+
+
+async def run_password_hash(func, *args):
+    """在专用的有界线程池里跑 bcrypt，不占用通用线程池；排队满了抛 PasswordHashBusy。"""
+    if not _password_hash_slots.acquire(blocking=False):
+        raise PasswordHashBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(PASSWORD_HASH_EXECUTOR, func, *args)
+    finally:
+        _password_hash_slots.release()
+
 def is_trusted_device(device_id):
     """检查设备是否受信任且未过期"""
     if not device_id:
         return False
-        
-    trusted_devices = load_trusted_devices()
-    device_info = trusted_devices.get(device_id)
-    
+
+    device_info = _cached_trusted_devices().get(device_id)
     if not device_info:
         return False
 
-    security_config = get_security_config()
+    security_config = _cached_security_config()
     resolved = resolve_trusted_device_auth_state(security_config, device_info)
     if not resolved:
-        del trusted_devices[device_id]
+        trusted_devices = load_trusted_devices()
+        trusted_devices.pop(device_id, None)
         save_trusted_devices(trusted_devices)
         return False
 
@@ -16378,27 +20357,35 @@ def is_trusted_device(device_id):
     # 检查过期时间
     expire_days = security_config.get('trusted_expire_days', 30)
     expire_seconds = expire_days * 24 * 3600
-    
+
     try:
         last_seen = datetime.fromisoformat(str(device_info.get('last_seen') or ''))
     except Exception:
         last_seen = datetime.now()
-    if (datetime.now() - last_seen).total_seconds() > expire_seconds:
+    seen_ago = (datetime.now() - last_seen).total_seconds()
+    if seen_ago > expire_seconds:
         # 自动删除过期设备
-        del trusted_devices[device_id]
-        save_trusted_devices(trusted_devices)
-        return False
-        
-    # 更新最后访问时间
-    device_info['last_seen'] = now_iso()
-    device_info['auth_type'] = 'system' if is_system_admin else 'credential'
-    device_info['system_admin'] = is_system_admin
-    device_info['credential_id'] = '' if is_system_admin else str(device_info.get('credential_id') or '')
-    device_info['permissions'] = permissions
-    trusted_devices[device_id] = device_info
-    save_trusted_devices(trusted_devices)
-    
-    return bool(is_system_admin or device_info.get('permissions', {}).get('write_access', False))
+        trusted_devices = load_trusted_devices()
+        trusted_devices.pop(device_id, None)
+        save_trusted_devices(trusted_devices)
+        return False
+
+    # 更新最后访问时间：授权信息没变且上次记录还新时不落盘
+    updates = {
+        'auth_type': 'system' if is_system_admin else 'credential',
+        'system_admin': is_system_admin,
+        'credential_id': '' if is_system_admin else str(device_info.get('credential_id') or ''),
+        'permissions': permissions,
+    }
+    if seen_ago >= TRUSTED_DEVICE_LAST_SEEN_PERSIST_SECONDS or any(
+        device_info.get(key) != value for key, value in updates.items()
+    ):
+        trusted_devices = load_trusted_devices()
+        if device_id in trusted_devices:
+            trusted_devices[device_id].update(updates, last_seen=now_iso())
+            save_trusted_devices(trusted_devices)
+
+    return bool(is_system_admin or permissions.get('write_access', False))
 
 def is_local_remote(remote: Optional[str] = None) -> bool:
     """检查请求是否来自本地回环地址"""
@@ -16466,7 +20453,7 @@ def is_request_allowed():
         return True
 
     # 获取安全配置
-    security_config = get_security_config()
+    security_config = _cached_security_config()
     
     # 安全保护关闭时允许所有访问
     if not security_config.get('security_enabled', True):
@@ -16501,7 +20488,7 @@ def is_request_allowed():
 
 def is_device_unlocked() -> bool:
     """检查安全防护状态，判断当前设备是否已解锁"""
-    security_config = get_security_config()
+    security_config = _cached_security_config()
     
     # 安全防护关闭时放行
     if not security_config.get('security_enabled', True):
@@ -16532,55 +20519,93 @@ def require_unlocked_device(action: str):
     return jsonify({'status': 'error', 'message': message}), 403
 
 
-def find_matching_device_credential(password: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], str]:
-    security_config = get_security_config()
-    system_password_hash = get_system_password_hash(security_config)
-    if system_password_hash and verify_password(password, system_password_hash):
-        return security_config, None, 'system'
-    for credential in security_config.get('device_credentials', []):
-        if not is_credential_usable(credential):
-            continue
-        if verify_password(password, credential.get('password_hash', '')):
-            return security_config, credential, 'credential'
+async def find_matching_device_credential(password: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], str]:
+    """按预哈希标签选出候选后再做 bcrypt，通常只需一次；返回的配置和凭据是共享缓存，只读。"""
+    security_config = _cached_security_config()
+    for auth_type, credential, password_hash in password_hash_candidates(security_config, password, usable_only=True):
+        if await run_password_hash(verify_password, password, password_hash):
+            return security_config, credential, auth_type
     return security_config, None, ''
 
 
-def update_security_credential_usage(credential_id: str) -> None:
+def update_security_credential_usage(credential_id: str, password: Optional[str] = None) -> None:
+    """累加凭据使用次数；传入 password 时顺便给缺少预哈希标签的旧凭据（或系统密码）补上标签。"""
     security_config = get_security_config()
     updated = False
-    for credential in security_config.get('device_credentials', []):
+    if not credential_id:
+        if password is not None and get_system_password_hash(security_config) and not security_config.get('system_password_lookup'):
+            security_config['system_password_lookup'] = password_lookup_tag(security_config, password)
+            updated = True
+    for credential in security_config.get('device_credentials', []) if credential_id else []:
         if credential.get('credential_id') == credential_id:
             credential['used_count'] = coerce_int(credential.get('used_count'), 0) or 0
             credential['used_count'] += 1
             credential['updated_at'] = now_iso()
+            if password is not None and not credential.get('password_lookup'):
+                credential['password_lookup'] = password_lookup_tag(security_config, password)
             updated = True
             break
     if updated:
         save_security_config(security_config)
 
 # 认证相关API端点
-@app.route('/auth/login', methods=['POST'])
-def auth_login():
-    """设备登录认证"""
+def _login_retry_response(message: str, retry_after: float, status: int):
+    response = jsonify({'status': 'error', 'message': message, 'retry_after': math.ceil(retry_after)})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@app.route('/auth/login', methods=['POST'], load_body=True)
+async def auth_login():
+    """设备登录认证
+
+    协程路由：密码校验在专用 bcrypt 线程池里等待，不占通用线程池；
+    写受信任设备等文件操作再交回线程池执行。
+    """
+    client_ip = request.remote_addr
+    data = request.json
+    username = data.get('username') if isinstance(data, dict) else None
+    username = username if isinstance(username, str) else ''
+    retry_after = login_backoff_remaining(client_ip, username)
+    if retry_after > 0:
+        return _login_retry_response('尝试过于频繁，请稍后再试', retry_after, 429)
+
     # 获取设备ID
     device_id, cookie_response = get_or_set_device_id()
     
     # 获取密码
-    data = request.json
-    if not data or 'password' not in data:
+    if not isinstance(data, dict) or not isinstance(data.get('password'), str):
         return jsonify({'status': 'error', 'message': '请输入密码'}), 400
     
     password = data['password']
     
     # 验证密码
-    security_config, matched_credential, auth_type = find_matching_device_credential(password)
+    try:
+        security_config, matched_credential, auth_type = await find_matching_device_credential(password)
+    except PasswordHashBusy:
+        return _login_retry_response('登录请求过多，请稍后再试', 1, 503)
     has_any_credential = bool(get_system_password_hash(security_config)) or any(is_credential_usable(item) for item in security_config.get('device_credentials', []))
     if not matched_credential and auth_type != 'system':
         if not has_any_credential:
             return jsonify({'status': 'error', 'message': '系统未设置密码，请联系管理员'}), 401
-        app.logger.warning(f"认证失败 - 设备ID: {device_id[:8]}..., IP: {request.remote_addr}, UA哈希: {hashlib.md5(request.headers.get('User-Agent', '').encode()).hexdigest()[:8]}")
+        record_login_failure(client_ip, username)
+        app.logger.warning(f"认证失败 - 设备ID: {device_id[:8]}..., IP: {client_ip}, UA哈希: {hashlib.md5(request.headers.get('User-Agent', '').encode()).hexdigest()[:8]}")
         return jsonify({'status': 'error', 'message': '密码错误'}), 401
 
+    clear_login_failures(client_ip, username)
+    return await _run_sync_in_thread(
+        _complete_auth_login,
+        device_id=device_id,
+        cookie_response=cookie_response,
+        matched_credential=matched_credential,
+        auth_type=auth_type,
+        password=password,
+    )
+
+
+def _complete_auth_login(device_id: str, cookie_response: Any, matched_credential: Optional[Dict[str, Any]],
+                         auth_type: str, password: str):
     # 添加设备到受信任列表
     trusted_devices = load_trusted_devices()
     now = datetime.now().isoformat()
@@ -16617,7 +20642,12 @@ def auth_login():
     
     save_trusted_devices(trusted_devices)
     if matched_credential:
-        update_security_credential_usage(matched_credential['credential_id'])
+        update_security_credential_usage(
+            matched_credential['credential_id'],
+            None if matched_credential.get('password_lookup') else password,
+        )
+    elif is_system_admin and not _cached_security_config().get('system_password_lookup'):
+        update_security_credential_usage('', password)
     
     # 记录成功的认证
     app.logger.info(f"认证成功 - 设备ID: {device_id[:8]}..., IP: {request.remote_addr}, 类型: {'system' if is_system_admin else 'credential'}")
@@ -16723,6 +20753,7 @@ def auth_set_password():
         return jsonify({'status': 'error', 'message': '该密码已被共享凭据占用，请使用新的唯一密码'}), 400
     
     security_config['system_password_hash'] = hash_password(password)
+    security_config['system_password_lookup'] = password_lookup_tag(security_config, password)
     security_config['password_hash'] = ''
     save_security_config(security_config)
     
@@ -16784,6 +20815,7 @@ def auth_credentials_collection():
     credential = normalize_security_credential({
         'credential_id': credential_id,
         'password_hash': hash_password(password),
+        'password_lookup': password_lookup_tag(security_config, password),
         'remark': data.get('remark') or '',
         'expires_at': data.get('expires_at') or '',
         'max_uses': data.get('max_uses'),
@@ -16844,6 +20876,7 @@ def auth_credential_item(credential_id):
         if password_conflict:
             return jsonify({'status': 'error', 'message': '该密码已被共享凭据占用，请使用新的唯一密码'}), 400
         target['password_hash'] = hash_password(password)
+        target['password_lookup'] = password_lookup_tag(security_config, password)
     target['updated_at'] = now_iso()
     credentials[target_index] = normalize_security_credential(target, credential_id)
     security_config['device_credentials'] = credentials
@@ -17071,7 +21104,7 @@ def auth_list_trusted():
     # 格式化设备信息，隐藏完整ID
     formatted_devices = []
     for device_id, info in trusted_devices.items():
-        credential = get_device_credential_by_id(get_security_config(), str(info.get('credential_id') or ''))
+        credential = get_device_credential_by_id(_cached_security_config(), str(info.get('credential_id') or ''))
         auth_type = str(info.get('auth_type') or '').strip().lower()
         if not auth_type:
             auth_type = 'system' if parse_bool(info.get('system_admin'), False) or str(info.get('credential_id') or '').strip() == 'legacy-admin' else ('credential' if str(info.get('credential_id') or '').strip() else '')
@@ -17266,30 +21299,60 @@ def get_my_ip():
 def amll_state_api():
     """AMLL 状态快照 API"""
     host = request.host
-    lines = _build_amll_lines_for_client(AMLL_STATE.get("raw_lines", []), request.args)
+    lyrics_rev, raw_lines = _amll_lyrics_head()
+    lines = _build_amll_lines_for_client(raw_lines, request.args)
     return jsonify({
         "song": _normalize_song_for_host(AMLL_STATE["song"], host),
         "progress_ms": AMLL_STATE["progress_ms"],
-        "lines": lines
+        "lines": lines,
+        "lyrics_rev": lyrics_rev,
+        "lyrics_epoch": AMLL_LYRICS_EPOCH,
     })
 
 @app.route('/amll/stream')
-def amll_stream_api():
-    """AMLL 实时事件流 API (Server-Sent Events)"""
+async def amll_stream_api():
+    """AMLL 实时事件流 API (Server-Sent Events)
+
+    协程实现：空闲连接只挂起在订阅者的 asyncio.Event 上，不占用线程池；
+    歌词/快照这类较重的转换才临时借用线程池。
+
+    带 ``delta=1`` 的客户端按歌词版本号（lyrics_rev）接收 ``lyrics_delta`` 行级差量；
+    重连时附带 ``lyrics_epoch=<e>&lyrics_rev=<n>``，纪元与本进程一致且版本仍在历史中就只补差量，
+    否则（含服务重启后）回退为整份快照。
+
+    律动频带：``audio_hz=<n>`` 为本订阅者再降低 audio_levels 频率（不高于 AMLL_AUDIO_LEVELS_HZ），
+    期间的帧按 ``audio_merge=peak|mean`` 合并；``audio_format=u8`` 下发 uint8 量化后的 Base64 紧凑编码。
+    """
     split_opts = _parse_char_split_options(request.args)
+    delta_mode = parse_bool(request.args.get("delta"), False)
+    resume_rev = None
+    if delta_mode and request.args.get("lyrics_epoch") == AMLL_LYRICS_EPOCH:
+        resume_rev = coerce_int(request.args.get("lyrics_rev"))
+    audio_format = "u8" if (request.args.get("audio_format") or "").strip().lower() == "u8" else "json"
+    audio_accumulator = None
+    try:
+        audio_hz = float(request.args.get("audio_hz") or 0)
+    except ValueError:
+        audio_hz = 0.0
+    if 0 < audio_hz < AMLL_AUDIO_LEVELS_HZ:
+        audio_merge = (request.args.get("audio_merge") or AMLL_AUDIO_LEVELS_MERGE).strip().lower()
+        audio_accumulator = AudioLevelsAccumulator(max(audio_hz, 1.0), audio_merge)
+    # 流式响应在中间件返回后才开始迭代，请求上下文需提前取出
+    host = request.host
 
     def _normalize_song_for_client(song_val: dict) -> dict:
-        return _normalize_song_for_host(song_val or {}, request.host)
+        return _normalize_song_for_host(song_val or {}, host)
 
-    def _normalize_state_snapshot(snapshot: dict) -> dict:
-        raw_lines = snapshot.get("raw_lines")
-        if raw_lines is None:
-            raw_lines = AMLL_STATE.get("raw_lines", [])
-        return {
+    def _normalize_state_snapshot(snapshot: dict, lyrics_rev: int, include_lines: bool) -> dict:
+        payload = {
             "song": _normalize_song_for_client(snapshot.get("song", {})),
             "progress_ms": snapshot.get("progress_ms", 0),
-            "lines": _build_amll_lines_for_client(raw_lines, char_split_options=split_opts),
+            "lyrics_rev": lyrics_rev,
+            "lyrics_epoch": AMLL_LYRICS_EPOCH,
         }
+        if include_lines:
+            payload["lines"] = _amll_front_lines_for_rev(lyrics_rev, split_opts) or []
+        return payload
 
     def _transform_event_payload(etype: str, data: dict) -> dict:
         if etype == "lyrics":
@@ -17298,30 +21361,131 @@ def amll_stream_api():
                 raw_lines = data.get("lines", [])
             return {
                 "lines": _build_amll_lines_for_client(raw_lines, char_split_options=split_opts),
+                "lyrics_rev": data.get("lyrics_rev", 0),
+                "lyrics_epoch": AMLL_LYRICS_EPOCH,
             }
-        if etype == "state":
-            return _normalize_state_snapshot(data)
         if etype == "song":
             return {"song": _normalize_song_for_client(data.get("song", {}))}
+        if etype == "audio_levels":
+            return _amll_audio_levels_payload(data, audio_format)
         return data
 
-    @stream_with_context
-    def _gen():
-        # 先发一份完整快照（让新打开的前端立刻有内容）
-        yield _sse("state", _normalize_state_snapshot(AMLL_STATE))
-        # 然后持续推送增量
-        while True:
-            try:
-                evt = AMLL_QUEUE.get(timeout=15)
+    def _encode_lyrics_delta(base_rev: int, rev: int) -> bytes:
+        # 空 bytes 表示无法/不值得做差量，调用方回退到整份歌词
+        old_lines = _amll_front_lines_for_rev(base_rev, split_opts)
+        new_lines = _amll_front_lines_for_rev(rev, split_opts)
+        if old_lines is None or new_lines is None:
+            return b""
+        ops = _amll_lines_delta(old_lines, new_lines)
+        if ops is None:
+            return b""
+        return _sse("lyrics_delta", {"base_rev": base_rev, "lyrics_rev": rev,
+                                     "lyrics_epoch": AMLL_LYRICS_EPOCH, "ops": ops}).encode("utf-8")
+
+    # 先订阅再取快照，避免两者之间发布的事件丢失
+    subscription = AMLL_BROKER.subscribe(label=request.remote_addr or "")
+    subscription.bind_loop(asyncio.get_running_loop())
+
+    def _encode_frame(etype: str, data: dict) -> bytes:
+        return _sse(etype, _transform_event_payload(etype, data)).encode("utf-8")
+
+    def _encode_state_frame(lyrics_rev: int, include_lines: bool) -> bytes:
+        return _sse("state", _normalize_state_snapshot(AMLL_STATE, lyrics_rev, include_lines)).encode("utf-8")
+
+    async def _cached_frame(etype: str, event_id: int, builder, **key_kwargs) -> bytes:
+        key = _amll_frame_cache_key(etype, event_id, split_opts, host, **key_kwargs)
+        frame = AMLL_FRAME_CACHE.get(key)
+        if frame is not None:
+            return frame
+        if etype in AMLL_COALESCE_EVENT_TYPES:
+            # 高频小事件直接在事件循环里序列化
+            return AMLL_FRAME_CACHE.get_or_build(key, builder)
+        return await _run_sync_in_thread(AMLL_FRAME_CACHE.get_or_build, key=key, builder=builder)
+
+    def _merged_audio_frame(now: float) -> bytes:
+        # 按订阅者合并的帧各不相同，不进共享缓存
+        merged = audio_accumulator.take(now)
+        return _encode_frame("audio_levels", merged) if merged else b""
+
+    async def _lyrics_delta_frame(base_rev: Optional[int], rev: int) -> bytes:
+        if base_rev is None or base_rev >= rev or _amll_lyrics_raw_for_rev(base_rev) is None:
+            return b""
+        builder = functools.partial(_encode_lyrics_delta, base_rev, rev)
+        return await _cached_frame("lyrics_delta", rev, builder, lyrics_rev=base_rev)
+
+    async def _gen():
+        try:
+            # 先发一份快照（让新打开的前端立刻有内容）
+            head_rev, _ = _amll_lyrics_head()
+            resume_frame = b""
+            include_lines = True
+            if resume_rev is not None and resume_rev == head_rev:
+                include_lines = False
+            elif resume_rev is not None:
+                resume_frame = await _lyrics_delta_frame(resume_rev, head_rev)
+                include_lines = not resume_frame
+            yield await _cached_frame(
+                "state", subscription.last_event_id,
+                functools.partial(_encode_state_frame, head_rev, include_lines),
+                lyrics_rev=head_rev, include_lines=include_lines,
+            )
+            if resume_frame:
+                yield resume_frame
+            client_rev = head_rev
+            # 然后持续推送增量
+            while not subscription.closed:
+                timeout = 15
+                if audio_accumulator is not None and audio_accumulator.pending:
+                    timeout = max(0.0, audio_accumulator.due_in(time.monotonic()))
+                evt = await subscription.get_async(timeout=timeout)
+                if evt is None:
+                    if audio_accumulator is not None and audio_accumulator.pending:
+                        yield _merged_audio_frame(time.monotonic())
+                        continue
+                    # 心跳：防止 Nginx/浏览器断流
+                    yield b": keep-alive\n\n"
+                    continue
                 etype = evt.get("type")
                 data = evt.get("data", {})
-                payload = _transform_event_payload(etype, data)
-                yield _sse(etype, payload)
-            except queue.Empty:
-                # 心跳：防止 Nginx/浏览器断流
-                yield ": keep-alive\n\n"
+                if etype == "audio_levels" and audio_accumulator is not None:
+                    now = time.monotonic()
+                    audio_accumulator.add(
+                        data.get("levels") or [],
+                        thresholds=data.get("thresholds") or [], timestamp=data.get("timestamp") or 0,
+                    )
+                    if audio_accumulator.due_in(now) <= 0:
+                        yield _merged_audio_frame(now)
+                    continue
+                if etype == "lyrics":
+                    rev = coerce_int(data.get("lyrics_rev"), 0)
+                    if rev <= client_rev:
+                        # 快照已包含这一版
+                        continue
+                    if delta_mode:
+                        delta_frame = await _lyrics_delta_frame(client_rev, rev)
+                        client_rev = rev
+                        if delta_frame:
+                            yield delta_frame
+                            continue
+                    client_rev = rev
+                yield await _cached_frame(etype, evt.get("id", 0), functools.partial(_encode_frame, etype, data),
+                                          audio_format=audio_format)
+        finally:
+            AMLL_BROKER.unsubscribe(subscription)
     return StreamingResponse(_gen(), media_type="text/event-stream")
 
+
+@app.route('/amll/stream/stats')
+def amll_stream_stats_api():
+    """AMLL 事件流订阅者统计（积压、丢弃、合并计数）与 WS 帧流水线队列深度、各阶段耗时"""
+    # 订阅者 label 为客户端地址，与其它内部统计接口一样只对受信任来源开放
+    if not is_request_allowed():
+        return abort(403)
+    stats = AMLL_BROKER.stats()
+    stats["frame_cache"] = AMLL_FRAME_CACHE.stats()
+    stats["ws_pipeline"] = AMLL_WS_PIPELINE.stats()
+    return jsonify(stats)
+
 @app.route('/lyrics-amll')
 def lyrics_amll_page():
     """AMLL 歌词展示页面"""
@@ -17996,7 +22160,8 @@ def _cover_palette_cache_set(key, value: dict) -> None:
     _cover_palette_cache_order.append(key)
     _cover_palette_cache[key] = value
 
-def _build_cover_palette_payload(data: dict, meta: dict) -> dict:
+def _cover_palette_source(data: dict, meta: dict) -> Tuple[Optional[str], str]:
+    """色盘提取源：(封面 URL, cover_data_url)。"""
     cover_data_url = ""
     if isinstance(data, dict):
         cover_data_url = data.get("cover_data_url") or ""
@@ -18018,7 +22183,11 @@ def _build_cover_palette_payload(data: dict, meta: dict) -> dict:
         if candidate and not _is_video_file(candidate):
             cover_url = candidate
             break
+    return cover_url, cover_data_url
+
 
+def _build_cover_palette_payload(data: dict, meta: dict) -> dict:
+    cover_url, cover_data_url = _cover_palette_source(data, meta)
     cache_key = _cover_palette_cache_key(cover_url, cover_data_url)
     if cache_key is not None:
         cached = _cover_palette_cache_get(cache_key)
@@ -18356,24 +22525,194 @@ def _amll_publish(evt_type: str, data: dict):
             AMLL_STATE["raw_lines"] = data.get("raw_lines", [])
         elif "lines" in data:
             AMLL_STATE["lines"] = data.get("lines", [])
+        raw_lines = data.get("raw_lines")
+        if raw_lines is None:
+            raw_lines = data.get("lines", [])
+        with _amll_lyrics_history_lock:
+            rev = int(AMLL_STATE.get("lyrics_rev", 0)) + 1
+            AMLL_STATE["lyrics_rev"] = rev
+            _amll_lyrics_history.append((rev, raw_lines or []))
+        data = dict(data, lyrics_rev=rev)
     elif evt_type == "progress":
         AMLL_STATE["progress_ms"] = int(data.get("progress_ms", 0))
     elif evt_type == "song":
         AMLL_STATE["song"] = _merge_song_state(AMLL_STATE.get("song", {}), data.get("song", {}))
     AMLL_STATE["last_update"] = time.time()
 
-    # 推送到队列
-    try:
-        AMLL_QUEUE.put_nowait({"type": evt_type, "data": data})
-    except queue.Full:
-        # 队列满时静默丢弃，避免日志刷屏
-        pass
+    # 扇出到所有订阅者（每个订阅者独立缓冲，慢订阅者不会拖住发布端）
+    AMLL_BROKER.publish(evt_type, data)
+
+def _amll_lyrics_head() -> Tuple[int, list]:
+    """原子地取当前歌词版本号及其 raw_lines。"""
+    with _amll_lyrics_history_lock:
+        if _amll_lyrics_history:
+            return _amll_lyrics_history[-1]
+        return int(AMLL_STATE.get("lyrics_rev", 0)), AMLL_STATE.get("raw_lines", []) or []
+
+
+def _amll_lyrics_raw_for_rev(rev: Optional[int]) -> Optional[list]:
+    """取历史中某一版的 raw_lines；版本过旧（已移出历史）时返回 None。"""
+    if rev is None:
+        return None
+    with _amll_lyrics_history_lock:
+        for hist_rev, raw_lines in reversed(_amll_lyrics_history):
+            if hist_rev == rev:
+                return raw_lines
+        if not _amll_lyrics_history and rev == int(AMLL_STATE.get("lyrics_rev", 0)):
+            return AMLL_STATE.get("raw_lines", []) or []
+    return None
+
+
+# 差量里变更的行数超过新歌词的这一比例时，直接下发整份快照更省
+AMLL_LYRICS_DELTA_MAX_RATIO = 0.5
+
+
+def _amll_lines_delta(old_lines: list, new_lines: list) -> Optional[list]:
+    """计算前端歌词行的行级差量。
+
+    返回的 ops 按行号从后往前排列，客户端按顺序依次应用即可，索引不会互相错位：
+      {"op": "replace", "index": i, "lines": [...]}  替换 i 起等长的若干行
+      {"op": "delete", "index": i, "count": n}       删除 i 起 n 行
+      {"op": "insert", "index": i, "lines": [...]}   在 i 处插入若干行
+    变更过多（不如整份下发）时返回 None。
+    """
+    old_keys = [json.dumps(line, ensure_ascii=False, sort_keys=True) for line in old_lines]
+    new_keys = [json.dumps(line, ensure_ascii=False, sort_keys=True) for line in new_lines]
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    ops: list = []
+    changed = 0
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        changed += max(i2 - i1, j2 - j1)
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            ops.append({"op": "replace", "index": i1, "lines": new_lines[j1:j2]})
+            continue
+        if i2 > i1:
+            ops.append({"op": "delete", "index": i1, "count": i2 - i1})
+        if j2 > j1:
+            ops.append({"op": "insert", "index": i1, "lines": new_lines[j1:j2]})
+    if changed > max(1, len(new_lines)) * AMLL_LYRICS_DELTA_MAX_RATIO:
+        return None
+    return ops
+
 
 def _sse(event: str, data: dict) -> str:
     """SSE 格式：event:<name>\ndata:<json>\n\n"""
     return f"event:{event}\ndata:{json.dumps(data, ensure_ascii=False)}\n\n"
 
 
+AMLL_FRAME_CACHE_MAX = max(16, int(os.getenv("AMLL_FRAME_CACHE_MAX", "256")))
+
+
+class AmllFrameCache:
+    """已编码 SSE 帧的共享缓存。
+
+    同一事件在相同的逐字拆分参数 / host 下只转换、序列化一次，
+    其余订阅者直接复用同一份 bytes。并发未命中同一个键时只构建一次。
+    """
+
+    def __init__(self, max_entries: int = AMLL_FRAME_CACHE_MAX):
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._building: Dict[tuple, threading.Lock] = {}
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+            return frame
+
+    def get_or_build(self, key: tuple, builder) -> bytes:
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            with self._lock:
+                frame = self._frames.get(key)
+                if frame is not None:
+                    # 等待期间已被其他订阅者构建完成
+                    self._frames.move_to_end(key)
+                    self.hits += 1
+                    return frame
+                self.misses += 1
+            try:
+                frame = builder()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            # 写入帧与移除构建锁放在同一临界区，避免订阅者在两者之间落空而重复构建
+            with self._lock:
+                self._frames[key] = frame
+                self._frames.move_to_end(key)
+                while len(self._frames) > self._max_entries:
+                    self._frames.popitem(last=False)
+                self._building.pop(key, None)
+            return frame
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._frames),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+AMLL_FRAME_CACHE = AmllFrameCache()
+# 按 (歌词版本, 拆分参数) 缓存转换后的前端歌词行，供差量计算复用
+AMLL_FRONT_LINES_CACHE = AmllFrameCache(max_entries=32)
+
+
+def _amll_front_lines_for_rev(rev: int, split_opts: dict) -> Optional[list]:
+    raw_lines = _amll_lyrics_raw_for_rev(rev)
+    if raw_lines is None:
+        return None
+    key = ("front", rev, split_opts.get("mode"), split_opts.get("threshold_ms"), _animation_config_revision)
+    return AMLL_FRONT_LINES_CACHE.get_or_build(
+        key,
+        lambda: _build_amll_lines_for_client(raw_lines, char_split_options=split_opts),
+    )
+
+
+def _amll_frame_cache_key(etype: str, event_id: int, split_opts: dict, host: str,
+                          *, lyrics_rev: int = 0, include_lines: bool = True,
+                          audio_format: str = "json") -> tuple:
+    """只保留真正影响输出的维度，让不同参数的订阅者尽量共享帧。
+
+    lyrics_delta 的 event_id 为目标歌词版本，lyrics_rev 为基准版本。
+    """
+    if etype == "state":
+        return (etype, event_id, split_opts.get("mode"), split_opts.get("threshold_ms"), host,
+                _animation_config_revision, lyrics_rev, include_lines)
+    if etype == "lyrics_delta":
+        return (etype, lyrics_rev, event_id, split_opts.get("mode"), split_opts.get("threshold_ms"),
+                _animation_config_revision)
+    if etype == "lyrics":
+        return (etype, event_id, split_opts.get("mode"), split_opts.get("threshold_ms"),
+                _animation_config_revision)
+    if etype == "song":
+        return (etype, event_id, host)
+    if etype == "audio_levels":
+        return (etype, event_id, audio_format)
+    return (etype, event_id)
+
+
 def _parse_char_split_threshold_ms(request_args) -> int:
     """Parse char_split_threshold_ms; 0 is valid; default 2000 when absent/invalid."""
     th_raw = None
@@ -18734,23 +23073,126 @@ def _try_parse_amll_binary_frame(buf: bytes) -> tuple[Optional[str], Optional[by
     return None, payload
 
 # === 音频数据处理（用于律动背景） ===
-_audio_data_buffer = []  # 存储最近的音频数据
+try:
+    import numpy as _np
+except ImportError:  # 没有 numpy 时退化为纯 Python 的简单模式
+    _np = None
+
+AUDIO_BAND_COUNT = 16
+# audio_levels 发布频率上限（Hz）；两次发布之间的帧在服务端合并（peak：逐频带取峰值；mean：逐频带平均）
+AMLL_AUDIO_LEVELS_HZ = max(1.0, float(os.getenv("AMLL_AUDIO_LEVELS_HZ", "60")))
+AMLL_AUDIO_LEVELS_MERGE = "mean" if os.getenv("AMLL_AUDIO_LEVELS_MERGE", "peak").strip().lower() == "mean" else "peak"
 _audio_buffer_max_size = 8000  # 缓冲区最大大小（约8秒的音频数据，假设采样率44100Hz）
-_audio_threshold_update_timer = None  # 阈值更新定时器
-_audio_thresholds = [0.1] * 16  # 默认16个频带的阈值
+_audio_thresholds = [0.1] * AUDIO_BAND_COUNT  # 默认16个频带的阈值
 _audio_last_threshold_update = 0  # 上次更新阈值的时间
+_AUDIO_LEVEL_LOG_NORM = math.log10(1000 + 1)
+
+
+class _AudioRingBuffer:
+    """预分配的 float32 环形缓冲，追加音频帧不产生新的 Python 对象。"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = _np.zeros(capacity, dtype=_np.float32) if _np is not None else []
+        self._pos = 0
+        self._filled = 0
+
+    def __len__(self) -> int:
+        return self._filled
+
+    def extend(self, samples) -> None:
+        if _np is None:
+            self._data.extend(samples)
+            if len(self._data) > self.capacity:
+                del self._data[:-self.capacity]
+            self._filled = len(self._data)
+            return
+        count = len(samples)
+        if count >= self.capacity:
+            self._data[:] = samples[-self.capacity:]
+            self._pos = 0
+            self._filled = self.capacity
+            return
+        head = min(count, self.capacity - self._pos)
+        self._data[self._pos:self._pos + head] = samples[:head]
+        if head < count:
+            self._data[:count - head] = samples[head:]
+        self._pos = (self._pos + count) % self.capacity
+        self._filled = min(self.capacity, self._filled + count)
+
+    def snapshot(self):
+        """按时间顺序返回缓冲内容（副本）。"""
+        if _np is None:
+            return list(self._data)
+        if self._filled < self.capacity:
+            return self._data[:self._filled].copy()
+        return _np.concatenate((self._data[self._pos:], self._data[:self._pos]))
+
+
+_audio_data_buffer = _AudioRingBuffer(_audio_buffer_max_size)  # 存储最近的音频数据
+
+
+@functools.lru_cache(maxsize=32)
+def _audio_band_starts(bin_count: int, band_count: int = AUDIO_BAND_COUNT):
+    """rfft 频点按对数间隔分成 band_count 段，返回 np.add.reduceat 用的起点与每段频点数。
+
+    与离线节奏曲线（_build_beat_curve_bins）一样按对数刻度划分，只是实时数据不知道采样率，
+    这里直接在频点序号上取对数（跳过直流分量），每段至少保留一个频点。
+    """
+    if bin_count <= band_count:
+        starts = _np.arange(min(bin_count, band_count), dtype=_np.intp)
+    else:
+        edges = _np.logspace(0.0, math.log10(bin_count), band_count + 1)
+        starts = _np.floor(edges[:-1]).astype(_np.intp)
+        for i in range(1, band_count):
+            if starts[i] <= starts[i - 1]:
+                starts[i] = starts[i - 1] + 1
+        # 顶端频段被推挤时整体回退，保证最后一段仍在范围内
+        overflow = starts[-1] - (bin_count - 1)
+        if overflow > 0:
+            starts = _np.minimum(starts, _np.arange(bin_count - band_count, bin_count, dtype=_np.intp))
+    counts = _np.diff(_np.append(starts, bin_count)).astype(_np.float32)
+    starts.setflags(write=False)
+    counts.setflags(write=False)
+    return starts, counts
+
+
+def _band_mean_magnitudes(samples):
+    """对一段 float32 样本做 rfft，返回按对数频段聚合后的平均幅度（长度 AUDIO_BAND_COUNT）。"""
+    magnitude = _np.abs(_np.fft.rfft(samples))
+    starts, counts = _audio_band_starts(len(magnitude))
+    means = _np.add.reduceat(magnitude, starts) / counts
+    if len(means) < AUDIO_BAND_COUNT:
+        means = _np.pad(means, (0, AUDIO_BAND_COUNT - len(means)))
+    return means
+
 
 def _decode_audio_samples(audio_bytes: bytes):
     """
     Decode audio bytes into float samples in [-1, 1].
     Prefer f32 PCM when values look valid, otherwise fall back to i16 PCM.
+    With numpy the f32 path is a zero-copy view over the frame bytes.
     """
     if not audio_bytes:
         return [], "empty"
 
+    f32_count = len(audio_bytes) // 4
+    i16_count = len(audio_bytes) // 2
+    if _np is not None:
+        if f32_count > 0:
+            raw_f32 = _np.frombuffer(audio_bytes, dtype="<f4", count=f32_count)
+            head = raw_f32[:64]
+            if _np.isfinite(head).all() and float(_np.abs(head).max()) <= 2.5:
+                return raw_f32, "f32"
+        if i16_count > 0:
+            raw_i16 = _np.frombuffer(audio_bytes, dtype="<i2", count=i16_count)
+            samples = raw_i16.astype(_np.float32)
+            samples *= 1.0 / 32768.0
+            return samples, "i16"
+        return [], "unknown"
+
     import array
 
-    f32_count = len(audio_bytes) // 4
     if f32_count > 0:
         raw_f32 = array.array('f', audio_bytes[:f32_count * 4])
         valid = True
@@ -18763,7 +23205,6 @@ def _decode_audio_samples(audio_bytes: bytes):
         if valid and checked:
             return list(raw_f32), "f32"
 
-    i16_count = len(audio_bytes) // 2
     if i16_count > 0:
         raw_i16 = array.array('h', audio_bytes[:i16_count * 2])
         return [float(value) / 32768.0 for value in raw_i16], "i16"
@@ -18775,14 +23216,14 @@ def _process_audio_data(audio_bytes: bytes):
     处理音频数据，用于律动背景
     音频数据格式：f32 PCM（小端序）
     """
-    global _audio_data_buffer, _audio_threshold_update_timer, _audio_thresholds, _audio_last_threshold_update
+    global _audio_last_threshold_update
 
     if not audio_bytes:
         return
 
     try:
         samples, sample_format = _decode_audio_samples(audio_bytes)
-        if not samples:
+        if len(samples) == 0:
             return
 
         if app.logger.isEnabledFor(logging.DEBUG):
@@ -18792,10 +23233,6 @@ def _process_audio_data(audio_bytes: bytes):
 
         _audio_data_buffer.extend(samples)
 
-        # 限制缓冲区大小
-        if len(_audio_data_buffer) > _audio_buffer_max_size:
-            _audio_data_buffer = _audio_data_buffer[-_audio_buffer_max_size:]
-
         # 每8秒更新一次阈值
         current_time = time.time()
         if current_time - _audio_last_threshold_update >= 8.0:
@@ -18817,91 +23254,183 @@ def _update_audio_thresholds():
     if len(_audio_data_buffer) < 1024:
         return
 
-    try:
-        import numpy as np
+    samples = _audio_data_buffer.snapshot()
+    if _np is not None:
+        means = _band_mean_magnitudes(samples)
+        # 归一化到 0-1 范围（使用对数刻度），NaN 回落到默认阈值
+        normalized = _np.log10(means + 1) / _AUDIO_LEVEL_LOG_NORM
+        normalized = _np.nan_to_num(normalized, nan=0.1)
+        _audio_thresholds = _np.clip(normalized, 0.05, 0.5).tolist()
+        app.logger.info(f"[Audio] 更新阈值: {[f'{t:.3f}' for t in _audio_thresholds[:4]]}...")
+        return
 
-        # 转换为 numpy 数组
-        samples = np.array(_audio_data_buffer[-len(_audio_data_buffer):])
-
-        # 计算 FFT
-        fft_result = np.fft.rfft(samples)
-        fft_magnitude = np.abs(fft_result)
-
-        # 将 FFT 结果分为 16 个频带
-        num_bands = 16
-        band_size = len(fft_magnitude) // num_bands
-        new_thresholds = []
-
-        for i in range(num_bands):
-            start = i * band_size
-            end = start + band_size
-            band_data = fft_magnitude[start:end]
-
-            if len(band_data) > 0:
-                # 计算该频带的平均值作为阈值
-                threshold = float(np.mean(band_data))
-                # 归一化到 0-1 范围（使用对数刻度）
-                normalized = np.log10(threshold + 1) / np.log10(1000 + 1)
-                # 确保 normalized 不是 NaN
-                if normalized != normalized:  # NaN 检查
-                    normalized = 0.1
-                new_thresholds.append(float(np.clip(normalized, 0.05, 0.5)))
-            else:
-                new_thresholds.append(0.1)
+    # 如果没有 numpy，使用简单的峰值检测
+    num_bands = AUDIO_BAND_COUNT
+    band_size = len(samples) // num_bands
+    new_thresholds = []
+
+    for i in range(num_bands):
+        start = i * band_size
+        end = start + band_size
+        band_data = samples[start:end]
+
+        if len(band_data) > 0:
+            # 计算绝对值的平均值
+            threshold = sum(abs(s) for s in band_data) / len(band_data)
+            # 归一化
+            normalized = min(threshold / 0.5, 0.5)
+            # 确保 normalized 不是 NaN
+            if normalized != normalized:  # NaN 检查
+                normalized = 0.1
+            new_thresholds.append(max(normalized, 0.05))
+        else:
+            new_thresholds.append(0.1)
 
-        _audio_thresholds = new_thresholds
-        app.logger.info(f"[Audio] 更新阈值: {[f'{t:.3f}' for t in _audio_thresholds[:4]]}...")
+    _audio_thresholds = new_thresholds
+    app.logger.info(f"[Audio] 更新阈值（简单模式）: {[f'{t:.3f}' for t in _audio_thresholds[:4]]}...")
+
+class AudioLevelsAccumulator:
+    """按频率上限合并频带能量：未到发送时间的帧先累积，到点后一次性取出合并结果。"""
+
+    def __init__(self, max_hz: float = AMLL_AUDIO_LEVELS_HZ, merge: str = AMLL_AUDIO_LEVELS_MERGE):
+        self.interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        self.merge = "mean" if merge == "mean" else "peak"
+        self._levels: Optional[List[float]] = None
+        self._extra: Dict[str, Any] = {}
+        self._count = 0
+        self._last_emit = float("-inf")
+        self.merged = 0
 
-    except ImportError:
-        # 如果没有 numpy，使用简单的峰值检测
-        samples = _audio_data_buffer[-len(_audio_data_buffer):]
-        num_bands = 16
-        band_size = len(samples) // num_bands
-        new_thresholds = []
-
-        for i in range(num_bands):
-            start = i * band_size
-            end = start + band_size
-            band_data = samples[start:end]
-
-            if len(band_data) > 0:
-                # 计算绝对值的平均值
-                threshold = sum(abs(s) for s in band_data) / len(band_data)
-                # 归一化
-                normalized = min(threshold / 0.5, 0.5)
-                # 确保 normalized 不是 NaN
-                if normalized != normalized:  # NaN 检查
-                    normalized = 0.1
-                new_thresholds.append(max(normalized, 0.05))
+    @property
+    def pending(self) -> bool:
+        return self._count > 0
+
+    def add(self, levels: List[float], **extra) -> None:
+        if self._levels is None or len(self._levels) != len(levels):
+            self._levels = [float(v) for v in levels]
+            self._count = 1
+        else:
+            if self.merge == "mean":
+                self._levels = [a + b for a, b in zip(self._levels, levels)]
             else:
-                new_thresholds.append(0.1)
+                self._levels = [a if a >= b else b for a, b in zip(self._levels, levels)]
+            self._count += 1
+            self.merged += 1
+        # 阈值、时间戳等附带字段取最新一帧
+        self._extra = extra
+
+    def due_in(self, now: float) -> float:
+        """距离允许下一次发送还有多少秒（<= 0 表示可以立即发送）"""
+        return self._last_emit + self.interval - now
+
+    def take(self, now: float) -> Optional[dict]:
+        if not self._count:
+            return None
+        levels = self._levels
+        if self.merge == "mean" and self._count > 1:
+            levels = [v / self._count for v in levels]
+        result = dict(self._extra, levels=levels)
+        self._levels = None
+        self._extra = {}
+        self._count = 0
+        self._last_emit = now
+        return result
+
+    def offer(self, levels: List[float], now: float, **extra) -> Optional[dict]:
+        """累积一帧；到了发送时间则返回合并后的帧，否则返回 None"""
+        self.add(levels, **extra)
+        if self.due_in(now) <= 0:
+            return self.take(now)
+        return None
+
+
+_audio_levels_accumulator = AudioLevelsAccumulator()
+# 累积器由音频工作线程与补发线程共用；补发线程负责音频帧停止（暂停等）后把最后一批合并帧发出去
+_audio_levels_cond = threading.Condition()
+_audio_levels_flusher: Optional[threading.Thread] = None
+
+
+def _publish_audio_levels(merged: dict) -> None:
+    _amll_publish("audio_levels", {
+        "levels": merged["levels"],
+        "thresholds": merged["thresholds"],
+        "timestamp": merged["timestamp"]
+    })
+
+
+def _audio_levels_flush_loop() -> None:
+    """有待发送的合并帧时等到发送时间；届时若音频线程还没发出去，就由这里补发。"""
+    while True:
+        with _audio_levels_cond:
+            while not _audio_levels_accumulator.pending:
+                _audio_levels_cond.wait()
+            delay = _audio_levels_accumulator.due_in(time.monotonic())
+            if delay > 0:
+                _audio_levels_cond.wait(delay)
+                continue
+            merged = _audio_levels_accumulator.take(time.monotonic())
+        try:
+            _publish_audio_levels(merged)
+        except Exception as e:
+            app.logger.warning(f"[Audio] 补发音频数据失败: {e}")
+
+
+def _ensure_audio_levels_flusher_locked() -> None:
+    global _audio_levels_flusher
+    if _audio_levels_flusher is None:
+        _audio_levels_flusher = threading.Thread(target=_audio_levels_flush_loop, name="Audio-Levels-Flush", daemon=True)
+        _audio_levels_flusher.start()
+
+
+def _pack_unit_levels_u8(values) -> str:
+    """0-1 的频带值量化为 uint8 后 Base64（与 AMBG 节奏曲线同一量化方式）"""
+    return base64.b64encode(bytes(
+        int(round(min(max(float(v), 0.0), 1.0) * 255)) for v in values
+    )).decode("ascii")
+
+
+def _amll_audio_levels_payload(data: dict, audio_format: str = "json") -> dict:
+    """audio_levels 事件的下发格式：json 为浮点数组；u8 为量化后的紧凑编码"""
+    if audio_format != "u8":
+        return data
+    levels = data.get("levels") or []
+    return {
+        "fmt": "u8",
+        "bands": len(levels),
+        "levels": _pack_unit_levels_u8(levels),
+        "thresholds": _pack_unit_levels_u8(data.get("thresholds") or []),
+        "timestamp": int(data.get("timestamp") or 0),
+    }
 
-        _audio_thresholds = new_thresholds
-        app.logger.info(f"[Audio] 更新阈值（简单模式）: {[f'{t:.3f}' for t in _audio_thresholds[:4]]}...")
 
 def _broadcast_audio_data(samples):
     """
-    将音频数据推送给前端（通过 SSE）
+    将音频数据推送给前端（通过 SSE），发布频率受 AMLL_AUDIO_LEVELS_HZ 限制，
+    期间到达的帧合并进下一次发布；之后不再来帧时由补发线程按时发出
     """
     try:
-        # 计算频带能量
-        band_levels = _calculate_band_levels(samples)
-
-        # 确保所有数值都是有效的（过滤 NaN 和 Infinity）
-        valid_levels = [float(x) if isinstance(x, (int, float)) and not (x != x) else 0.0 for x in band_levels]
-        valid_thresholds = [float(x) if isinstance(x, (int, float)) and not (x != x) else 0.1 for x in _audio_thresholds]
+        # 计算频带能量（已过滤 NaN / Infinity）
+        valid_levels = [round(v, 4) for v in _calculate_band_levels(samples)]
+        valid_thresholds = [round(float(x), 4) if isinstance(x, (int, float)) and not (x != x) else 0.1 for x in _audio_thresholds]
 
         if app.logger.isEnabledFor(logging.DEBUG):
             app.logger.debug(
                 f"[Audio] 推送音频数据: samples={len(samples)}, levels={[f'{l:.3f}' for l in valid_levels[:4]]}..."
             )
 
+        with _audio_levels_cond:
+            merged = _audio_levels_accumulator.offer(
+                valid_levels, time.monotonic(),
+                thresholds=valid_thresholds, timestamp=time.time() * 1000,
+            )
+            if merged is None:
+                # 还没到发送时间：交给补发线程，之后即使不再来帧也会按时发出
+                _ensure_audio_levels_flusher_locked()
+                _audio_levels_cond.notify()
+                return
+
         # 通过 SSE 推送给前端
-        _amll_publish("audio_levels", {
-            "levels": valid_levels,
-            "thresholds": valid_thresholds,
-            "timestamp": time.time() * 1000
-        })
+        _publish_audio_levels(merged)
 
     except Exception as e:
         app.logger.warning(f"[Audio] 推送音频数据失败: {e}")
@@ -18911,58 +23440,33 @@ def _calculate_band_levels(samples):
     计算音频数据的频带能量
     返回 16 个频带的能量值（0-1 范围）
     """
-    try:
-        import numpy as np
-
-        # 转换为 numpy 数组
-        audio_array = np.array(samples)
-
-        # 计算 FFT
-        fft_result = np.fft.rfft(audio_array)
-        fft_magnitude = np.abs(fft_result)
-
-        # 分为 16 个频带
-        num_bands = 16
-        band_size = len(fft_magnitude) // num_bands
-        band_levels = []
-
-        for i in range(num_bands):
-            start = i * band_size
-            end = start + band_size
-            band_data = fft_magnitude[start:end]
-
-            if len(band_data) > 0:
-                # 计算该频带的能量
-                energy = float(np.mean(band_data))
-                # 归一化
-                normalized = np.log10(energy + 1) / np.log10(1000 + 1)
-                band_levels.append(float(np.clip(normalized, 0, 1)))
-            else:
-                band_levels.append(0.0)
-
-        return band_levels
-
-    except ImportError:
-        # 如果没有 numpy，使用简单的能量计算
-        num_bands = 16
-        band_size = len(samples) // num_bands
-        band_levels = []
-
-        for i in range(num_bands):
-            start = i * band_size
-            end = start + band_size
-            band_data = samples[start:end]
-
-            if len(band_data) > 0:
-                # 计算绝对值的平均值
-                energy = sum(abs(s) for s in band_data) / len(band_data)
-                # 归一化
-                normalized = min(energy / 0.5, 1.0)
-                band_levels.append(float(min(normalized, 1.0)))
-            else:
-                band_levels.append(0.0)
+    if _np is not None:
+        if len(samples) == 0:
+            return [0.0] * AUDIO_BAND_COUNT
+        means = _band_mean_magnitudes(_np.asarray(samples, dtype=_np.float32))
+        normalized = _np.log10(means + 1) / _AUDIO_LEVEL_LOG_NORM
+        return _np.clip(_np.nan_to_num(normalized, nan=0.0), 0, 1).tolist()
+
+    # 如果没有 numpy，使用简单的能量计算
+    num_bands = AUDIO_BAND_COUNT
+    band_size = len(samples) // num_bands
+    band_levels = []
+
+    for i in range(num_bands):
+        start = i * band_size
+        end = start + band_size
+        band_data = samples[start:end]
+
+        if len(band_data) > 0:
+            # 计算绝对值的平均值
+            energy = sum(abs(s) for s in band_data) / len(band_data)
+            # 归一化
+            normalized = min(energy / 0.5, 1.0)
+            band_levels.append(float(min(normalized, 1.0)) if normalized == normalized else 0.0)
+        else:
+            band_levels.append(0.0)
 
-        return band_levels
+    return band_levels
 
 def is_port_in_use(port):
     import socket
@@ -18974,79 +23478,434 @@ def is_port_in_use(port):
 # === WebSocket 服务（AMLL 对接：ws://localhost:11444）===
 WS_HOST = ""          # 监听所有地址（同时覆盖 IPv4 / IPv6）
 WS_PORT = 11444
+WS_PIPELINE_WORKERS = max(1, int(os.getenv("AMLL_WS_PIPELINE_WORKERS", "2")))
+WS_PIPELINE_QUEUE_SIZE = max(1, int(os.getenv("AMLL_WS_PIPELINE_QUEUE_SIZE", "64")))
+WS_PIPELINE_LATENCY_WINDOW = 512
+
+
+class AmllWsFramePipeline:
+    """AMLL WebSocket 帧处理流水线。
+
+    WS 循环只解析帧头并入队，解码、图片处理和磁盘 I/O 交给工作线程：
+    普通任务进有界队列并行处理，结果按入队顺序发布，song/lyrics 事件不会乱序；
+    进度等无需处理的事件经 publish_ordered 插入同一发布序列，不会跑到前面的歌曲/歌词之前；
+    音频帧走“最新覆盖”单槽，处理不过来的旧帧直接被新帧替换，不会积压。
+    """
+
+    def __init__(self, publisher, audio_handler, workers: int = WS_PIPELINE_WORKERS,
+                 queue_size: int = WS_PIPELINE_QUEUE_SIZE):
+        self._publisher = publisher
+        self._audio_handler = audio_handler
+        self._workers = max(1, int(workers))
+        self._queue_size = max(1, int(queue_size))
+        self._cond = threading.Condition()
+        self._jobs: deque = deque()
+        self._audio_slot: Optional[tuple] = None
+        self._audio_busy = False
+        self._threads: List[threading.Thread] = []
+        self._next_seq = 0
+        # 按序发布：已完成但前序任务未完成的结果暂存于此
+        self._publish_lock = threading.Lock()
+        self._publish_seq = 0
+        self._completed: Dict[int, Any] = {}
+        self._stats_lock = threading.Lock()
+        self._latency: Dict[str, deque] = {}
+        self._latency_counts: Dict[str, int] = {}
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.backpressure_waits = 0
+        self.audio_frames = 0
+        self.audio_superseded = 0
+
+    def _ensure_started_locked(self) -> None:
+        if self._threads:
+            return
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run, name=f"WS-Pipeline-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, kind: str, fn, *args) -> bool:
+        """入队一个有序任务；fn 返回待发布的 (事件类型, 数据) 列表。队列已满时返回 False。"""
+        with self._cond:
+            if len(self._jobs) >= self._queue_size:
+                return False
+            seq = self._next_seq
+            self._next_seq += 1
+            self._jobs.append((seq, kind, fn, args, time.perf_counter()))
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._jobs))
+            self._ensure_started_locked()
+            self._cond.notify()
+        return True
+
+    async def submit_async(self, kind: str, fn, *args) -> None:
+        """队列满时让出事件循环稍后重试，只对当前连接施加背压。"""
+        while not self.submit(kind, fn, *args):
+            with self._cond:
+                self.backpressure_waits += 1
+            await asyncio.sleep(0.005)
+
+    def publish_ordered(self, evt_type: str, data: Any) -> None:
+        """无需处理的轻量事件（如播放进度）：不占队列和工作线程，但占一个发布序号，
+        排在此前入队的 song/lyrics 等任务之后发布；前面没有未完成任务时当场发布。"""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            self.enqueued += 1
+        self._complete(seq, [(evt_type, data)])
+
+    def submit_audio(self, payload: bytes) -> None:
+        """音频帧只保留最新一帧，尚未处理的旧帧被覆盖。"""
+        with self._cond:
+            if self._audio_slot is not None:
+                self.audio_superseded += 1
+            self._audio_slot = (payload, time.perf_counter())
+            self.audio_frames += 1
+            self._ensure_started_locked()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    # 音频一次只处理一帧（频带阈值等状态非线程安全），其余工作线程继续消费队列
+                    if self._audio_slot is not None and not self._audio_busy:
+                        audio, self._audio_slot = self._audio_slot, None
+                        self._audio_busy = True
+                        job = None
+                        break
+                    if self._jobs:
+                        audio, job = None, self._jobs.popleft()
+                        break
+                    self._cond.wait()
+            if audio is not None:
+                self._run_audio(*audio)
+            else:
+                self._run_job(*job)
+
+    def _run_audio(self, payload: bytes, enqueued_at: float) -> None:
+        started = time.perf_counter()
+        self._record("audio_wait", started - enqueued_at)
+        try:
+            self._audio_handler(payload)
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            app.logger.warning(f"[WS] 音频帧处理失败: {e}")
+        finally:
+            self._record("audio", time.perf_counter() - started)
+            with self._cond:
+                self._audio_busy = False
+                if self._audio_slot is not None:
+                    self._cond.notify()
+
+    def _run_job(self, seq: int, kind: str, fn, args: tuple, enqueued_at: float) -> None:
+        started = time.perf_counter()
+        self._record("queue_wait", started - enqueued_at)
+        publications = None
+        try:
+            publications = fn(*args)
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            app.logger.warning(f"[WS] {kind} 帧处理失败: {e}")
+        self._record(kind, time.perf_counter() - started)
+        self._complete(seq, publications)
+
+    def _complete(self, seq: int, publications) -> None:
+        with self._publish_lock:
+            self._completed[seq] = publications or ()
+            while self._publish_seq in self._completed:
+                for evt_type, data in self._completed.pop(self._publish_seq):
+                    try:
+                        self._publisher(evt_type, data)
+                    except Exception as e:
+                        app.logger.warning(f"[WS] 发布 {evt_type} 事件失败: {e}")
+                self._publish_seq += 1
+                self.processed += 1
+
+    def _record(self, stage: str, seconds: float) -> None:
+        with self._stats_lock:
+            window = self._latency.get(stage)
+            if window is None:
+                window = self._latency[stage] = deque(maxlen=WS_PIPELINE_LATENCY_WINDOW)
+            window.append(seconds)
+            self._latency_counts[stage] = self._latency_counts.get(stage, 0) + 1
+
+    def wait_idle(self, timeout: float = 5.0) -> bool:
+        """等待队列、音频槽与按序发布全部清空（测试与关闭时使用）。"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                busy = bool(self._jobs) or self._audio_slot is not None or self._audio_busy
+            with self._publish_lock:
+                busy = busy or self._publish_seq < self._next_seq
+            if not busy:
+                return True
+            time.sleep(0.002)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            result = {
+                "workers": self._workers,
+                "queue_size": self._queue_size,
+                "depth": len(self._jobs),
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "backpressure_waits": self.backpressure_waits,
+                "audio_frames": self.audio_frames,
+                "audio_superseded": self.audio_superseded,
+                "audio_pending": self._audio_slot is not None,
+            }
+        with self._publish_lock:
+            result["reorder_pending"] = len(self._completed)
+        stages = {}
+        with self._stats_lock:
+            for stage, window in self._latency.items():
+                samples = sorted(window)
+                if not samples:
+                    continue
+                stages[stage] = {
+                    "count": self._latency_counts.get(stage, 0),
+                    "avg_ms": round(sum(samples) / len(samples) * 1000, 3),
+                    "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                    "max_ms": round(samples[-1] * 1000, 3),
+                }
+        result["stages"] = stages
+        return result
+
+
+AMLL_WS_PIPELINE = AmllWsFramePipeline(
+    publisher=lambda evt_type, data: _amll_publish(evt_type, data),
+    audio_handler=lambda payload: _process_audio_data(payload),
+)
+
+
+def _ws_publications(*publications):
+    """把已就绪的事件按顺序排进流水线（排在此前入队的封面/歌词之后发布）。"""
+    return list(publications)
+
+
+def _ws_cover_song_patch(candidate: bytes, label: str) -> Optional[dict]:
+    if not candidate:
+        return None
+    mime_guess = _detect_image_mime(candidate)
+    if not mime_guess:
+        return None
+    b64 = base64.b64encode(candidate).decode("ascii")
+    data_url = _build_data_url(b64, mime_guess)
+    file_url, _ = _store_cover_bytes(candidate, mime_guess)
+    app.logger.info(f"[WS] {label}作为封面处理（{len(candidate)} bytes，mime={mime_guess}，file={file_url}）")
+    song_patch = {
+        "cover_data_url": data_url,
+        "cover": data_url,
+        "albumImgSrc": data_url,
+    }
+    if file_url:
+        song_patch["cover_file_url"] = file_url
+        song_patch["cover"] = file_url
+        song_patch["albumImgSrc"] = file_url
+    return song_patch
+
+
+def _ws_process_binary_frame(b: bytes, kind: Optional[str], payload: Optional[bytes]):
+    """非音频二进制帧：封面 → 兜底 TTML / 原始字节落盘。"""
+    for candidate, label in ((payload, "按payload "), (b, "按整帧 ")):
+        song_patch = _ws_cover_song_patch(candidate, label)
+        if song_patch:
+            return [("song", {"song": song_patch})]
+    if kind == "cover" and payload:
+        return []  # 已处理
+
+    try:
+        txt = b.decode("utf-8")
+    except UnicodeDecodeError:
+        txt = None
+    if txt and txt.lstrip().startswith("<"):
+        name = f"lyrics_ttml_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ttml"
+        (EXPORTS_DIR / name).write_text(txt, encoding="utf-8")
+        app.logger.info(f"[WS] 收到二进制 TTML，已保存 exports/{name}")
+    else:
+        # 只保存非音频数据的二进制帧
+        name = f"lyrics_binary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.bin"
+        (EXPORTS_DIR / name).write_bytes(b)
+        app.logger.info(f"[WS] 收到二进制帧（{len(b)} bytes），已保存 exports/{name}")
+    return []
+
+
+def _ws_cover_patch_from_message(payload):
+    """setMusicAlbumCoverImageData 等旧版封面消息 → song 补丁事件。"""
+    cover_url = ""
+    cover_data_url = ""
+    cover_file_url = ""
+    if isinstance(payload, str):
+        if payload.startswith("data:"):
+            cover_data_url = payload
+        else:
+            cover_url = payload
+    elif isinstance(payload, dict):
+        cover_data_url = payload.get("dataUrl") or payload.get("dataURL") or ""
+        cover_url = payload.get("url") or payload.get("cover") or payload.get("coverUrl") or ""
+        if not cover_data_url:
+            raw_data = payload.get("imageData") or payload.get("data") or payload.get("buffer") or payload.get("blob")
+            if isinstance(raw_data, str):
+                cover_data_url = _build_data_url(raw_data, payload.get("mime") or payload.get("contentType"))
+            elif isinstance(raw_data, (bytes, bytearray)):
+                b64 = base64.b64encode(raw_data).decode("utf-8")
+                cover_data_url = _build_data_url(b64, payload.get("mime") or payload.get("contentType"))
+            elif isinstance(raw_data, list):
+                try:
+                    b = bytes(raw_data)
+                    b64 = base64.b64encode(b).decode("utf-8")
+                    cover_data_url = _build_data_url(b64, payload.get("mime") or payload.get("contentType"))
+                except Exception:
+                    pass
+            # 保存为文件，便于前端用 http 访问
+            if isinstance(raw_data, (bytes, bytearray)):
+                cover_file_url, _ = _store_cover_bytes(raw_data, payload.get("mime") or payload.get("contentType"))
+            elif isinstance(raw_data, list):
+                try:
+                    b = bytes(raw_data)
+                    cover_file_url, _ = _store_cover_bytes(b, payload.get("mime") or payload.get("contentType"))
+                except Exception:
+                    pass
+    song_patch = {}
+    if cover_url:
+        song_patch["cover"] = cover_url
+        song_patch["albumImgSrc"] = cover_url
+    if cover_data_url:
+        song_patch["cover_data_url"] = cover_data_url
+    if cover_file_url:
+        song_patch["cover_file_url"] = cover_file_url
+        song_patch["cover"] = cover_file_url
+        song_patch["albumImgSrc"] = cover_file_url
+    return [("song", {"song": song_patch})] if song_patch else []
+
+
+def _ws_cover_patch_from_state(val: dict, content):
+    """state/setCover 消息 → song 补丁事件。"""
+    song_patch = {}
+    cover_payload = _extract_cover_payload_from_state(val)
+    if not cover_payload:
+        if isinstance(content, dict):
+            cover_payload = content
+        elif isinstance(content, str) and content.strip():
+            cover_payload = {"url": content}
+    source = cover_payload.get("source") if isinstance(cover_payload, dict) else None
+    if str(source).lower() == "uri":
+        url = cover_payload.get("url") or cover_payload.get("uri") or ""
+        if url:
+            song_patch["cover"] = url
+            song_patch["albumImgSrc"] = url
+    elif str(source).lower() == "data":
+        img = cover_payload.get("image") or {}
+        mime = img.get("mimeType") or "image/jpeg"
+        data_b64 = img.get("data")
+        if isinstance(data_b64, str):
+            song_patch["cover_data_url"] = _build_data_url(data_b64, mime)
+            song_patch["cover"] = song_patch["cover_data_url"]
+            song_patch["albumImgSrc"] = song_patch["cover_data_url"]
+            try:
+                payload = base64.b64decode(data_b64)
+                file_url, _ = _store_cover_bytes(payload, mime)
+                if file_url:
+                    song_patch["cover_file_url"] = file_url
+                    song_patch["cover"] = file_url
+                    song_patch["albumImgSrc"] = file_url
+            except Exception:
+                pass
+        elif isinstance(data_b64, list):
+            try:
+                b = bytes(data_b64)
+                b64 = base64.b64encode(b).decode("ascii")
+                song_patch["cover_data_url"] = _build_data_url(b64, mime)
+                song_patch["cover"] = song_patch["cover_data_url"]
+                song_patch["albumImgSrc"] = song_patch["cover_data_url"]
+                file_url, _ = _store_cover_bytes(b, mime)
+                if file_url:
+                    song_patch["cover_file_url"] = file_url
+                    song_patch["cover"] = file_url
+                    song_patch["albumImgSrc"] = file_url
+            except Exception:
+                pass
+    elif isinstance(cover_payload, dict):
+        url = cover_payload.get("url") or cover_payload.get("cover") or cover_payload.get("coverUrl")
+        if url:
+            song_patch["cover"] = url
+            song_patch["albumImgSrc"] = url
+        raw_data = cover_payload.get("data") or cover_payload.get("imageData") or cover_payload.get("buffer")
+        if isinstance(raw_data, (bytes, bytearray)):
+            b64 = base64.b64encode(raw_data).decode("ascii")
+            mime = cover_payload.get("mime") or cover_payload.get("contentType")
+            song_patch["cover_data_url"] = _build_data_url(b64, mime)
+            file_url, _ = _store_cover_bytes(raw_data, mime)
+            if file_url:
+                song_patch["cover_file_url"] = file_url
+                song_patch["cover"] = file_url
+                song_patch["albumImgSrc"] = file_url
+    return [("song", {"song": song_patch})] if song_patch else []
+
+
+def _ws_export_lyrics_chars(payload: list, label: str):
+    """逐字展开导出 CSV（在工作线程中执行，不阻塞 WS 循环）"""
+    print(f"[WS] 收到{label} {len(payload)} 行（逐字导出）")
+    # 逐行明细只在 DEBUG 下输出，避免每版歌词都逐行打印到控制台
+    log_lines = app.logger.isEnabledFor(logging.DEBUG)
+    rows = []
+    for i, line in enumerate(payload, 1):
+        words = line.get("words", [])
+        if log_lines:
+            s_ms = int(line.get("startTime") or 0); e_ms = int(line.get("endTime") or 0)
+            app.logger.debug(f"[WS] {i:04d} [{ms_to_ts(s_ms)} → {ms_to_ts(e_ms)}] {join_line_text(words)}")
+        is_bg = bool(line.get("isBG", False)); is_duet = bool(line.get("isDuet", False))
+        for j, wobj in enumerate(words, 1):
+            for k, ev in enumerate(split_word_to_chars(wobj), 1):
+                rows.append({
+                    "line_index": i, "word_index": j, "char_index": k,
+                    "char": ev["char"], "roman_char": ev["roman_char"],
+                    "start_ms": ev["start_ms"], "end_ms": ev["end_ms"],
+                    "start_ts": ms_to_ts(ev["start_ms"]), "end_ts": ms_to_ts(ev["end_ms"]),
+                    "is_bg": is_bg, "is_duet": is_duet
+                })
+    if rows:
+        import csv
+        name = f"lyrics_chars_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        with open(EXPORTS_DIR / name, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys())); writer.writeheader(); writer.writerows(rows)
+        print(f"[WS] 逐字 CSV 已导出：exports/{name}（{len(rows)} 条）")
+    return []
+
+
+async def _ws_submit_lyrics(payload: list, label: str):
+    # 先按序发布 raw_lines，逐字 CSV 导出作为独立任务并行落盘
+    await AMLL_WS_PIPELINE.submit_async("lyrics", _ws_publications, ("lyrics", {"raw_lines": payload}))
+    await AMLL_WS_PIPELINE.submit_async("export", _ws_export_lyrics_chars, payload, label)
+
 
 async def ws_handle(ws):
     peer = getattr(ws, "remote_address", None)
     print(f"[WS] 客户端连接: {peer}")
+    pipeline = AMLL_WS_PIPELINE
     try:
         async for raw in ws:
-            # 二进制帧：可能是 TTML、封面或音频数据
+            # 二进制帧：可能是 TTML、封面或音频数据；这里只解析帧头，其余交给流水线
             if isinstance(raw, (bytes, bytearray)):
                 b = bytes(raw)
-                print(f"[WS] 收到二进制帧: {len(b)} bytes")
                 kind, payload = _try_parse_amll_binary_frame(b)
-                def _handle_cover(candidate: bytes, label: str) -> bool:
-                    if not candidate:
-                        return False
-                    mime_guess = _detect_image_mime(candidate)
-                    if not mime_guess:
-                        return False
-                    b64 = base64.b64encode(candidate).decode("ascii")
-                    data_url = _build_data_url(b64, mime_guess)
-                    file_url, _ = _store_cover_bytes(candidate, mime_guess)
-                    print(f"[WS] {label}作为封面处理（{len(candidate)} bytes，mime={mime_guess}，file={file_url}）")
-                    song_patch = {
-                        "cover_data_url": data_url,
-                        "cover": data_url,
-                        "albumImgSrc": data_url,
-                    }
-                    if file_url:
-                        song_patch["cover_file_url"] = file_url
-                        song_patch["cover"] = file_url
-                        song_patch["albumImgSrc"] = file_url
-                    _amll_publish("song", {"song": song_patch})
-                    return True
-
-                # 处理音频数据（magic=0）
-                try:
-                    magic_val, size = struct.unpack("<HI", b[:6])
-                    print(f"[WS] 二进制帧 magic={magic_val}, size={size}, payload_len={len(payload) if payload else 0}")
-                    if magic_val == 0:  # OnAudioData
-                        # 音频数据：解析并推送给前端用于律动背景
-                        print(f"[WS] 检测到音频数据帧，开始处理")
-                        _process_audio_data(payload)
-                        continue
-                except Exception as e:
-                    print(f"[WS] 解析二进制帧失败: {e}")
-                    pass
-
-                if _handle_cover(payload, "按payload "):
+                magic_val = struct.unpack_from("<H", b)[0] if len(b) >= 6 else None
+                if magic_val == 0:  # OnAudioData：最新覆盖，不积压
+                    if payload:
+                        pipeline.submit_audio(payload)
                     continue
-                if _handle_cover(b, "按整帧 "):
-                    continue
-                try:
-                    magic_val, _ = struct.unpack("<HI", b[:6])
-                except Exception:
-                    magic_val = None
-                if magic_val == 4 and payload:
-                    if _handle_cover(payload, "按magic=4 payload "):
-                        continue
-                if kind == "cover" and payload:
-                    continue  # 已处理
-
-                try:
-                    txt = b.decode("utf-8")
-                except UnicodeDecodeError:
-                    txt = None
-                if txt and txt.lstrip().startswith("<"):
-                    name = f"lyrics_ttml_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ttml"
-                    (EXPORTS_DIR / name).write_text(txt, encoding="utf-8")
-                    print(f"[WS] 收到二进制 TTML，已保存 exports/{name}")
-                else:
-                    # 只保存非音频数据的二进制帧
-                    name = f"lyrics_binary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.bin"
-                    (EXPORTS_DIR / name).write_bytes(b)
-                    print(f"[WS] 收到二进制帧（{len(b)} bytes），已保存 exports/{name}")
+                if app.logger.isEnabledFor(logging.DEBUG):
+                    app.logger.debug(f"[WS] 二进制帧 magic={magic_val}, size={len(b)}, payload_len={len(payload) if payload else 0}")
+                await pipeline.submit_async("binary", _ws_process_binary_frame, b, kind, payload)
                 continue
 
             # 文本帧：优先按 JSON 解析
@@ -19065,56 +23924,10 @@ async def ws_handle(ws):
                 info = msg.get("value") or {}
                 song = _normalize_song_info(info)
                 print("[WS] 歌曲元数据：", song)
-                _amll_publish("song", {"song": song})
+                await pipeline.submit_async("song", _ws_publications, ("song", {"song": song}))
                 continue
             if mtype in ("setmusicalbumcoverimagedata", "setalbumcover", "setcover"):
-                payload = msg.get("value") or {}
-                cover_url = ""
-                cover_data_url = ""
-                cover_file_url = ""
-                if isinstance(payload, str):
-                    if payload.startswith("data:"):
-                        cover_data_url = payload
-                    else:
-                        cover_url = payload
-                elif isinstance(payload, dict):
-                    cover_data_url = payload.get("dataUrl") or payload.get("dataURL") or ""
-                    cover_url = payload.get("url") or payload.get("cover") or payload.get("coverUrl") or ""
-                    if not cover_data_url:
-                        raw_data = payload.get("imageData") or payload.get("data") or payload.get("buffer") or payload.get("blob")
-                        if isinstance(raw_data, str):
-                            cover_data_url = _build_data_url(raw_data, payload.get("mime") or payload.get("contentType"))
-                        elif isinstance(raw_data, (bytes, bytearray)):
-                            b64 = base64.b64encode(raw_data).decode("utf-8")
-                            cover_data_url = _build_data_url(b64, payload.get("mime") or payload.get("contentType"))
-                        elif isinstance(raw_data, list):
-                            try:
-                                b = bytes(raw_data)
-                                b64 = base64.b64encode(b).decode("utf-8")
-                                cover_data_url = _build_data_url(b64, payload.get("mime") or payload.get("contentType"))
-                            except Exception:
-                                pass
-                        # 保存为文件，便于前端用 http 访问
-                        if isinstance(raw_data, (bytes, bytearray)):
-                            cover_file_url, _ = _store_cover_bytes(raw_data, payload.get("mime") or payload.get("contentType"))
-                        elif isinstance(raw_data, list):
-                            try:
-                                b = bytes(raw_data)
-                                cover_file_url, _ = _store_cover_bytes(b, payload.get("mime") or payload.get("contentType"))
-                            except Exception:
-                                pass
-                song_patch = {}
-                if cover_url:
-                    song_patch["cover"] = cover_url
-                    song_patch["albumImgSrc"] = cover_url
-                if cover_data_url:
-                    song_patch["cover_data_url"] = cover_data_url
-                if cover_file_url:
-                    song_patch["cover_file_url"] = cover_file_url
-                    song_patch["cover"] = cover_file_url
-                    song_patch["albumImgSrc"] = cover_file_url
-                if song_patch:
-                    _amll_publish("song", {"song": song_patch})
+                await pipeline.submit_async("cover", _ws_cover_patch_from_message, msg.get("value") or {})
                 continue
             if mtype == "state":
                 val = msg.get("value") or {}
@@ -19144,70 +23957,10 @@ async def ws_handle(ws):
                             preview_full_msg = repr(msg)
                         print(f"[WS] setmusic 原始载荷调试 payload={preview_payload} content={preview_content} full={preview_full_msg}")
                     print("[WS] 歌曲元数据(state)：", song)
-                    _amll_publish("song", {"song": song})
+                    await pipeline.submit_async("song", _ws_publications, ("song", {"song": song}))
                     continue
                 if update in ("setcover", "cover", "albumcover", "artwork"):
-                    song_patch = {}
-                    cover_payload = _extract_cover_payload_from_state(val)
-                    if not cover_payload:
-                        if isinstance(content, dict):
-                            cover_payload = content
-                        elif isinstance(content, str) and content.strip():
-                            cover_payload = {"url": content}
-                    source = cover_payload.get("source") if isinstance(cover_payload, dict) else None
-                    if str(source).lower() == "uri":
-                        url = cover_payload.get("url") or cover_payload.get("uri") or ""
-                        if url:
-                            song_patch["cover"] = url
-                            song_patch["albumImgSrc"] = url
-                    elif str(source).lower() == "data":
-                        img = cover_payload.get("image") or {}
-                        mime = img.get("mimeType") or "image/jpeg"
-                        data_b64 = img.get("data")
-                        if isinstance(data_b64, str):
-                            song_patch["cover_data_url"] = _build_data_url(data_b64, mime)
-                            song_patch["cover"] = song_patch["cover_data_url"]
-                            song_patch["albumImgSrc"] = song_patch["cover_data_url"]
-                            try:
-                                payload = base64.b64decode(data_b64)
-                                file_url, _ = _store_cover_bytes(payload, mime)
-                                if file_url:
-                                    song_patch["cover_file_url"] = file_url
-                                    song_patch["cover"] = file_url
-                                    song_patch["albumImgSrc"] = file_url
-                            except Exception:
-                                pass
-                        elif isinstance(data_b64, list):
-                            try:
-                                b = bytes(data_b64)
-                                b64 = base64.b64encode(b).decode("ascii")
-                                song_patch["cover_data_url"] = _build_data_url(b64, mime)
-                                song_patch["cover"] = song_patch["cover_data_url"]
-                                song_patch["albumImgSrc"] = song_patch["cover_data_url"]
-                                file_url, _ = _store_cover_bytes(b, mime)
-                                if file_url:
-                                    song_patch["cover_file_url"] = file_url
-                                    song_patch["cover"] = file_url
-                                    song_patch["albumImgSrc"] = file_url
-                            except Exception:
-                                pass
-                    elif isinstance(cover_payload, dict):
-                        url = cover_payload.get("url") or cover_payload.get("cover") or cover_payload.get("coverUrl")
-                        if url:
-                            song_patch["cover"] = url
-                            song_patch["albumImgSrc"] = url
-                        raw_data = cover_payload.get("data") or cover_payload.get("imageData") or cover_payload.get("buffer")
-                        if isinstance(raw_data, (bytes, bytearray)):
-                            b64 = base64.b64encode(raw_data).decode("ascii")
-                            mime = cover_payload.get("mime") or cover_payload.get("contentType")
-                            song_patch["cover_data_url"] = _build_data_url(b64, mime)
-                            file_url, _ = _store_cover_bytes(raw_data, mime)
-                            if file_url:
-                                song_patch["cover_file_url"] = file_url
-                                song_patch["cover"] = file_url
-                                song_patch["albumImgSrc"] = file_url
-                    if song_patch:
-                        _amll_publish("song", {"song": song_patch})
+                    await pipeline.submit_async("cover", _ws_cover_patch_from_state, val, content)
                     continue
                 if update in ("setlyric", "lyrics", "lyric"):
                     payload = _extract_lines_from_state_update(val)
@@ -19216,38 +23969,13 @@ async def ws_handle(ws):
                             payload = content.get("lines") or []
                         elif isinstance(content, list):
                             payload = content
-                    print(f"[WS] 收到歌词(state) {len(payload)} 行（逐字导出）")
-                    rows = []
-                    for i, line in enumerate(payload, 1):
-                        words = line.get("words", [])
-                        line_text = join_line_text(words)
-                        s_ms = int(line.get("startTime") or 0); e_ms = int(line.get("endTime") or 0)
-                        print(f"{i:04d} [{ms_to_ts(s_ms)} → {ms_to_ts(e_ms)}] {line_text}")
-                        is_bg = bool(line.get("isBG", False)); is_duet = bool(line.get("isDuet", False))
-                        for j, wobj in enumerate(words, 1):
-                            for k, ev in enumerate(split_word_to_chars(wobj), 1):
-                                rows.append({
-                                    "line_index": i, "word_index": j, "char_index": k,
-                                    "char": ev["char"], "roman_char": ev["roman_char"],
-                                    "start_ms": ev["start_ms"], "end_ms": ev["end_ms"],
-                                    "start_ts": ms_to_ts(ev["start_ms"]), "end_ts": ms_to_ts(ev["end_ms"]),
-                                    "is_bg": is_bg, "is_duet": is_duet
-                                })
-                    if rows:
-                        import csv
-                        name = f"lyrics_chars_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                        with open(EXPORTS_DIR / name, "w", encoding="utf-8-sig", newline="") as f:
-                            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys())); writer.writeheader(); writer.writerows(rows)
-                        print(f"[WS] 逐字 CSV 已导出：exports/{name}（{len(rows)} 条）")
-
-                    print(f"[WS] 收到歌词(state) {len(payload)} 行（raw_lines 发布）")
-                    _amll_publish("lyrics", {"raw_lines": payload})
+                    await _ws_submit_lyrics(payload, "歌词(state)")
                     continue
                 if update in ("progress", "playprogress", "onplayprogress", "setprogress", "position", "time"):
                     prog = _extract_progress_ms_from_state(val)
                     if prog is not None:
                         app.logger.debug(f"[WS] 进度(state)：{prog}")
-                        _amll_publish("progress", {"progress_ms": prog})
+                        pipeline.publish_ordered("progress", {"progress_ms": prog})
                     continue
                 if update in ("resumed", "resume", "playing", "paused", "pause", "stopped", "stop"):
                     app.logger.debug(f"[WS] 播放状态(state)：{update}")
@@ -19256,7 +23984,7 @@ async def ws_handle(ws):
                 prog = int((msg.get("value") or {}).get("progress") or 0)
                 # 不打印每秒进度到控制台，避免刷屏
                 app.logger.debug(f"[WS] 进度(ms)：{prog}")
-                _amll_publish("progress", {"progress_ms": prog})
+                pipeline.publish_ordered("progress", {"progress_ms": prog})
                 continue
             if mtype in ("onresumed","onpaused"):
                 app.logger.debug(f"[WS] 播放状态：{mtype}"); continue
@@ -19264,32 +23992,7 @@ async def ws_handle(ws):
             # 逐字展开导出
             if mtype == "setlyric":
                 payload = msg.get("value", {}).get("data", [])
-                print(f"[WS] 收到歌词 {len(payload)} 行（逐字导出）")
-                rows = []
-                for i, line in enumerate(payload, 1):
-                    words = line.get("words", [])
-                    line_text = join_line_text(words)
-                    s_ms = int(line.get("startTime") or 0); e_ms = int(line.get("endTime") or 0)
-                    print(f"{i:04d} [{ms_to_ts(s_ms)} → {ms_to_ts(e_ms)}] {line_text}")
-                    is_bg = bool(line.get("isBG", False)); is_duet = bool(line.get("isDuet", False))
-                    for j, wobj in enumerate(words, 1):
-                        for k, ev in enumerate(split_word_to_chars(wobj), 1):
-                            rows.append({
-                                "line_index": i, "word_index": j, "char_index": k,
-                                "char": ev["char"], "roman_char": ev["roman_char"],
-                                "start_ms": ev["start_ms"], "end_ms": ev["end_ms"],
-                                "start_ts": ms_to_ts(ev["start_ms"]), "end_ts": ms_to_ts(ev["end_ms"]),
-                                "is_bg": is_bg, "is_duet": is_duet
-                            })
-                if rows:
-                    import csv
-                    name = f"lyrics_chars_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                    with open(EXPORTS_DIR / name, "w", encoding="utf-8-sig", newline="") as f:
-                        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys())); writer.writeheader(); writer.writerows(rows)
-                    print(f"[WS] 逐字 CSV 已导出：exports/{name}（{len(rows)} 条）")
-
-                print(f"[WS] 收到歌词 {len(payload)} 行（raw_lines 发布）")
-                _amll_publish("lyrics", {"raw_lines": payload})
+                await _ws_submit_lyrics(payload, "歌词")
                 continue
 
             print("[WS] 未知消息：", msg)
@@ -19343,6 +24046,7 @@ def start_ws_server_once():
 # Must run after helpers such as _normalize_song_audio_reference are defined.
 init_song_search_index_on_startup()
 init_artist_playlist_index_on_startup()
+start_static_library_watcher_once()
 
 if __name__ == '__main__':
     """主函数入口
@@ -19350,6 +24054,9 @@ if __name__ == '__main__':
     处理命令行参数，启动WebSocket服务器和FastAPI应用。
     支持指定端口，如果默认端口被占用会自动切换到随机端口。
     """
+    # 打包后的 exe 被批量转换进程池 spawn 时，在这里转去执行子进程逻辑
+    multiprocessing.freeze_support()
+    cleanup_legacy_player_ttml_files()
     import random
     def try_run(port):
         """尝试在指定端口启动应用
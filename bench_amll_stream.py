@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""AMLL 事件流负载测试：大量空闲 SSE 订阅者在线时普通请求的延迟。
+
+默认用 uvicorn 在子进程里启动本仓库的 backend（跳过索引初始化，即空曲库），
+先在没有订阅者时压 /songs/search，再保持 N 个 /amll/stream 连接后重复一遍，对比延迟分位数。
+
+用法：
+    python bench_amll_stream.py                          # 500 个订阅者，200 次搜索，并发 5
+    python bench_amll_stream.py --clients 1000 --requests 500
+    python bench_amll_stream.py --url http://127.0.0.1:5000   # 压测已在运行的服务
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+ROOT = Path(__file__).parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ, FAMYLIAM_SKIP_INDEX_INIT='1')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=str(ROOT), env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'服务进程已退出（{proc.returncode}）')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/songs/search?q=x', timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('等待服务启动超时')
+
+
+def _search_latencies(base_url: str, total: int, concurrency: int) -> List[float]:
+    local = threading.local()
+
+    def one(i: int) -> float:
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        resp = session.get(f'{base_url}/songs/search', params={'q': f'bench {i % 17}'}, timeout=30)
+        resp.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(total)))
+
+
+def _percentiles(samples: List[float]) -> str:
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return (f'p50 {statistics.median(ordered):7.1f} ms   p90 {pick(0.90):7.1f} ms   '
+            f'p99 {pick(0.99):7.1f} ms   max {ordered[-1]:7.1f} ms')
+
+
+class _SseClients:
+    """在独立事件循环线程里保持 N 个 /amll/stream 连接；每个连接收到首个 state 帧即视为已订阅。"""
+
+    def __init__(self, base_url: str, count: int) -> None:
+        parts = urlsplit(base_url)
+        self._host = parts.hostname or '127.0.0.1'
+        self._port = parts.port or 80
+        self._count = count
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._writers: List[asyncio.StreamWriter] = []
+        self._tasks: List[asyncio.Task] = []
+        self.connected = 0
+
+    async def _client(self, ready: asyncio.Semaphore) -> None:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        self._writers.append(writer)
+        writer.write(f'GET /amll/stream?char_split=off HTTP/1.1\r\nHost: {self._host}\r\n'
+                     'Accept: text/event-stream\r\n\r\n'.encode('ascii'))
+        await writer.drain()
+        subscribed = False
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            if not subscribed and b'event:state' in chunk:
+                subscribed = True
+                self.connected += 1
+                ready.release()
+
+    async def _open(self, timeout: float) -> None:
+        ready = asyncio.Semaphore(0)
+        for _ in range(self._count):
+            self._tasks.append(asyncio.ensure_future(self._client(ready)))
+        deadline = time.monotonic() + timeout
+        for _ in range(self._count):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(ready.acquire(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    def open(self, timeout: float = 60.0) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(timeout), self._loop).result()
+
+    def close(self) -> None:
+        async def _close() -> None:
+            for writer in self._writers:
+                writer.close()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _raise_fd_limit(needed: int) -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='已运行服务的地址；缺省时在子进程里启动 backend')
+    parser.add_argument('--clients', type=int, default=500, help='同时在线的 SSE 订阅者数量')
+    parser.add_argument('--requests', type=int, default=200, help='每轮 /songs/search 请求数')
+    parser.add_argument('--concurrency', type=int, default=5)
+    args = parser.parse_args()
+
+    _raise_fd_limit(args.clients + 256)
+    server: Optional[subprocess.Popen] = None
+    base_url = (args.url or '').rstrip('/')
+    if not base_url:
+        port = _free_port()
+        server = _start_server(port)
+        base_url = f'http://127.0.0.1:{port}'
+    try:
+        _search_latencies(base_url, args.concurrency * 4, args.concurrency)  # 预热
+        rows: List[Tuple[str, List[float]]] = [
+            ('无订阅者', _search_latencies(base_url, args.requests, args.concurrency)),
+        ]
+        clients = _SseClients(base_url, args.clients)
+        start = time.perf_counter()
+        clients.open()
+        print(f'{clients.connected}/{args.clients} 个 SSE 订阅者就绪，用时 {time.perf_counter() - start:.1f} s')
+        try:
+            rows.append((f'{clients.connected} 个空闲订阅者',
+                         _search_latencies(base_url, args.requests, args.concurrency)))
+        finally:
+            clients.close()
+        print(f'/songs/search × {args.requests}，并发 {args.concurrency}')
+        for name, samples in rows:
+            print(f'{name:<16}{_percentiles(samples)}')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""律动背景实时频带分析基准：单个 OnAudioData 帧在 _process_audio_data 中的耗时。
+
+SSE 发布被替换为空操作，只计解码、环形缓冲、频带聚合与限频合并本身。
+
+用法：
+    python bench_audio_bands.py                   # f32 / i16 × 1024 / 4096 采样，各 2000 帧
+    python bench_audio_bands.py --frames 5000 --sizes 512 2048
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+os.environ.setdefault('FAMYLIAM_SKIP_INDEX_INIT', '1')
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+
+def _frames(fmt: str, size: int, count: int, seed: int) -> List[bytes]:
+    np = backend._np
+    rng = np.random.default_rng(seed)
+    t = np.arange(size, dtype=np.float32)
+    frames = []
+    for i in range(count):
+        tone = np.sin(2 * np.pi * (8 + i % 64) * t / size) * 0.6 + rng.normal(0, 0.05, size)
+        tone = np.clip(tone, -1, 1).astype(np.float32)
+        if fmt == 'i16':
+            # 高半字解读为 f32 时为 NaN，走 i16 回退路径
+            pcm = (tone * 32767).astype('<i2')
+            pcm[1::2] = 32767
+            frames.append(pcm.tobytes())
+        else:
+            frames.append(tone.astype('<f4').tobytes())
+    return frames
+
+
+def _per_frame_us(frames: List[bytes], rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for frame in frames:
+            backend._process_audio_data(frame)
+        samples.append((time.perf_counter() - start) / len(frames) * 1e6)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 4096], help='每帧采样数')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    if backend._np is None:
+        print('未安装 numpy，无法运行该基准')
+        return
+    backend._amll_publish = lambda evt_type, data: None
+    print(f'每种帧 {args.frames} 个，取 {args.rounds} 轮中位数（SSE 发布已替换为空操作）')
+    for fmt in ('f32', 'i16'):
+        for size in args.sizes:
+            frames = _frames(fmt, size, args.frames, seed=size)
+            decoded = backend._decode_audio_samples(frames[0])[1]
+            assert decoded == fmt, (fmt, decoded)
+            us = _per_frame_us(frames, args.rounds)
+            print(f'{fmt} {size:>5} 采样{us:10.1f} us/帧')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""LYS 解析基准：冷解析 / 缓存命中 / TTML 转换 / 快速编辑器解析。
+
+用法：
+    python bench_lys_parse.py                 # 生成 20 首各 2000 行的合成歌词
+    python bench_lys_parse.py --dir static/songs --rounds 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+_WORDS = ['hello ', 'world ', 'ラ', 'ブ', '愛し', 'てる ', '(ooh ', 'ah) ', 'la', 'da ', 'で', 'night ']
+
+
+def _synthetic_lys(seed: int, lines: int) -> str:
+    rng = random.Random(seed)
+    out = ['[ti:Bench]', '[ar:Bench]', '[by:bench]', f'[offset:{rng.randint(-200, 200)}]']
+    t = 1000
+    for i in range(lines):
+        if i % 400 == 0:
+            out.append(rng.choice(['[font-family:Main(en),Sub(ja)]', '[font-family:]']))
+        marker = rng.choice(['', '1', '2', '5', '6'])
+        parts = []
+        for _ in range(rng.randint(3, 12)):
+            d = rng.randint(80, 500)
+            parts.append(f'{rng.choice(_WORDS)}({t},{d})')
+            t += rng.randint(50, 600)
+        out.append(f'[{marker}]' + ''.join(parts))
+    return '\n'.join(out) + '\n'
+
+
+def _time_ms(func: Callable[[], object], rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', type=Path, help='包含 .lys 文件的目录；缺省时生成合成语料')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths: List[Path] = sorted(args.dir.rglob('*.lys'))
+        else:
+            paths = []
+            for i in range(args.files):
+                path = Path(tmp) / f'bench_{i}.lys'
+                path.write_text(_synthetic_lys(i, args.lines), encoding='utf-8')
+                paths.append(path)
+        if not paths:
+            print('没有找到 .lys 文件')
+            return
+        texts = [backend.load_lys_document(p).text for p in paths]
+        total_lines = sum(len(t.splitlines()) for t in texts)
+        print(f'{len(paths)} 个文件，共 {total_lines} 行，每项取 {args.rounds} 轮中位数（整个语料）')
+
+        def cold() -> None:
+            for text in texts:
+                backend._lys_document_cache.clear()
+                backend.parse_lys(text)
+
+        def warm() -> None:
+            for path in paths:
+                backend.build_lys_player_lines(backend.load_lys_document(path))
+
+        def ttml() -> None:
+            for path in paths:
+                backend.lys_to_ttml(str(path), str(Path(tmp) / 'out.ttml'))
+
+        def quick_editor() -> None:
+            for text in texts:
+                backend.qe_parse_lys(text)
+
+        warm()
+        rows = [
+            ('parse_lys 冷解析', _time_ms(cold, args.rounds)),
+            ('parse_lys 缓存命中', _time_ms(warm, args.rounds)),
+            ('lys_to_ttml', _time_ms(ttml, args.rounds)),
+            ('qe_parse_lys', _time_ms(quick_editor, args.rounds)),
+        ]
+        for name, ms in rows:
+            print(f'{name:<20}{ms:10.1f} ms')
+        print(f'文档解析次数: {backend._lys_document_cache.parses}')
+
+
+if __name__ == '__main__':
+    main()
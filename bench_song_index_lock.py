@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""歌曲索引读写锁基准：写者频繁改行、偶尔长时间持有写锁时，并发搜索的延迟与读锁等待。
+
+在进程内装入合成曲库，若干搜索线程持续调用 /songs/search 背后的查询函数，
+写者线程逐行 upsert，每写若干行就持有写锁一段时间（模拟落盘 / 重建换入）。
+结束后打印搜索延迟分位数，以及锁自带的等待直方图与乐观读统计（同 /internal/song_search_index_stats）。
+
+用法：
+    python bench_song_index_lock.py               # 2 万首，3 个搜索线程，运行 10 s
+    python bench_song_index_lock.py --songs 50000 --hold-ms 500 --seconds 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+os.environ.setdefault('FAMYLIAM_SKIP_INDEX_INIT', '1')
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+from bench_song_search import _synthetic_rows  # noqa: E402
+
+
+def _install(rows) -> None:
+    for row in rows.values():
+        row['rank'] = backend._song_search_rank_keys(row['summary'])
+    with backend._song_search_index_lock:
+        backend._song_search_index_reset_locked(rows)
+        backend._song_search_ngram_index.rebuild(backend._song_search_index)
+        backend._song_search_term_index.build(backend._song_search_index)
+        backend._rebuild_artist_playlist_from_song_index_locked()
+
+
+def _pct(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--searchers', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--hold-every', type=int, default=50, help='每写这么多行持有一次写锁')
+    parser.add_argument('--hold-ms', type=float, default=300.0, help='每次持有写锁的时长')
+    args = parser.parse_args()
+
+    rows = _synthetic_rows(args.songs, seed=11)
+    _install(rows)
+    titles = [row['summary']['title'] for row in rows.values()]
+    filenames = list(rows)
+    backend._song_search_index_lock.reset_stats()
+    stop = threading.Event()
+    latencies: List[float] = []
+    latency_lock = threading.Lock()
+    writes = [0]
+
+    def searcher(seed: int) -> None:
+        rng = random.Random(seed)
+        local: List[float] = []
+        while not stop.is_set():
+            title = rng.choice(titles)
+            query = title[:rng.randint(1, min(3, len(title)))]
+            start = time.perf_counter()
+            backend._run_library_search_ordered_summaries(query, rng.random() < 0.3)
+            local.append((time.perf_counter() - start) * 1000)
+        with latency_lock:
+            latencies.extend(local)
+
+    def writer() -> None:
+        rng = random.Random(0)
+        while not stop.is_set():
+            fn = rng.choice(filenames)
+            with backend._song_search_index_lock:
+                row = dict(backend._song_search_index[fn])
+                row['summary'] = dict(row['summary'], mtime=time.time())
+                backend._song_search_index_set_row_locked(fn, row)
+                writes[0] += 1
+                if writes[0] % args.hold_every == 0:
+                    time.sleep(args.hold_ms / 1000)
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=searcher, args=(i,)) for i in range(args.searchers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    ordered = sorted(latencies)
+    stats = backend._song_search_index_lock.stats()
+    print(f'{len(rows)} 首，{args.searchers} 个搜索线程，写者每 {args.hold_every} 行持锁 {args.hold_ms:g} ms，'
+          f'运行 {args.seconds:g} s')
+    print(f'搜索 {len(ordered)} 次：p50 {statistics.median(ordered):.2f} ms  p90 {_pct(ordered, 0.90):.2f} ms  '
+          f'p99 {_pct(ordered, 0.99):.2f} ms  max {ordered[-1]:.2f} ms')
+    print(f'写入 {writes[0]} 行；读锁等待 {stats["read"]["count"]} 次（竞争 {stats["read"]["contended"]}），'
+          f'乐观读 {stats["optimisticReads"]} 次，回退 {stats["optimisticRetries"]} 次')
+    print(f'写锁等待直方图: {stats["write"]["buckets"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""曲库搜索基准：n-gram 倒排索引取候选再校验 vs 全表逐行匹配。
+
+合成曲库标题约 60% 汉字、20% 假名、20% 拉丁字母；每类查询取若干条求中位数，
+并报告索引构建、二进制序列化 / 加载耗时与落盘体积。两种方式的结果逐条比对一致。
+
+用法：
+    python bench_song_search.py                   # 5 万首，每类 30 条查询
+    python bench_song_search.py --songs 20000 --queries 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+os.environ.setdefault('FAMYLIAM_SKIP_INDEX_INIT', '1')
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+_CJK = [chr(c) for c in range(0x4E00, 0x4E00 + 400)]
+_KANA = [chr(c) for c in range(0x3041, 0x3097)]
+_LATIN = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def _word(rng: random.Random, alphabet, low: int, high: int) -> str:
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def _synthetic_rows(count: int, seed: int) -> Dict[str, Dict[str, object]]:
+    rng = random.Random(seed)
+    artists = [_word(rng, _CJK, 2, 4) for _ in range(600)] + [_word(rng, _LATIN, 4, 9) for _ in range(300)]
+    rows = {}
+    for i in range(count):
+        alphabet = rng.choices((_CJK, _KANA, _LATIN), weights=(6, 2, 2))[0]
+        title = _word(rng, alphabet, 2, 8) if alphabet is not _LATIN else ' '.join(
+            _word(rng, _LATIN, 3, 8) for _ in range(rng.randint(1, 3)))
+        artist = rng.choice(artists)
+        summary = {
+            'filename': f'{title} - {artist} {i}.json',
+            'title': title,
+            'artists': [artist],
+            'album': _word(rng, _CJK, 2, 5),
+            'song': f'songs/{title}.mp3',
+            'lyricsPath': f'songs/{title}.lys',
+            'hasAudio': True,
+            'mtime': float(i),
+        }
+        pool = backend._search_pool_from_summary(summary)
+        rows[summary['filename']] = {
+            'mtime': float(i),
+            'summary': summary,
+            'pool': pool,
+            'pool_compact': backend._compact_search_pool(pool),
+        }
+    return rows
+
+
+def _tokens(query: str, fuzzy: bool) -> List[str]:
+    if fuzzy:
+        return backend._parse_library_fuzzy_chars(query)
+    return backend._parse_library_search_keywords(query)
+
+
+def _matcher(tokens: List[str], fuzzy: bool) -> Callable[[Dict[str, object]], bool]:
+    if fuzzy:
+        return lambda row: all(ch in row['pool_compact'] for ch in tokens)
+    return lambda row: all(kw in row['pool'] for kw in tokens)
+
+
+def _linear(rows, query: str, fuzzy: bool) -> Set[str]:
+    tokens = _tokens(query, fuzzy)
+    match = _matcher(tokens, fuzzy)
+    return {fn for fn, row in rows.items() if match(row)}
+
+
+def _indexed(index, rows, query: str, fuzzy: bool) -> Set[str]:
+    tokens = _tokens(query, fuzzy)
+    match = _matcher(tokens, fuzzy)
+    candidates: Optional[List[str]] = index.candidates(tokens, fuzzy)
+    if candidates is None:
+        return {fn for fn, row in rows.items() if match(row)}
+    return {fn for fn in candidates if match(rows[fn])}
+
+
+def _queries(rows, count: int, seed: int) -> List[Tuple[str, List[Tuple[str, bool]]]]:
+    rng = random.Random(seed)
+    summaries = [row['summary'] for row in rows.values()]
+    picks = [rng.choice(summaries) for _ in range(count)]
+    cjk_titles = [s['title'] for s in summaries if s['title'][0] in _CJK]
+
+    def two_chars(title: str) -> str:
+        chars = [ch for ch in title if not ch.isspace()]
+        return ''.join(rng.sample(chars, 2)) if len(chars) >= 2 else title
+
+    return [
+        ('标题前缀', [(s['title'][:2], False) for s in picks]),
+        ('歌手', [(s['artists'][0], False) for s in picks]),
+        ('2 字模糊', [(two_chars(s['title']), True) for s in picks]),
+        ('单个汉字', [(rng.choice(cjk_titles)[0], False) for _ in range(count)]),
+        ("'json'（全部命中）", [('json', False)] * count),
+    ]
+
+
+def _median_ms(func: Callable[[str, bool], Set[str]], queries: List[Tuple[str, bool]]) -> float:
+    samples = []
+    for query, fuzzy in queries:
+        start = time.perf_counter()
+        func(query, fuzzy)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=30, help='每类查询条数')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rows = _synthetic_rows(args.songs, args.seed)
+    start = time.perf_counter()
+    index = backend.SongSearchNgramIndex()
+    index.rebuild(rows)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    data = index.to_bytes(1)
+    dump_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index, _ = backend.SongSearchNgramIndex.from_bytes(data, rows)
+    load_s = time.perf_counter() - start
+    print(f'{len(rows)} 首合成歌曲；索引构建 {build_s:.2f} s，序列化 {dump_s:.2f} s，'
+          f'加载 {load_s:.2f} s，落盘 {len(data) / 1024 / 1024:.1f} MB')
+    print(f'每类 {args.queries} 条查询的中位数：')
+    for name, queries in _queries(rows, args.queries, args.seed):
+        for query, fuzzy in queries:
+            if _indexed(index, rows, query, fuzzy) != _linear(rows, query, fuzzy):
+                raise SystemExit(f'结果不一致: {query!r} fuzzy={fuzzy}')
+        linear_ms = _median_ms(lambda q, f: _linear(rows, q, f), queries)
+        indexed_ms = _median_ms(lambda q, f: _indexed(index, rows, q, f), queries)
+        print(f'{name:<16}全表 {linear_ms:8.2f} ms  ->  索引 {indexed_ms:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""AMLL realtime pipeline contract tests (SSE broker, frame cache, lyric deltas, audio bands, WS frame pipeline)."""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+from backend import (  # noqa: E402
+    AUDIO_BAND_COUNT,
+    AudioLevelsAccumulator,
+    AmllEventBroker,
+    AmllFrameCache,
+    AmllWsFramePipeline,
+    _amll_audio_levels_payload,
+    _amll_frame_cache_key,
+    _amll_lines_delta,
+    _AudioRingBuffer,
+    _sse,
+    _calculate_band_levels,
+    _decode_audio_samples,
+)
+
+
+def _drain(sub):
+    events = []
+    while True:
+        evt = sub.get(timeout=0)
+        if evt is None:
+            return events
+        events.append(evt)
+
+
+def test_every_subscriber_sees_every_event():
+    broker = AmllEventBroker(buffer_size=16)
+    a = broker.subscribe()
+    b = broker.subscribe()
+    broker.publish("song", {"song": {"musicName": "x"}})
+    broker.publish("lyrics", {"raw_lines": []})
+    assert [e["type"] for e in _drain(a)] == ["song", "lyrics"]
+    assert [e["type"] for e in _drain(b)] == ["song", "lyrics"]
+
+
+def test_slow_subscriber_drops_oldest_without_affecting_others():
+    broker = AmllEventBroker(buffer_size=8)
+    slow = broker.subscribe()
+    fast = broker.subscribe()
+    seen = []
+    for i in range(20):
+        broker.publish("lyrics", {"i": i})
+        seen.append(fast.get(timeout=0)["data"]["i"])
+    assert seen == list(range(20))
+    kept = [e["data"]["i"] for e in _drain(slow)]
+    assert kept == list(range(12, 20))
+    assert slow.dropped == 12
+    assert fast.dropped == 0
+
+
+def test_high_frequency_events_are_coalesced_in_order():
+    broker = AmllEventBroker(buffer_size=8)
+    sub = broker.subscribe()
+    broker.publish("progress", {"progress_ms": 1})
+    broker.publish("song", {"song": {}})
+    broker.publish("progress", {"progress_ms": 2})
+    broker.publish("progress", {"progress_ms": 3})
+    events = _drain(sub)
+    assert [e["type"] for e in events] == ["song", "progress"]
+    assert events[-1]["data"]["progress_ms"] == 3
+    assert sub.coalesced == 2
+
+
+def test_coalesced_events_do_not_push_out_lyrics_for_stalled_subscriber():
+    broker = AmllEventBroker(buffer_size=8)
+    stalled = broker.subscribe()
+    broker.publish("lyrics", {"raw_lines": ["a"]})
+    for i in range(20):
+        broker.publish("audio_levels", {"i": i})
+    events = _drain(stalled)
+    assert [e["type"] for e in events] == ["lyrics", "audio_levels"]
+    assert events[-1]["data"]["i"] == 19
+    assert stalled.dropped == 0
+    assert stalled.coalesced == 19
+
+
+def test_unsubscribe_stops_delivery_and_stats_report_lag():
+    broker = AmllEventBroker(buffer_size=8)
+    sub = broker.subscribe(label="screen")
+    broker.publish("lyrics", {})
+    broker.publish("lyrics", {})
+    stats = broker.stats()
+    assert stats["subscribers"][0]["label"] == "screen"
+    assert stats["subscribers"][0]["lag_events"] == 2
+    assert stats["subscribers"][0]["depth"] == 2
+    broker.unsubscribe(sub)
+    assert sub.closed
+    assert sub.get(timeout=0) is None
+    assert broker.subscriber_count() == 0
+
+
+def test_stream_stats_route_is_limited_to_trusted_clients(monkeypatch):
+    client = TestClient(backend.app)
+    monkeypatch.setattr(backend, "is_request_allowed", lambda: False)
+    assert client.get("/amll/stream/stats").status_code == 403
+    monkeypatch.setattr(backend, "is_request_allowed", lambda: True)
+    resp = client.get("/amll/stream/stats")
+    assert resp.status_code == 200 and "subscribers" in resp.json()
+
+
+def test_async_subscribers_are_woken_from_publisher_thread_without_threads():
+    broker = AmllEventBroker(buffer_size=8)
+
+    async def scenario():
+        subs = [broker.subscribe() for _ in range(500)]
+        loop = asyncio.get_running_loop()
+        for sub in subs:
+            sub.bind_loop(loop)
+        threads_before = threading.active_count()
+        waiters = [asyncio.ensure_future(sub.get_async(timeout=5)) for sub in subs]
+        await asyncio.sleep(0)
+        assert threading.active_count() == threads_before
+        publisher = threading.Thread(target=broker.publish, args=("song", {"song": {}}))
+        publisher.start()
+        results = await asyncio.gather(*waiters)
+        publisher.join()
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(results) == 500
+    assert all(evt is not None and evt["type"] == "song" for evt in results)
+
+
+def test_async_get_times_out_and_close_wakes_waiter():
+    broker = AmllEventBroker(buffer_size=8)
+
+    async def scenario():
+        sub = broker.subscribe()
+        assert await sub.get_async(timeout=0.01) is None
+        waiter = asyncio.ensure_future(sub.get_async(timeout=5))
+        await asyncio.sleep(0)
+        broker.unsubscribe(sub)
+        return await asyncio.wait_for(waiter, timeout=1)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_frame_cache_builds_each_frame_once():
+    cache = AmllFrameCache(max_entries=4)
+    calls = []
+
+    def build():
+        calls.append(1)
+        return b"event:lyrics\ndata:{}\n\n"
+
+    key = _amll_frame_cache_key("lyrics", 7, {"mode": "off", "threshold_ms": 2000}, "a:5000")
+    same_for_other_host = _amll_frame_cache_key("lyrics", 7, {"mode": "off", "threshold_ms": 2000}, "b:5000")
+    assert key == same_for_other_host
+    frames = [cache.get_or_build(key, build) for _ in range(10)]
+    assert len(calls) == 1
+    assert all(frame is frames[0] for frame in frames)
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 9
+
+
+def test_frame_cache_concurrent_subscribers_share_one_build():
+    cache = AmllFrameCache(max_entries=4)
+    release = threading.Event()
+    builds = []
+
+    def build():
+        builds.append(1)
+        release.wait(1)
+        return b"frame"
+
+    def fail():
+        builds.append(1)
+        release.wait(1)
+        raise RuntimeError("boom")
+
+    results, errors = [], []
+
+    def subscribe(key, builder):
+        try:
+            results.append(cache.get_or_build(key, builder))
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=subscribe, args=(("a",), build)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1 and results == [b"frame"] * 6
+    assert cache.stats()["misses"] == 1
+
+    # A failed build is not cached; the subscriber waiting behind it builds the frame itself.
+    builds.clear()
+    release.clear()
+    results.clear()
+    failing = threading.Thread(target=subscribe, args=(("b",), fail))
+    failing.start()
+    time.sleep(0.05)
+    waiting = threading.Thread(target=subscribe, args=(("b",), build))
+    waiting.start()
+    time.sleep(0.05)
+    release.set()
+    failing.join()
+    waiting.join()
+    assert len(errors) == 1 and results == [b"frame"] and len(builds) == 2
+    assert cache.get_or_build(("b",), fail) == b"frame"
+
+
+def test_frame_cache_keys_split_on_host_and_split_options():
+    opts_off = {"mode": "off", "threshold_ms": 2000}
+    opts_on = {"mode": "on", "threshold_ms": 2000}
+    assert _amll_frame_cache_key("song", 1, opts_off, "a") != _amll_frame_cache_key("song", 1, opts_off, "b")
+    assert _amll_frame_cache_key("lyrics", 1, opts_off, "a") != _amll_frame_cache_key("lyrics", 1, opts_on, "a")
+    assert _amll_frame_cache_key("progress", 1, opts_off, "a") == _amll_frame_cache_key("progress", 1, opts_on, "b")
+
+
+def test_frame_cache_evicts_least_recently_used():
+    cache = AmllFrameCache(max_entries=2)
+    cache.get_or_build(("a",), lambda: b"a")
+    cache.get_or_build(("b",), lambda: b"b")
+    cache.get(("a",))
+    cache.get_or_build(("c",), lambda: b"c")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == b"a"
+
+
+def _apply_delta(lines, ops):
+    lines = list(lines)
+    for op in ops:
+        if op["op"] == "replace":
+            lines[op["index"]:op["index"] + len(op["lines"])] = op["lines"]
+        elif op["op"] == "delete":
+            del lines[op["index"]:op["index"] + op["count"]]
+        elif op["op"] == "insert":
+            lines[op["index"]:op["index"]] = op["lines"]
+    return lines
+
+
+def _line(text):
+    return {"syllables": [{"text": text}], "translatedLyric": ""}
+
+
+def test_lines_delta_round_trips_insert_replace_delete():
+    old = [_line(str(i)) for i in range(20)]
+    new = list(old)
+    new[3] = _line("three")
+    del new[10:12]
+    new.insert(15, _line("extra"))
+    new.append(_line("tail"))
+    ops = _amll_lines_delta(old, new)
+    assert ops is not None
+    assert _apply_delta(old, ops) == new
+    assert sum(len(op.get("lines", [])) for op in ops) == 3
+
+
+def test_lines_delta_falls_back_when_most_lines_change():
+    old = [_line(str(i)) for i in range(10)]
+    new = [_line(f"other-{i}") for i in range(10)]
+    assert _amll_lines_delta(old, new) is None
+
+
+def test_publish_assigns_lyrics_revisions_kept_in_history(monkeypatch):
+    monkeypatch.setattr(backend, "AMLL_BROKER", AmllEventBroker(buffer_size=8))
+    sub = backend.AMLL_BROKER.subscribe()
+    first = [{"words": [{"word": "a", "startTime": 0, "endTime": 100}]}]
+    second = first + [{"words": [{"word": "b", "startTime": 100, "endTime": 200}]}]
+    backend._amll_publish("lyrics", {"raw_lines": first})
+    backend._amll_publish("lyrics", {"raw_lines": second})
+    rev_a = sub.get(timeout=0)["data"]["lyrics_rev"]
+    rev_b = sub.get(timeout=0)["data"]["lyrics_rev"]
+    assert rev_b == rev_a + 1
+    assert backend._amll_lyrics_head() == (rev_b, second)
+    assert backend._amll_lyrics_raw_for_rev(rev_a) is first
+    assert backend._amll_lyrics_raw_for_rev(rev_a - backend.AMLL_LYRICS_HISTORY_SIZE) is None
+
+
+async def _first_stream_frame(query):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/amll/stream", "raw_path": b"/amll/stream", "root_path": "",
+             "query_string": query.encode(), "headers": [(b"host", b"testserver")],
+             "client": ("127.0.0.1", 1), "server": ("testserver", 80)}
+    first = asyncio.get_running_loop().create_future()
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body") and not first.done():
+            first.set_result(message["body"])
+
+    task = asyncio.create_task(backend.app(scope, receive, send))
+    try:
+        frame = await asyncio.wait_for(first, 5)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+    return json.loads(frame.decode("utf-8").split("data:", 1)[1])
+
+
+def test_stream_resumes_lyrics_only_within_the_same_process_epoch(monkeypatch):
+    monkeypatch.setattr(backend, "AMLL_STATE", dict(backend.AMLL_STATE))
+    monkeypatch.setattr(backend, "AMLL_BROKER", AmllEventBroker(buffer_size=8))
+    monkeypatch.setattr(backend, "AMLL_FRAME_CACHE", AmllFrameCache(max_entries=16))
+    monkeypatch.setattr(backend, "_amll_lyrics_history", type(backend._amll_lyrics_history)(maxlen=4))
+    backend._amll_publish("lyrics", {"raw_lines": [{"words": [{"word": "a", "startTime": 0, "endTime": 100}]}]})
+    rev, _ = backend._amll_lyrics_head()
+    epoch = backend.AMLL_LYRICS_EPOCH
+
+    state = asyncio.run(_first_stream_frame(f"delta=1&lyrics_rev={rev}&lyrics_epoch={epoch}"))
+    assert state["lyrics_epoch"] == epoch and "lines" not in state
+    # A rev from before a restart (or sent without its epoch) may collide with this process's numbering.
+    for query in (f"delta=1&lyrics_rev={rev}&lyrics_epoch=previous", f"delta=1&lyrics_rev={rev}"):
+        state = asyncio.run(_first_stream_frame(query))
+        assert state["lyrics_rev"] == rev and len(state["lines"]) == 1
+
+
+def test_decode_audio_f32_is_zero_copy_view():
+    frame = struct.pack("<4f", 0.0, 0.5, -0.25, 1.0)
+    samples, fmt = _decode_audio_samples(frame)
+    assert fmt == "f32"
+    assert samples.tolist() == [0.0, 0.5, -0.25, 1.0]
+    assert not samples.flags.owndata
+
+
+def test_decode_audio_falls_back_to_i16_when_f32_looks_invalid():
+    # A 0x7FFF high half makes the f32 reading NaN, forcing the i16 path.
+    frame = struct.pack("<4h", 16384, 32767, -16384, 32767)
+    samples, fmt = _decode_audio_samples(frame)
+    assert fmt == "i16"
+    assert samples[0] == 0.5
+    assert samples[2] == -0.5
+
+
+def test_audio_ring_buffer_keeps_latest_samples_in_order():
+    ring = _AudioRingBuffer(5)
+    ring.extend(backend._np.arange(3, dtype="float32"))
+    ring.extend(backend._np.arange(3, 7, dtype="float32"))
+    assert len(ring) == 5
+    assert ring.snapshot().tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+    ring.extend(backend._np.arange(10, 20, dtype="float32"))
+    assert ring.snapshot().tolist() == [15.0, 16.0, 17.0, 18.0, 19.0]
+
+
+def test_band_levels_follow_log_spaced_tone_position():
+    np = backend._np
+    t = np.arange(2048, dtype="float32")
+    low = _calculate_band_levels(np.sin(2 * np.pi * 4 * t / 2048).astype("float32"))
+    high = _calculate_band_levels(np.sin(2 * np.pi * 700 * t / 2048).astype("float32"))
+    assert len(low) == len(high) == AUDIO_BAND_COUNT
+    assert all(0.0 <= v <= 1.0 for v in low + high)
+    assert max(range(AUDIO_BAND_COUNT), key=low.__getitem__) < AUDIO_BAND_COUNT // 2
+    assert max(range(AUDIO_BAND_COUNT), key=high.__getitem__) >= AUDIO_BAND_COUNT // 2
+
+
+def test_ws_pipeline_publishes_in_submission_order_across_workers():
+    published = []
+    pipeline = AmllWsFramePipeline(lambda t, d: published.append(d["i"]), lambda p: None, workers=4, queue_size=64)
+
+    def job(i, delay):
+        time.sleep(delay)
+        return [("song", {"i": i})]
+
+    for i in range(12):
+        assert pipeline.submit("cover", job, i, 0.02 if i % 3 == 0 else 0)
+    assert pipeline.wait_idle()
+    assert published == list(range(12))
+    stats = pipeline.stats()
+    assert stats["processed"] == 12
+    assert stats["depth"] == 0
+    assert stats["stages"]["cover"]["count"] == 12
+    assert "queue_wait" in stats["stages"]
+
+
+def test_ws_progress_is_published_after_earlier_song_and_cover(monkeypatch):
+    published = []
+    pipeline = AmllWsFramePipeline(lambda t, d: published.append(t), lambda p: None, workers=2)
+    monkeypatch.setattr(backend, "AMLL_WS_PIPELINE", pipeline)
+
+    def slow_cover(value):
+        time.sleep(0.05)
+        return [("song", {"song": {"cover": "x"}})]
+
+    monkeypatch.setattr(backend, "_ws_cover_patch_from_message", slow_cover)
+
+    class FakeWs:
+        remote_address = ("test", 0)
+
+        def __init__(self, frames):
+            self._frames = list(frames)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self._frames:
+                raise StopAsyncIteration
+            return self._frames.pop(0)
+
+    frames = [
+        '{"type": "setMusicAlbumCoverImageData", "value": {}}',
+        '{"type": "onPlayProgress", "value": {"progress": 1200}}',
+        '{"type": "state", "value": {"update": "progress", "value": {"progress": 1300}}}',
+    ]
+    asyncio.run(backend.ws_handle(FakeWs(frames)))
+    assert pipeline.wait_idle()
+    assert published == ["song", "progress", "progress"]
+    # Nothing pending: progress goes out immediately, without a worker.
+    pipeline.publish_ordered("progress", {"progress_ms": 1})
+    assert published[-1] == "progress" and pipeline.stats()["depth"] == 0
+
+
+def test_ws_pipeline_audio_slot_keeps_only_latest_frame():
+    handled = []
+    gate = threading.Event()
+
+    def handle(payload):
+        gate.wait(1)
+        handled.append(payload)
+
+    pipeline = AmllWsFramePipeline(lambda t, d: None, handle, workers=2)
+    pipeline.submit_audio(b"first")
+    time.sleep(0.05)
+    for i in range(50):
+        pipeline.submit_audio(b"frame-%d" % i)
+    gate.set()
+    assert pipeline.wait_idle()
+    assert handled == [b"first", b"frame-49"]
+    stats = pipeline.stats()
+    assert stats["audio_superseded"] == 49
+    assert stats["audio_pending"] is False
+
+
+def test_ws_lyrics_export_does_not_print_every_line(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(backend, "EXPORTS_DIR", tmp_path)
+    payload = [{"startTime": i * 1000, "endTime": i * 1000 + 900,
+                "words": [{"word": f"w{i}", "startTime": i * 1000, "endTime": i * 1000 + 900}]}
+               for i in range(50)]
+    assert backend._ws_export_lyrics_chars(payload, "歌词") == []
+    assert len(capsys.readouterr().out.splitlines()) == 2
+    assert len(list(tmp_path.glob("lyrics_chars_*.csv"))) == 1
+
+
+def test_ws_pipeline_bounded_queue_applies_backpressure():
+    gate = threading.Event()
+    pipeline = AmllWsFramePipeline(lambda t, d: None, lambda p: None, workers=1, queue_size=2)
+    pipeline.submit("binary", lambda: gate.wait(1) and None)
+    time.sleep(0.05)
+    assert pipeline.submit("binary", lambda: None)
+    assert pipeline.submit("binary", lambda: None)
+    assert not pipeline.submit("binary", lambda: None)
+
+    async def scenario():
+        waiter = asyncio.ensure_future(pipeline.submit_async("binary", lambda: None))
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        gate.set()
+        await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(scenario())
+    assert pipeline.wait_idle()
+    stats = pipeline.stats()
+    assert stats["backpressure_waits"] >= 1
+    assert stats["max_depth"] == 2
+    assert stats["processed"] == 4
+
+
+def test_audio_levels_accumulator_caps_rate_with_peak_hold():
+    acc = AudioLevelsAccumulator(max_hz=10, merge="peak")
+    assert acc.offer([0.1, 0.9], now=0.0, timestamp=1)["levels"] == [0.1, 0.9]
+    assert acc.offer([0.8, 0.2], now=0.03, timestamp=2) is None
+    assert acc.offer([0.3, 0.4], now=0.06, timestamp=3) is None
+    assert acc.due_in(0.06) > 0
+    merged = acc.offer([0.0, 0.5], now=0.1, timestamp=4)
+    assert merged == {"levels": [0.8, 0.5], "timestamp": 4}
+    assert not acc.pending
+    assert acc.merged == 2
+
+
+def test_audio_levels_accumulator_mean_merge():
+    acc = AudioLevelsAccumulator(max_hz=10, merge="mean")
+    acc.offer([1.0, 1.0], now=0.0)
+    acc.add([0.2, 0.4])
+    acc.add([0.4, 0.8])
+    assert acc.due_in(0.05) > 0
+    assert acc.take(0.1)["levels"] == [0.30000000000000004, 0.6000000000000001]
+
+
+def test_pending_audio_levels_are_flushed_after_frames_stop(monkeypatch):
+    published = []
+    monkeypatch.setattr(backend, "_audio_levels_accumulator", AudioLevelsAccumulator(max_hz=20, merge="peak"))
+    monkeypatch.setattr(backend, "_amll_publish", lambda evt, data: published.append((evt, data)))
+    samples = backend._np.zeros(2048, dtype=backend._np.float32)
+    backend._broadcast_audio_data(samples)
+    assert len(published) == 1
+    # The second frame lands inside the rate-limit window and then playback pauses.
+    tone = backend._np.sin(backend._np.arange(2048, dtype=backend._np.float32) * 0.3).astype(backend._np.float32)
+    backend._broadcast_audio_data(tone)
+    assert len(published) == 1
+    deadline = time.monotonic() + 1.0
+    while len(published) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [evt for evt, _ in published] == ["audio_levels", "audio_levels"]
+    assert published[1][1]["levels"] != published[0][1]["levels"]
+    assert not backend._audio_levels_accumulator.pending
+
+
+def test_compact_audio_levels_encoding_quantizes_to_uint8():
+    rng = backend._np.random.default_rng(7)
+    levels = rng.random(AUDIO_BAND_COUNT).tolist()
+    data = {"levels": levels, "thresholds": rng.random(AUDIO_BAND_COUNT).tolist(), "timestamp": 1700000000123.456}
+    compact = _amll_audio_levels_payload(data, "u8")
+    decoded = list(base64.b64decode(compact["levels"]))
+    assert compact["fmt"] == "u8" and compact["bands"] == AUDIO_BAND_COUNT
+    assert all(abs(d / 255 - v) <= 0.5 / 255 for d, v in zip(decoded, levels))
+    # Full-precision float JSON was the previous wire format.
+    assert len(_sse("audio_levels", compact)) * 4 < len(_sse("audio_levels", data))
+    assert _amll_audio_levels_payload(data, "json") is data
+    assert _amll_frame_cache_key("audio_levels", 5, {}, "a", audio_format="u8") != \
+        _amll_frame_cache_key("audio_levels", 5, {}, "a")
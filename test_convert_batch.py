@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Batch lyric conversion jobs: per-call converter state, process pool, per-file results."""
+
+from __future__ import annotations
+
+import io
+import json
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+DUET_TTML = (
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttm="http://www.w3.org/ns/ttml#metadata">'
+    '<body><div>'
+    '<p begin="00:01.000" end="00:02.000" ttm:agent="v1"><span begin="00:01.000" end="00:02.000">a</span></p>'
+    '<p begin="00:03.000" end="00:04.000" ttm:agent="v2"><span begin="00:03.000" end="00:04.000">b</span>'
+    '<span ttm:role="x-bg"><span begin="00:03.500" end="00:04.000">(bg)</span></span></p>'
+    '</div></body></tt>'
+)
+SOLO_TTML = (
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div>'
+    '<p begin="00:01.000" end="00:02.000"><span begin="00:01.000" end="00:02.000">solo</span></p>'
+    '</div></body></tt>'
+)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    songs = tmp_path / "songs"
+    songs.mkdir()
+    monkeypatch.setitem(backend.RESOURCE_DIRECTORIES, "songs", songs)
+    monkeypatch.setattr(backend, "EXPORTS_DIR", tmp_path / "exports")
+    (tmp_path / "exports").mkdir()
+    monkeypatch.setattr(backend, "is_request_allowed", lambda: True)
+    monkeypatch.setattr(backend, "is_device_unlocked", lambda: True)
+    monkeypatch.setattr(backend, "CONVERT_BATCH_TASKS", {})
+    (songs / "a.lys").write_text("[1]Hello (1000,200)world(1200,300)\n", encoding="utf-8")
+    (songs / "a_trans.lrc").write_text("[00:01.000]你好\n", encoding="utf-8")
+    (songs / "b.lrc").write_text("[00:02.000]plain line\n", encoding="utf-8")
+    (songs / "temp_upload.lys").write_text("[1]x(0,1)\n", encoding="utf-8")
+    (songs / "duet.ttml").write_text(DUET_TTML, encoding="utf-8")
+    (songs / "solo.ttml").write_text(SOLO_TTML, encoding="utf-8")
+    (songs / "broken.ttml").write_text("<tt><body>", encoding="utf-8")
+    return songs
+
+
+def _run_job(client, payload):
+    resp = client.post("/convert_batch/start", json=payload)
+    assert resp.json()["status"] == "success"
+    task_id = resp.json()["task"]["task_id"]
+    for _ in range(600):
+        task = client.get("/convert_batch/status", params={"task_id": task_id}).json()["task"]
+        if task["status"] in ("done", "error"):
+            break
+        time.sleep(0.05)
+    assert task["status"] == "done", task
+    download = client.get("/convert_batch/download", params={"task_id": task_id})
+    assert download.status_code == 200
+    return task, zipfile.ZipFile(io.BytesIO(download.content))
+
+
+def test_converter_flags_are_per_call():
+    # A duet/background document must not leak its role offsets into the next conversion.
+    ok, duet, _, _ = backend.ttml_text_to_lys_parts(DUET_TTML)
+    assert ok and duet[0].startswith("[4]")
+    ok, solo, _, _ = backend.ttml_text_to_lys_parts(SOLO_TTML)
+    assert solo == ["[0]solo(1000,1000)"]
+    assert not hasattr(backend.TTMLLine, "have_duet")
+
+
+def test_library_to_ttml_reports_per_file(library):
+    client = TestClient(backend.app)
+    task, archive = _run_job(client, {"target": "ttml"})
+    # The translation LRC is attached to a.lys, not converted on its own; scratch uploads are skipped.
+    assert task["total_files"] == 2 and task["converted_files"] == 2 and task["failed"] == []
+    assert sorted(archive.namelist()) == ["conversion-report.json", "songs/a.ttml", "songs/b.ttml"]
+    assert "你好" in archive.read("songs/a.ttml").decode("utf-8")
+    assert not (library / "a.ttml").exists()
+
+
+def test_ttml_to_lys_in_process_pool_matches_inline(library, monkeypatch):
+    client = TestClient(backend.app)
+    monkeypatch.setattr(backend, "CONVERT_BATCH_MAX_WORKERS", 1)
+    _, inline = _run_job(client, {"target": "lys"})
+
+    monkeypatch.setattr(backend, "CONVERT_BATCH_MAX_WORKERS", 2)
+    monkeypatch.setattr(backend, "_convert_batch_pool", None)
+    try:
+        task, pooled = _run_job(client, {"target": "lys"})
+        assert backend._convert_batch_pool is not None
+    finally:
+        if backend._convert_batch_pool is not None:
+            backend._convert_batch_pool.shutdown()
+
+    assert task["total_files"] == 3 and task["converted_files"] == 2
+    assert [item["source"] for item in task["failed"]] == ["broken.ttml"]
+    names = sorted(pooled.namelist())
+    assert names == sorted(inline.namelist())
+    for name in names:
+        assert pooled.read(name) == inline.read(name)
+    report = json.loads(pooled.read("conversion-report.json"))
+    assert [(r["source"], r["status"]) for r in report["results"]] == [
+        ("broken.ttml", "error"), ("duet.ttml", "ok"), ("solo.ttml", "ok")]
+    assert pooled.read("songs/solo.lys").decode("utf-8") == "[0]solo(1000,1000)\n"
+
+
+def test_explicit_files_and_bad_requests(library):
+    client = TestClient(backend.app)
+    assert client.post("/convert_batch/start", json={"target": "docx"}).status_code == 400
+    task, archive = _run_job(client, {"target": "ttml", "files": ["songs/b.lrc", "songs/missing.lys", "../x.lys"]})
+    assert task["converted_files"] == 1
+    assert sorted(item["source"] for item in task["failed"]) == ["../x.lys", "songs/missing.lys"]
+    assert "songs/b.ttml" in archive.namelist()
+    other = TestClient(backend.app)
+    status = other.get("/convert_batch/status", params={"task_id": task["task_id"]})
+    assert status.status_code == 403
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Login cost contract: one bcrypt per attempt, dedicated hash pool, per-IP backoff."""
+
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+
+import bcrypt
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+LOOKUP_KEY = "0123456789abcdef0123456789abcdef"
+
+
+def _fast_hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(4)).decode("utf-8")
+
+
+@pytest.fixture
+def login_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "SECURITY_CONFIG_FILE", tmp_path / "security_config.json")
+    monkeypatch.setattr(backend, "TRUSTED_DEVICES_FILE", tmp_path / "trusted_devices.json")
+    monkeypatch.setattr(backend, "_LOGIN_FAILURES", {})
+    config = {"password_lookup_key": LOOKUP_KEY, "device_credentials": []}
+    for i in range(30):
+        password = f"shared-{i}"
+        config["device_credentials"].append({
+            "credential_id": f"c{i}",
+            "password_hash": _fast_hash(password),
+            "password_lookup": backend.password_lookup_tag(config, password),
+        })
+    config["device_credentials"].append({"credential_id": "legacy", "password_hash": _fast_hash("old-secret")})
+    config["system_password_hash"] = _fast_hash("admin-secret")
+    config["system_password_lookup"] = backend.password_lookup_tag(config, "admin-secret")
+    backend.save_security_config(config)
+    backend.save_trusted_devices({})
+
+    calls = []
+    real_verify = backend.verify_password
+
+    def counting_verify(password, hashed):
+        calls.append(threading.current_thread().name)
+        return real_verify(password, hashed)
+
+    monkeypatch.setattr(backend, "verify_password", counting_verify)
+    return calls
+
+
+def test_login_runs_one_bcrypt_on_the_hash_pool(login_env):
+    calls = login_env
+    client = TestClient(backend.app)
+    resp = client.post("/auth/login", json={"password": "shared-17"})
+    assert resp.status_code == 200
+    assert resp.json()["credential_id"] == "c17"
+    # Tagged candidates come first, so only the legacy credential could add a second check.
+    assert len(calls) == 1
+    assert calls[0].startswith("password-hash")
+
+    calls.clear()
+    resp = client.post("/auth/login", json={"password": "admin-secret"})
+    assert resp.json()["is_system_admin"] is True
+    assert len(calls) == 1
+    assert backend._cached_security_config()["device_credentials"][17]["used_count"] == 1
+
+
+def test_legacy_credential_gets_its_lookup_tag_backfilled(login_env):
+    calls = login_env
+    client = TestClient(backend.app)
+    assert client.post("/auth/login", json={"password": "old-secret"}).status_code == 200
+    legacy = backend.get_device_credential_by_id(backend._cached_security_config(), "legacy")
+    assert legacy["password_lookup"] == backend.password_lookup_tag(backend._cached_security_config(), "old-secret")
+
+    calls.clear()
+    assert client.post("/auth/login", json={"password": "old-secret"}).status_code == 200
+    assert len(calls) == 1
+
+
+def test_failed_logins_back_off_per_ip(login_env):
+    client = TestClient(backend.app)
+    for _ in range(backend.LOGIN_BACKOFF_FREE_FAILURES + 1):
+        assert client.post("/auth/login", json={"password": "nope"}).status_code == 401
+    resp = client.post("/auth/login", json={"password": "shared-3"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    # Other addresses are unaffected, and success clears the counter.
+    assert backend.login_backoff_remaining("198.51.100.7") == 0
+    backend.clear_login_failures("testclient")
+    assert client.post("/auth/login", json={"password": "shared-3"}).status_code == 200
+    assert ("", "testclient") not in backend._LOGIN_FAILURES
+
+
+def test_login_backoff_is_keyed_on_username_and_client_ip(login_env):
+    client = TestClient(backend.app)
+    for _ in range(backend.LOGIN_BACKOFF_FREE_FAILURES + 1):
+        resp = client.post("/auth/login", json={"username": "Mallory", "password": "nope"})
+        assert resp.status_code == 401
+    assert client.post("/auth/login", json={"username": "mallory", "password": "shared-3"}).status_code == 429
+    # Another user behind the same address (e.g. the same reverse proxy) can still log in.
+    assert backend.login_backoff_remaining("testclient", "alice") == 0
+    assert client.post("/auth/login", json={"username": "alice", "password": "shared-3"}).status_code == 200
+    assert client.post("/auth/login", json={"password": "shared-4"}).status_code == 200
+    # The same username from a different client address is not locked out either.
+    assert backend.login_backoff_remaining("203.0.113.9", "mallory") == 0
+    assert backend.login_backoff_remaining("testclient", "mallory") > 0
+
+
+def test_saturated_hash_pool_rejects_instead_of_queueing(login_env, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(backend, "_password_hash_slots", slots)
+    resp = TestClient(backend.app).post("/auth/login", json={"password": "shared-1"})
+    assert resp.status_code == 503
+    assert "Retry-After" in resp.headers
+    assert login_env == []
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Shared LYS parse engine: one tokenizer for all consumers, cached per file."""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+SAMPLE = "\n".join([
+    "[ti:Sample]",
+    "[offset:-100]",
+    "[font-family:Main(en),Sub(ja)]",
+    "[1]Hello (1000,200)world(1200,300)",
+    "[6](ooh (1500,100)ah)(1600,100)",
+    "[2]愛し(2000,400)(2400,0)",
+    "[]end (03000,500)",
+    "[by:nobody]",
+])
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    backend._lys_document_cache.clear()
+    yield
+    backend._lys_document_cache.clear()
+
+
+def test_parse_lys_applies_offset_fonts_and_background(capsys):
+    lines = backend.parse_lys(SAMPLE)
+    assert [line["line"] for line in lines] == ["Hello world", "ooh ah", "愛し", "end "]
+    first = lines[0]
+    assert first["syllables"][0] == {"text": "Hello ", "startTime": 0.9, "duration": 0.2, "fontFamily": "Main"}
+    assert first["style"] == {"align": "left", "fontSize": "normal",
+                              "fontFamilyMap": {"en": "Main", "ja": "Sub"}, "fontFamilySuggested": "Main"}
+    assert lines[1]["isBackground"] is True and lines[1]["style"]["align"] == "left"
+    assert lines[2]["syllables"][0]["fontFamily"] == "Sub"
+    assert lines[2]["style"]["align"] == "right"
+    assert lines[3]["style"]["align"] == "center"
+    assert all("disappearTime" in line for line in lines)
+    # No per-line debug printing on the hot path.
+    assert capsys.readouterr().out == ""
+
+
+def test_cached_results_are_private_copies():
+    parses = backend._lys_document_cache.parses
+    first = backend.parse_lys(SAMPLE)
+    first[0]["syllables"][0]["text"] = "mutated"
+    first[0]["style"]["fontFamilyMap"]["en"] = "mutated"
+    second = backend.parse_lys(SAMPLE)
+    assert second[0]["syllables"][0]["text"] == "Hello "
+    assert second[0]["style"]["fontFamilyMap"]["en"] == "Main"
+    assert backend._lys_document_cache.parses == parses + 1
+
+
+def test_quick_editor_keeps_raw_timestamps_and_wide_parens():
+    doc = backend.qe_parse_lys("[ti:x]\n[1]a(0012,5)b（7,8）\nplain\n")
+    rows = [(line["prefix"], line["is_meta"], [(t["ts"], t["text"]) for t in line["tokens"]]) for line in doc["lines"]]
+    assert rows == [
+        ("", True, [("", "[ti:x]")]),
+        ("[1]", False, [("0012,5", "a"), ("7,8", "b")]),
+        ("", True, [("", "plain")]),
+    ]
+    assert backend.qe_dump_lys(doc) == "[ti:x]\n[1]a(0012,5)b(7,8)\nplain"
+
+
+def test_files_are_parsed_once_until_they_change(tmp_path):
+    parses = backend._lys_document_cache.parses
+    path = tmp_path / "song.lys"
+    path.write_text(SAMPLE, encoding="utf-8")
+    out = tmp_path / "song.ttml"
+    assert backend.lys_to_ttml(str(path), str(out)) == (True, None)
+    assert backend.build_lys_player_lines(backend.load_lys_document(path))
+    assert backend._extract_lyrics_windows_from_meta(str(path.relative_to(tmp_path)), None,
+                                                      fallback_json_path=tmp_path / "song.json")
+    assert backend._lys_document_cache.parses == parses + 1
+    assert 'begin="00:00.900"' in out.read_text(encoding="utf-8")
+
+    path.write_text(SAMPLE + "\n[1]more(9000,100)", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert backend.parse_lys(backend.load_lys_document(path).text)[-1]["line"] == "more"
+    assert backend._lys_document_cache.parses == parses + 2
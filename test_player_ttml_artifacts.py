@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Content-addressed player TTML artifacts: reuse, strong ETags, size-bounded LRU on disk."""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+
+@pytest.fixture
+def songs(tmp_path, monkeypatch):
+    songs_dir = tmp_path / "songs"
+    songs_dir.mkdir()
+    monkeypatch.setattr(backend, "STATIC_DIR", tmp_path)
+    monkeypatch.setitem(backend.RESOURCE_DIRECTORIES, "songs", songs_dir)
+    monkeypatch.setattr(backend, "is_request_allowed", lambda: True)
+    monkeypatch.setattr(backend, "_get_artists_from_related_json", lambda path: (["Singer"], 9000))
+    monkeypatch.setattr(backend, "_ttml_artifact_cache",
+                        backend.TtmlArtifactCache(tmp_path / "artifacts", 1024 * 1024))
+    (songs_dir / "a.lys").write_text("[1]Hello (1000,200)world(1200,300)\n", encoding="utf-8")
+    (songs_dir / "a_trans.lrc").write_text("[00:01.000]你好\n", encoding="utf-8")
+    return songs_dir
+
+
+def _prepare(client, path="songs/a.lys"):
+    resp = client.post("/prepare_ttml_for_player", json={"path": path})
+    assert resp.json()["status"] == "success", resp.json()
+    return resp.json()["ttmlPath"]
+
+
+def test_identical_requests_share_one_artifact(songs):
+    client = TestClient(backend.app)
+    cache = backend._ttml_artifact_cache
+    first = _prepare(client)
+    assert _prepare(client) == first
+    assert cache.builds == 1
+    assert list(songs.glob("*.ttml")) == []
+
+    path = "/" + first.split("/", 3)[3]
+    resp = client.get(path)
+    assert resp.status_code == 200
+    assert "你好" in resp.text and "Singer" in resp.text
+    etag = resp.headers["ETag"]
+    assert not etag.startswith("W/") and etag.strip('"') in first
+    assert "immutable" in resp.headers["Cache-Control"]
+    again = client.get(path, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert client.get("/player-ttml/" + "0" * 64 + ".ttml").status_code == 404
+
+    # The temp conversion has no creator line, so it is a different artifact that is reused in turn.
+    temp = client.post("/convert_to_ttml_temp", json={"path": "songs/a.lys"}).json()["ttmlPath"]
+    assert temp != first
+    assert client.post("/convert_to_ttml_temp", json={"path": "songs/a.lys"}).json()["ttmlPath"] == temp
+    assert cache.builds == 2
+
+
+def test_changed_inputs_get_a_new_artifact(songs):
+    client = TestClient(backend.app)
+    first = _prepare(client)
+    (songs / "a_trans.lrc").write_text("[00:01.000]再见\n", encoding="utf-8")
+    second = _prepare(client)
+    assert second != first
+    assert "再见" in client.get("/" + second.split("/", 3)[3]).text
+
+    (songs / "notes.txt").write_text("x", encoding="utf-8")
+    resp = client.post("/prepare_ttml_for_player", json={"path": "songs/notes.txt"})
+    assert resp.status_code == 400
+    assert backend._ttml_artifact_cache.builds == 2
+
+
+def test_lru_eviction_by_total_size_survives_restart(tmp_path):
+    cache = backend.TtmlArtifactCache(tmp_path, max_bytes=250)
+    keys = [f"{i:064x}" for i in range(4)]
+    for key in keys[:2]:
+        cache.get_or_create(key, lambda: "x" * 100)
+    assert cache.get(keys[0]) is not None  # keys[1] is now least recently used
+    time.sleep(0.01)
+    cache.get_or_create(keys[2], lambda: "y" * 100)
+    assert cache.get(keys[1]) is None
+    assert not cache.path_for(keys[1]).exists()
+
+    reloaded = backend.TtmlArtifactCache(tmp_path, max_bytes=250)
+    assert reloaded.get(keys[0]) is not None and reloaded.get(keys[2]) is not None
+    reloaded.get_or_create(keys[3], lambda: "z" * 100)
+    assert reloaded.get(keys[0]) is None
+    assert sorted(p.stem for p in tmp_path.glob("*.ttml")) == [keys[2], keys[3]]
+
+
+def test_hits_refresh_mtime_only_when_it_is_old(tmp_path):
+    cache = backend.TtmlArtifactCache(tmp_path, max_bytes=1024)
+    fresh, stale = "b" * 64, "c" * 64
+    for key in (fresh, stale):
+        cache.get_or_create(key, lambda: "<tt/>")
+    now = time.time()
+    recent = now - 60
+    old = now - backend.PLAYER_TTML_TOUCH_INTERVAL_SEC - 60
+    backend.os.utime(cache.path_for(fresh), (recent, recent))
+    backend.os.utime(cache.path_for(stale), (old, old))
+    assert cache.get(fresh) is not None and cache.get(stale) is not None
+    assert cache.path_for(fresh).stat().st_mtime == recent
+    assert cache.path_for(stale).stat().st_mtime >= now - 1
+
+
+def test_concurrent_misses_build_once(tmp_path):
+    cache = backend.TtmlArtifactCache(tmp_path, max_bytes=1024)
+    calls = []
+    gate = threading.Event()
+
+    def build():
+        calls.append(1)
+        gate.wait(1)
+        return "<tt/>"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("a" * 64, build)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and results[0].read_text() == "<tt/>"
+
+
+def test_legacy_player_files_sweep_keeps_library_ttml(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "SONGS_DIR", tmp_path)
+    (tmp_path / "lyrics_player_0123.ttml").write_text("<tt/>", encoding="utf-8")
+    (tmp_path / "song.ttml").write_text("<tt/>", encoding="utf-8")
+    assert backend.cleanup_legacy_player_ttml_files() == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["song.ttml"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Lazy request body contract for the FlaskCompat middleware."""
+
+from __future__ import annotations
+
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+from backend import app, jsonify, request  # noqa: E402
+
+_seen = {}
+
+
+def _untouched_route():
+    _seen['body'] = request._require_context()._body
+    return jsonify({'ok': True})
+
+
+def _upload_route():
+    upload = request.files['file']
+    _seen['rolled'] = bool(getattr(upload.stream, '_rolled', False))
+    size = upload.seek(0, 2)
+    return jsonify({'size': size, 'json': request.get_json(silent=True)})
+
+
+async def _async_json_route():
+    return jsonify(request.get_json(silent=True))
+
+
+async def _async_undeclared_route():
+    return jsonify(request.get_json(silent=True))
+
+
+@pytest.fixture(scope='module')
+def client():
+    saved_routes = app.router.routes[:]
+    app.route('/__test__/body/untouched', methods=['POST'])(_untouched_route)
+    app.route('/__test__/body/upload', methods=['POST'])(_upload_route)
+    app.route('/__test__/body/async', methods=['POST'], load_body=True)(_async_json_route)
+    app.route('/__test__/body/async-undeclared', methods=['POST'])(_async_undeclared_route)
+    # The SPA catch-all is registered first; put the probe routes ahead of it.
+    probes = [r for r in app.router.routes if r not in saved_routes]
+    app.router.routes[:] = probes + saved_routes
+    try:
+        yield TestClient(app)
+    finally:
+        # Leave the shared app exactly as other test modules expect it.
+        app.router.routes[:] = saved_routes
+
+
+def test_body_is_not_read_unless_the_route_asks(client):
+    assert client.post('/__test__/body/untouched', json={'x': 1}).status_code == 200
+    assert _seen['body'] is backend._MISSING
+
+
+def test_multipart_uploads_spool_to_disk(client):
+    payload = b'\0' * (3 * 1024 * 1024)
+    resp = client.post('/__test__/body/upload', files={'file': ('big.bin', payload)})
+    assert resp.json() == {'size': len(payload), 'json': None}
+    assert _seen['rolled'] is True
+
+
+def test_async_routes_opt_in_to_body_loading(client):
+    assert client.post('/__test__/body/async', json={'a': [1, 2]}).json() == {'a': [1, 2]}
+    with pytest.raises(RuntimeError):
+        client.post('/__test__/body/async-undeclared', json={'a': 1})
+
+
+def test_import_static_reads_zip_from_spooled_upload(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, 'is_request_allowed', lambda: True)
+    monkeypatch.setattr(backend, 'STATIC_DIR', tmp_path)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        archive.writestr('songs/readme.txt', 'hello')
+    resp = client.post('/import_static', files={'file': ('static.zip', buf.getvalue())})
+    # The archive was opened in place: the asset was extracted, only the JSON check fails.
+    assert resp.json()['message'] == '压缩包中未发现 JSON 文件'
+    assert (tmp_path / 'songs' / 'readme.txt').read_text() == 'hello'
+    bad = client.post('/import_static', files={'file': ('static.zip', b'not a zip')})
+    assert bad.json()['message'] == '文件不是有效的 ZIP 压缩包'
+    empty = client.post('/import_static', files={'file': ('static.zip', b'')})
+    assert empty.status_code == 400
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Security config / trusted device cache contract tests (no auth file I/O per request)."""
+
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+
+@pytest.fixture
+def auth_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "SECURITY_CONFIG_FILE", tmp_path / "security_config.json")
+    monkeypatch.setattr(backend, "TRUSTED_DEVICES_FILE", tmp_path / "trusted_devices.json")
+    writes = []
+    real_write = backend._write_json_atomically
+
+    def counting_write(path, payload):
+        writes.append(Path(path).name)
+        real_write(path, payload)
+
+    monkeypatch.setattr(backend, "_write_json_atomically", counting_write)
+    backend.save_security_config({
+        "security_enabled": True,
+        "device_credentials": [
+            {"credential_id": "c1", "password_hash": "x", "permissions": {"write_access": True}},
+            {"credential_id": "c2", "password_hash": "y", "revoked": True},
+        ],
+    })
+    backend.save_trusted_devices({
+        "dev1": {"credential_id": "c1", "auth_type": "credential", "last_seen": backend.now_iso()},
+        "dev2": {"credential_id": "c2", "auth_type": "credential", "last_seen": backend.now_iso()},
+    })
+    writes.clear()
+    return tmp_path, writes
+
+
+def test_reads_are_cached_copies_and_saves_are_atomic(auth_files):
+    tmp_path, writes = auth_files
+    loads = backend._security_config_cache.loads
+    config = backend.get_security_config()
+    config["device_credentials"].clear()
+    config["security_enabled"] = False
+    # Callers get private copies: mutating one does not leak into the cache.
+    assert backend._cached_security_config()["security_enabled"] is True
+    assert len(backend.get_security_config()["device_credentials"]) == 2
+    assert backend._security_config_cache.loads == loads
+    shared = backend._cached_security_config()
+    assert backend.get_device_credential_by_id(shared, "c1") is shared["device_credentials"][0]
+    assert backend.get_device_credential_by_id(config, "c1") is None
+
+    backend.save_security_config(config)
+    assert writes == ["security_config.json"]
+    assert backend._cached_security_config()["security_enabled"] is False
+    assert json.loads((tmp_path / "security_config.json").read_text(encoding="utf-8"))["device_credentials"] == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["security_config.json", "trusted_devices.json"]
+
+
+def test_external_edits_are_picked_up_by_mtime(auth_files, monkeypatch):
+    tmp_path, _ = auth_files
+    monkeypatch.setattr(backend, "CONFIG_FILE_CACHE_STAT_INTERVAL", 0.0)
+    path = tmp_path / "trusted_devices.json"
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["dev3"] = {"credential_id": "c1", "remark": "added by hand"}
+    path.write_text(json.dumps(data, indent=4), encoding="utf-8")
+    assert backend._cached_trusted_devices()["dev3"]["remark"] == "added by hand"
+
+
+def test_trusted_device_checks_do_not_rewrite_files(auth_files):
+    _, writes = auth_files
+    for _ in range(5):
+        assert backend.is_trusted_device("dev1") is True
+    # At most one write to record the normalized auth state, then only memory reads.
+    assert writes.count("trusted_devices.json") <= 1
+    writes.clear()
+    for _ in range(5):
+        assert backend.is_trusted_device("dev1") is True
+    assert writes == []
+
+    # A stale last_seen is persisted again; a revoked credential drops the device.
+    stale = (datetime.now() - timedelta(seconds=backend.TRUSTED_DEVICE_LAST_SEEN_PERSIST_SECONDS + 5)).isoformat()
+    devices = backend.load_trusted_devices()
+    devices["dev1"]["last_seen"] = stale
+    backend.save_trusted_devices(devices)
+    writes.clear()
+    assert backend.is_trusted_device("dev1") is True
+    assert writes == ["trusted_devices.json"]
+    assert backend._cached_trusted_devices()["dev1"]["last_seen"] != stale
+    assert backend.is_trusted_device("dev2") is False
+    assert "dev2" not in backend.load_trusted_devices()
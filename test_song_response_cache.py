@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""/lyrics and /song-info response cache: file fingerprints, ETag/304, precompressed bodies."""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+
+def _bump_mtime(path: Path) -> None:
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def song_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "STATIC_DIR", tmp_path)
+    monkeypatch.setattr(backend.app, "static_folder", str(tmp_path))
+    (tmp_path / "songs").mkdir()
+    lines = [f"[1]line{i} (1{i:03d}0,200)word(1{i:03d}2,300)" for i in range(60)]
+    (tmp_path / "songs" / "a.lys").write_text("\n".join(lines), encoding="utf-8")
+    (tmp_path / "a.json").write_text(json.dumps({
+        "song": "",
+        "cover": "http://127.0.0.1:5000/static/songs/cover.png",
+        "meta": {"title": "A", "lyrics": "::/songs/a.lys::/songs/a.lrc::"},
+    }), encoding="utf-8")
+
+    builds = []
+    real_build = backend.build_lys_player_lines
+
+    def counting_build(doc):
+        builds.append(doc)
+        return real_build(doc)
+
+    monkeypatch.setattr(backend, "build_lys_player_lines", counting_build)
+    backend._song_response_cache.clear()
+    yield tmp_path, builds
+    backend._song_response_cache.clear()
+
+
+def test_lyrics_are_served_from_cache_with_etag_and_gzip(song_dir):
+    _, builds = song_dir
+    client = TestClient(backend.app)
+    first = client.get("/lyrics", params={"file": "a.json"}, headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert len(first.json()["lyrics"]) == 60
+    assert "content-encoding" not in first.headers
+    etag = first.headers["ETag"]
+
+    hits = backend._song_response_cache.hits
+    second = client.get("/lyrics", params={"file": "a.json"}, headers={"Accept-Encoding": "gzip"})
+    assert second.headers["content-encoding"] == "gzip"
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == etag
+    assert backend._song_response_cache.hits == hits + 1
+    assert len(builds) == 1
+
+    not_modified = client.get("/lyrics", params={"file": "a.json"}, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert "no-store" not in not_modified.headers["Cache-Control"]
+
+
+def test_lyrics_cache_follows_files_and_options(song_dir):
+    tmp_path, builds = song_dir
+    client = TestClient(backend.app)
+    assert client.get("/lyrics", params={"file": "a.json"}).json()["translation"] == []
+
+    # A translation that appears later, a lyric edit and a style change all miss the cache.
+    (tmp_path / "songs" / "a.lrc").write_text("[00:01.000]译文\n", encoding="utf-8")
+    assert client.get("/lyrics", params={"file": "a.json"}).json()["translation"]
+    lys = tmp_path / "songs" / "a.lys"
+    lys.write_text(lys.read_text(encoding="utf-8") + "\n[1]tail(99000,100)", encoding="utf-8")
+    _bump_mtime(lys)
+    assert client.get("/lyrics", params={"file": "a.json"}).json()["lyrics"][-1]["line"] == "tail"
+    client.get("/lyrics", params={"file": "a.json", "style": "junp"})
+    assert len(builds) == 4
+
+    backend.update_animation_config({"exitDuration": 777})
+    try:
+        client.get("/lyrics", params={"file": "a.json"})
+        assert len(builds) == 5
+    finally:
+        backend.update_animation_config({"exitDuration": backend.ANIMATION_CONFIG_DEFAULTS["exitDuration"]})
+
+
+def test_clear_drops_entries_and_in_flight_builds():
+    cache = backend.SongResponseCache(max_entries=2)
+    generation = cache.generation
+    cache.put(("lyrics", 1), {"a": 1}, [], generation)
+    assert cache.get(("lyrics", 1))["identity"] == b'{"a":1}'
+    cache.clear()
+    assert cache.get(("lyrics", 1)) is None
+    # A build that started before clear() is returned but not stored.
+    cache.put(("lyrics", 2), {"b": 2}, [], generation)
+    assert cache.get(("lyrics", 2)) is None
+
+
+def test_song_info_is_cached_per_host(song_dir, monkeypatch):
+    tmp_path, _ = song_dir
+    monkeypatch.setattr(backend, "_song_snapshot_cache_max_age", lambda: 60.0)
+    client = TestClient(backend.app)
+    first = client.get("/song-info", params={"file": "a.json"})
+    assert first.json()["cover"] == "http://testserver/songs/cover.png"
+    hits = backend._song_response_cache.hits
+    assert client.get("/song-info", params={"file": "a.json"}).json() == first.json()
+    assert backend._song_response_cache.hits == hits + 1
+
+    other = client.get("/song-info", params={"file": "a.json"}, headers={"Host": "192.168.1.5:8080"})
+    assert other.json()["cover"] == "http://192.168.1.5:8080/songs/cover.png"
+
+    data = json.loads((tmp_path / "a.json").read_text(encoding="utf-8"))
+    data["meta"]["title"] = "B"
+    (tmp_path / "a.json").write_text(json.dumps(data), encoding="utf-8")
+    _bump_mtime(tmp_path / "a.json")
+    assert client.get("/song-info", params={"file": "a.json"}).json()["meta"]["title"] == "B"
@@ -0,0 +1,783 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Library search index contract tests (n-gram candidates, presorted orderings, persistence)."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import random
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+from backend import (  # noqa: E402
+    SongSearchNgramIndex,
+    SongSearchOrderings,
+    _compact_search_pool,
+    _parse_library_fuzzy_chars,
+    _parse_library_search_keywords,
+    _search_pool_from_summary,
+    _sort_search_summaries_inplace,
+)
+
+_CJK = [chr(c) for c in range(0x4E00, 0x4E00 + 60)]
+_KANA = [chr(c) for c in range(0x3041, 0x3061)]
+_LATIN = "abcdefghijklmnop"
+
+
+def _word(rng, alphabet, low, high):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def _synthetic_rows(count, seed=3):
+    rng = random.Random(seed)
+    artists = [_word(rng, _CJK, 2, 3) for _ in range(40)] + [_word(rng, _LATIN, 3, 6) for _ in range(20)]
+    rows = {}
+    for i in range(count):
+        alphabet = rng.choice((_CJK, _KANA, _LATIN))
+        title = _word(rng, alphabet, 2, 6)
+        artist = rng.choice(artists)
+        summary = {
+            "filename": f"{title} - {artist} {i}.json",
+            "title": title,
+            "artists": [artist],
+            "album": _word(rng, _CJK, 2, 4),
+            "song": f"songs/{title}.mp3",
+            "lyricsPath": "songs/x.lys",
+            "hasAudio": True,
+            "mtime": float(i),
+        }
+        pool = _search_pool_from_summary(summary)
+        rows[summary["filename"]] = {
+            "mtime": float(i),
+            "summary": summary,
+            "pool": pool,
+            "pool_compact": _compact_search_pool(pool),
+        }
+    return rows
+
+
+def _linear(rows, query, fuzzy):
+    tokens = _parse_library_fuzzy_chars(query) if fuzzy else _parse_library_search_keywords(query)
+    if not tokens:
+        return set()
+    if fuzzy:
+        return {fn for fn, row in rows.items() if all(ch in row["pool_compact"] for ch in tokens)}
+    return {fn for fn, row in rows.items() if all(kw in row["pool"] for kw in tokens)}
+
+
+@pytest.fixture
+def search_rows(monkeypatch):
+    rows = _synthetic_rows(1500)
+    index = SongSearchNgramIndex()
+    index.rebuild(rows)
+    monkeypatch.setattr(backend, "_song_search_index", rows)
+    monkeypatch.setattr(backend, "_song_search_ngram_index", index)
+    monkeypatch.setattr(backend, "_song_search_orderings", SongSearchOrderings())
+    monkeypatch.setattr(backend, "_song_search_term_index", backend.SongSearchTermIndex())
+    monkeypatch.setattr(backend, "_song_resource_graph", backend.SongResourceGraph())
+    monkeypatch.setattr(backend, "_song_search_change_log", backend.deque(maxlen=backend.SONG_SEARCH_CHANGE_LOG_MAX))
+    monkeypatch.setattr(backend, "_song_search_change_log_floor", backend._song_search_index_generation)
+    monkeypatch.setattr(backend, "_song_search_revision_generations", backend.OrderedDict())
+    monkeypatch.setattr(backend, "_song_snapshot_cache", backend.OrderedDict())
+    monkeypatch.setattr(backend, "_song_search_index_revision", 10)
+    monkeypatch.setattr(backend, "_artist_playlist_index", {})
+    monkeypatch.setattr(backend, "_artist_playlist_file_to_keys", {})
+    monkeypatch.setattr(backend, "_artist_playlist_orderings", {})
+    monkeypatch.setattr(backend, "_artist_playlist_stamps", {})
+    for fn, row in rows.items():
+        backend._artist_index_add_file_locked(fn, row["summary"])
+    _publish_patched_index(monkeypatch)
+    with backend._song_search_index_lock:
+        backend._record_song_search_revision_generation_locked()
+    return rows
+
+
+def _publish_patched_index(monkeypatch):
+    """Republish the lock-free view after the fixture swapped the live index structures."""
+    monkeypatch.setattr(backend, "_song_search_view", backend._song_search_view)
+    monkeypatch.setattr(backend, "_artist_playlist_dirty_keys", None)
+    with backend._song_search_index_lock:
+        backend._publish_song_search_view_locked(force=True)
+
+
+def test_ngram_candidates_never_miss_linear_matches(search_rows):
+    rng = random.Random(11)
+    pools = [row["pool"] for row in search_rows.values()]
+    queries = []
+    for _ in range(150):
+        pool = rng.choice(pools)
+        start = rng.randrange(len(pool))
+        queries.append(pool[start:start + rng.randint(1, 5)].strip() or "a")
+    queries += ["中,了", "a b", "zz不存在", "json"]
+    for query in queries:
+        for fuzzy in (False, True):
+            got = {s["filename"] for s in backend._run_library_search_ordered_summaries(query, fuzzy)}
+            assert got == _linear(search_rows, query, fuzzy), (query, fuzzy)
+
+
+def test_ngram_candidates_narrow_selective_queries(search_rows):
+    index = backend._song_search_ngram_index
+    target = next(iter(search_rows.values()))["summary"]["title"]
+    tokens = _parse_library_search_keywords(target)
+    candidates = index.candidates(tokens, False)
+    assert candidates is not None
+    assert len(candidates) < len(search_rows) // 4
+    assert target in "".join(search_rows[fn]["pool"] for fn in candidates)
+
+
+def _reference_order(rows, sort_type, sort_asc):
+    summaries = [row["summary"] for row in rows.values()]
+    _sort_search_summaries_inplace(summaries, sort_type, sort_asc)
+    return [s["filename"] for s in summaries]
+
+
+def test_presorted_pages_match_full_sort_after_incremental_updates(search_rows):
+    with backend._song_search_index_lock:
+        orderings = backend._song_search_orderings_locked()
+        changed = dict(search_rows[next(iter(search_rows))])
+        changed["summary"] = dict(changed["summary"], mtime=99999.0, title="zzz last")
+        backend._song_search_index_set_row_locked(next(iter(search_rows)), changed)
+        for fn in list(search_rows)[5:40]:
+            backend._song_search_index_pop_row_locked(fn)
+    for sort_type in ("time", "name"):
+        for sort_asc in (True, False):
+            expected = _reference_order(search_rows, sort_type, sort_asc)
+            assert orderings.ordered(sort_type, sort_asc) == expected
+            pages = []
+            for offset in range(0, len(expected), 50):
+                pages.extend(orderings.page(sort_type, sort_asc, offset, 50))
+            assert pages == expected
+            subset = set(expected[::97])
+            assert orderings.order_subset(subset, sort_type, sort_asc) == [fn for fn in expected if fn in subset]
+
+
+def test_search_results_are_cached_until_the_index_changes(search_rows):
+    first = backend._run_library_search_ordered_summaries("json", False, "name", True)
+    assert backend._run_library_search_ordered_summaries("json", False, "name", True) is first
+    assert [s["filename"] for s in first] == _reference_order(search_rows, "name", True)
+    fn = next(iter(search_rows))
+    with backend._song_search_index_lock:
+        backend._song_search_index_pop_row_locked(fn)
+    second = backend._run_library_search_ordered_summaries("json", False, "name", True)
+    assert second is not first
+    assert fn not in {s["filename"] for s in second}
+
+
+def test_ngram_index_tracks_updates_and_removals():
+    index = SongSearchNgramIndex()
+    for i in range(4):
+        index.add(f"other{i}.json", f"unrelated {i}")
+    index.add("a.json", "晴天 周杰伦")
+    index.add("b.json", "七里香 周杰伦")
+    assert sorted(index.candidates(["周杰"], False)) == ["a.json", "b.json"]
+    index.add("a.json", "稻香 周杰伦")
+    assert index.candidates(["晴天"], False) == []
+    assert index.candidates(["稻香"], False) == ["a.json"]
+    index.remove("b.json")
+    assert index.candidates(["周杰"], False) == ["a.json"]
+    assert len(index) == 5
+
+
+def test_ngram_index_round_trips_binary_format():
+    rows = _synthetic_rows(200)
+    index = SongSearchNgramIndex()
+    index.rebuild(rows)
+    loaded, revision = SongSearchNgramIndex.from_bytes(index.to_bytes(42), rows)
+    assert revision == 42
+    assert loaded.filenames() == set(rows)
+    for query in ("ab", "中", "json"):
+        assert sorted(loaded.candidates([query], False) or []) == sorted(index.candidates([query], False) or [])
+    with pytest.raises(ValueError):
+        SongSearchNgramIndex.from_bytes(index.to_bytes(1), dict(list(rows.items())[:10]))
+
+
+def test_ngram_index_persists_next_to_song_index(tmp_path, monkeypatch):
+    rows = _synthetic_rows(50)
+    monkeypatch.setattr(backend, "SONG_SEARCH_INDEX_FILE", tmp_path / "song_search_index.json")
+    monkeypatch.setattr(backend, "_song_search_index", rows)
+    monkeypatch.setattr(backend, "_song_search_index_revision", 6)
+    index = SongSearchNgramIndex()
+    index.rebuild(rows)
+    monkeypatch.setattr(backend, "_song_search_ngram_index", index)
+    with backend._song_search_index_lock:
+        backend._persist_song_search_index()
+        revision = backend._song_search_index_revision
+    assert (tmp_path / "song_search_ngram_index.bin").is_file()
+    monkeypatch.setattr(backend, "_song_search_ngram_index", SongSearchNgramIndex())
+    with backend._song_search_index_lock:
+        assert backend._load_song_search_ngram_index_locked(revision - 1) is False
+        assert backend._load_song_search_ngram_index_locked(revision) is True
+    assert backend._song_search_ngram_index.filenames() == set(rows)
+
+
+def test_snapshot_revalidates_with_etag_and_compresses(search_rows):
+    with TestClient(backend.app) as client:
+        first = client.get("/songs/snapshot?sortType=name&sortAsc=1", headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200
+        assert first.headers["content-encoding"] == "gzip"
+        assert "no-store" not in first.headers["cache-control"]
+        payload = first.json()
+        assert payload["revision"] == 10
+        assert [s["filename"] for s in payload["songs"]] == _reference_order(search_rows, "name", True)
+        etag = first.headers["etag"]
+
+        again = client.get("/songs/snapshot?sortType=name&sortAsc=1", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+
+        identity = client.get("/songs/snapshot?sortType=name&sortAsc=1", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.headers["etag"] == etag
+        assert json.loads(identity.content) == payload
+        raw = backend._song_snapshot_cache[next(iter(backend._song_snapshot_cache))]
+        assert gzip.decompress(raw["gzip"]) == identity.content
+
+        with backend._song_search_index_lock:
+            backend._song_search_index_pop_row_locked(next(iter(search_rows)))
+        changed = client.get("/songs/snapshot?sortType=name&sortAsc=1", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()["total"] == len(search_rows)
+
+
+def test_snapshot_since_returns_only_changed_and_removed_rows(search_rows):
+    fns = list(search_rows)
+    with backend._song_search_index_lock:
+        updated = dict(search_rows[fns[0]])
+        updated["summary"] = dict(updated["summary"], title="renamed")
+        backend._song_search_index_set_row_locked(fns[0], updated)
+        backend._song_search_index_pop_row_locked(fns[1])
+        backend._bump_song_search_index_revision_locked()
+        backend._song_search_index_pop_row_locked(fns[2])
+    with TestClient(backend.app) as client:
+        delta = client.get("/songs/snapshot?since=10").json()
+        assert delta["delta"] is True
+        assert delta["revision"] == 11
+        assert [s["filename"] for s in delta["changed"]] == [fns[0]]
+        assert delta["changed"][0]["title"] == "renamed"
+        assert sorted(delta["removed"]) == sorted(fns[1:3])
+
+        latest = client.get("/songs/snapshot?since=11").json()
+        assert latest["changed"] == [] and latest["removed"] == [fns[2]]
+
+        unknown = client.get("/songs/snapshot?since=3").json()
+        assert "delta" not in unknown
+        assert unknown["total"] == len(search_rows)
+
+
+@pytest.fixture
+def static_library(tmp_path, monkeypatch):
+    static_dir = tmp_path / "static"
+    songs_dir = static_dir / "songs"
+    songs_dir.mkdir(parents=True)
+    monkeypatch.setattr(backend, "STATIC_DIR", static_dir)
+    monkeypatch.setattr(backend, "SONGS_DIR", songs_dir)
+    monkeypatch.setitem(backend.RESOURCE_DIRECTORIES, "static", static_dir)
+    monkeypatch.setitem(backend.RESOURCE_DIRECTORIES, "songs", songs_dir)
+    monkeypatch.setattr(backend, "SONG_SEARCH_INDEX_FILE", tmp_path / "cache" / "song_search_index.json")
+    monkeypatch.setattr(backend, "ARTIST_PLAYLIST_INDEX_FILE", tmp_path / "cache" / "artist_playlist_index.json")
+    monkeypatch.setattr(backend, "SONG_SEARCH_REBUILD_WORKERS", 4)
+    monkeypatch.setattr(backend, "_static_json_listing_cache", {})
+    monkeypatch.setattr(backend, "_song_search_index", {})
+    monkeypatch.setattr(backend, "_song_search_ngram_index", SongSearchNgramIndex())
+    monkeypatch.setattr(backend, "_song_search_orderings", SongSearchOrderings())
+    monkeypatch.setattr(backend, "_song_search_term_index", backend.SongSearchTermIndex())
+    monkeypatch.setattr(backend, "_song_resource_graph", backend.SongResourceGraph())
+    monkeypatch.setattr(backend, "_song_resource_graph_ready", False)
+    monkeypatch.setattr(backend, "_artist_playlist_index", {})
+    monkeypatch.setattr(backend, "_artist_playlist_file_to_keys", {})
+    monkeypatch.setattr(backend, "_artist_playlist_orderings", {})
+    monkeypatch.setattr(backend, "_artist_playlist_stamps", {})
+    _publish_patched_index(monkeypatch)
+    for i in range(12):
+        (songs_dir / f"s{i}.lys").write_text("[1]plain line\n", encoding="utf-8")
+        meta = {"title": f"song {i}", "artists": [f"artist {i % 3}"], "lyrics": f"songs/s{i}.lys"}
+        (static_dir / f"s{i}.json").write_text(
+            json.dumps({"meta": meta, "song": f"songs/s{i}.mp3"}), encoding="utf-8"
+        )
+    return static_dir
+
+
+def _bump_mtime(path):
+    st = path.stat()
+    backend.os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_rebuild_reuses_rows_whose_fingerprints_are_unchanged(static_library):
+    songs_dir = static_library / "songs"
+    assert backend.rebuild_song_search_index_full() == 12
+    assert backend._song_search_index["s0.json"]["summary"]["hasAudio"] is False
+    assert backend.rebuild_song_search_index_full() == 0
+
+    (songs_dir / "s3.lys").write_text("[2]duet line\n", encoding="utf-8")
+    _bump_mtime(songs_dir / "s3.lys")
+    (songs_dir / "s5.mp3").write_bytes(b"ID3")
+    assert backend.rebuild_song_search_index_full() == 2
+    assert backend._song_search_index["s3.json"]["summary"]["hasDuet"] is True
+    assert backend._song_search_index["s5.json"]["summary"]["hasAudio"] is True
+    assert backend.rebuild_song_search_index_full(force=True) == 12
+    assert set(backend._song_search_ngram_index.filenames()) == set(backend._song_search_index)
+
+
+def test_sync_reparses_only_changed_songs_and_keeps_concurrent_upserts(static_library, monkeypatch):
+    backend.rebuild_song_search_index_full()
+    assert backend.sync_song_search_index_with_disk() is False
+
+    (static_library / "s1.json").unlink()
+    (static_library / "s2.json").write_text(
+        json.dumps({"meta": {"title": "renamed", "lyrics": "songs/s2.lys"}}), encoding="utf-8"
+    )
+    _bump_mtime(static_library / "s2.json")
+    built = []
+    real_build = backend._build_song_search_row
+
+    def _tracking_build(path):
+        built.append(path.name)
+        if path.name == "s2.json":
+            # Another thread upserts the same song while the sync parses outside the lock.
+            with backend._song_search_index_lock:
+                row = dict(backend._song_search_index["s2.json"])
+                row["summary"] = dict(row["summary"], title="from upsert")
+                backend._song_search_index_set_row_locked("s2.json", row)
+        return real_build(path)
+
+    monkeypatch.setattr(backend, "_build_song_search_row", _tracking_build)
+    assert backend.sync_song_search_index_with_disk() is True
+    assert built == ["s2.json"]
+    assert "s1.json" not in backend._song_search_index
+    assert backend._song_search_index["s2.json"]["summary"]["title"] == "from upsert"
+    assert len(backend._song_search_index) == 11
+
+
+def test_sync_after_change_log_overflow_keeps_concurrent_upserts(static_library, monkeypatch):
+    backend.rebuild_song_search_index_full()
+    monkeypatch.setattr(backend, "_song_search_change_log", backend.deque(maxlen=2))
+    s2 = static_library / "s2.json"
+    s2.write_text(json.dumps({"meta": {"title": "renamed", "lyrics": "songs/s2.lys"}}), encoding="utf-8")
+    _bump_mtime(s2)
+    real_build = backend._build_song_search_row
+    raced = []
+
+    def _racing_build(path):
+        row = real_build(path)
+        if path.name == "s2.json" and not raced:
+            raced.append(1)
+            # Another thread saves a newer version, then enough writes follow to overflow the change log.
+            s2.write_text(json.dumps({"meta": {"title": "newer", "lyrics": "songs/s2.lys"}}), encoding="utf-8")
+            _bump_mtime(s2)
+            backend.upsert_song_search_index_for_path(s2)
+            with backend._song_search_index_lock:
+                for fn in ("s5.json", "s6.json", "s7.json"):
+                    backend._song_search_index_set_row_locked(fn, dict(backend._song_search_index[fn]))
+        return row
+
+    monkeypatch.setattr(backend, "_build_song_search_row", _racing_build)
+    backend.sync_song_search_index_with_disk()
+    assert backend._song_search_index["s2.json"]["summary"]["title"] == "newer"
+    assert len(backend._song_search_index) == 12
+
+
+def test_term_index_is_built_with_the_index_and_follows_syncs(static_library, monkeypatch):
+    backend.rebuild_song_search_index_full()
+    term_index = backend._song_search_term_index
+    assert term_index.built and term_index.lookup("song") == set(backend._song_search_index)
+
+    (static_library / "s4.json").write_text(
+        json.dumps({"meta": {"title": "quartzite", "lyrics": "songs/s4.lys"}}), encoding="utf-8"
+    )
+    _bump_mtime(static_library / "s4.json")
+    assert backend.sync_song_search_index_with_disk() is True
+    assert term_index.lookup("quartzite") == {"s4.json"}
+    assert "s4.json" not in term_index.lookup("song")
+    # Ranked queries no longer build it lazily under the write lock.
+    monkeypatch.setattr(term_index, "build", None)
+    assert backend._run_library_search_ranked("quartzite", False, 10)[0] == 1
+
+
+def test_static_listing_is_cached_until_the_directory_changes(static_library, monkeypatch):
+    monkeypatch.setattr(backend, "_STATIC_LISTING_RACY_WINDOW_NS", 0)
+    scans = []
+    real_scan = backend.scan_static_json_entries
+
+    def _counting_scan():
+        scans.append(1)
+        return real_scan()
+
+    monkeypatch.setattr(backend, "scan_static_json_entries", _counting_scan)
+    first = {p.name for p in backend.collect_static_json_file_paths()}
+    assert first == {f"s{i}.json" for i in range(12)}
+    assert {p.name for p in backend.collect_static_json_file_paths()} == first
+    assert len(scans) == 1
+
+    (static_library / "new.json").write_text("{}", encoding="utf-8")
+    st = static_library.stat()
+    backend.os.utime(static_library, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert "new.json" in {p.name for p in backend.collect_static_json_file_paths()}
+    assert len(scans) == 2
+
+
+def test_poll_watcher_refreshes_only_changed_json(static_library, monkeypatch):
+    backend.rebuild_song_search_index_full()
+    watcher = backend.StaticLibraryWatcher("poll")
+    watcher._snapshot = watcher._scan()
+    assert watcher.poll_once() == (0, 0)
+
+    (static_library / "s4.json").write_text(
+        json.dumps({"meta": {"title": "edited", "lyrics": "songs/s4.lys"}}), encoding="utf-8"
+    )
+    _bump_mtime(static_library / "s4.json")
+    (static_library / "s6.json").unlink()
+    (static_library / "extra.json").write_text(json.dumps({"meta": {"title": "extra"}}), encoding="utf-8")
+    assert watcher.poll_once() == (2, 1)
+    assert backend._song_search_index["s4.json"]["summary"]["title"] == "edited"
+    assert backend._song_search_index["extra.json"]["summary"]["title"] == "extra"
+    assert "s6.json" not in backend._song_search_index
+
+    backend.upsert_song_search_index_for_path(static_library / "s7.json")
+    watcher.dispatch(SimpleNamespace(is_directory=False, src_path=str(static_library / "s7.json")))
+    assert watcher.flush_pending() == (0, 0)
+
+
+def test_resource_graph_tracks_dependencies_and_reports_orphans(static_library):
+    songs_dir = static_library / "songs"
+    (songs_dir / "s0.lys").write_text("[font-family:Hymmnos]\n[1]line\n", encoding="utf-8")
+    (songs_dir / "Hymmnos.ttf").write_bytes(b"font")
+    (songs_dir / "s1.mp3").write_bytes(b"ID3")
+    (songs_dir / "unused.png").write_bytes(b"png")
+    meta = {"title": "cover", "lyrics": "::songs/s2.lys::songs/s2.tr.lys::!::",
+            "albumImgSrc": "./songs/c2.jpg", "background_beat_curve": "./songs/s2.curve.json"}
+    (static_library / "s2.json").write_text(json.dumps({"meta": meta, "song": "songs/s1.mp3"}), encoding="utf-8")
+    (songs_dir / "s2.tr.lys").write_text("[1]tr\n", encoding="utf-8")
+    backend.rebuild_song_search_index_full()
+
+    graph = backend._song_resource_graph
+    assert graph.referrers("Hymmnos.ttf") == {"s0.json"}
+    assert graph.referrers("s1.mp3", ("audio",)) == {"s1.json", "s2.json"}
+    assert graph.dependencies("s2.json")["beatCurve"] == ("s2.curve.json",)
+    assert backend._find_static_json_path_by_audio_relative("songs/s1.mp3").name in {"s1.json", "s2.json"}
+    assert backend._translation_path_from_meta_json(songs_dir / "s2.lys") == str((songs_dir / "s2.tr.lys").resolve())
+    assert backend.find_related_json(str(songs_dir / "s2.tr.lys")) == [str((static_library / "s2.json").resolve())]
+
+    backend.remove_song_search_index_entry("s0.json")
+    assert graph.referrers("Hymmnos.ttf") == set()
+    report = backend.song_resource_orphan_report()
+    orphans = {item["path"] for item in report["orphans"]}
+    assert {"unused.png", "Hymmnos.ttf", "s0.lys"} <= orphans
+    assert "s1.mp3" not in orphans
+    missing = {item["path"]: item for item in report["missing"]}
+    assert missing["c2.jpg"]["kinds"] == ["cover"] and missing["c2.jpg"]["referrers"] == ["s2.json"]
+
+
+def test_sqlite_store_upserts_only_touched_rows_and_reloads(static_library, monkeypatch):
+    db_path = static_library.parent / "cache" / "song_search_index.sqlite3"
+    monkeypatch.setattr(backend, "SONG_SEARCH_INDEX_FILE", db_path)
+    monkeypatch.setattr(backend, "_song_index_stores", {})
+    backend.rebuild_song_search_index_full()
+    with backend._song_search_index_lock:
+        store = backend._song_index_store()
+    assert isinstance(store, backend.SqliteSongIndexStore)
+    saved = []
+    real_save = store.save_song_index
+    monkeypatch.setattr(store, "save_song_index", lambda rows, rev, touched=None: (
+        saved.append(None if touched is None else set(touched)), real_save(rows, rev, touched)))
+
+    meta = {"title": "retitled", "artists": ["someone"], "lyrics": "songs/s3.lys"}
+    (static_library / "s3.json").write_text(json.dumps({"meta": meta}), encoding="utf-8")
+    _bump_mtime(static_library / "s3.json")
+    backend.upsert_song_search_index_for_path(static_library / "s3.json")
+    backend.remove_song_search_index_entry("s4.json")
+    backend.flush_pending_index_persists()
+    assert saved == [{"s3.json", "s4.json"}]
+
+    reopened = backend.SqliteSongIndexStore(db_path, db_path.with_suffix(".json"), backend.ARTIST_PLAYLIST_INDEX_FILE)
+    rows, revision = reopened.load_song_index()
+    assert revision == backend._song_search_index_revision
+    assert rows == json.loads(json.dumps(backend._song_search_index))
+    assert rows["s3.json"]["summary"]["title"] == "retitled" and "s4.json" not in rows
+    buckets, file_to_keys, _, paired = reopened.load_artist_index()
+    assert file_to_keys == backend._artist_playlist_file_to_keys and paired == revision
+    assert buckets["someone"] == {"s3.json"}
+    reopened.close()
+
+    exported = static_library.parent / "export.json"
+    backend.export_song_search_index_json(exported)
+    assert backend._read_song_search_index_json(exported) == (rows, revision)
+    store.close()
+
+
+def test_sqlite_store_migrates_legacy_json_cache(tmp_path, monkeypatch):
+    legacy = tmp_path / "song_search_index.json"
+    row = {"summary": {"title": "old", "hasAudio": True}, "pool": "old", "pool_compact": "old",
+           "mtime": 1.0, "fp": {"json": [1, 2]}}
+    legacy.write_text(json.dumps({"version": 2, "revision": 7, "entries": {"old.json": row}}), encoding="utf-8")
+    monkeypatch.setattr(backend, "SONG_SEARCH_INDEX_FILE", tmp_path / "song_search_index.sqlite3")
+    monkeypatch.setattr(backend, "_song_index_stores", {})
+    with backend._song_search_index_lock:
+        rows, revision = backend._load_song_search_index_from_disk()
+    assert revision == 7 and rows["old.json"]["summary"]["title"] == "old"
+    assert "fp" not in rows["old.json"]  # forces the startup sync to re-parse the row
+    legacy.unlink()
+    monkeypatch.setattr(backend, "_song_index_stores", {})
+    with backend._song_search_index_lock:
+        assert backend._load_song_search_index_from_disk() == (rows, 7)
+        backend._song_index_store().close()
+
+
+def test_read_write_lock_shares_readers_and_prefers_writers():
+    lock = backend.ReadWriteLock()
+    order = []
+    with lock.read():
+        with lock.read():
+            pass  # a second reader is admitted while the first holds the lock
+        writer = threading.Thread(target=lambda: (lock.acquire(), order.append("writer"), lock.release()))
+        writer.start()
+        while not lock.stats()["writersWaiting"]:
+            pass
+        late_reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append("reader"), lock.release_read()))
+        late_reader.start()
+        writer.join(0.05)
+        assert order == []
+    writer.join(5)
+    late_reader.join(5)
+    assert order == ["writer", "reader"]
+    stats = lock.stats()
+    assert stats["read"]["count"] == 3 and stats["read"]["contended"] == 1
+    assert stats["write"]["count"] == 1 and stats["write"]["contended"] == 1
+    assert sum(stats["write"]["buckets"].values()) == 1
+    assert lock.read_optimistic(lambda: "value") == "value"
+    assert lock.stats()["optimisticReads"] == 1
+
+
+def test_read_write_lock_downgrade_admits_readers_but_not_writers():
+    published = []
+    lock = backend.ReadWriteLock(after_write=lambda: published.append(True))
+    with lock.write() as guard:
+        guard.downgrade()
+        assert published == [True]
+        # Downgraded: other readers get in, writers still wait for the guard to exit.
+        with lock.read():
+            pass
+        writer = threading.Thread(target=lambda: (lock.acquire(), lock.release()))
+        writer.start()
+        writer.join(0.05)
+        assert writer.is_alive()
+    writer.join(5)
+    assert not writer.is_alive()
+    assert lock.stats()["write"]["contended"] == 1
+
+
+def test_readers_see_the_published_view_while_a_writer_holds_the_lock(search_rows, monkeypatch):
+    total = len(search_rows)
+    victim = next(iter(search_rows))
+    entered, release = threading.Event(), threading.Event()
+
+    def writer():
+        with backend._song_search_index_lock:
+            backend._song_search_index_pop_row_locked(victim)
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert entered.wait(5)
+    client = TestClient(backend.app)
+    try:
+        page = client.get("/songs/summary?page=1&pageSize=50").json()
+        assert page["total"] == total and page["revision"] == 10
+        meta = client.get("/songs/snapshot?meta=1").json()
+        assert meta["total"] == total
+        artists = client.get("/songs/artists").json()["artists"]
+        assert sum(item["count"] for item in artists) == total
+        assert victim in backend._song_search_view.rows
+    finally:
+        release.set()
+        thread.join(5)
+    assert victim not in backend._song_search_view.rows
+    assert client.get("/songs/snapshot?meta=1").json()["total"] == total - 1
+    monkeypatch.setattr(backend, "is_request_allowed", lambda: True)
+    stats = client.get("/internal/song_search_index_stats?reset=1").json()
+    assert stats["rows"] == total - 1
+    assert stats["lock"]["write"]["count"] >= 1
+    assert client.get("/internal/song_search_index_stats").json()["lock"]["write"]["count"] == 0
+
+
+def _ranked_library(monkeypatch, summaries):
+    rows = {}
+    for i, summary in enumerate(summaries):
+        summary = dict({"lyricsPath": "songs/x.lys", "hasAudio": True, "mtime": float(i)}, **summary)
+        pool = _search_pool_from_summary(summary)
+        rows[summary["filename"]] = {
+            "mtime": summary["mtime"],
+            "summary": summary,
+            "pool": pool,
+            "pool_compact": _compact_search_pool(pool),
+            "rank": backend._song_search_rank_keys(summary),
+        }
+    index = SongSearchNgramIndex()
+    index.rebuild(rows)
+    monkeypatch.setattr(backend, "_song_search_index", dict(rows))
+    monkeypatch.setattr(backend, "_song_search_ngram_index", index)
+    monkeypatch.setattr(backend, "_song_search_orderings", SongSearchOrderings())
+    monkeypatch.setattr(backend, "_song_search_term_index", backend.SongSearchTermIndex())
+    monkeypatch.setattr(backend, "_song_resource_graph", backend.SongResourceGraph())
+    monkeypatch.setattr(backend, "_artist_playlist_index", {})
+    monkeypatch.setattr(backend, "_artist_playlist_file_to_keys", {})
+    monkeypatch.setattr(backend, "_artist_playlist_orderings", {})
+    monkeypatch.setattr(backend, "_artist_playlist_stamps", {})
+    _publish_patched_index(monkeypatch)
+    return rows
+
+
+def _ranked_filenames(query, fuzzy=False, limit=50):
+    total, summaries = backend._run_library_search_ranked(query, fuzzy, limit)
+    return total, [s["filename"] for s in summaries]
+
+
+def test_ranked_search_orders_by_field_weight_and_match_quality(monkeypatch):
+    _ranked_library(monkeypatch, [
+        {"filename": "in-album.json", "title": "Other", "artists": ["Someone"], "album": "Yellow"},
+        {"filename": "in-artist.json", "title": "Song", "artists": ["Yellow Band"], "album": "A"},
+        {"filename": "title-mid.json", "title": "Mellow Yellow", "artists": ["X"], "album": "B"},
+        {"filename": "title-exact.json", "title": "Yellow", "artists": ["Y"], "album": "C"},
+        {"filename": "yellow-file.json", "title": "Untitled", "artists": ["Z"], "album": "D"},
+        {"filename": "unrelated.json", "title": "Blue", "artists": ["Z"], "album": "D"},
+    ])
+    total, names = _ranked_filenames("yellow")
+    assert total == 5
+    assert names == ["title-exact.json", "title-mid.json", "in-artist.json", "in-album.json", "yellow-file.json"]
+    # Keywords are scored independently and summed: a row hitting both beats single hits.
+    total, names = _ranked_filenames("yellow, band")
+    assert names == ["in-artist.json"]
+
+
+def test_ranked_score_keeps_best_field_when_later_fields_match_worse():
+    needles = [("abc", (), set())]
+    title_only = {"summary": {}, "pool": "xabc", "pool_compact": "xabc", "rank": {"title": "xabc", "artist": "zzz"}}
+    both = {"summary": {}, "pool": "xabc yabc", "pool_compact": "xabcyabc",
+            "rank": {"title": "xabc", "artist": "yabc"}}
+    assert backend._song_search_row_score("a.json", title_only, needles, False) == 5.0
+    assert backend._song_search_row_score("b.json", both, needles, False) == 5.0
+
+
+def test_ranked_search_tolerates_typos_and_matches_romaji(monkeypatch):
+    _ranked_library(monkeypatch, [
+        {"filename": "a.json", "title": "Let It Be", "artists": ["The Beatles"]},
+        {"filename": "b.json", "title": "さくら", "artists": ["森山直太朗"]},
+        {"filename": "c.json", "title": "Beat It", "artists": ["Michael Jackson"]},
+    ])
+    # Transposition within one edit of "beatles"; the boolean search finds nothing.
+    assert backend._run_library_search_ordered_summaries("beatels", False) == []
+    assert _ranked_filenames("beatels") == (1, ["a.json"])
+    assert _ranked_filenames("sakura") == (1, ["b.json"])
+    assert _ranked_filenames("let be")[1] == ["a.json"]  # words out of order / not contiguous
+    # Short words get no typo budget.
+    assert _ranked_filenames("bet")[0] == 0
+    total, names = _ranked_filenames("beat", fuzzy=True)
+    assert names[:2] == ["c.json", "a.json"]
+
+
+def test_ranked_search_pages_top_k_and_keeps_boolean_recall(monkeypatch):
+    summaries = [
+        {"filename": f"song-{i:03d}.json", "title": f"Track {i}", "artists": ["Band"], "song": f"songs/vault/{i}.mp3"}
+        for i in range(230)
+    ]
+    _ranked_library(monkeypatch, summaries)
+    client = TestClient(backend.app)
+    first = client.get("/songs/search?q=track&sortType=relevance&pageSize=50").json()
+    assert first["sortType"] == "relevance" and first["total"] == 230 and first["totalPages"] == 5
+    last = client.get("/songs/search?q=track&sortType=relevance&pageSize=50&page=5").json()
+    assert last["loaded"] == 30
+    names = [s["filename"] for s in first["songs"] + last["songs"]]
+    assert len(set(names)) == 80
+    # Equal scores fall back to newest first.
+    assert names[0] == "song-229.json"
+    # Matches only found in the pool (audio path) are still returned, after field hits.
+    total, names = _ranked_filenames("vault")
+    assert total == 230
+
+
+def test_term_index_follows_row_updates(search_rows):
+    term_index = backend._song_search_term_index
+    fn = next(iter(search_rows))
+    with backend._song_search_index_lock:
+        term_index.build(backend._song_search_index)
+        row = dict(search_rows[fn])
+        row["rank"] = {"title": "zyxwvut"}
+        backend._song_search_index_set_row_locked(fn, row)
+    assert term_index.lookup("zyxwvut") == {fn}
+    assert term_index.lookup("zyxwvt") == {fn}
+    assert term_index.lookup("zyx") == {fn}
+    with backend._song_search_index_lock:
+        backend._song_search_index_pop_row_locked(fn)
+    assert term_index.lookup("zyxwvut") == set()
+    assert "zyxwvut" not in term_index._sorted_terms
+
+
+def _artist_with_most_songs(rows):
+    counts = {}
+    for row in rows.values():
+        artist = row["summary"]["artists"][0]
+        counts[artist] = counts.get(artist, 0) + 1
+    return max(counts, key=counts.get)
+
+
+def test_artist_pages_follow_cursor_across_inserts(search_rows):
+    artist = _artist_with_most_songs(search_rows)
+    expected = [r["summary"] for r in search_rows.values() if r["summary"]["artists"][0] == artist]
+    _sort_search_summaries_inplace(expected, "name", True)
+    client = TestClient(backend.app)
+    url = f"/songs/artist?artist={artist}&sortType=name&sortAsc=1&pageSize=7"
+    first = client.get(url).json()
+    assert first["total"] == len(expected) and first["nextCursor"]
+    assert [s["filename"] for s in first["songs"]] == [s["filename"] for s in expected[:7]]
+    # A song sorting before the cursor appears mid-paging: cursor pages neither repeat nor skip.
+    newcomer = dict(next(iter(search_rows.values())))
+    newcomer["summary"] = dict(newcomer["summary"], filename="!first.json", title="!first", artists=[artist])
+    with backend._song_search_index_lock:
+        backend._install_song_search_row_locked("!first.json", newcomer)
+    seen = [s["filename"] for s in first["songs"]]
+    cursor = first["nextCursor"]
+    while cursor:
+        page = client.get(f"{url}&cursor={cursor}").json()
+        assert page["page"] is None and page["loaded"] <= 7
+        seen += [s["filename"] for s in page["songs"]]
+        cursor = page["nextCursor"]
+        assert page["hasMore"] == bool(cursor)
+    assert seen == [s["filename"] for s in expected]
+    by_page = client.get(f"{url}&page=1").json()
+    assert by_page["total"] == len(expected) + 1 and by_page["songs"][0]["filename"] == "!first.json"
+    assert client.get(f"{url}&cursor=bogus").status_code == 400
+    assert client.get(f"{url}&sortAsc=0&cursor={first['nextCursor']}").status_code == 400
+
+
+def test_artist_routes_revalidate_with_etags(search_rows):
+    artist = _artist_with_most_songs(search_rows)
+    client = TestClient(backend.app)
+    listing = client.get("/songs/artists")
+    etag = listing.headers["etag"]
+    assert "no-store" not in listing.headers["cache-control"]
+    assert client.get("/songs/artists", headers={"If-None-Match": etag}).status_code == 304
+    url = f"/songs/artist?artist={artist}&pageSize=5"
+    songs = client.get(url)
+    songs_etag = songs.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": songs_etag}).status_code == 304
+    other_artist_fn = next(fn for fn, r in search_rows.items() if r["summary"]["artists"][0] != artist)
+    with backend._song_search_index_lock:
+        backend._install_song_search_row_locked(other_artist_fn, None)
+    # Another artist changed: this artist's pages stay valid, the artist list does not.
+    assert client.get(url, headers={"If-None-Match": songs_etag}).status_code == 304
+    assert client.get("/songs/artists", headers={"If-None-Match": etag}).status_code == 200
+    own_fn = next(fn for fn, r in search_rows.items() if r["summary"]["artists"][0] == artist)
+    with backend._song_search_index_lock:
+        backend._install_song_search_row_locked(own_fn, None)
+    fresh = client.get(url, headers={"If-None-Match": songs_etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != songs_etag
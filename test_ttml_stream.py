@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Streaming TTML sanitizer / TTML->LYS golden tests (expected output recorded from the minidom pipeline)."""
+
+from __future__ import annotations
+
+import sys
+import xml.dom.minidom
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import backend  # noqa: E402
+
+APPLE = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttm="http://www.w3.org/ns/ttml#metadata" '
+    'xmlns:amll="http://www.example.com/ns/amll" xmlns:itunes="http://music.apple.com/lyric-ttml-internal" '
+    'itunes:timing="Word" xml:lang="ja">'
+    '<head><metadata>'
+    '<ttm:agent type="person" xml:id="v1"/><ttm:agent type="other" xml:id="v2"/>'
+    '<amll:meta key="musicName" value="Song &amp; Title"/><amll:meta key="empty" value=""/>'
+    '<songwriters><songwriter>Someone</songwriter></songwriters>'
+    '<iTunesMetadata xmlns="http://music.apple.com/lyric-ttml-internal">'
+    '<translations><translation type="replacement" xml:lang="zh-Hans">'
+    '<text for="L1">你好 世界</text>'
+    '<text for="L2"><span begin="00:03.000" end="00:04.000">逐字</span>翻译<span ttm:role="x-bg">（背景 <b>译</b>）</span></text>'
+    '</translation></translations>'
+    '<transliterations><transliteration xml:lang="ja-Latn">'
+    '<text for="L2"><span begin="00:03.000" end="00:03.500">ai</span> <span begin="00:03.500" end="00:04.000">shi</span>'
+    '<span ttm:role="x-bg">(ooh)</span></text>'
+    '</transliteration></transliterations>'
+    '</iTunesMetadata></metadata></head>'
+    '<body dur="00:10.000"><div begin="00:01.000" end="00:09.000">'
+    '<p begin="00:01.000" end="00:02.500" itunes:key="L1" ttm:agent="v1">'
+    '<span begin="00:01.000" end="00:01.500">Hello</span> <span begin="00:01.500" end="00:02.500" amll:obscene="true">w&lt;o&gt;rld</span>'
+    '<!-- comment --><br/><foo>dropped</foo></p>\n'
+    '<p begin="00:03.000" end="00:06.000" itunes:key="L2" ttm:agent="v2">'
+    '<span begin="00:03.000" end="00:03.500">愛</span><span begin="00:03.500" end="00:04.000" amll:empty-beat="1"><![CDATA[し]]></span>'
+    '<span ttm:role="x-bg" begin="00:04.000" end="00:06.000">'
+    '<span begin="00:04.000" end="00:05.000">((ooh</span> <span begin="00:05.000" end="00:06.000">ah))</span></span>'
+    '<span begin="00:06.000">no end</span></p>'
+    '<p begin="00:07.000" end="00:08.000" ttm:agent="v1">plain &amp; simple</p>'
+    '<p end="00:09.000"><span begin="00:08.000" end="00:09.000">no begin</span></p>'
+    '</div></body></tt>'
+)
+
+DUET_WITHOUT_AGENTS = (
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttm="http://www.w3.org/ns/ttml#metadata">'
+    '<head><metadata/></head><body><div>'
+    '<p begin="00:00.500" end="00:01.000" ttm:agent="lead"><span begin="00:00.500" end="00:01.000">one</span></p>'
+    '<p begin="00:01.000" end="00:02.000" ttm:agent="chorus"><span begin="00:01.000" end="00:02.000">two</span>'
+    '<span ttm:role="x-translation" xml:lang="en">二</span><span ttm:role="x-roman">ni</span></p>'
+    '</div></body></tt>'
+)
+
+
+APPLE_SANITIZED = (
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttm="http://www.w3.org/ns/ttml#metadata" '
+    'xmlns:amll="http://www.example.com/ns/amll" xmlns:itunes="http://music.apple.com/lyric-ttml-internal">'
+    '<head><metadata><ttm:agent type="person" xml:id="v1"/><ttm:agent type="other" xml:id="v2"/>'
+    '<amll:meta key="musicName" value="Song &amp; Title"/></metadata></head>'
+    '<body dur="00:10.000"><div begin="00:01.000" end="00:09.000">'
+    '<p begin="00:01.000" end="00:02.500" itunes:key="L1" ttm:agent="v1">'
+    '<span begin="00:01.000" end="00:01.500">Hello</span> '
+    '<span begin="00:01.500" end="00:02.500" amll:obscene="true">w&lt;o&gt;rld</span>'
+    '<span ttm:role="x-translation" xml:lang="zh-CN">你好 世界</span></p>'
+    '<p begin="00:03.000" end="00:06.000" itunes:key="L2" ttm:agent="v2">'
+    '<span begin="00:03.000" end="00:03.500">愛</span>'
+    '<span begin="00:03.500" end="00:04.000" amll:empty-beat="1">し</span>'
+    '<span ttm:role="x-bg" begin="00:04.000" end="00:06.000">'
+    '<span begin="00:04.000" end="00:05.000">((ooh</span> <span begin="00:05.000" end="00:06.000">ah))</span>'
+    '<span ttm:role="x-translation" xml:lang="zh-CN">背景 译</span><span ttm:role="x-roman">ooh</span></span>'
+    '<span ttm:role="x-translation" xml:lang="zh-CN">翻译</span><span ttm:role="x-roman">ai shi</span></p>'
+    '<p begin="00:07.000" end="00:08.000" ttm:agent="v1">plain &amp; simple</p>'
+    '</div></body></tt>'
+)
+
+
+@pytest.fixture
+def no_minidom(monkeypatch):
+    def _refuse(*_args, **_kwargs):
+        raise AssertionError("minidom must not be used on the TTML import path")
+
+    monkeypatch.setattr(xml.dom.minidom, "parseString", _refuse)
+
+
+def test_sanitize_matches_recorded_output(no_minidom):
+    assert backend.sanitize_ttml_content(APPLE) == APPLE_SANITIZED
+    # Sanitizing is idempotent: the whitelisted document passes through unchanged.
+    assert backend.sanitize_ttml_content(APPLE_SANITIZED) == APPLE_SANITIZED
+
+
+def test_lys_and_translation_lines_match_recorded_output(no_minidom):
+    assert backend.ttml_text_to_lys_parts(APPLE) == (True, [
+        "[4]Hello (1000,500)w<o>rld(1500,1000)",
+        "[5]愛(3000,500)し(3500,500)",
+        "[8](ooh (4000,1000)ah)(5000,1000)",
+        "[4]plain & simple(7000,1000)",
+    ], ["[00:01.000]你好 世界", "[00:03.000]翻译"], "")
+
+
+def test_agents_are_normalized_against_the_main_person(no_minidom):
+    sanitized = backend.sanitize_ttml_content(DUET_WITHOUT_AGENTS)
+    assert '<ttm:agent type="other" xml:id="v2"/>' in sanitized
+    assert sanitized.count('ttm:agent="v2"') == 2
+    assert '<span ttm:role="x-translation" xml:lang="en">二</span><span ttm:role="x-roman">ni</span>' in sanitized
+    assert backend.ttml_text_to_lys_parts(DUET_WITHOUT_AGENTS) == (
+        True, ["[2]one(500,500)", "[2]two(1000,1000)"], ["[00:01.000]二"], "")
+
+
+@pytest.mark.parametrize("ttml, message", [
+    ("<tt><body><div></div></body></tt>", "TTML 中缺少 <p> 节点，无法净化保存"),
+    ("<tt><body><p>x</body></tt>", "TTML 解析失败: mismatched tag: line 1, column 16"),
+    ('<tt xmlns="http://www.w3.org/ns/ttml"><body><p ttm:agent="v1"/></body></tt>',
+     "TTML 解析失败: unbound prefix: line 1, column 44"),
+])
+def test_errors_keep_their_messages(ttml, message):
+    with pytest.raises(ValueError) as excinfo:
+        backend.sanitize_ttml_content(ttml)
+    assert str(excinfo.value) == message
+    assert backend.ttml_text_to_lys_parts(ttml) == (False, [], [], f"TTML 白名单过滤失败: {message}")